@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import threading
+import time
+from src.cache.asyncgeocache import AsyncGeoDistributedLRUCache
+from src.cache.geocache import GeoDistributedLRUCache
+from src.messaging import AsyncInMemoryTransport, InMemoryTransport
+
+"""
+Throughput of concurrent requests served by AsyncGeoDistributedLRUCache from one event loop against
+GeoDistributedLRUCache called from one thread per concurrent request, with a simulated broker round trip on every
+publish. One request in write_every is a put, the others are gets.
+Run with: python -m benchmarks.bench_async
+"""
+
+REGIONS = ['us-east', 'eu-central', 'asia-south']
+
+
+class DelayedTransport(InMemoryTransport):
+    """ An InMemoryTransport whose publish blocks for the broker round trip, like a confirmed pika publish """
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def publish(self, name, body):
+        time.sleep(self.delay)
+        super().publish(name, body)
+
+
+class DelayedAsyncTransport(AsyncInMemoryTransport):
+    """ An AsyncInMemoryTransport delivering every message after the broker round trip """
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def _send(self, name, body):
+        self.loop.call_later(self.delay, super()._send, name, body)
+
+
+def _request(i, write_every):
+    return f"key{i % 1000}", i % write_every == 0
+
+
+def threaded(concurrency, requests, delay, write_every):
+    """
+    :return: Requests per second served by concurrency threads sharing a GeoDistributedLRUCache.
+    """
+    transport = DelayedTransport(delay)
+    cache = GeoDistributedLRUCache(REGIONS, capacity=1000, transport=transport)
+
+    def client(offset):
+        for i in range(offset, requests, concurrency):
+            key, write = _request(i, write_every)
+            if write:
+                cache.put(key, i, REGIONS[i % 3])
+            else:
+                cache.get(key, REGIONS[i % 3])
+
+    clients = [threading.Thread(target=client, args=(offset,)) for offset in range(concurrency)]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cache.close()
+    return requests / elapsed
+
+
+async def _asynchronous(concurrency, requests, delay, write_every):
+    cache = AsyncGeoDistributedLRUCache(REGIONS, capacity=1000, transport=DelayedAsyncTransport(delay))
+
+    async def client(offset):
+        for i in range(offset, requests, concurrency):
+            key, write = _request(i, write_every)
+            if write:
+                await cache.put(key, i, REGIONS[i % 3])
+            else:
+                await cache.get(key, REGIONS[i % 3])
+            await asyncio.sleep(0)  # Let the other requests in, as a request handler awaiting I/O would
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await cache.flush()
+    await cache.close()
+    return requests / elapsed
+
+
+def asynchronous(concurrency, requests, delay, write_every):
+    """
+    :return: Requests per second served by concurrency tasks sharing an AsyncGeoDistributedLRUCache.
+    """
+    return asyncio.run(_asynchronous(concurrency, requests, delay, write_every))
+
+
+def run(concurrency=(10, 100), requests=20000, delay=0.001, write_every=10):
+    results = []
+    for count in concurrency:
+        results.append({'concurrency': count, 'path': 'threads',
+                        'requests_per_sec': threaded(count, requests, delay, write_every)})
+        results.append({'concurrency': count, 'path': 'asyncio',
+                        'requests_per_sec': asynchronous(count, requests, delay, write_every)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent request throughput of the asyncio and thread-based caches')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--delay', type=float, default=0.001, help='Simulated broker round trip in seconds')
+    parser.add_argument('--write-every', type=int, default=10, help='One request in this many is a put')
+    args = parser.parse_args()
+    print(f"{'concurrency':>12} {'path':>8} {'requests/s':>12}")
+    for row in run(args.concurrency, args.requests, args.delay, args.write_every):
+        print(f"{row['concurrency']:>12} {row['path']:>8} {row['requests_per_sec']:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
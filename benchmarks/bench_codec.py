@@ -0,0 +1,77 @@
+import argparse
+import json
+import time
+from src.utils import serialize_data, deserialize_data
+
+"""
+Encode/decode throughput and message size of the binary replication codec against the JSON path it replaces.
+Run with: python -m benchmarks.bench_codec
+"""
+
+PAYLOADS = {
+    'short-str': lambda i: f'value{i}',
+    'record': lambda i: {'id': i, 'name': f'user{i}', 'score': i / 7, 'active': True, 'tags': ['a', 'b', 'c']},
+    'long-str': lambda i: 'x' * 4096,
+}
+
+
+def _json_encode(records):
+    return json.dumps(records[0]) if len(records) == 1 else json.dumps({'batch': records})
+
+
+def _json_decode(message):
+    payload = json.loads(message)
+    return payload['batch'] if 'batch' in payload else [payload]
+
+
+CODECS = {
+    'json': (lambda records: _json_encode(records).encode('utf-8'), _json_decode),
+    'binary': (serialize_data, deserialize_data),
+}
+
+
+def measure(encode, decode, records, rounds):
+    """
+    Time encoding and decoding of one message.
+
+    :return: Tuple of (encodes per second, decodes per second, message size in bytes).
+    """
+    message = encode(records)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encode(records)
+    encode_rate = rounds / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decode(message)
+    decode_rate = rounds / (time.perf_counter() - start)
+    return encode_rate, decode_rate, len(message)
+
+
+def run(batch_sizes=(1, 100), rounds=2000):
+    results = []
+    for payload, make_value in PAYLOADS.items():
+        for batch_size in batch_sizes:
+            records = [{'key': f'key{i}', 'value': make_value(i)} for i in range(batch_size)]
+            row = {'payload': payload, 'batch_size': batch_size}
+            for name, (encode, decode) in CODECS.items():
+                encode_rate, decode_rate, size = measure(encode, decode, records, max(1, rounds // batch_size))
+                row[name] = {'encode_per_sec': encode_rate, 'decode_per_sec': decode_rate, 'bytes': size}
+            results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Binary codec vs JSON for replication messages')
+    parser.add_argument('--rounds', type=int, default=20000, help='Messages encoded/decoded per single-record case')
+    args = parser.parse_args()
+    print(f"{'payload':>10} {'batch':>6} {'codec':>7} {'enc msg/s':>12} {'dec msg/s':>12} {'bytes':>9}")
+    for row in run(rounds=args.rounds):
+        for name in CODECS:
+            stats = row[name]
+            print(f"{row['payload']:>10} {row['batch_size']:>6} {name:>7} {stats['encode_per_sec']:>12,.0f} "
+                  f"{stats['decode_per_sec']:>12,.0f} {stats['bytes']:>9,}")
+
+
+if __name__ == '__main__':
+    main()
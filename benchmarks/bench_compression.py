@@ -0,0 +1,69 @@
+import argparse
+import time
+from src.cache.lrucache import LRUCache
+from src.utils import compress_value, serialize_data
+
+"""
+Stored bytes, replication message size and put/get latency of a region cache without compression and with the zlib
+and lzma codecs, for compressible JSON-like values of several sizes.
+Run with: python -m benchmarks.bench_compression
+"""
+
+CODECS = (None, 'zlib', 'lzma')
+
+
+def make_value(size):
+    """
+    :return: A list of records, about size bytes once encoded, as a typical cached API response.
+    """
+    record = {'id': 0, 'name': 'customer', 'email': 'customer@example.com', 'status': 'active', 'score': 0.5}
+    records = []
+    while len(serialize_data([{'key': 'key', 'value': records}])) < size:
+        records.append(dict(record, id=len(records), score=len(records) / 7))
+    return records
+
+
+def measure(codec, value, entries):
+    """
+    Fill a cache with entries copies of the value, then read them all back.
+
+    :return: Tuple of (stored bytes, message bytes, microseconds per put, microseconds per get).
+    """
+    cache = LRUCache(entries, 3600, compression=codec, max_bytes=2 ** 40)
+    keys = [f'key{i}' for i in range(entries)]
+    start = time.perf_counter()
+    for key in keys:
+        cache.put(key, value)
+    put_us = (time.perf_counter() - start) / entries * 1e6
+    start = time.perf_counter()
+    for key in keys:
+        cache.get(key)
+    get_us = (time.perf_counter() - start) / entries * 1e6
+    message = serialize_data([{'key': 'key0', 'value': compress_value(value, codec)[0] if codec else value}])
+    return cache.bytes, len(message), put_us, get_us
+
+
+def run(sizes=(5000, 50000, 200000), entries=50):
+    results = []
+    for size in sizes:
+        value = make_value(size)
+        for codec in CODECS:
+            stored, message, put_us, get_us = measure(codec, value, entries)
+            results.append({'value_bytes': size, 'codec': codec or 'none', 'stored_bytes': stored,
+                            'message_bytes': message, 'put_us': put_us, 'get_us': get_us})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory, message size and latency of compressed region caches')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 50000, 200000])
+    parser.add_argument('--entries', type=int, default=50)
+    args = parser.parse_args()
+    print(f"{'value':>8} {'codec':>6} {'stored KB':>10} {'msg bytes':>10} {'put us':>9} {'get us':>9}")
+    for row in run(args.sizes, args.entries):
+        print(f"{row['value_bytes']:>8} {row['codec']:>6} {row['stored_bytes'] / 1024:>10.1f} "
+              f"{row['message_bytes']:>10,} {row['put_us']:>9.1f} {row['get_us']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import threading
+import time
+from src.cache.geocache import GeoDistributedLRUCache
+from src.messaging import InMemoryTransport
+from .workloads import keyspace, zipf
+
+"""
+Hot keys: read throughput of a few celebrity keys served by the region cache or by the near cache, from several
+threads, and replication messages published when the same keys are rewritten in a burst, one message per write
+without hot key detection against one per key per interval with it.
+Run with: python -m benchmarks.bench_hotkeys
+"""
+
+
+class CountingTransport(InMemoryTransport):
+    """ An InMemoryTransport counting the messages it publishes """
+
+    def __init__(self):
+        super().__init__()
+        self.published = 0
+
+    def publish(self, name, body):
+        self.published += 1
+        super().publish(name, body)
+
+
+def read(hot_keys, keys, accesses, threads):
+    """
+    Read accesses from one region with several threads, each reading its own slice.
+
+    :return: Microseconds per read, all threads together.
+    """
+    cache = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=keys, transport=InMemoryTransport(),
+                                   consume=False, hot_keys=hot_keys)
+    for key in keyspace(keys):
+        cache.put(key, key, 'us-east')
+    for key in accesses:  # Warm up, the hot keys are found and their near cache filled
+        cache.get(key, 'us-east')
+    slices = [accesses[i::threads] for i in range(threads)]
+
+    def reader(part):
+        get = cache.get
+        for key in part:
+            get(key, 'us-east')
+
+    workers = [threading.Thread(target=reader, args=(part,)) for part in slices]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    cache.close()
+    return elapsed / len(accesses) * 1e6
+
+
+def rewrite(hot_keys, celebrities, writes, interval):
+    """
+    Rewrite a few keys in a burst, each read as often as written so that they are detected as hot.
+
+    :return: Tuple of (messages published, seconds taken by the writes).
+    """
+    transport = CountingTransport()
+    cache = GeoDistributedLRUCache(['us-east', 'eu-central', 'ap-south'], capacity=1000, transport=transport,
+                                   consume=False, hot_keys=hot_keys, hot_key_interval=interval)
+    names = [f"celebrity{i}" for i in range(celebrities)]
+    start = time.perf_counter()
+    for i in range(writes):
+        key = names[i % celebrities]
+        cache.put(key, i, 'us-east')
+        cache.get(key, 'us-east')
+    elapsed = time.perf_counter() - start
+    cache.close()
+    return transport.published, elapsed
+
+
+def run(keys=10000, operations=200000, skew=1.2, threads=(1, 4), celebrities=10, writes=50000, interval=0.05,
+        repeat=3):
+    accesses = zipf(keys, operations, skew)
+    results = []
+    for count in threads:
+        lru_us = near_us = float('inf')
+        for _ in range(repeat):  # Alternated and best of repeat, the machine is noisy
+            lru_us = min(lru_us, read(False, keys, accesses, count))
+            near_us = min(near_us, read(True, keys, accesses, count))
+        results.append({'test': f'read, {count} threads', 'without': lru_us, 'with': near_us, 'unit': 'us/get'})
+    published, plain_s = rewrite(False, celebrities, writes, interval)
+    debounced, hot_s = rewrite(True, celebrities, writes, interval)
+    results.append({'test': f'{writes} rewrites', 'without': published, 'with': debounced, 'unit': 'messages'})
+    results.append({'test': f'{writes} rewrites', 'without': plain_s, 'with': hot_s, 'unit': 's'})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Near cache and write debouncing of the hot keys')
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--operations', type=int, default=200000)
+    parser.add_argument('--skew', type=float, default=1.2, help='Zipf exponent of the reads')
+    parser.add_argument('--writes', type=int, default=50000)
+    args = parser.parse_args()
+    print(f"{'test':>22} {'without':>12} {'with':>12} {'unit':>9}")
+    for row in run(args.keys, args.operations, args.skew, writes=args.writes):
+        print(f"{row['test']:>22} {row['without']:>12.3f} {row['with']:>12.3f} {row['unit']:>9}")
+
+
+if __name__ == '__main__':
+    main()
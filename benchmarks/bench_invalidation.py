@@ -0,0 +1,73 @@
+import argparse
+import random
+from src.cache.geocache import GeoDistributedLRUCache
+from src.messaging import InMemoryTransport
+
+"""
+Replication bandwidth and remote memory of full-value against invalidation-only replication, for large values written
+in one region and read from the others with a given probability.
+Run with: python -m benchmarks.bench_invalidation
+"""
+
+
+class CountingTransport(InMemoryTransport):
+    """ An InMemoryTransport counting the bytes it publishes """
+
+    def __init__(self):
+        super().__init__()
+        self.published_bytes = 0
+
+    def publish(self, name, body):
+        self.published_bytes += len(body)
+        super().publish(name, body)
+
+
+def measure(regions, writes, value_size, remote_reads, invalidation):
+    """
+    Write keys in the first region, then read a fraction of them from every other region.
+
+    :return: Tuple of (bytes published, items held by the remote regions).
+    """
+    transport = CountingTransport()
+    cache = GeoDistributedLRUCache(regions, capacity=writes, transport=transport,
+                                   invalidation_prefixes=('blob:',) if invalidation else ())
+    value = 'x' * value_size
+    origin, rng = regions[0], random.Random(1)
+    for i in range(writes):
+        cache.put(f"blob:{i}", value, origin)
+    transport.join()
+    for region in regions[1:]:
+        for i in range(writes):
+            if rng.random() < remote_reads:
+                cache.get(f"blob:{i}", region)
+    held = sum(len(cache.regions[region]) for region in regions[1:])
+    cache.close()
+    return transport.published_bytes, held
+
+
+def run(regions=4, writes=2000, value_size=10000, remote_reads=(0.01, 0.1, 0.5)):
+    results = []
+    names = [f"region-{i}" for i in range(regions)]
+    for fraction in remote_reads:
+        for invalidation in (False, True):
+            published, held = measure(names, writes, value_size, fraction, invalidation)
+            results.append({'remote_reads': fraction, 'mode': 'invalidate' if invalidation else 'full',
+                            'published_bytes': published, 'remote_items': held})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bandwidth and remote memory of full-value and invalidation-only '
+                                                 'replication')
+    parser.add_argument('--regions', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=2000)
+    parser.add_argument('--value-size', type=int, default=10000)
+    args = parser.parse_args()
+    print(f"{'reads':>6} {'mode':>11} {'published MB':>13} {'remote items':>13}")
+    for row in run(args.regions, args.writes, args.value_size):
+        print(f"{row['remote_reads']:>6} {row['mode']:>11} {row['published_bytes'] / 2 ** 20:>13.2f} "
+              f"{row['remote_items']:>13,}")
+
+
+if __name__ == '__main__':
+    main()
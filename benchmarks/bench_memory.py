@@ -0,0 +1,97 @@
+import argparse
+import gc
+import time
+import tracemalloc
+from collections import OrderedDict
+from src.cache.lrucache import LRUCache
+
+"""
+Memory per entry and put/get throughput of LRUCache against the original dict-per-entry layout.
+Run with: python -m benchmarks.bench_memory
+"""
+
+
+class DictEntryLRUCache:
+    """ The original LRUCache layout: one {'value': ..., 'ttl': ...} dict allocated per put, checked lazily """
+
+    def __init__(self, capacity, expiration_time):
+        self.cache = OrderedDict()
+        self.capacity = capacity
+        self.expiration_time = expiration_time
+
+    def get(self, key):
+        if key not in self.cache or time.time() - self.cache[key]['ttl'] > self.expiration_time:
+            return -1
+        self.cache.move_to_end(key)
+        return self.cache[key]['value']
+
+    def put(self, key, value):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        self.cache[key] = {'value': value, 'ttl': time.time()}
+        if len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+
+
+IMPLEMENTATIONS = {'dict-entry': DictEntryLRUCache, 'lrucache': LRUCache}
+
+
+def bytes_per_entry(factory, entries):
+    """
+    Measure the memory a cache holds per entry, excluding the keys and values themselves.
+
+    :return: Allocated bytes divided by the number of entries.
+    """
+    keys = [f"key{i}" for i in range(entries)]
+    value = "value"
+    gc.collect()
+    tracemalloc.start()
+    cache = factory(entries, 300)
+    for key in keys:
+        cache.put(key, value)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cache
+    return current / entries
+
+
+def ops_per_sec(factory, entries, rounds):
+    """
+    :return: Tuple of (puts per second, gets per second) on a warm cache of the given size.
+    """
+    keys = [f"key{i}" for i in range(entries)]
+    cache = factory(entries, 300)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for key in keys:
+            cache.put(key, key)
+    put_rate = rounds * entries / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for key in keys:
+            cache.get(key)
+    get_rate = rounds * entries / (time.perf_counter() - start)
+    return put_rate, get_rate
+
+
+def run(entries=1000000, rounds=2):
+    results = []
+    for name, factory in IMPLEMENTATIONS.items():
+        put_rate, get_rate = ops_per_sec(factory, min(entries, 100000), rounds)
+        results.append({'implementation': name, 'bytes_per_entry': bytes_per_entry(factory, entries),
+                        'put_per_sec': put_rate, 'get_per_sec': get_rate})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LRUCache memory per entry and throughput')
+    parser.add_argument('--entries', type=int, default=1000000)
+    args = parser.parse_args()
+    print(f"{'layout':>12} {'bytes/entry':>12} {'put/s':>12} {'get/s':>12}")
+    for row in run(args.entries):
+        print(f"{row['implementation']:>12} {row['bytes_per_entry']:>12,.1f} {row['put_per_sec']:>12,.0f} "
+              f"{row['get_per_sec']:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import time
+from src.cache.geocache import GeoDistributedLRUCache
+from src.exceptions import MessagePublishError
+from src.messaging import InMemoryTransport
+
+"""
+Put latency of GeoDistributedLRUCache publishing from the writing thread against publishing through the outbox, with
+a healthy, a slow and an unreachable broker simulated over the in-process transport.
+Run with: python -m benchmarks.bench_outbox
+"""
+
+
+class SimulatedTransport(InMemoryTransport):
+    """ An InMemoryTransport taking delay seconds per publish, and failing after it when down """
+
+    def __init__(self, delay=0.0, down=False):
+        super().__init__()
+        self.delay = delay
+        self.down = down
+
+    def publish(self, name, body):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.down:
+            raise MessagePublishError(f"Failed to publish to {name}: the broker is down")
+        super().publish(name, body)
+
+
+BROKERS = {
+    'healthy': {},
+    'slow': {'delay': 0.002},
+    'down': {'delay': 0.002, 'down': True},
+}
+
+
+def measure(broker, outbox, writes, regions):
+    """
+    :return: Tuple of (mean microseconds per put, 99th percentile microseconds per put).
+    """
+    cache = GeoDistributedLRUCache(regions, capacity=writes, transport=SimulatedTransport(**BROKERS[broker]),
+                                   outbox=outbox)
+    latencies = []
+    for i in range(writes):
+        start = time.perf_counter()
+        cache.put(f"key{i}", f"value{i}", regions[0])
+        latencies.append(time.perf_counter() - start)
+    if outbox:  # Do not wait for a dead broker, the messages left are of no use
+        cache.messaging.outbox.close(timeout=0)
+    cache.close()
+    latencies.sort()
+    return sum(latencies) / writes * 1e6, latencies[int(writes * 0.99)] * 1e6
+
+
+def run(writes=500, regions=('us-east', 'eu-central', 'asia-south')):
+    results = []
+    for broker in BROKERS:
+        for outbox in (False, True):
+            mean, p99 = measure(broker, outbox, writes, list(regions))
+            results.append({'broker': broker, 'outbox': outbox, 'put_us': mean, 'put_p99_us': p99})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Put latency with and without the outbox for healthy, slow and '
+                                                 'unreachable brokers')
+    parser.add_argument('--writes', type=int, default=500)
+    args = parser.parse_args()
+    print(f"{'broker':>8} {'outbox':>7} {'put us':>9} {'p99 us':>9}")
+    for row in run(args.writes):
+        print(f"{row['broker']:>8} {str(row['outbox']):>7} {row['put_us']:>9.1f} {row['put_p99_us']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
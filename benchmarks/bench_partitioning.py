@@ -0,0 +1,90 @@
+import argparse
+from src.cache.geocache import GeoDistributedLRUCache
+from src.messaging import InMemoryTransport, Transport
+
+"""
+Memory and write fan-out of full replication against partitioned mode as the number of regions grows.
+Run with: python -m benchmarks.bench_partitioning
+"""
+
+
+class CountingTransport(Transport):
+    """ Wraps a transport and counts the published messages """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.published = 0
+
+    def declare_queue(self, name):
+        self.transport.declare_queue(name)
+
+    def publish(self, name, body):
+        self.published += 1
+        self.transport.publish(name, body)
+
+    def consume(self, name, callback):
+        self.transport.consume(name, callback)
+
+    def close(self):
+        self.transport.close()
+
+
+def measure(regions, keys, partitioned, replication_factor):
+    """
+    Write every key once from rotating regions and wait for the replication to settle.
+
+    :return: Tuple of (entries stored over all regions, messages published per write).
+    """
+    inner = InMemoryTransport()
+    transport = CountingTransport(inner)
+    cache = GeoDistributedLRUCache(regions, capacity=keys, transport=transport, partitioned=partitioned,
+                                   replication_factor=replication_factor)
+    for i in range(keys):
+        cache.put(f"key{i}", i, regions[i % len(regions)])
+    inner.join()
+    stored = sum(len(region.cache) for region in cache.regions.values())
+    cache.messaging.close()
+    return stored, transport.published / keys
+
+
+def key_movement(region_count, keys, replication_factor):
+    """
+    :return: Share of the stored entries copied when one region joins a partitioned cache.
+    """
+    regions = [f"region-{i}" for i in range(region_count)]
+    cache = GeoDistributedLRUCache(regions, capacity=keys, transport=InMemoryTransport(), partitioned=True,
+                                   replication_factor=replication_factor)
+    for i in range(keys):
+        for owner in cache.owners(f"key{i}"):
+            cache.regions[owner].put(f"key{i}", i)
+    moved = cache.add_region(f"region-{region_count}")
+    cache.messaging.close()
+    return moved / (keys * replication_factor)
+
+
+def run(region_counts=(2, 4, 8, 16), keys=5000, replication_factor=2):
+    results = []
+    for count in region_counts:
+        regions = [f"region-{i}" for i in range(count)]
+        full_stored, full_fanout = measure(regions, keys, False, replication_factor)
+        part_stored, part_fanout = measure(regions, keys, True, replication_factor)
+        results.append({'regions': count, 'full_entries': full_stored, 'partitioned_entries': part_stored,
+                        'full_fanout': full_fanout, 'partitioned_fanout': part_fanout,
+                        'moved_on_join': key_movement(count, keys, replication_factor)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory and fan-out of full replication vs partitioned mode')
+    parser.add_argument('--keys', type=int, default=5000)
+    parser.add_argument('--replication-factor', type=int, default=2)
+    args = parser.parse_args()
+    print(f"{'regions':>8} {'full entries':>13} {'part. entries':>14} {'full fan-out':>13} {'part. fan-out':>14} "
+          f"{'moved on join':>14}")
+    for row in run(keys=args.keys, replication_factor=args.replication_factor):
+        print(f"{row['regions']:>8} {row['full_entries']:>13,} {row['partitioned_entries']:>14,} "
+              f"{row['full_fanout']:>13.2f} {row['partitioned_fanout']:>14.2f} {row['moved_on_join']:>14.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import time
+from src.cache.geocache import GeoDistributedLRUCache
+from src.messaging import InMemoryTransport
+
+"""
+Replication throughput of GeoDistributedLRUCache over the in-process transport, no broker needed.
+Run with: python -m benchmarks.bench_replication
+"""
+
+
+def measure(regions, writes, batching, codec='binary'):
+    """
+    Write keys in the first region and wait until every other region applied them.
+
+    :return: Tuple of (writes per second accepted by put, writes per second fully replicated).
+    """
+    transport = InMemoryTransport()
+    cache = GeoDistributedLRUCache(regions, capacity=writes, batching=batching, codec=codec, transport=transport)
+    origin = regions[0]
+    start = time.perf_counter()
+    for i in range(writes):
+        cache.put(f"key{i}", f"value{i}", origin)
+    put_elapsed = time.perf_counter() - start
+    cache.messaging.flush()
+    transport.join()
+    total_elapsed = time.perf_counter() - start
+    cache.messaging.close()
+    return writes / put_elapsed, writes / total_elapsed
+
+
+def run(region_counts=(2, 4, 8), writes=20000):
+    results = []
+    for count in region_counts:
+        regions = [f"region-{i}" for i in range(count)]
+        for batching in (False, True):
+            put_rate, replicated_rate = measure(regions, writes, batching)
+            results.append({'regions': count, 'batching': batching, 'put_per_sec': put_rate,
+                            'replicated_per_sec': replicated_rate})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replication throughput over the in-process transport')
+    parser.add_argument('--writes', type=int, default=20000)
+    args = parser.parse_args()
+    print(f"{'regions':>8} {'batching':>9} {'put/s':>12} {'replicated/s':>13}")
+    for row in run(writes=args.writes):
+        print(f"{row['regions']:>8} {str(row['batching']):>9} {row['put_per_sec']:>12,.0f} "
+              f"{row['replicated_per_sec']:>13,.0f}")
+
+
+if __name__ == '__main__':
+    main()
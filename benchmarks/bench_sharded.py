@@ -0,0 +1,86 @@
+import argparse
+import random
+import threading
+import time
+from threading import Lock
+from src.cache.lrucache import LRUCache
+from src.cache.shardedcache import ShardedLRUCache
+
+"""
+Throughput of get/put under a growing number of threads, for a single LRUCache behind one region lock against a
+ShardedLRUCache. Run with: python -m benchmarks.bench_sharded
+"""
+
+
+class LockedLRUCache:
+    """ A single LRUCache guarded by one lock, which is how a region was protected before sharding """
+
+    def __init__(self, capacity, expiration_time):
+        self.cache = LRUCache(capacity, expiration_time)
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.cache.get(key)
+
+    def put(self, key, value):
+        with self.lock:
+            self.cache.put(key, value)
+
+
+def _worker(cache, keys, operations, write_ratio, seed, barrier):
+    rng = random.Random(seed)
+    barrier.wait()
+    for _ in range(operations):
+        key = keys[rng.randrange(len(keys))]
+        if rng.random() < write_ratio:
+            cache.put(key, key)
+        else:
+            cache.get(key)
+
+
+def measure(cache, threads, operations, keyspace=10000, write_ratio=0.1):
+    """
+    Run a mixed get/put workload against a cache.
+
+    :param cache: The cache under test.
+    :param threads: Number of concurrent threads.
+    :param operations: Number of operations issued by each thread.
+    :param keyspace: Number of distinct keys.
+    :param write_ratio: Fraction of operations that are puts.
+    :return: Operations per second over all threads.
+    """
+    keys = [f"key{i}" for i in range(keyspace)]
+    barrier = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=_worker, args=(cache, keys, operations, write_ratio, seed, barrier))
+               for seed in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * operations / (time.perf_counter() - start)
+
+
+def run(thread_counts=(1, 2, 4, 8), operations=50000, capacity=5000, shards=16):
+    results = []
+    for threads in thread_counts:
+        locked = measure(LockedLRUCache(capacity, 300), threads, operations)
+        sharded = measure(ShardedLRUCache(capacity, 300, shards), threads, operations)
+        results.append({'threads': threads, 'locked_ops_per_sec': locked, 'sharded_ops_per_sec': sharded})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LRUCache vs ShardedLRUCache thread scaling')
+    parser.add_argument('--operations', type=int, default=50000, help='Operations per thread')
+    parser.add_argument('--shards', type=int, default=16)
+    args = parser.parse_args()
+    print(f"{'threads':>8} {'locked ops/s':>14} {'sharded ops/s':>14}")
+    for row in run(operations=args.operations, shards=args.shards):
+        print(f"{row['threads']:>8} {row['locked_ops_per_sec']:>14,.0f} {row['sharded_ops_per_sec']:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import gc
+import multiprocessing
+import os
+import time
+import tracemalloc
+from src.cache.lrucache import LRUCache
+from src.cache.sharedcache import SharedMemoryLRUCache
+from .workloads import keyspace
+
+"""
+Memory per host and get latency of region caches shared by several worker processes: one private LRUCache per
+worker against one SharedMemoryLRUCache attached by every worker, read concurrently from separate processes.
+Run with: python -m benchmarks.bench_shared
+"""
+
+
+def private_bytes(entries, value):
+    """
+    :return: Bytes a private LRUCache of the given number of entries allocates, keys and values included.
+    """
+    keys = keyspace(entries)
+    gc.collect()
+    tracemalloc.start()
+    cache = LRUCache(entries, 3600)
+    for key in keys:
+        cache.put(key, value)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cache
+    return current
+
+
+def _read(name, keys, operations, results):
+    if name is None:
+        cache = LRUCache(len(keys), 3600)
+        for key in keys:
+            cache.put(key, key)
+    else:
+        cache = SharedMemoryLRUCache(name, create=False)
+    get = cache.get
+    start = time.perf_counter()
+    for i in range(operations):
+        get(keys[i % len(keys)])
+    results.put(time.perf_counter() - start)
+    if name is not None:
+        cache.close()
+
+
+def get_latency(name, keys, workers, operations):
+    """
+    Read from worker processes in parallel, each from a private cache or from the shared one.
+
+    :return: Mean microseconds per get, over every worker.
+    """
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=_read, args=(name, keys, operations, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    elapsed = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(elapsed) / (workers * operations) * 1e6
+
+
+def run(entries=10000, workers=(1, 4), operations=20000, value_size=100):
+    results = []
+    value = 'x' * value_size
+    keys = keyspace(entries)
+    name = f"bench-shared-{os.getpid()}"
+    shared = SharedMemoryLRUCache(name, entries, 3600, slot_size=value_size + 64)
+    try:
+        for key in keys:
+            shared.put(key, value)
+        private = private_bytes(entries, value)
+        for count in workers:
+            results.append({'cache': 'private', 'workers': count, 'host_bytes': private * count,
+                            'get_us': get_latency(None, keys, count, operations)})
+            results.append({'cache': 'shared', 'workers': count, 'host_bytes': shared.block.size,
+                            'get_us': get_latency(name, keys, count, operations)})
+    finally:
+        shared.close()
+        shared.unlink()
+        os.remove(shared.lock.path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory per host and get latency of private and shared region '
+                                                 'caches across worker processes')
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--operations', type=int, default=20000)
+    parser.add_argument('--value-size', type=int, default=100)
+    args = parser.parse_args()
+    print(f"{'cache':>8} {'workers':>8} {'host MB':>8} {'get us':>7}")
+    for row in run(args.entries, args.workers, args.operations, args.value_size):
+        print(f"{row['cache']:>8} {row['workers']:>8} {row['host_bytes'] / 2 ** 20:>8.1f} {row['get_us']:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
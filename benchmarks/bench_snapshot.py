@@ -0,0 +1,64 @@
+import argparse
+import os
+import tempfile
+import time
+from src.cache.lrucache import LRUCache
+
+"""
+Snapshot write time, file size and restore time of an LRUCache, restoring with values decoded lazily from the
+memory-mapped file and eagerly.
+Run with: python -m benchmarks.bench_snapshot
+"""
+
+
+def measure(entries, value_size, lazy, directory):
+    """
+    Fill a cache, snapshot it and restore it into an empty one.
+
+    :return: Tuple of (write seconds, file bytes, restore seconds, seconds to read every value after the restore).
+    """
+    path = os.path.join(directory, f"bench-{lazy}.snapshot")
+    cache = LRUCache(entries, 3600)
+    value = 'x' * value_size
+    cache.put_many({f"key{i}": value for i in range(entries)})
+    start = time.perf_counter()
+    cache.snapshot(path)
+    write_elapsed = time.perf_counter() - start
+    del cache
+    restarted = LRUCache(entries, 3600)
+    start = time.perf_counter()
+    restarted.restore(path, lazy=lazy)
+    restore_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    for entry in restarted.cache.values():
+        entry.value
+    read_elapsed = time.perf_counter() - start
+    size = os.path.getsize(path)
+    del restarted
+    os.remove(path)
+    return write_elapsed, size, restore_elapsed, read_elapsed
+
+
+def run(entries=1000000, value_size=100):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for lazy in (True, False):
+            write_elapsed, size, restore_elapsed, read_elapsed = measure(entries, value_size, lazy, directory)
+            results.append({'entries': entries, 'lazy': lazy, 'write_seconds': write_elapsed, 'file_bytes': size,
+                            'restore_seconds': restore_elapsed, 'read_all_seconds': read_elapsed})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LRUCache snapshot write and restore time')
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--value-size', type=int, default=100)
+    args = parser.parse_args()
+    print(f"{'entries':>9} {'lazy':>5} {'write s':>8} {'file MB':>8} {'restore s':>10} {'read all s':>11}")
+    for row in run(args.entries, args.value_size):
+        print(f"{row['entries']:>9,} {str(row['lazy']):>5} {row['write_seconds']:>8.2f} "
+              f"{row['file_bytes'] / 2 ** 20:>8.1f} {row['restore_seconds']:>10.2f} {row['read_all_seconds']:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
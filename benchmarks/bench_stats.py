@@ -0,0 +1,79 @@
+import argparse
+import time
+from src.cache.geocache import GeoDistributedLRUCache
+from src.messaging import InMemoryTransport
+
+"""
+Overhead of the statistics subsystem: the same workloads with stats disabled and enabled. The get-only loop is the
+worst case, a lookup in a local dictionary costing little more than the counting itself; the mixed loop adds one
+replicated put every ten operations.
+Run with: python -m benchmarks.bench_stats
+"""
+
+
+def build(stats, keys):
+    transport = InMemoryTransport()
+    cache = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=keys, transport=transport, stats=stats)
+    for i in range(keys):
+        cache.put(f"key{i}", i, 'eu-central')
+    transport.join()
+    return cache, transport
+
+
+def loops(cache, names):
+    """
+    :return: Dictionary of the benchmarked loops over a cache.
+    """
+    def gets():
+        for key in names:
+            cache.get(key, 'us-east')
+
+    def puts():
+        for key in names:
+            cache.put(key, 1, 'us-east')
+
+    def mixed():
+        for i, key in enumerate(names):
+            if i % 10:
+                cache.get(key, 'us-east')
+            else:
+                cache.put(key, 1, 'us-east')
+
+    return {'get': gets, 'put': puts, 'mixed': mixed}
+
+
+def run(operations=50000, keys=1000, rounds=7):
+    """
+    Run every loop on a cache without and a cache with stats, alternating between them so that both see the same
+    machine conditions, and keep the best time of each.
+    """
+    names = [f"key{i % (keys * 2)}" for i in range(operations)]  # Half hits, half misses
+    caches = {stats: build(stats, keys) for stats in (False, True)}
+    best = {}
+    for _ in range(rounds):
+        for stats, (cache, transport) in caches.items():
+            for name, loop in loops(cache, names).items():
+                start = time.perf_counter()
+                loop()
+                elapsed = time.perf_counter() - start
+                transport.join()
+                best[name, stats] = min(best.get((name, stats), elapsed), elapsed)
+    for cache, _ in caches.values():
+        cache.messaging.close()
+    return [{'operation': name, 'stats_off_per_sec': operations / best[name, False],
+             'stats_on_per_sec': operations / best[name, True], 'overhead': best[name, True] / best[name, False] - 1}
+            for name in ('get', 'put', 'mixed')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Overhead of the statistics on get, put and a mixed workload')
+    parser.add_argument('--operations', type=int, default=50000)
+    args = parser.parse_args()
+    print(f"{'operation':>9} {'stats off/s':>12} {'stats on/s':>12} {'overhead':>9}")
+    for row in run(args.operations):
+        print(f"{row['operation']:>9} {row['stats_off_per_sec']:>12,.0f} {row['stats_on_per_sec']:>12,.0f} "
+              f"{row['overhead']:>9.1%}")
+
+
+if __name__ == '__main__':
+    main()
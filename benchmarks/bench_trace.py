@@ -0,0 +1,65 @@
+import argparse
+import os
+import tempfile
+import time
+from src.cache.lrucache import LRUCache
+from src.cache.mrc import miss_ratio_curves
+from src.cache.trace import TraceRecorder
+from .workloads import zipf
+
+"""
+Cost of recording an access trace on LRUCache reads and writes, and accuracy of the miss-ratio curves replayed from
+traces sampled at several rates, against the miss ratio of LRU caches serving the same accesses.
+Run with: python -m benchmarks.bench_trace
+"""
+
+
+def serve(cache, accesses):
+    """
+    Serve accesses from a cache loading every miss.
+
+    :return: Tuple of (microseconds per access, miss ratio).
+    """
+    misses = 0
+    start = time.perf_counter()
+    for key in accesses:
+        if cache.get(key) == -1:
+            misses += 1
+            cache.put(key, key)
+    return (time.perf_counter() - start) / len(accesses) * 1e6, misses / len(accesses)
+
+
+def run(keys=100000, operations=500000, rates=(0.001, 0.01, 0.1), capacities=(1000, 10000, 50000), repeat=3):
+    accesses = zipf(keys, operations)
+    exact = {capacity: serve(LRUCache(capacity), accesses)[1] for capacity in capacities}
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trace.bin')
+        for rate in rates:
+            baseline = access_us = float('inf')
+            for _ in range(repeat):  # Alternated and best of repeat, the difference is small next to the noise
+                baseline = min(baseline, serve(LRUCache(keys), accesses)[0])
+                recorder = TraceRecorder(path, rate, capacity=2 * operations)
+                access_us = min(access_us, serve(LRUCache(keys, trace=recorder), accesses)[0])
+                recorder.close()
+            start = time.perf_counter()
+            curve = miss_ratio_curves(path, capacities)['']['curve']
+            replay = time.perf_counter() - start
+            results.append({'sample_rate': rate, 'access_us': baseline, 'traced_us': access_us, 'replay_s': replay,
+                            'max_error': max(abs(curve[capacity] - exact[capacity]) for capacity in capacities)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tracing overhead and accuracy of sampled miss-ratio curves')
+    parser.add_argument('--keys', type=int, default=100000)
+    parser.add_argument('--operations', type=int, default=500000)
+    args = parser.parse_args()
+    print(f"{'sample rate':>12} {'access us':>10} {'traced us':>10} {'replay s':>9} {'max error':>10}")
+    for row in run(args.keys, args.operations):
+        print(f"{row['sample_rate']:>12} {row['access_us']:>10.3f} {row['traced_us']:>10.3f} "
+              f"{row['replay_s']:>9.2f} {row['max_error']:>10.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+from src.cache.geocache import GeoDistributedLRUCache
+from src.cache.lrucache import LRUCache
+from src.messaging import InMemoryTransport
+from src.utils import LatencyHistogram
+from .workloads import WORKLOADS, keyspace, mix, zipf
+
+"""
+Benchmark suite of the cache and replication path, runnable without a broker: LRUCache microbenchmarks, hit ratio
+and throughput under generated workloads, thread contention on GeoDistributedLRUCache, and replication throughput
+and lag over the in-process transport. Results are written as JSON and can be compared against a stored baseline,
+the run failing when a metric regressed by more than the tolerance. benchmarks/baseline.json is a --quick run of the
+reference machine, only comparable with --quick runs; record one with --output on the machine running the check.
+Run with: python -m benchmarks.suite --quick --baseline benchmarks/baseline.json
+"""
+
+SECTIONS = ('micro', 'workloads', 'contention', 'replication')
+
+
+def metric(value, unit, better='higher'):
+    """
+    :param value: The measured value.
+    :param unit: The unit of the value, for the reports.
+    :param better: 'higher' or 'lower', which direction is an improvement.
+    """
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def best_rate(loop, operations, rounds):
+    """
+    :return: Operations per second of the fastest of several runs of loop, the least disturbed by the machine.
+    """
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        loop()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return operations / best
+
+
+def micro(capacities=(100, 10000, 100000), operations=100000, rounds=5):
+    """
+    LRUCache.get hits and misses, put updates and put inserts evicting the oldest entry, across capacities.
+    """
+    results = {}
+    for capacity in capacities:
+        cache = LRUCache(capacity, 300)
+        present = keyspace(capacity)
+        for key in present:
+            cache.put(key, key)
+        hits = [present[i % capacity] for i in range(operations)]
+        absent = [f"absent{i}" for i in range(operations)]
+        fresh = [f"new{i}" for i in range(operations)]
+        get, put = cache.get, cache.put
+
+        def get_hits():
+            for key in hits:
+                get(key)
+
+        def get_misses():
+            for key in absent:
+                get(key)
+
+        def put_updates():
+            for key in hits:
+                put(key, key)
+
+        def put_inserts():
+            for key in fresh:
+                put(key, key)
+
+        for name, loop in (('get_hit', get_hits), ('get_miss', get_misses), ('put_update', put_updates),
+                           ('put_insert', put_inserts)):
+            results[f"micro/{name}/capacity={capacity}"] = metric(best_rate(loop, operations, rounds), 'ops/s')
+    return results
+
+
+def workloads(keys=10000, capacity=1000, operations=200000, policies=('lru', 'tinylfu'), rounds=3):
+    """
+    Cache-aside runs of every generated workload: a get, and a put on a miss. The hit ratio depends only on the
+    workload and the policy, so it is the most stable metric of the suite.
+    """
+    results = {}
+    for workload, generate in WORKLOADS.items():
+        accesses = generate(keys, operations)
+        for policy in policies:
+            hit_ratio = None
+
+            def loop():
+                nonlocal hit_ratio
+                cache = LRUCache(capacity, 300, policy=policy)
+                get, put = cache.get, cache.put
+                hits = 0
+                for key in accesses:
+                    if get(key) == -1:
+                        put(key, key)
+                    else:
+                        hits += 1
+                hit_ratio = hits / operations
+
+            rate = best_rate(loop, operations, rounds)
+            results[f"workloads/{workload}/{policy}/ops"] = metric(rate, 'ops/s')
+            results[f"workloads/{workload}/{policy}/hit_ratio"] = metric(hit_ratio, 'ratio')
+    return results
+
+
+def _contention_worker(cache, operations, region, barrier):
+    barrier.wait()
+    for operation, key in operations:
+        if operation == 'get':
+            cache.get(key, region)
+        else:
+            cache.put(key, key, region)
+
+
+def contention(thread_counts=(1, 4, 8), operations=20000, keys=10000, write_ratio=0.1, shards=(None, 16)):
+    """
+    Threads issuing a Zipfian read/write mix against one region of a GeoDistributedLRUCache, with the region behind
+    a single lock and sharded. Writes are replicated to a second region.
+    """
+    results = {}
+    for shard_count in shards:
+        for threads in thread_counts:
+            transport = InMemoryTransport()
+            cache = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=keys, shards=shard_count,
+                                           transport=transport)
+            cache.put_many({key: key for key in keyspace(keys)}, 'us-east')
+            barrier = threading.Barrier(threads + 1)
+            workers = [threading.Thread(target=_contention_worker,
+                                        args=(cache, mix(zipf(keys, operations, seed=seed), write_ratio, seed),
+                                              'us-east', barrier))
+                       for seed in range(threads)]
+            for worker in workers:
+                worker.start()
+            barrier.wait()
+            start = time.perf_counter()
+            for worker in workers:
+                worker.join()
+            rate = threads * operations / (time.perf_counter() - start)
+            transport.join()
+            cache.messaging.close()
+            layout = 'locked' if shard_count is None else f"shards={shard_count}"
+            results[f"contention/{layout}/threads={threads}"] = metric(rate, 'ops/s')
+    return results
+
+
+def replication(region_counts=(2, 4), writes=10000):
+    """
+    Writes from one region until every other region applied them: accepted and replicated writes per second, and
+    the lag between a put and its application in another region.
+    """
+    results = {}
+    for count in region_counts:
+        regions = [f"region-{i}" for i in range(count)]
+        for batching in (False, True):
+            transport = InMemoryTransport()
+            cache = GeoDistributedLRUCache(regions, capacity=writes, batching=batching, transport=transport,
+                                           stats=True)
+            cache.stats_data.sample_rate = cache.stats_data.countdown = 1  # Timestamp every write
+            start = time.perf_counter()
+            for i in range(writes):
+                cache.put(f"key{i}", i, regions[0])
+            put_elapsed = time.perf_counter() - start
+            cache.messaging.flush()
+            transport.join()
+            total_elapsed = time.perf_counter() - start
+            cache.messaging.close()
+            lag = LatencyHistogram()
+            for region in regions[1:]:
+                lag.merge(cache.stats_data.region(region).replication_lag)
+            name = f"replication/regions={count}/{'batched' if batching else 'direct'}"
+            results[f"{name}/put"] = metric(writes / put_elapsed, 'writes/s')
+            results[f"{name}/replicated"] = metric(writes / total_elapsed, 'writes/s')
+            results[f"{name}/lag_p50"] = metric(lag.percentile(50), 's', 'lower')
+            results[f"{name}/lag_p99"] = metric(lag.percentile(99), 's', 'lower')
+    return results
+
+
+def run(sections=SECTIONS, quick=False):
+    """
+    :param sections: The sections to run, from SECTIONS.
+    :param quick: Run every section on a tenth of the operations, for a smoke test.
+    :return: Dictionary of the run environment ('meta') and the metrics by name ('metrics').
+    """
+    scale = 10 if quick else 1
+    runners = {
+        'micro': lambda: micro(operations=100000 // scale),
+        'workloads': lambda: workloads(operations=200000 // scale),
+        'contention': lambda: contention(operations=20000 // scale),
+        'replication': lambda: replication(writes=10000 // scale),
+    }
+    metrics = {}
+    for section in sections:
+        metrics.update(runners[section]())
+    return {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'time': time.time(),
+                     'quick': quick},
+            'metrics': metrics}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the metrics of a run against a baseline run.
+
+    :param results: The current run, as returned by run().
+    :param baseline: The baseline run, in the same format.
+    :param tolerance: Relative change allowed in the worse direction, 0.25 accepts 25% less throughput.
+    :return: List of (name, baseline value, current value, relative change) of the regressed metrics. Metrics
+    missing from either side are ignored.
+    """
+    regressions = []
+    for name, current in results['metrics'].items():
+        reference = baseline['metrics'].get(name)
+        if reference is None or not reference['value']:
+            continue
+        change = current['value'] / reference['value'] - 1
+        worse = -change if current['better'] == 'higher' else change
+        if worse > tolerance:
+            regressions.append((name, reference['value'], current['value'], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cache and replication benchmark suite with baseline comparison')
+    parser.add_argument('--sections', default=','.join(SECTIONS), help='Comma-separated sections to run')
+    parser.add_argument('--quick', action='store_true', help='Run a tenth of the operations')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against the results stored in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Relative regression allowed per metric')
+    args = parser.parse_args()
+    sections = [section for section in args.sections.split(',') if section]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('quick', False) != args.quick:
+            parser.error(f"{args.baseline} was recorded {'without' if args.quick else 'with'} --quick, rerun it "
+                         f"the same way or record a new baseline with --output")
+    results = run(sections, args.quick)
+    for name, result in results['metrics'].items():
+        value = result['value']
+        print(f"{name:<48} {value:>14,.0f} {result['unit']}" if value >= 100 else
+              f"{name:<48} {value:>14.6f} {result['unit']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:,.6g} -> {after:,.6g} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import bisect
+import itertools
+import random
+
+"""
+Key access generators for the benchmarks. Every generator is seeded and returns a list, so that runs replay exactly
+the same sequence and the generation cost stays out of the timed loops.
+"""
+
+
+def keyspace(keys):
+    """
+    :param keys: Number of distinct keys.
+    :return: The key names.
+    """
+    return [f"key{i}" for i in range(keys)]
+
+
+def uniform(keys, operations, seed=0):
+    """
+    Every key is equally likely.
+
+    :param keys: Number of distinct keys.
+    :param operations: Number of accesses.
+    :param seed: Seed of the random generator.
+    :return: List of keys.
+    """
+    names = keyspace(keys)
+    rng = random.Random(seed)
+    return [names[rng.randrange(keys)] for _ in range(operations)]
+
+
+def zipf(keys, operations, skew=0.99, seed=0):
+    """
+    The key of rank i is accessed with a probability proportional to 1 / i ** skew, the usual model of a cache
+    workload where a few keys take most of the traffic. Ranks are shuffled over the key names so that popularity does
+    not follow insertion order.
+
+    :param keys: Number of distinct keys.
+    :param operations: Number of accesses.
+    :param skew: Zipf exponent, 0 is uniform and higher values concentrate the accesses.
+    :param seed: Seed of the random generator.
+    :return: List of keys.
+    """
+    names = keyspace(keys)
+    rng = random.Random(seed)
+    rng.shuffle(names)
+    weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, keys + 1)))
+    total = weights[-1]
+    return [names[bisect.bisect_left(weights, rng.random() * total)] for _ in range(operations)]
+
+
+def scan(keys, operations):
+    """
+    Sequential passes over the whole key space, the worst case of LRU when the key space exceeds the capacity.
+
+    :param keys: Number of distinct keys.
+    :param operations: Number of accesses.
+    :return: List of keys.
+    """
+    names = keyspace(keys)
+    return [names[i % keys] for i in range(operations)]
+
+
+def scan_with_hot_set(keys, operations, hot_keys, scan_ratio=0.5, skew=0.99, seed=0):
+    """
+    Zipfian accesses to a small hot set interleaved with a scan of cold keys, which tells apart the policies that
+    resist scans from plain LRU.
+
+    :param keys: Number of distinct cold keys scanned.
+    :param operations: Number of accesses.
+    :param hot_keys: Number of distinct hot keys.
+    :param scan_ratio: Fraction of the accesses that belong to the scan.
+    :param skew: Zipf exponent of the hot set.
+    :param seed: Seed of the random generator.
+    :return: List of keys.
+    """
+    rng = random.Random(seed)
+    hot = iter(zipf(hot_keys, operations, skew, seed))
+    cold = iter(scan(keys, operations))
+    return [f"cold-{next(cold)}" if rng.random() < scan_ratio else next(hot) for _ in range(operations)]
+
+
+def mix(accesses, write_ratio=0.1, seed=0):
+    """
+    Turn a key sequence into a read/write mix.
+
+    :param accesses: List of keys, e.g. from zipf or uniform.
+    :param write_ratio: Fraction of the operations that are writes.
+    :param seed: Seed of the random generator.
+    :return: List of (operation, key) tuples, operation being 'get' or 'put'.
+    """
+    rng = random.Random(seed)
+    return [('put' if rng.random() < write_ratio else 'get', key) for key in accesses]
+
+
+WORKLOADS = {
+    'uniform': lambda keys, operations, seed=0: uniform(keys, operations, seed=seed),
+    'zipf': lambda keys, operations, seed=0: zipf(keys, operations, seed=seed),
+    'scan': lambda keys, operations, seed=0: scan(keys, operations),
+    'scan+hot': lambda keys, operations, seed=0: scan_with_hot_set(keys, operations, max(1, keys // 10), seed=seed),
+}
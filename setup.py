@@ -19,5 +19,6 @@ setup(
     keywords='lru cache redis',
     author='Lenny Siemeni',
     test_suite='tests',
-    install_requires=['']
+    install_requires=[''],
+    extras_require={'async': ['aio-pika>=9']}
 )
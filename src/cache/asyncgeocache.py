@@ -0,0 +1,144 @@
+import asyncio
+from functools import partial
+from .entry import MISS, STALE
+from .geocache import GeoDistributedLRUCache
+from ..messaging import AsyncRabbitMQTransport, AsyncTransport
+
+"""
+This class is the asyncio front end of GeoDistributedLRUCache. The region caches answer in microseconds and are used
+from the event loop directly, while replication goes through an AsyncTransport: publishing only queues the message,
+one task of the loop per region consumes, and writers wait, without blocking the loop, while the transport holds too
+many undelivered messages. Loaders are blocking calls, they run in the default executor of the loop, stale refreshes
+included, started by tasks of the loop rather than threads of their own.
+"""
+
+
+class AsyncGeoDistributedLRUCache:
+    def __init__(self, regions, capacity=5, expiration_time=300, transport=None, **options):
+        """
+        Initialize the asyncio Geo Distributed LRU Cache. It must be created from a coroutine, its consumers are
+        tasks of the running event loop.
+
+        :param regions: List of region names (e.g., 'us-east', 'eu-central').
+        :param capacity: The capacity of the LRU cache in each region.
+        :param expiration_time: The time after which a cache entry expires.
+        :param transport: The AsyncTransport replicating updates between regions (e.g. an AsyncInMemoryTransport),
+        an AsyncRabbitMQTransport by default.
+        :param options: Other options of GeoDistributedLRUCache, e.g. shards, policy, codec, partitioned, stats.
+        Batching and the outbox do not apply, publishing never waits for the broker already.
+        """
+        if options.get('batching') or options.get('outbox'):
+            raise ValueError("The asyncio cache publishes through its transport queues, without batching or outbox")
+        if transport is None:
+            transport = AsyncRabbitMQTransport()
+        elif not isinstance(transport, AsyncTransport):
+            raise ValueError("The asyncio cache needs an AsyncTransport")
+        self.transport = transport
+        self.cache = GeoDistributedLRUCache(regions, capacity, expiration_time, transport=transport, batching=False,
+                                            outbox=False, **options)
+        self.regions = self.cache.regions
+        self.refreshes = set()  # Tasks refreshing stale values, referenced until they are done
+
+    async def get(self, key: str, region: str):
+        """
+        Retrieve a value, see GeoDistributedLRUCache.get. With a stale grace window, a stale value is returned and
+        refreshed by a task of the loop. Misses are never loaded, see get_or_load.
+
+        :return: The value associated with the key, or -1 if not found or expired.
+        """
+        if not self.cache.stale_grace:
+            return self.cache.get(key, region)
+        result = self.cache.lookup(key, region)
+        if result.state == STALE:
+            self.cache.revalidate(key, region, result, start=self._start_refresh)
+        return result.value
+
+    async def get_with_state(self, key: str, region: str, loader=None, ttl=None):
+        """
+        Retrieve a value and tell whether it is fresh or stale, see GeoDistributedLRUCache.get_with_state. A stale
+        value is refreshed by a task of the loop, and the refresh and the load of a miss run in the default executor
+        of the loop, so a blocking loader does not stall the other requests.
+
+        :return: A CacheResult of the value, -1 on a miss without loader, and its state.
+        :raises CacheLoadError: If the key had to be loaded and the loader failed.
+        """
+        result = self.cache.lookup(key, region)
+        if result.state != MISS or (loader or self.cache.loader) is None:
+            return self.cache.revalidate(key, region, result, loader, ttl, self._start_refresh)
+        await self.transport.wait_writable()  # The loaded value is replicated
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(self.cache.revalidate, key, region, result, loader, ttl))
+
+    def _start_refresh(self, refresh):
+        """
+        Run the refresh of a stale value from a task of the loop.
+
+        :param refresh: Callable without arguments loading and storing the value, see GeoDistributedLRUCache.
+        """
+        task = asyncio.get_running_loop().create_task(self._refresh(refresh))
+        self.refreshes.add(task)
+        task.add_done_callback(self.refreshes.discard)
+
+    async def _refresh(self, refresh):
+        await self.transport.wait_writable()  # The refreshed value is replicated
+        await asyncio.get_running_loop().run_in_executor(None, refresh)
+
+    async def get_many(self, keys, region: str):
+        """
+        Retrieve several keys from a region, see GeoDistributedLRUCache.get_many.
+
+        :return: A dictionary of the keys found and their values.
+        """
+        return self.cache.get_many(keys, region)
+
+    async def put(self, key: str, value: str, region: str, ttl=None):
+        """
+        Add or update a key-value pair in its region and queue its replication, once the transport has room.
+
+        :param key: The key to add or update.
+        :param value: The value to associate with the key.
+        :param region: The region where the write originates.
+        :param ttl: Time in seconds after which this entry expires, defaults to the cache expiration time.
+        """
+        await self.transport.wait_writable()
+        self.cache.put(key, value, region, ttl)
+
+    async def put_many(self, mapping, region: str, ttl=None):
+        """
+        Add or update several key-value pairs, see GeoDistributedLRUCache.put_many, once the transport has room.
+        """
+        await self.transport.wait_writable()
+        self.cache.put_many(mapping, region, ttl)
+
+    async def get_or_load(self, key: str, region: str, loader=None, ttl=None):
+        """
+        Retrieve a value, loading it in the default executor of the loop on a miss, see
+        GeoDistributedLRUCache.get_or_load.
+
+        :return: The cached or loaded value.
+        :raises CacheLoadError: If the loader failed, now or less than negative_ttl seconds ago.
+        """
+        if (loader or self.cache.loader) is None:
+            raise ValueError("get_or_load needs a loader")
+        return (await self.get_with_state(key, region, loader, ttl)).value
+
+    async def flush(self):
+        """
+        Wait until every update published so far was delivered.
+        """
+        await self.transport.join()
+
+    def stats(self):
+        """
+        :return: The statistics of the cache, see GeoDistributedLRUCache.stats.
+        """
+        return self.cache.stats()
+
+    async def close(self):
+        """
+        Wait for the running refreshes, then close the cache and wait for the tasks of its transport.
+        """
+        if self.refreshes:
+            await asyncio.gather(*self.refreshes, return_exceptions=True)
+        self.cache.close()
+        await self.transport.wait_closed()
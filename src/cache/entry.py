@@ -0,0 +1,85 @@
+from collections import namedtuple
+from ..utils import CompressedValue, decompress_value
+
+"""This file contains the CacheEntry class, the compact record stored for every item of an LRUCache, its
+CompressedEntry variant, and the CacheResult returned by the lookups that tell fresh values from stale ones."""
+
+FRESH, STALE, MISS = 'fresh', 'stale', 'miss'
+
+
+class CacheEntry:
+    """
+    A cache item. Slots avoid the per-instance __dict__, so an entry costs a fixed, small amount of memory and
+    updating an existing key rewrites its fields in place instead of allocating a new record.
+    """
+    __slots__ = ('key', 'value', 'expires_at', 'bucket', 'version')
+
+    def __init__(self, key, value, expires_at, version=0):
+        """
+        Initialize a Cache Entry.
+
+        :param key: Key of the item.
+        :param value: Value of the item.
+        :param expires_at: Time after which the item is expired.
+        :param version: Version of the write that stored the value, see HybridLogicalClock. 0 when unversioned.
+        """
+        self.key = key
+        self.value = value
+        self.expires_at = expires_at
+        self.bucket = None  # Timer wheel bucket holding the entry, see TimerWheel
+        self.version = version
+
+    def __repr__(self):
+        return (f"CacheEntry(key={self.key!r}, value={self.value!r}, expires_at={self.expires_at}, "
+                f"version={self.version})")
+
+    @property
+    def compressed(self):
+        return False
+
+
+_value_slot = CacheEntry.value  # The slot descriptor of CacheEntry, wrapped by CompressedEntry
+
+
+class CompressedEntry(CacheEntry):
+    """
+    An entry of a compressing cache. Its value slot may hold a CompressedValue, decompressed on every read so that
+    only the compressed bytes stay in memory. Entries of other caches read their slot directly.
+    """
+    __slots__ = ()
+
+    @property
+    def value(self):
+        value = _value_slot.__get__(self)
+        return decompress_value(value) if value.__class__ is CompressedValue else value
+
+    @value.setter
+    def value(self, value):
+        _value_slot.__set__(self, value)
+
+    @property
+    def stored(self):
+        """
+        :return: The value as stored, a CompressedValue if it was compressed.
+        """
+        return _value_slot.__get__(self)
+
+    @property
+    def compressed(self):
+        return _value_slot.__get__(self).__class__ is CompressedValue
+
+
+class CacheResult(namedtuple('CacheResult', ('value', 'state'))):
+    """
+    Outcome of a lookup: the value, or -1 on a miss, and its state, FRESH, STALE (expired but within the grace
+    window) or MISS.
+    """
+    __slots__ = ()
+
+    @property
+    def fresh(self):
+        return self.state == FRESH
+
+    @property
+    def stale(self):
+        return self.state == STALE
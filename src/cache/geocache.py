@@ -1,7 +1,32 @@
+from .entry import CacheResult, FRESH, STALE
+from .hotkeys import HotKeys
+from .loader import LoaderStats, SingleFlight
 from .lrucache import LRUCache
+from .merkle import MerkleTree
+from .shardedcache import ShardedLRUCache
+from .sharedcache import SharedMemoryLRUCache
+from .snapshot import write_snapshot
+from .trace import TRACE_DELETE, TRACE_GET, TRACE_PUT, TraceRecorder
+from ..exceptions import CacheCapacityError, CacheLoadError
 from ..messaging import Messaging, CircuitBreaker
-from threading import Lock
+from ..utils import (ANTI_ENTROPY_DEPTH, ANTI_ENTROPY_INTERVAL, CACHE_COMPRESSION, CACHE_COMPRESSION_THRESHOLD,
+                     CACHE_EVICTION_POLICY, CACHE_SNAPSHOT_DIRECTORY,
+                     CACHE_STALE_GRACE, CACHE_STALE_GRACE_OPEN_FACTOR, HLC_NODE_ID, HOT_KEYS,
+                     HOT_KEY_REPLICATION_INTERVAL,
+                     INVALIDATION_PREFIXES, NEGATIVE_CACHE_TTL,
+                     OUTBOX_SPILL_PATH, REPLICATION_BATCHING, REPLICATION_OUTBOX,
+                     REPLICATION_CODEC, REPLICATION_FACTOR, STATS_ENABLED, CacheStats, ConsistentHashRing,
+                     HybridLogicalClock, LatencyTracker, LATENCY_PROBE_INTERVAL, serialize_data, deserialize_data,
+                     is_serialized, check_codec, compress_value, decompress_value)
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from functools import partial
+from threading import Event, Lock, Thread
+from time import perf_counter
 import json
+import logging
+import os
+import time
 
 """
 This class is responsible for managing the cache for each region.
@@ -11,50 +36,1222 @@ and the messaging system for cross-region replication.
 
 
 class GeoDistributedLRUCache:
-    def __init__(self, regions, capacity=5, expiration_time=300):
+    def __init__(self, regions, capacity=5, expiration_time=300, shards=None, batching=REPLICATION_BATCHING,
+                 codec=REPLICATION_CODEC, policy=CACHE_EVICTION_POLICY, transport=None, partitioned=False,
+                 replication_factor=REPLICATION_FACTOR, distances=None, loader=None,
+                 negative_ttl=NEGATIVE_CACHE_TTL, stale_grace=CACHE_STALE_GRACE, stats=STATS_ENABLED,
+                 anti_entropy=False, anti_entropy_interval=ANTI_ENTROPY_INTERVAL, shared_memory=None, consume=True,
+                 hosts=None, probe_interval=LATENCY_PROBE_INTERVAL, hedge=False, compression=CACHE_COMPRESSION,
+                 compression_threshold=CACHE_COMPRESSION_THRESHOLD, max_bytes=None,
+                 invalidation_prefixes=INVALIDATION_PREFIXES, outbox=REPLICATION_OUTBOX,
+                 outbox_spill=OUTBOX_SPILL_PATH, trace=None, hot_keys=HOT_KEYS,
+                 hot_key_interval=HOT_KEY_REPLICATION_INTERVAL, node_id=HLC_NODE_ID):
         """
         Initialize the Geo Distributed LRU Cache.
 
         :param regions: List of region names (e.g., 'us-east', 'eu-central').
         :param capacity: The capacity of the LRU cache in each region.
         :param expiration_time: The time after which a cache entry expires.
+        :param shards: When set, each region uses a ShardedLRUCache with this many independently locked segments
+        instead of a single LRUCache behind one region lock.
+        :param batching: Buffer replication updates and publish them as coalesced batches, see ReplicationBatcher.
+        :param codec: Wire format of outgoing replication messages, 'binary' or 'json'. Incoming messages are
+        decoded whatever their format.
+        :param policy: Eviction policy of the region caches, a name ('lru', 'slru', '2q', 'arc', 'tinylfu') or an
+        EvictionPolicy subclass. Every region gets its own instance.
+        :param transport: The Transport replicating updates between regions (e.g. an InMemoryTransport), RabbitMQ
+        by default.
+        :param partitioned: Store each key only in the replication_factor regions that own it on a consistent-hashing
+        ring, instead of in every region. Writes are sent to the owners only and reads of a key a region does not
+        own are served by the nearest owner.
+        :param replication_factor: Number of regions owning each key in partitioned mode.
+        :param distances: Mapping of (from region, to region) to a network cost such as a latency, used to pick the
+        nearest owner. Without it the owners are tried in ring order.
+        :param loader: Callable receiving a key and returning its value from the backing store, used by get_or_load
+        on a miss.
+        :param negative_ttl: Time in seconds a load error is remembered, during which get_or_load fails fast
+        instead of calling the loader again.
+        :param stale_grace: Stale-while-revalidate window in seconds. A key expired for less than this is still
+        returned, as stale, while one background call to the loader refreshes it. The window grows by
+        CACHE_STALE_GRACE_OPEN_FACTOR while the circuit breaker is open. 0 disables stale reads.
+        :param stats: Keep per-region counters and latency histograms, see stats(). Replication messages then carry
+        their origin timestamp to measure the replication lag.
+        :param anti_entropy: Keep a Merkle digest of every region, so that resync can bring a region that missed
+        replication messages back in sync by copying only the differing items. Costs a key hash per write.
+        :param anti_entropy_interval: With anti_entropy, time in seconds between background rounds resyncing every
+        region with its neighbour, 0 leaves resync to the caller.
+        :param shared_memory: When set, each region uses a SharedMemoryLRUCache in the block named
+        '<shared_memory>-<region>', so that the worker processes of a host share one copy of every region instead of
+        holding one each. Eviction is then CLOCK whatever the policy.
+        :param consume: Consume the replication messages of the regions. With shared_memory, exactly one process of
+        the host should consume them and apply them to the shared caches, the others only publish.
+        :param hosts: Mapping of region to the host name, or (host, port) tuple, probed to measure its latency, see
+        probe_latency.
+        :param probe_interval: With hosts, time in seconds between background latency probes, 0 leaves probing to
+        the caller.
+        :param hedge: Hedge the fallback reads of get_routed by default.
+        :param compression: Codec compressing the values of at least compression_threshold bytes, 'zlib', 'lzma' or
+        None, or a mapping of region to codec, e.g. lzma for a region holding cold data. A value is compressed once
+        by the region where it is written and replicated compressed, regions with another codec convert it.
+        :param compression_threshold: Encoded size in bytes from which a value is compressed.
+        :param max_bytes: When set, each region also evicts items while its values take more than this many bytes,
+        counted compressed, see LRUCache.
+        :param invalidation_prefixes: Key prefixes, e.g. of large or rarely read keys, replicated as invalidations
+        rather than values. The region where such a key is written stores it and the others only receive its key and
+        version: they drop an older copy and fetch the value from the writing region on their next read of the key.
+        Other keys stay fully replicated. Full replication mode only.
+        :param outbox: Queue the replication messages in a bounded Outbox sent by a background thread, so that put
+        never waits for the broker. While the broker fails, the publishing circuit breaker of Messaging, apart from
+        the one of the loader, paces the retries and the messages wait, in memory then in outbox_spill.
+        :param outbox_spill: Path of the append-only file receiving the messages overflowing the outbox, replayed in
+        order once the broker is back, also after a restart. None drops the oldest messages instead.
+        :param trace: A TraceRecorder, or the path of the trace file to create, receiving the reads, writes and
+        removals of a sample of the keys in every region, local and replicated. Replay it with mrc.py to size the
+        regions from real traffic.
+        :param hot_keys: Detect the hot keys of every region, see HotKeys. get serves them from a near cache of the
+        process, without locking the region or updating its recency, and put replicates their writes at most once per
+        hot_key_interval, the latest one, instead of once per write. Not with shared_memory, whose regions other
+        processes write to.
+        :param hot_key_interval: Time in seconds during which the writes of a hot key are replicated once.
+        :param node_id: Node identifier of the clock versioning the writes, below 1024 and distinct for every process
+        writing to the regions, see HybridLogicalClock. Random when None, which risks collisions between writers.
         """
-        self.regions = {region: LRUCache(capacity, expiration_time) for region in regions}
-        self.locks = {region: Lock() for region in regions}
+        if codec not in ('binary', 'json'):
+            raise ValueError(f"Unknown replication codec: {codec}")
+        if replication_factor < 1:
+            raise ValueError("The replication factor must be at least 1")
+        if shared_memory and (shards or anti_entropy or compression or max_bytes is not None):
+            raise ValueError("Shared memory region caches are neither sharded, digested for anti-entropy, compressed "
+                             "nor bounded in bytes")
+        if shared_memory and hot_keys:
+            raise ValueError("Shared memory regions are written by other processes, which a near cache would miss")
+        if partitioned and invalidation_prefixes:
+            raise ValueError("Invalidation replication needs full replication mode, partitioned keys have no copies")
+        for region_codec in (compression.values() if isinstance(compression, dict) else (compression,)):
+            check_codec(region_codec)
+        self.codec = codec
+        self.capacity = capacity
+        self.expiration_time = expiration_time
+        self.shards = shards
+        self.policy = policy
+        self.stale_grace = stale_grace
+        self.anti_entropy = anti_entropy
+        self.shared_memory = shared_memory
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.max_bytes = max_bytes
+        self.invalidation_prefixes = tuple(invalidation_prefixes)
+        self.invalidated = {}  # region -> {key: (region holding the value, version)} of the invalidated keys
+        self.invalidated_lock = Lock()
+        self.trackers = {} if hot_keys else None  # region -> HotKeys
+        self.owns_trace = isinstance(trace, (str, os.PathLike))  # A recorder created here is closed with the cache
+        self.trace = TraceRecorder(trace) if self.owns_trace else trace
+        self.regions = {}
+        self.locks = {}
+        for region in regions:
+            self._add_region_cache(region)
+        self.ring = ConsistentHashRing(regions) if partitioned else None
+        self.replication_factor = replication_factor
+        self.distances = distances or {}
+        self.loader = loader
+        self.negative_ttl = negative_ttl
+        self.negative_cache = {}  # key -> (CacheLoadError, time until which it is returned)
+        self.flights = SingleFlight()
+        self.refreshing = set()  # Keys with a background refresh in flight
+        self.refresh_lock = Lock()
+        self.loader_stats = LoaderStats()
+        self.stats_data = CacheStats(regions) if stats else None
         self.circuit_breaker = CircuitBreaker()
-        self.messaging = Messaging(self)
+        self.clock = HybridLogicalClock(node_id)  # Versions every write, see put and update_cache
+        self.batching = batching
+        self.outbox = outbox
+        self.messaging = Messaging(self, batching=batching, transport=transport, consume=consume, outbox=outbox,
+                                   outbox_spill=outbox_spill, debounce_interval=hot_key_interval if hot_keys else None)
+        self.latency = LatencyTracker()  # Smoothed latency of the regions, see get_routed
+        self.hosts = hosts or {}
+        self.hedge = hedge
+        self.hedge_pool = None  # Threads of the hedged reads, started on the first one
+        self.hedge_pool_lock = Lock()
+        self.closed = Event()
+        if anti_entropy and anti_entropy_interval > 0:
+            Thread(target=self._run_anti_entropy, args=(anti_entropy_interval,), daemon=True).start()
+        if self.hosts and probe_interval > 0:
+            Thread(target=self._run_probes, args=(probe_interval,), daemon=True).start()
+
+    def _add_region_cache(self, region):
+        """
+        Create the cache and the lock of a region.
+
+        :param region: The name of the region.
+        """
+        retention = self.stale_grace * CACHE_STALE_GRACE_OPEN_FACTOR  # Longest window an entry may be served in
+        if self.trackers is not None:
+            self.trackers[region] = HotKeys()
+        digest_depth = ANTI_ENTROPY_DEPTH if self.anti_entropy else None
+        storage = {'compression': self._codec(region), 'compression_threshold': self.compression_threshold,
+                   'max_bytes': self.max_bytes}
+        if self.trackers is not None:  # Items deleted, evicted or expired locally leave the near cache too
+            storage['on_remove'] = partial(self._near_discard, region)
+        if self.shared_memory:
+            self.regions[region] = SharedMemoryLRUCache(f"{self.shared_memory}-{region}", self.capacity,
+                                                        self.expiration_time, stale_grace=retention)
+            # The shared cache takes its own cross-process lock
+            self.locks[region] = nullcontext()
+        elif self.shards:
+            self.regions[region] = ShardedLRUCache(self.capacity, self.expiration_time, self.shards, self.policy,
+                                                   stale_grace=retention, digest_depth=digest_depth, **storage)
+            # Sharded regions lock per segment, a region-wide lock would serialize them again
+            self.locks[region] = nullcontext()
+        else:
+            self.regions[region] = LRUCache(self.capacity, self.expiration_time, policy=self.policy,
+                                            stale_grace=retention, digest_depth=digest_depth, **storage)
+            self.locks[region] = Lock()
+
+    def _codec(self, region):
+        """
+        :return: The compression codec of a region, None when its values are not compressed.
+        """
+        if isinstance(self.compression, dict):
+            return self.compression.get(region)
+        return self.compression
+
+    @property
+    def partitioned(self):
+        return self.ring is not None
+
+    def owners(self, key):
+        """
+        :param key: The key to locate.
+        :return: The regions storing the key: its replication_factor owners in partitioned mode, every region
+        otherwise.
+        """
+        if self.ring is None:
+            return list(self.regions)
+        return self.ring.owners(key, self.replication_factor)
+
+    def route(self, key, region):
+        """
+        Select the region serving a read issued in a region.
+
+        :param key: The key to read.
+        :param region: The region where the read originates.
+        :return: The region itself if it stores the key, otherwise the fastest owner, or the nearest one before
+        their latency was observed.
+        """
+        owners = self.owners(key)
+        if region in owners:
+            return region
+        return self.latency.nearest(owners, self.distances, region)
 
     def get(self, key: str, region: str):
         """
-        Retrieve a value from the cache for a given key and region.
+        Retrieve a value from the cache for a given key and region. In partitioned mode a key the region does not
+        own is read from its nearest owner.
 
         :param key: The key to retrieve.
         :param region: The region from which to retrieve the key.
-        :return: The value associated with the key, or -1 if not found or expired.
+        :return: The value associated with the key, or -1 if not found or expired. With a stale grace window, a
+        recently expired value is returned too and refreshed in the background, see get_with_state. Misses are never
+        loaded, see get_or_load.
         """
-        try:
+        if self.trackers is not None:
+            serving = region if self.ring is None else self.route(key, region)
+            tracker = self.trackers[serving]
+            value = tracker.get(key)  # Counts the read, near cache hits too or hot keys would cool down
+            if value != -1:
+                if self.trace is not None:
+                    self.trace.record(key, TRACE_GET, serving)
+                return value
+            if key in tracker.hot:
+                return self._get_hot(key, region, serving, tracker)
+        if self.stale_grace:
+            return self._serve_stale(key, region, self.lookup(key, region))
+        if self.ring is not None:
+            region = self.route(key, region)
+        if self.trace is not None:
+            self.trace.record(key, TRACE_GET, region)
+        if self.invalidation_prefixes and key.startswith(self.invalidation_prefixes):
+            with self.locks[region]:
+                value = self.regions[region].get(key)
+            return self._fetch(key, region) if value == -1 else value
+        stats = self.stats_data
+        if stats is not None:
+            stats.countdown -= 1  # Inlined CacheStats.sample(), this is the hottest path
+            if stats.countdown <= 0:
+                stats.countdown = stats.sample_rate
+                return self._timed_get(key, region, stats.region(region))
+        with self.locks[region]:
             return self.regions[region].get(key)
-        except ConnectionError:
-            return self.regions[region].get_stale_data(key)
 
-    def put(self, key: str, value: str, region: str):
+    def _get_hot(self, key, region, serving, tracker):
+        """
+        Read a hot key missing from the near cache like get does, and store it in the near cache when fresh.
+        """
+        epoch = tracker.epoch  # Read first, a change of the hot keys meanwhile drops the entry
+        result = self.lookup(key, region)
+        if result.state != FRESH:
+            return self._serve_stale(key, region, result)
+        with self.locks[serving]:
+            entry = self.regions[serving].peek(key)
+        if entry is not None and entry.expires_at > time.time():
+            tracker.fill(key, entry, epoch)
+        return result.value
+
+    def _serve_stale(self, key, region, result):
+        """
+        Complete a lookup for get: a stale value is refreshed in the background, a miss is not loaded.
+
+        :return: The value of the CacheResult.
+        """
+        if result.state == STALE:
+            self.revalidate(key, region, result)
+        return result.value
+
+    def _timed_get(self, key, region, region_stats):
+        """
+        Read a key like get does, recording the lock wait and the latency.
+        """
+        start = perf_counter()
+        with self.locks[region]:
+            acquired = perf_counter()
+            value = self.regions[region].get(key)
+        region_stats.lock_wait.record(acquired - start)
+        region_stats.get.record(perf_counter() - start)
+        return value
+
+    def get_routed(self, key: str, region: str, hedge=None):
+        """
+        Retrieve a value from the region where the read originates, or on a miss from the other regions storing the
+        key, fastest first. Useful right after a write, before its replication reached the local region.
+
+        With hedging, a fallback read still unanswered after the usual latency of its region, the
+        HEDGE_PERCENTILE-th percentile of its observed reads, is doubled with a read to the next region and the
+        first value wins, which bounds the tail latency when a region is degraded.
+
+        :param key: The key to retrieve.
+        :param region: The region where the read originates.
+        :param hedge: Hedge the fallback reads, defaults to the hedge setting of the cache.
+        :return: The value associated with the key, or -1 if no region holds it.
+        """
+        owners = self.owners(key)
+        if region in owners:
+            with self.locks[region]:
+                value = self.regions[region].get(key)
+            if value != -1:
+                return value
+        candidates = self.latency.rank([owner for owner in owners if owner != region], self.distances, region)
+        if self.hedge if hedge is None else hedge:
+            value = self._hedged_read(key, candidates)
+        else:
+            value = -1
+            for candidate in candidates:
+                value = self._read_region(key, candidate)
+                if value != -1:
+                    break
+        if value != -1:
+            with self.latency.lock:
+                self.latency.fallbacks += 1
+        return value
+
+    def _read_region(self, key, region):
+        """
+        Read a key from a region, recording the latency of the read.
+        """
+        start = perf_counter()
+        with self.locks[region]:
+            value = self.regions[region].get(key)
+        self.latency.observe(region, perf_counter() - start)
+        return value
+
+    def _hedged_read(self, key, candidates):
+        """
+        Read a key from the first candidate holding it, sending the read to the next candidate as soon as the
+        previous one missed or took longer than its hedge delay.
+        """
+        pool = self._hedge_pool()
+        pending, hedged = {}, set()
+        remaining = list(candidates)
+        while remaining or pending:
+            timeout = None
+            if remaining:
+                region = remaining.pop(0)
+                future = pool.submit(self._read_region, key, region)
+                if pending:
+                    hedged.add(future)
+                pending[future] = region
+                if remaining:
+                    timeout = self.latency.hedge_delay(region)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                value = future.result()
+                if value != -1:
+                    with self.latency.lock:
+                        self.latency.hedges += len(hedged)
+                        self.latency.hedge_wins += future in hedged
+                    return value
+        with self.latency.lock:
+            self.latency.hedges += len(hedged)
+        return -1
+
+    def _hedge_pool(self):
+        with self.hedge_pool_lock:
+            if self.hedge_pool is None:
+                self.hedge_pool = ThreadPoolExecutor(thread_name_prefix='hedged-read')
+            return self.hedge_pool
+
+    def probe_latency(self):
+        """
+        Probe the host of every region and fold the connection latency into its smoothed latency.
+
+        :return: Dictionary of the measured latencies in seconds, None for unreachable regions.
+        """
+        return self.latency.probe(self.hosts)
+
+    def _run_probes(self, interval):
+        while not self.closed.wait(interval):
+            try:
+                self.probe_latency()
+            except Exception as e:  # Keep probing, the next round may succeed
+                logging.error("Latency probe failed: %s", e)
+
+    def get_with_state(self, key: str, region: str, loader=None, ttl=None):
+        """
+        Retrieve a value and tell whether it is fresh or stale (stale-while-revalidate).
+
+        A fresh value is returned as is. A value expired for less than the grace window is returned right away as
+        stale, and unless the circuit breaker is open one background call to the loader refreshes it. On a miss
+        the value is loaded synchronously when there is a loader.
+
+        :param key: The key to retrieve.
+        :param region: The region from which to retrieve the key.
+        :param loader: Callable receiving the key and returning its value, defaults to the cache's loader.
+        :param ttl: Time in seconds after which a loaded entry expires, defaults to the cache expiration time.
+        :return: A CacheResult of the value, -1 on a miss without loader, and its state.
+        :raises CacheLoadError: If the key had to be loaded and the loader failed.
+        """
+        return self.revalidate(key, region, self.lookup(key, region), loader, ttl)
+
+    def lookup(self, key: str, region: str):
+        """
+        Read a key and tell whether it is fresh or stale, without calling a loader. An invalidated key is fetched
+        from the region holding it.
+
+        :param key: The key to retrieve.
+        :param region: The region from which to retrieve the key.
+        :return: A CacheResult of the value, -1 on a miss, and its state.
+        """
+        serving = region if self.ring is None else self.route(key, region)
+        if self.trace is not None:
+            self.trace.record(key, TRACE_GET, serving)
+        if self.stats_data is not None and self.stats_data.sample():
+            region_stats = self.stats_data.region(serving)
+            start = perf_counter()
+            with self.locks[serving]:
+                acquired = perf_counter()
+                result = self.regions[serving].get_with_state(key, self.grace())
+            region_stats.lock_wait.record(acquired - start)
+            region_stats.get.record(perf_counter() - start)
+        else:
+            with self.locks[serving]:
+                result = self.regions[serving].get_with_state(key, self.grace())
+        if result.state != FRESH and self.invalidation_prefixes and key.startswith(self.invalidation_prefixes):
+            value = self._fetch(key, region)
+            if value != -1:
+                return CacheResult(value, FRESH)
+        return result
+
+    def revalidate(self, key: str, region: str, result, loader=None, ttl=None, start=None):
+        """
+        Complete a lookup: a stale value is refreshed in the background unless the circuit breaker is open, a
+        missing one is loaded synchronously.
+
+        :param key: The key looked up.
+        :param region: The region from which the key was looked up.
+        :param result: The CacheResult returned by lookup.
+        :param loader: Callable receiving the key and returning its value, defaults to the cache's loader.
+        :param ttl: Time in seconds after which a loaded entry expires, defaults to the cache expiration time.
+        :param start: Callable receiving the refresh of a stale value, a callable without arguments, and running it
+        in the background. A new thread by default.
+        :return: The CacheResult, or a FRESH one of the loaded value.
+        :raises CacheLoadError: If the key had to be loaded and the loader failed.
+        """
+        if result.state == FRESH:
+            return result
+        loader = loader or self.loader
+        if loader is None:
+            return result
+        if result.state == STALE:
+            self._refresh(key, region, loader, ttl, start)
+            return result
+        return CacheResult(self._load_once(key, region, loader, ttl), FRESH)
+
+    def grace(self):
         """
-        Add or update a key-value pair in the cache and replicate it across regions.
+        :return: The current stale grace window in seconds, stretched while the circuit breaker is open.
+        """
+        if self.stale_grace and self.circuit_breaker.is_open():
+            return self.stale_grace * CACHE_STALE_GRACE_OPEN_FACTOR
+        return self.stale_grace
+
+    def get_or_load(self, key: str, region: str, loader=None, ttl=None):
+        """
+        Retrieve a value, loading it from the backing store on a miss. Concurrent misses on a key share a single
+        call to the loader, and the loaded value is written to the region and replicated like any put.
+
+        :param key: The key to retrieve.
+        :param region: The region from which to retrieve the key.
+        :param loader: Callable receiving the key and returning its value, defaults to the cache's loader.
+        :param ttl: Time in seconds after which the loaded entry expires, defaults to the cache expiration time.
+        :return: The cached or loaded value.
+        :raises CacheLoadError: If the loader failed, now or less than negative_ttl seconds ago.
+        """
+        if (loader or self.loader) is None:
+            raise ValueError("get_or_load needs a loader")
+        return self.get_with_state(key, region, loader, ttl).value
+
+    def _load_once(self, key, region, loader, ttl):
+        """
+        Load a key, or wait for the load of it already in flight.
+        """
+        value, leader = self.flights.do(key, lambda: self._load(key, region, loader, ttl))
+        if not leader:
+            self.loader_stats.record_coalesced()
+        return value
+
+    def _refresh(self, key, region, loader, ttl, start=None):
+        """
+        Reload a stale key in the background, unless a refresh of it is already running or the circuit breaker
+        refuses it. Once the breaker's reset time elapsed, the refresh is its half-open probe.
+
+        :param start: Callable running the refresh, see revalidate, a new thread by default.
+        """
+        with self.refresh_lock:
+            if key in self.refreshing or not self.circuit_breaker.allow_request():
+                return
+            self.refreshing.add(key)
+        refresh = partial(self._run_refresh, key, region, loader, ttl)
+        if start is None:
+            Thread(target=refresh, daemon=True).start()
+        else:
+            start(refresh)
+
+    def _run_refresh(self, key, region, loader, ttl):
+        try:
+            self._load_once(key, region, loader, ttl)
+        except CacheLoadError as e:
+            logging.error("Failed to refresh key %s: %s", key, e)
+        finally:
+            with self.refresh_lock:
+                self.refreshing.discard(key)
+
+    def _load(self, key, region, loader, ttl):
+        """
+        Call the loader for a key and store the result, unless a recent load of the key failed.
+        """
+        failure = self.negative_cache.get(key)
+        if failure is not None:
+            error, until = failure
+            if time.monotonic() < until:
+                self.loader_stats.record_negative_hit()
+                raise error
+            self.negative_cache.pop(key, None)
+        start = time.perf_counter()
+        try:
+            value = loader(key)
+        except Exception as e:
+            self.loader_stats.record_load(time.perf_counter() - start, failed=True)
+            self.circuit_breaker.record_failure()
+            error = CacheLoadError(f"Failed to load key {key}: {e}")
+            error.__cause__ = e
+            self._remember_failure(key, error)
+            raise error
+        self.loader_stats.record_load(time.perf_counter() - start)
+        self.circuit_breaker.record_success()
+        self.put(key, value, region, ttl)
+        return value
+
+    def _remember_failure(self, key, error):
+        """
+        Negative-cache a load error, dropping the outdated ones once there are more of them than the capacity.
+        """
+        now = time.monotonic()
+        if len(self.negative_cache) >= self.capacity:
+            for stale in [k for k, (_, until) in list(self.negative_cache.items()) if until <= now]:
+                self.negative_cache.pop(stale, None)
+        self.negative_cache[key] = (error, now + self.negative_ttl)
+
+    def put(self, key: str, value: str, region: str, ttl=None, *, version=None):
+        """
+        Add or update a key-value pair in the region where the write originates, and replicate it to the other
+        regions (to the other owners of the key in partitioned mode).
 
         :param key: The key to add or update.
         :param value: The value to associate with the key.
         :param region: The region where the write originates.
+        :param ttl: Time in seconds after which this entry expires, defaults to the cache expiration time.
+        :param version: Version of the write, a new one from the cache's HybridLogicalClock by default. Regions keep
+        the value with the highest version whatever the order messages arrive in.
         """
-        message = json.dumps({'key': key, 'value': value})
-        self.messaging.publish_update(message, region)
+        if version is None:
+            version = self.clock.now()
+        written = value
+        if self.compression:
+            codec = self._codec(region)
+            if codec is not None:  # Compressed once here, stored and replicated compressed
+                value = compress_value(value, codec, self.compression_threshold)[0]
+        record = {'key': key, 'value': value, 'version': version}
+        if ttl is not None:
+            record['ttl'] = ttl
+        region_stats = start = None
+        if self.stats_data is not None:
+            region_stats = self.stats_data.region(region)
+            region_stats.puts += 1
+            if self.stats_data.sample():
+                start = perf_counter()
+                record['ts'] = time.time()  # Lets the receiving regions measure the replication lag
+        owners = None if self.ring is None else self.owners(key)
+        if self.trace is not None and (owners is None or region in owners):
+            self.trace.record(key, TRACE_PUT, region, self.expiration_time if ttl is None else ttl)
+        if owners is None or region in owners:
+            with self.locks[region]:
+                applied = self.regions[region].put_if_newer(key, value, version, ttl)
+            if applied and self.trackers is not None:
+                self._near_update(region, key, written, ttl, version)
+        if self.invalidation_prefixes and key.startswith(self.invalidation_prefixes):
+            record = self._invalidation(record, region)
+        if self.trackers is not None:
+            tracker = self.trackers[region]
+            tracker.offer(key)
+            if key in tracker.hot:  # Rewritten often: replicate its latest write once per interval
+                self.messaging.debounce_update(record, region, owners)
+                record = None
+        if record is not None:
+            self._replicate([record], region, owners)
+        if start is not None:
+            region_stats.put.record(perf_counter() - start)
+
+    def _near_update(self, region, key, value, ttl, version):
+        """
+        Pass a write applied to a region to its near cache, which keeps it when the key is hot.
+        """
+        self.trackers[region].update(key, value, time.time() + (self.expiration_time if ttl is None else ttl), version)
+
+    def _near_discard(self, region, key):
+        """
+        Drop a key removed from a region cache from its near cache. Called with the lock of the region cache held.
+        """
+        tracker = self.trackers.get(region)
+        if tracker is not None:
+            tracker.discard(key)
+
+    def _near_clear(self, region):
+        """
+        Empty the near cache of a region after items were written to it in bulk.
+        """
+        if self.trackers is not None:
+            self.trackers[region].clear()
+
+    @staticmethod
+    def _invalidation(record, region):
+        """
+        :return: The invalidation replacing an update of a key replicated lazily: its key, version, and the region
+        now holding its value.
+        """
+        invalidation = {'key': record['key'], 'version': record['version'], 'invalidate': region}
+        if 'ts' in record:
+            invalidation['ts'] = record['ts']
+        return invalidation
+
+    def _fetch(self, key, region):
+        """
+        Fetch the value of an invalidated key from the region holding it and store it in the region reading it.
+
+        :return: The value, or -1 if the key was not invalidated or the region holding it no longer has it.
+        """
+        with self.invalidated_lock:
+            source, version = self.invalidated.get(region, {}).pop(key, (None, None))
+        if source is None or source not in self.regions:
+            return -1
+        with self.locks[source]:
+            entry = self.regions[source].peek(key)
+            if entry is None or entry.version < version:
+                return -1
+            value, expires_at, version = entry.value, entry.expires_at, entry.version
+        now = time.time()
+        if expires_at <= now:
+            return -1
+        with self.locks[region]:
+            self.regions[region].put_if_newer(key, value, version, expires_at - now)
+        if self.stats_data is not None:
+            self.stats_data.region(region).fetches += 1
+        return value
+
+    def _replicate(self, records, region, targets=None):
+        """
+        Send updates to other regions, buffered when batching is on.
+
+        :param records: List of updates.
+        :param region: The region where the updates originate, it never receives them.
+        :param targets: The destination regions, every region by default.
+        """
+        extra = () if targets is None else (targets,)
+        if self.batching:
+            for record in records:
+                self.messaging.buffer_update(record, region, *extra)
+        else:
+            self.messaging.publish_update(self.encode_updates(records), region, *extra)
+
+    def get_many(self, keys, region: str):
+        """
+        Retrieve several keys from a region under a single acquisition of the region lock. In partitioned mode the
+        keys are grouped by the region serving them and each group is read under that region's lock.
+
+        :param keys: The keys to retrieve.
+        :param region: The region from which to retrieve the keys.
+        :return: A dictionary of the keys found and their values. Missing and expired keys are left out.
+        """
+        if self.ring is None:
+            groups = {region: keys}
+        else:
+            groups = {}
+            for key in keys:
+                groups.setdefault(self.route(key, region), []).append(key)
+        found = {}
+        for serving, serving_keys in groups.items():
+            if self.trace is not None:
+                for key in serving_keys:
+                    self.trace.record(key, TRACE_GET, serving)
+            with self.locks[serving]:
+                serving_found = self.regions[serving].get_many(serving_keys)
+            found.update(serving_found)
+        if self.invalidation_prefixes:
+            for key in keys:
+                if key not in found and key.startswith(self.invalidation_prefixes):
+                    value = self._fetch(key, region)
+                    if value != -1:
+                        found[key] = value
+        return found
+
+    def put_many(self, mapping, region: str, ttl=None):
+        """
+        Add or update several key-value pairs. They are written to the originating region under a single
+        acquisition of its lock, and replicated as one message per remote region.
+
+        :param mapping: Dictionary of the keys and values to write.
+        :param region: The region where the write originates.
+        :param ttl: Time in seconds after which these entries expire, defaults to the cache expiration time.
+        """
+        if not mapping:
+            return
+        version = self.clock.now()  # One version for the whole call, keys are versioned independently
+        written = mapping
+        codec = self._codec(region) if self.compression else None
+        if codec is not None:
+            mapping = {key: compress_value(value, codec, self.compression_threshold)[0]
+                       for key, value in mapping.items()}
+        records = [{'key': key, 'value': value, 'version': version} for key, value in mapping.items()]
+        if ttl is not None:
+            for record in records:
+                record['ttl'] = ttl
+        if self.stats_data is not None:
+            self.stats_data.region(region).puts += len(records)
+            records[0]['ts'] = time.time()  # One timestamp per call is enough to sample the replication lag
+        if self.ring is None:
+            self._trace_puts(mapping, region, ttl)
+            with self.locks[region]:
+                self.regions[region].put_many(mapping, ttl, version)
+            if self.invalidation_prefixes:
+                records = [self._invalidation(record, region) if record['key'].startswith(self.invalidation_prefixes)
+                           else record for record in records]
+            if self.trackers is not None:
+                self._near_puts(written, written, region, ttl, version)
+                records = self._debounce_hot(records, region)
+            if records:
+                self._replicate(records, region)
+            return
+        local, outgoing = {}, {}
+        for record in records:
+            for owner in self.owners(record['key']):
+                if owner == region:
+                    local[record['key']] = record['value']
+                else:
+                    outgoing.setdefault(owner, []).append(record)
+        if local:
+            self._trace_puts(local, region, ttl)
+            with self.locks[region]:
+                self.regions[region].put_many(local, ttl, version)
+        if self.trackers is not None:
+            self._near_puts(written, local, region, ttl, version)
+            outgoing = {target: self._debounce_hot(target_records, region, [target])
+                        for target, target_records in outgoing.items()}
+        for target, target_records in outgoing.items():
+            if target_records:
+                self._replicate(target_records, region, [target])
+
+    def _near_puts(self, mapping, local, region, ttl, version):
+        """
+        Count the writes of several keys in the hot key detection of the region they originate in, and pass those
+        written to the region to its near cache.
+
+        :param mapping: Dictionary of the keys and uncompressed values written.
+        :param local: The keys written to the region.
+        """
+        tracker = self.trackers[region]
+        expires_at = time.time() + (self.expiration_time if ttl is None else ttl)
+        for key in mapping:
+            tracker.offer(key)
+        for key in local:
+            tracker.update(key, mapping[key], expires_at, version)
+
+    def _debounce_hot(self, records, region, targets=None):
+        """
+        Replicate the updates of the hot keys of a region once per interval, see Messaging.debounce_update.
+
+        :return: The other updates, to replicate now.
+        """
+        hot = self.trackers[region].hot
+        if not hot:
+            return records
+        remaining = []
+        for record in records:
+            if record['key'] in hot:
+                self.messaging.debounce_update(record, region, targets)
+            else:
+                remaining.append(record)
+        return remaining
+
+    def _trace_puts(self, keys, region, ttl):
+        """
+        Record the writes of several keys to a region, when tracing.
+        """
+        if self.trace is not None:
+            ttl = self.expiration_time if ttl is None else ttl
+            for key in keys:
+                self.trace.record(key, TRACE_PUT, region, ttl)
+
+    def add_region(self, region):
+        """
+        Add a region. In partitioned mode it takes over the keys of its arcs of the ring, about 1/N of them, which
+        are moved from the regions that no longer own them. Otherwise it is filled with a copy of another region.
+
+        :param region: The name of the new region.
+        :return: The number of entries copied into a region that did not hold them.
+        """
+        if region in self.regions:
+            return 0
+        self._add_region_cache(region)
+        if self.stats_data is not None:
+            self.stats_data.region(region)
+        self.messaging.add_region(region)
+        if self.ring is None:
+            source = next((reg for reg in self.regions if reg != region), None)
+            if source is None:
+                return 0
+            with self.locks[source]:
+                items = self.regions[source].items()
+            return self._store(region, items)
+        self.ring.add_node(region)
+        moved = 0
+        for reg in list(self.regions):
+            with self.locks[reg]:
+                leaving = [item for item in self.regions[reg].items() if reg not in self.owners(item[0])]
+                for key, *_ in leaving:
+                    self.regions[reg].delete(key)
+            if leaving:
+                self._near_clear(reg)
+            for owner, items in self._by_owner(leaving).items():
+                moved += self._store(owner, items)
+        return moved
+
+    def remove_region(self, region):
+        """
+        Remove a region. In partitioned mode the keys it owned are handed over to the regions next on the ring.
+
+        :param region: The name of the region to remove.
+        :return: The number of entries copied into a region that did not hold them.
+        """
+        if region not in self.regions:
+            return 0
+        with self.locks[region]:
+            items = self.regions[region].items()
+        del self.regions[region]
+        del self.locks[region]
+        if self.trackers is not None:
+            self.trackers.pop(region, None)
+        with self.invalidated_lock:
+            self.invalidated.pop(region, None)
+        if self.ring is None:
+            return 0
+        self.ring.remove_node(region)
+        moved = 0
+        for owner, owner_items in self._by_owner(items).items():
+            moved += self._store(owner, owner_items)
+        return moved
+
+    def _by_owner(self, items):
+        """
+        Group cache items by the regions owning their key.
+
+        :param items: List of (key, value, expires_at, version) tuples.
+        :return: Dictionary of region to the list of its items.
+        """
+        groups = {}
+        for item in items:
+            for owner in self.owners(item[0]):
+                groups.setdefault(owner, []).append(item)
+        return groups
+
+    def _store(self, region, items):
+        """
+        Copy items into a region, keeping their remaining time to live and their version. Keys the region already
+        holds in the same or a newer version are left alone.
+
+        :param region: The destination region.
+        :param items: List of (key, value, expires_at, version) tuples.
+        :return: The number of items copied.
+        """
+        now = time.time()
+        cache, stored = self.regions[region], 0
+        with self.locks[region]:
+            for key, value, expires_at, version in items:
+                if expires_at > now and cache.put_if_newer(key, value, version, expires_at - now):
+                    stored += 1
+        if stored:
+            self._near_clear(region)
+        return stored
+
+    def snapshot(self, directory=CACHE_SNAPSHOT_DIRECTORY, background=False):
+        """
+        Write one snapshot file per region, to warm the regions up with restore after a restart.
+
+        A region lock (a shard lock for sharded regions) is only held while its entries are listed. Encoding and
+        writing happen after the locks are released, so reads and writes carry on meanwhile, and an item rewritten
+        in the meantime may be saved with its newer value.
+
+        :param directory: The directory of the snapshot files, created if needed.
+        :param background: Write the files from a background thread.
+        :return: Dictionary of region to the number of items written, or the writing Thread when background is set.
+        """
+        os.makedirs(directory, exist_ok=True)
+        listed = {}
+        for region, cache in list(self.regions.items()):
+            with self.locks[region]:
+                listed[region] = cache.entries()
+
+        def write():
+            return {region: write_snapshot(self._snapshot_path(directory, region), entries)
+                    for region, entries in listed.items()}
+
+        if not background:
+            return write()
+        thread = Thread(target=write, daemon=True)
+        thread.start()
+        return thread
+
+    def restore(self, directory=CACHE_SNAPSHOT_DIRECTORY, lazy=True):
+        """
+        Load the snapshot file of every region that has one. Expired items are skipped, and values are decoded from
+        the memory-mapped files on their first read unless lazy is unset.
+
+        :param directory: The directory of the snapshot files.
+        :param lazy: Decode every value on its first read rather than now.
+        :return: Dictionary of region to the number of items restored.
+        """
+        restored = {}
+        for region, cache in list(self.regions.items()):
+            path = self._snapshot_path(directory, region)
+            if os.path.exists(path):
+                with self.locks[region]:
+                    restored[region] = cache.restore(path, lazy)
+                self._near_clear(region)
+        return restored
+
+    @staticmethod
+    def _snapshot_path(directory, region):
+        return os.path.join(directory, f"{region}.snapshot")
 
     def update_cache(self, message, region):
         """
-        Update the cache based on a message received from the message queue.
+        Update the cache based on a message received from the message queue. A batch message is applied as a whole
+        under a single acquisition of the region lock.
 
-        :param message: The message containing the key-value pair to update.
+        Versioned updates are last-writer-wins: an update older than the value the region holds, e.g. delivered
+        out of order or twice, is dropped. Updates without a version, from older senders, overwrite the value. An
+        update too large for a shared memory slot is logged and counted as rejected, the rest of the batch is applied.
+
+        :param message: The message containing the key-value pair(s) to update.
         :param region: The region for which this update is applicable.
         """
-        key, value = json.loads(message).get('key'), json.loads(message).get('value')
+        start = perf_counter()
+        records = self.decode_updates(message)
+        cache, applied, rejected, invalidations = self.regions[region], 0, 0, []
+        written = [] if self.trackers is not None else None
+        traced = [] if self.trace is not None else None  # Invalidations and applied writes, rejected ones are not
+        decompress = self.compression and self._codec(region) is None  # Other regions may send compressed values
+        with self.locks[region]:
+            for record in records:
+                if 'invalidate' in record:
+                    invalidations.append(record)
+                    if traced is not None:
+                        traced.append(record)
+                    continue
+                value, version = record.get('value'), record.get('version')
+                if decompress:
+                    value = decompress_value(value)
+                try:
+                    if version is None:
+                        cache.put(record.get('key'), value, record.get('ttl'))
+                        written_now = True
+                    else:
+                        self.clock.update(version)
+                        written_now = cache.put_if_newer(record.get('key'), value, version, record.get('ttl'))
+                except CacheCapacityError as e:
+                    logging.error("Rejected an update of region %s: %s", region, e)
+                    rejected += 1
+                    continue
+                applied += written_now
+                if written_now and written is not None:
+                    written.append((record.get('key'), value, record.get('ttl'), version))
+                if written_now and traced is not None:
+                    traced.append(record)
+        if invalidations:
+            self._invalidate(invalidations, region)
+        if written:
+            tracker = self.trackers[region]
+            for key, value, ttl, version in written:
+                if key in tracker.hot or key in tracker.near:  # Only decompressed for the near cache
+                    self._near_update(region, key, decompress_value(value), ttl, version)
+        if traced:
+            for record in traced:
+                if 'invalidate' in record:
+                    self.trace.record(record.get('key'), TRACE_DELETE, region)
+                else:
+                    ttl = record.get('ttl')
+                    self.trace.record(record.get('key'), TRACE_PUT, region,
+                                      self.expiration_time if ttl is None else ttl)
+        if self.stats_data is not None:
+            region_stats = self.stats_data.region(region)
+            region_stats.messages += 1
+            region_stats.rejected += rejected
+            region_stats.applied += applied
+            if self.stats_data.sample():
+                region_stats.apply.record(perf_counter() - start)
+            now = time.time()
+            for record in records:
+                if 'ts' in record:  # Only sampled writes carry their origin timestamp
+                    region_stats.replication_lag.record(max(0.0, now - record['ts']))
+
+    def _invalidate(self, records, region):
+        """
+        Apply invalidations to a region: drop the copies older than the invalidated version and remember where to
+        fetch the newer value from. The remembered keys of a region are bounded by its capacity, the oldest are
+        forgotten first and then read as misses.
+
+        :return: The number of invalidations newer than the copy of the region.
+        """
+        cache, applied = self.regions[region], 0
         with self.locks[region]:
-            self.regions[region].put(key, value)
+            newer = []
+            for record in records:
+                key, version = record['key'], record['version']
+                self.clock.update(version)
+                entry = cache.peek(key)
+                if entry is not None:
+                    if entry.version >= version:
+                        continue
+                    cache.delete(key)
+                if self.trackers is not None:
+                    self.trackers[region].remove(key, version)
+                newer.append((key, record['invalidate'], version))
+        with self.invalidated_lock:
+            invalidated = self.invalidated.setdefault(region, {})
+            for key, source, version in newer:
+                known = invalidated.pop(key, None)
+                if known is None or known[1] < version:
+                    invalidated[key] = (source, version)
+                    applied += 1
+                else:
+                    invalidated[key] = known
+            while len(invalidated) > self.capacity:
+                del invalidated[next(iter(invalidated))]
+        if self.stats_data is not None:
+            self.stats_data.region(region).invalidations += applied
+        return applied
+
+    def merkle_tree(self, region):
+        """
+        :param region: The name of the region.
+        :return: The MerkleTree of the keys and versions the region holds.
+        """
+        if not self.anti_entropy:
+            raise ValueError("Anti-entropy is disabled, create the cache with anti_entropy=True")
+        with self.locks[region]:
+            return MerkleTree(self.regions[region].leaf_hashes())
+
+    def resync(self, region, source):
+        """
+        Bring two regions back in sync, e.g. after one of them missed replication messages. Their Merkle trees
+        tell which key ranges differ, only the key versions of those ranges are compared, and only the items newer
+        on one side are copied to the other. The work is proportional to the divergence, not to the cache size.
+
+        Evictions are not propagated: a key one region evicted is only copied back while that region has room, so
+        regions at capacity do not keep refilling each other. Full replication mode only, the regions of a
+        partitioned cache hold different keys.
+
+        :param region: The region to resync.
+        :param source: The region to compare it with.
+        :return: The number of items copied, in both directions.
+        """
+        if self.ring is not None:
+            raise ValueError("Anti-entropy compares full replicas and is not available in partitioned mode")
+        copied = 0
+        for leaf in self.merkle_tree(region).diff(self.merkle_tree(source)):
+            with self.locks[region]:
+                mine = self.regions[region].leaf_versions(leaf)
+            with self.locks[source]:
+                theirs = self.regions[source].leaf_versions(leaf)
+            copied += self._copy_newer(source, region, theirs, mine)
+            copied += self._copy_newer(region, source, mine, theirs)
+        return copied
+
+    def _copy_newer(self, source, target, source_versions, target_versions):
+        """
+        Copy the items of a source region that are newer than their copy in a target region, or missing from it
+        while it has room.
+
+        :return: The number of items copied.
+        """
+        now, copied = time.time(), 0
+        target_cache = self.regions[target]
+        for key, version in source_versions.items():
+            if version <= target_versions.get(key, -1):
+                continue
+            with self.locks[source]:
+                entry = self.regions[source].peek(key)
+                if entry is None or entry.expires_at <= now:
+                    continue
+                value, expires_at, version = entry.value, entry.expires_at, entry.version
+            with self.locks[target]:
+                if key not in target_versions and len(target_cache) >= self.capacity:
+                    continue
+                copied += target_cache.put_if_newer(key, value, version, expires_at - now)
+        if copied:
+            self._near_clear(target)
+        return copied
+
+    def anti_entropy_round(self):
+        """
+        Resync every region with the next one in region order, the last one with the first.
+
+        :return: The number of items copied.
+        """
+        regions = list(self.regions)
+        if len(regions) < 2:
+            return 0
+        return sum(self.resync(region, regions[(i + 1) % len(regions)]) for i, region in enumerate(regions))
+
+    def _run_anti_entropy(self, interval):
+        while not self.closed.wait(interval):
+            try:
+                self.anti_entropy_round()
+            except Exception as e:  # Keep the background rounds going, a region may have been removed meanwhile
+                logging.error("Anti-entropy round failed: %s", e)
+
+    def close(self):
+        """
+        Stop the background anti-entropy rounds and probes, close the messaging and detach the shared memory region
+        caches. A trace created from a path is closed too.
+        """
+        self.closed.set()
+        self.messaging.close()
+        if self.owns_trace:
+            self.trace.close()
+        if self.hedge_pool is not None:
+            self.hedge_pool.shutdown(wait=False)
+        if self.shared_memory:
+            for cache in self.regions.values():
+                cache.close()
+
+    def hot_keys(self):
+        """
+        List the hot keys of every region, e.g. for operators to spot a celebrity key.
+
+        :return: Dictionary of region to its list of (key, estimated recent accesses) of its hot keys, the hottest
+        first, see HotKeys.snapshot.
+        """
+        if self.trackers is None:
+            raise ValueError("Hot key detection is disabled, create the cache with hot_keys=True")
+        return {region: tracker.snapshot() for region, tracker in list(self.trackers.items())}
+
+    def stats(self):
+        """
+        Take a snapshot of the statistics.
+
+        :return: Dictionary with a 'regions' entry mapping every region to its counters (lookups, hits, stale_hits,
+        misses, hit_ratio, size, capacity, evictions, expirations, bytes and max_bytes with a byte capacity, and
+        with stats enabled puts, published, publish_errors, applied, rejected, messages, invalidations, fetches,
+        with hot keys near_hits, the hits served by the near cache and counted in hits too, and the number of
+        hot_keys) and a 'latency' dictionary of histogram summaries (get, put, publish, apply, lock_wait,
+        replication_lag) in seconds, plus the 'loader' counters, the 'routing' latencies and counters of get_routed,
+        the state of the 'circuit_breaker' of the loader and of the 'publish_circuit_breaker' of the replication
+        messages, the 'clock' node_id and the duplicates received from clocks sharing it, and with an outbox its
+        'outbox' counters.
+        """
+        regions = {}
+        for region, cache in list(self.regions.items()):
+            snapshot = self.stats_data.region(region).snapshot() if self.stats_data is not None else {}
+            hits, stale_hits, misses = cache.hits, cache.stale_hits, cache.misses
+            tracker = self.trackers.get(region) if self.trackers is not None else None
+            if tracker is not None:
+                hits += tracker.near_hits
+            lookups = hits + stale_hits + misses
+            snapshot.update(lookups=lookups, hits=hits, stale_hits=stale_hits, misses=misses,
+                            hit_ratio=(hits + stale_hits) / lookups if lookups else 0.0, size=len(cache),
+                            capacity=self.capacity, evictions=cache.evictions, expirations=cache.expirations)
+            if self.max_bytes is not None:
+                snapshot.update(bytes=cache.bytes, max_bytes=self.max_bytes)
+            if tracker is not None:
+                snapshot.update(near_hits=tracker.near_hits, hot_keys=len(tracker.hot))
+            regions[region] = snapshot
+        snapshot = {
+            'regions': regions,
+            'loader': self.loader_stats.snapshot(),
+            'routing': self.latency.snapshot(),
+            'circuit_breaker': self.circuit_breaker.snapshot(),
+            'publish_circuit_breaker': self.messaging.circuit_breaker.snapshot(),
+            'clock': {'node_id': self.clock.node_id, 'duplicates': self.clock.duplicates},
+        }
+        if self.outbox:
+            snapshot['outbox'] = self.messaging.outbox.snapshot()
+        return snapshot
+
+    def encode_updates(self, records):
+        """
+        Encode replication updates into a message body.
+
+        :param records: List of {'key': ..., 'value': ...} updates, with an optional 'ttl'.
+        :return: A binary frame carrying every update, or with the JSON codec a single update message, or a batch
+        message when there are several updates.
+        """
+        if self.codec == 'binary':
+            return serialize_data(records)
+        if self.compression:  # JSON has no representation of compressed values
+            records = [record if 'invalidate' in record else dict(record, value=decompress_value(record['value']))
+                       for record in records]
+        if len(records) == 1:
+            return json.dumps(records[0])
+        return json.dumps({'batch': records})
+
+    @staticmethod
+    def decode_updates(message):
+        """
+        Decode a message body produced by encode_updates with either codec.
+
+        :param message: The message body.
+        :return: The list of {'key': ..., 'value': ...} updates it carries.
+        """
+        if is_serialized(message):
+            return deserialize_data(message)
+        payload = json.loads(message)
+        return payload['batch'] if 'batch' in payload else [payload]
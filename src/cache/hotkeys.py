@@ -0,0 +1,235 @@
+import random
+import time
+from threading import Lock
+from ..utils import HOT_KEY_CAPACITY, HOT_KEY_SAMPLE_RATE, HOT_KEY_SHARE, HOT_KEY_WINDOW
+
+"""
+Hot key detection and the near cache of the hot keys. Each region counts a sample of its accesses in a Space-Saving
+summary, which finds the most frequent keys of a stream in a fixed number of counters, and the keys above a share of
+the accesses are hot. A hot key is served from a plain dictionary read without a lock, instead of the region cache
+and its LRU bookkeeping, and its writes are replicated at most once per interval, see Messaging.debounce_update.
+"""
+
+_REMOVED = object()  # Value of a near cache entry dropped by a newer invalidation
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary (Metwally et al.): the counts of at most capacity keys, where a new key replaces one with the
+    lowest count and inherits it as its possible overestimation. Any key making more than 1 / capacity of the stream
+    is counted, with a count never below its true one. Counts are kept in buckets of equal counts so that every
+    update takes constant time.
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: Number of keys counted.
+        """
+        self.capacity = capacity
+        self.counts = {}  # key -> count
+        self.errors = {}  # key -> overestimation of its count
+        self.buckets = {}  # count -> keys of that count, in insertion order
+        self.minimum = 0  # Lowest count of the summary
+        self.total = 0  # Number of keys offered
+
+    def offer(self, key):
+        """
+        Count an occurrence of a key.
+        """
+        self.total += 1
+        count = self.counts.get(key)
+        if count is None:
+            if len(self.counts) < self.capacity:
+                count, error = 0, 0
+                self.minimum = 0
+            else:
+                count = error = self.minimum
+                victim = next(iter(self.buckets[count]))
+                self._unlink(victim, count)
+                del self.counts[victim], self.errors[victim]
+            self.errors[key] = error
+        else:
+            self._unlink(key, count)
+        self.counts[key] = count + 1
+        self.buckets.setdefault(count + 1, {})[key] = None
+        if count == self.minimum and count not in self.buckets:
+            self.minimum = count + 1
+
+    def _unlink(self, key, count):
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+
+    def heavy_hitters(self, share):
+        """
+        :param share: Share of the stream, between 0 and 1.
+        :return: Dictionary of the keys certainly making at least that share of the stream to their estimated count.
+        """
+        threshold = share * self.total
+        return {key: count for key, count in self.counts.items() if count - self.errors[key] >= threshold}
+
+    def decay(self):
+        """
+        Halve the counts, so that the summary follows the recent stream. Keys counted once are forgotten.
+        """
+        counts, errors = self.counts, self.errors
+        self.counts, self.errors, self.buckets = {}, {}, {}
+        for key, count in counts.items():
+            if count > 1:
+                self.counts[key] = count // 2
+                self.errors[key] = errors[key] // 2
+                self.buckets.setdefault(count // 2, {})[key] = None
+        self.minimum = min(self.buckets) if self.buckets else 0
+        self.total //= 2
+
+
+class HotKeys:
+    def __init__(self, capacity=HOT_KEY_CAPACITY, share=HOT_KEY_SHARE, sample_rate=HOT_KEY_SAMPLE_RATE,
+                 window=HOT_KEY_WINDOW):
+        """
+        Initialize the hot key detection and the near cache of a region.
+
+        One access in sample_rate on average is counted, at random intervals so that a periodic access pattern is
+        not sampled on a single phase. Every window counted accesses, the keys making at least share of them
+        become the hot keys, the near cache drops the keys that are no longer hot and the counts are halved.
+
+        The near cache is read without a lock. Every write to a hot key goes through update, and entries carry the
+        version of their write, so that a read racing a write never stores an older value over a newer one.
+
+        The sampling countdown and near_hits are updated without a lock too, like the counters of stats.py: two
+        threads updating them at the same instant may lose a decrement or an increment, so near_hits is approximate.
+        Threads reaching zero at the same time count a single access, the first one resets the countdown under the
+        lock, so the sampling interval is not skewed.
+
+        :param capacity: Number of keys the Space-Saving summary counts, above 1 / share to find every hot key.
+        :param share: Share of the counted accesses from which a key is hot.
+        :param sample_rate: One access in sample_rate on average is counted.
+        :param window: Number of counted accesses between two evaluations of the hot keys.
+        """
+        self.summary = SpaceSaving(capacity)
+        self.share = share
+        self.sample_rate = max(1, sample_rate)
+        self.countdown = self.sample_rate
+        self.window = window
+        self.counted = 0  # Accesses counted since the last evaluation
+        self.hot = frozenset()  # Replaced as a whole, read without a lock
+        self.estimates = {}  # Hot key -> estimated recent accesses
+        self.near = {}  # Hot key -> (value, expires_at, version)
+        self.epoch = 0  # Incremented whenever the hot keys change or the near cache is cleared
+        self.lock = Lock()
+        self.near_hits = 0
+
+    def offer(self, key):
+        """
+        Count an access to a key, one in sample_rate on average.
+        """
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self._sample(key)
+
+    def _sample(self, key):
+        """
+        Count a sampled access in the summary, and evaluate the hot keys at the end of a window.
+        """
+        with self.lock:
+            if self.countdown > 0:  # Another thread reached zero at the same time and already reset it
+                return
+            self.countdown = random.randint(1, 2 * self.sample_rate - 1)
+            self.summary.offer(key)
+            self.counted += 1
+            if self.counted >= self.window:
+                self._evaluate()
+
+    def _evaluate(self):
+        """
+        Replace the hot keys by the heavy hitters of the summary and halve its counts. Called with the lock held.
+        """
+        hitters = self.summary.heavy_hitters(self.share)
+        hot = frozenset(hitters)
+        if hot != self.hot:
+            self.hot = hot
+            self.epoch += 1
+            for key in [key for key in self.near if key not in hot]:
+                del self.near[key]
+        self.estimates = {key: count * self.sample_rate for key, count in hitters.items()}
+        self.summary.decay()
+        self.counted = 0
+
+    def get(self, key):
+        """
+        Count a read of a key, see offer, and look it up in the near cache.
+
+        :return: The value of the key in the near cache, or -1 when it is absent, expired or invalidated.
+        """
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self._sample(key)
+        entry = self.near.get(key)
+        if entry is None or time.time() > entry[1]:
+            return -1
+        self.near_hits += 1
+        return entry[0]
+
+    def fill(self, key, entry, epoch):
+        """
+        Store the entry of a hot key read from the region cache.
+
+        :param key: The key read.
+        :param entry: Its CacheEntry.
+        :param epoch: The epoch read before the region cache. The entry is dropped when it changed since.
+        """
+        with self.lock:
+            if epoch != self.epoch or key not in self.hot:
+                return
+            current = self.near.get(key)
+            if current is None or entry.version > current[2] or (entry.version == current[2] and
+                                                                 current[0] is _REMOVED):
+                self.near[key] = (entry.value, entry.expires_at, entry.version)
+
+    def update(self, key, value, expires_at, version):
+        """
+        Record a write of a key to the region cache, when the key is hot.
+
+        :param value: The value written, _REMOVED when the key was invalidated.
+        :param expires_at: Time after which the value is expired.
+        :param version: Version of the write, None for an unversioned write which always overwrites.
+        """
+        if key not in self.hot and key not in self.near:
+            return
+        with self.lock:
+            current = self.near.get(key)
+            if current is None or version is None or version >= current[2]:
+                self.near[key] = (value, expires_at, version or 0)
+
+    def remove(self, key, version):
+        """
+        Record the invalidation of a key, whose value then has to be fetched.
+        """
+        self.update(key, _REMOVED, 0.0, version)
+
+    def discard(self, key):
+        """
+        Drop a key from the near cache, after it was deleted, evicted or expired in the region cache. A read of the
+        key filling the near cache at the same time is dropped as well.
+        """
+        if key not in self.hot and key not in self.near:
+            return
+        with self.lock:
+            self.near.pop(key, None)
+            self.epoch += 1
+
+    def clear(self):
+        """
+        Empty the near cache, e.g. after items were copied into the region cache in bulk.
+        """
+        with self.lock:
+            self.near.clear()
+            self.epoch += 1
+
+    def snapshot(self):
+        """
+        :return: List of (key, estimated recent accesses) of the hot keys, the hottest first. Older accesses weigh
+        less, the counts are halved every window.
+        """
+        return sorted(self.estimates.items(), key=lambda item: item[1], reverse=True)
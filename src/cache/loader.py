@@ -0,0 +1,102 @@
+import threading
+
+"""
+This file contains the pieces of the read-through path of GeoDistributedLRUCache: SingleFlight, which lets
+concurrent misses on a key share one load, and LoaderStats, which counts what the loader did.
+"""
+
+
+class _Flight:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Initialize a Single Flight group. At most one call per key runs at a time, the callers arriving while it
+        runs wait for it and share its result.
+        """
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Run fn for a key, or wait for the run already in flight for it.
+
+        :param key: The key the call is for.
+        :param fn: Callable without arguments.
+        :return: Tuple of (result, True if this caller ran fn and False if it waited for another caller).
+        :raises Exception: Whatever fn raised, in the caller that ran it and in every waiter.
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, False
+        try:
+            flight.value = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.value, True
+
+    def __len__(self):
+        return len(self.flights)
+
+
+class LoaderStats:
+    def __init__(self):
+        """
+        Initialize the loader counters.
+        """
+        self.lock = threading.Lock()
+        self.loads = 0  # Loader calls
+        self.errors = 0  # Loader calls that raised
+        self.coalesced = 0  # Misses that waited for a load already in flight instead of calling the loader
+        self.negative_hits = 0  # Misses answered from the negative cache of recent load errors
+        self.load_time = 0.0  # Total time in seconds spent in the loader
+        self.max_load_time = 0.0
+
+    def record_load(self, elapsed, failed=False):
+        with self.lock:
+            self.loads += 1
+            self.errors += failed
+            self.load_time += elapsed
+            self.max_load_time = max(self.max_load_time, elapsed)
+
+    def record_coalesced(self):
+        with self.lock:
+            self.coalesced += 1
+
+    def record_negative_hit(self):
+        with self.lock:
+            self.negative_hits += 1
+
+    def snapshot(self):
+        """
+        :return: Dictionary of the counters, with the mean load latency in seconds.
+        """
+        with self.lock:
+            return {
+                'loads': self.loads,
+                'errors': self.errors,
+                'coalesced': self.coalesced,
+                'negative_hits': self.negative_hits,
+                'mean_load_time': self.load_time / self.loads if self.loads else 0.0,
+                'max_load_time': self.max_load_time,
+            }
+
@@ -1,5 +1,12 @@
 from collections import OrderedDict
-from ..utils import CACHE_CAPACITY, CACHE_EXPIRATION_TIME, CACHE_ELEMENT_TTL
+from .entry import CacheEntry, CacheResult, CompressedEntry, FRESH, STALE, MISS
+from .merkle import MerkleDigest
+from .policies import make_policy
+from .snapshot import read_snapshot, write_snapshot
+from .timerwheel import TimerWheel
+from .trace import TRACE_DELETE, TRACE_GET, TRACE_PUT
+from ..utils import (CACHE_CAPACITY, CACHE_COMPRESSION_THRESHOLD, CACHE_EXPIRATION_TIME, CACHE_EVICTION_POLICY,
+                     CACHE_TIMER_RESOLUTION, check_codec, compress_value, encode_value)
 
 import time
 
@@ -8,16 +15,59 @@ functionality."""
 
 
 class LRUCache:
-    def __init__(self, capacity=CACHE_CAPACITY, expiration_time=CACHE_EXPIRATION_TIME):
+    def __init__(self, capacity=CACHE_CAPACITY, expiration_time=CACHE_EXPIRATION_TIME,
+                 timer_resolution=CACHE_TIMER_RESOLUTION, policy=CACHE_EVICTION_POLICY, stale_grace=0,
+                 digest_depth=None, compression=None, compression_threshold=CACHE_COMPRESSION_THRESHOLD,
+                 max_bytes=None, trace=None, on_remove=None):
         """
         Initialize an LRU Cache.
 
         :param capacity: The Maximum number of items the cache can hold.
         :param expiration_time: Time in seconds after which an item expires.
+        :param timer_resolution: Granularity in seconds of the timer wheel that purges expired items.
+        :param policy: Eviction policy, as a name ('lru', 'slru', '2q', 'arc', 'tinylfu'), an EvictionPolicy
+        subclass or instance. See policies.py.
+        :param stale_grace: Time in seconds expired items are kept after their expiration, so that get_with_state
+        can still return them as stale. They keep using capacity until then.
+        :param digest_depth: When set, keep a MerkleDigest of the keys and their versions over 2 ** digest_depth key
+        ranges, which anti-entropy compares between regions. It costs a key hash per write and removal.
+        :param compression: Codec compressing the values of at least compression_threshold bytes once encoded,
+        'zlib' or 'lzma', see compression.py. Values are decompressed on every read. None stores values as given.
+        :param compression_threshold: Encoded size in bytes from which a value is compressed.
+        :param max_bytes: When set, the cache also evicts items while the encoded, and possibly compressed, size of
+        its values exceeds this many bytes. Costs encoding every value written to measure it.
+        :param trace: A TraceRecorder receiving the reads, writes and removals of a sample of the keys, replayed by
+        mrc.py to size the cache.
+        :param on_remove: Callable receiving the key of every item deleted, evicted, expired or cleared, e.g. to drop
+        copies of the item kept elsewhere. Called with the cache lock held, so it must not call back into the cache.
         """
-        self.cache = OrderedDict()
+        check_codec(compression)
+        self.cache = OrderedDict()  # key -> CacheEntry, from least to most recently used
         self.capacity = capacity
         self.expiration_time = expiration_time
+        self.stale_grace = stale_grace
+        self.timers = TimerWheel(timer_resolution, delay=stale_grace)
+        self.policy = make_policy(policy, capacity)
+        self.policy.bind(self.cache)
+        self.notify_policy = not self.policy.passive
+        self.expirations = 0  # Number of expired items reclaimed
+        self.evictions = 0  # Number of items evicted to respect the capacity
+        self.hits = 0  # Number of lookups that found a fresh item
+        self.stale_hits = 0  # Number of lookups answered with an expired item, see get_with_state
+        self.misses = 0  # Number of lookups that found nothing
+        self.digest = MerkleDigest(digest_depth) if digest_depth is not None else None
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.entry_class = CacheEntry if compression is None else CompressedEntry
+        self.max_bytes = max_bytes
+        self.sizes = {} if max_bytes is not None else None  # key -> stored size, in byte capacity mode
+        self.bytes = 0  # Stored size of the values, in byte capacity mode
+        self.prepare = compression is not None or max_bytes is not None  # Writes go through _prepare
+        self.trace = trace
+        self.on_remove = on_remove
+
+    def __len__(self):
+        return len(self.cache)
 
     def get(self, key: str):
         """
@@ -26,23 +76,349 @@ class LRUCache:
         :param key: Key of the item to retrieve.
         :return: The value associated with the key or -1 if the key is not present or expired.
         """
-        if key not in self.cache or self._is_expired(key):
+        if self.trace is not None:
+            self.trace.record(key, TRACE_GET)
+        now = time.time()
+        if now >= self.timers.horizon:
+            self._purge_expired(now)
+        entry = self.cache.get(key)
+        if entry is None or now > entry.expires_at:
+            self.misses += 1
             return -1
+        self.hits += 1
         self.cache.move_to_end(key)
-        return self.cache[key]['value']
+        if self.notify_policy:
+            self.policy.on_access(key)
+        return entry.value
+
+    def get_with_state(self, key: str, grace=None):
+        """
+        Retrieve an item and tell whether it is fresh, or expired for less than a grace period.
 
-    def put(self, key: str, value: str):
+        :param key: Key of the item to retrieve.
+        :param grace: Time in seconds an expired item is still returned as stale, defaults to stale_grace. Items
+        are only kept stale_grace seconds after their expiration, so a longer grace finds nothing more.
+        :return: A CacheResult, whose value is -1 on a miss.
+        """
+        if self.trace is not None:
+            self.trace.record(key, TRACE_GET)
+        now = time.time()
+        if now >= self.timers.horizon:
+            self._purge_expired(now)
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return CacheResult(-1, MISS)
+        if now > entry.expires_at:
+            if now > entry.expires_at + (self.stale_grace if grace is None else grace):
+                self.misses += 1
+                return CacheResult(-1, MISS)
+            self.stale_hits += 1
+            state = STALE
+        else:
+            self.hits += 1
+            state = FRESH
+        self.cache.move_to_end(key)
+        if self.notify_policy:
+            self.policy.on_access(key)
+        return CacheResult(entry.value, state)
+
+    def put(self, key: str, value: str, ttl=None, version=0):
         """
         Add a new item to the cache or update an existing one.
 
         :param key: Key of the item to add or update.
         :param value: Value of the item.
+        :param ttl: Time in seconds after which this item expires, defaults to the cache expiration time.
+        :param version: Version of the write, see HybridLogicalClock.
+        """
+        now = time.time()
+        if now >= self.timers.horizon:
+            self._purge_expired(now)
+        ttl = self.expiration_time if ttl is None else ttl
+        if self.trace is not None:
+            self.trace.record(key, TRACE_PUT, ttl=ttl)
+        self._write(key, value, now + ttl, version)
+
+    def put_if_newer(self, key: str, value: str, version, ttl=None):
+        """
+        Write an item unless the cache holds a version of it at least as recent, which makes applying replicated
+        writes last-writer-wins: a reordered or duplicated delivery never rolls a key back.
+
+        :param key: Key of the item to add or update.
+        :param value: Value of the item.
+        :param version: Version of the write, see HybridLogicalClock.
+        :param ttl: Time in seconds after which this item expires, defaults to the cache expiration time.
+        :return: True if the item was written.
+        """
+        entry = self.cache.get(key)
+        if entry is not None and entry.version >= version:
+            return False
+        self.put(key, value, ttl, version)
+        return True
+
+    def get_many(self, keys):
+        """
+        Retrieve several items at once.
+
+        :param keys: Keys of the items to retrieve.
+        :return: A dictionary of the keys found and their values. Missing and expired keys are left out.
+        """
+        now = time.time()
+        if now >= self.timers.horizon:
+            self._purge_expired(now)
+        cache, found, misses = self.cache, {}, 0
+        if self.trace is not None:
+            for key in keys:
+                self.trace.record(key, TRACE_GET)
+        for key in keys:
+            entry = cache.get(key)
+            if entry is not None and now <= entry.expires_at:
+                cache.move_to_end(key)
+                if self.notify_policy:
+                    self.policy.on_access(key)
+                found[key] = entry.value
+            else:
+                misses += 1
+        self.hits += len(found)
+        self.misses += misses
+        return found
+
+    def put_many(self, mapping, ttl=None, version=0):
+        """
+        Add or update several items at once.
+
+        :param mapping: Dictionary of the keys and values to write.
+        :param ttl: Time in seconds after which these items expire, defaults to the cache expiration time.
+        :param version: Version of the writes, see HybridLogicalClock.
         """
-        if key in self.cache:
+        now = time.time()
+        if now >= self.timers.horizon:
+            self._purge_expired(now)
+        ttl = self.expiration_time if ttl is None else ttl
+        if self.trace is not None:
+            for key in mapping:
+                self.trace.record(key, TRACE_PUT, ttl=ttl)
+        expires_at = now + ttl
+        for key, value in mapping.items():
+            self._write(key, value, expires_at, version)
+
+    def _write(self, key, value, expires_at, version=0):
+        """
+        Insert or update an item, evicting another one if the cache overflows.
+
+        :param key: Key of the item.
+        :param value: Value of the item.
+        :param expires_at: Time after which the item is expired.
+        :param version: Version of the write.
+        """
+        if self.digest is not None:
+            self.digest.add(key, version)
+        if self.prepare:
+            value = self._prepare(key, value)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self.cache[key] = self.entry_class(key, value, expires_at, version)
+            self.timers.schedule(entry)
+            if self.notify_policy:
+                self.policy.on_insert(key)
+            if len(self.cache) > self.capacity:  # If the cache is full, let the policy pick the element to drop
+                self._evict()
+        else:
             self.cache.move_to_end(key)
-        self.cache[key] = {'value': value, CACHE_ELEMENT_TTL: time.time()}
-        if len(self.cache) > self.capacity:  # If the cache is full, pop the oldest element
-            self.cache.popitem(last=False)
+            if self.notify_policy:
+                self.policy.on_access(key)
+            entry.value = value
+            entry.version = version
+            if expires_at < entry.expires_at:  # A later deadline is picked up lazily by the timer wheel
+                entry.expires_at = expires_at
+                self.timers.schedule(entry)
+            else:
+                entry.expires_at = expires_at
+        if self.sizes is not None and self.bytes > self.max_bytes:
+            self._evict_bytes()
+
+    def _prepare(self, key, value):
+        """
+        Compress a value about to be stored and account for its size in byte capacity mode.
+
+        :return: The value to store.
+        """
+        if self.compression is not None:
+            value, size = compress_value(value, self.compression, self.compression_threshold)
+        elif self.sizes is not None:
+            size = len(encode_value(value))
+        if self.sizes is not None:
+            self.bytes += size - self.sizes.get(key, 0)
+            self.sizes[key] = size
+        return value
+
+    def _evict_bytes(self):
+        """
+        Evict the elements chosen by the eviction policy until the values fit in max_bytes.
+        """
+        while self.bytes > self.max_bytes and self.cache:
+            self._evict()
+
+    def _forget(self, key):
+        """
+        Drop the size of a removed item, in byte capacity mode.
+        """
+        self.bytes -= self.sizes.pop(key, 0)
+
+    def delete(self, key: str):
+        """
+        Remove an item from the cache.
+
+        :param key: Key of the item to remove.
+        :return: True if the item was present.
+        """
+        if self.trace is not None:
+            self.trace.record(key, TRACE_DELETE)
+        entry = self.cache.pop(key, None)
+        if entry is None:
+            return False
+        self.timers.cancel(entry)
+        if self.digest is not None:
+            self.digest.discard(key)
+        if self.sizes is not None:
+            self._forget(key)
+        if self.notify_policy:
+            self.policy.on_remove(key)
+        if self.on_remove is not None:
+            self.on_remove(key)
+        return True
+
+    def items(self):
+        """
+        List the unexpired items, from least to most recently used, without touching their recency.
+
+        :return: List of (key, value, expires_at, version) tuples.
+        """
+        now = time.time()
+        return [(key, entry.value, entry.expires_at, entry.version) for key, entry in self.cache.items()
+                if now <= entry.expires_at]
+
+    def peek(self, key: str):
+        """
+        Look an item up without touching its recency or the lookup counters.
+
+        :param key: Key of the item.
+        :return: Its CacheEntry, expired or not, or None.
+        """
+        return self.cache.get(key)
+
+    def leaf_hashes(self):
+        """
+        :return: The leaf hashes of the digest, see MerkleDigest.
+        """
+        return self.digest.leaf_hashes()
+
+    def leaf_versions(self, leaf):
+        """
+        :param leaf: The index of a key range of the digest.
+        :return: Dictionary of the keys of the range to their version.
+        """
+        return dict(self.digest.leaves[leaf])
+
+    def entries(self):
+        """
+        List the entries from least to most recently used, e.g. to snapshot them after releasing a lock.
+
+        :return: List of CacheEntry.
+        """
+        return list(self.cache.values())
+
+    def snapshot(self, path):
+        """
+        Write the unexpired items to a snapshot file, keeping their recency order and expiration times.
+
+        :param path: The path of the snapshot file.
+        :return: The number of items written.
+        """
+        return write_snapshot(path, self.entries())
+
+    def restore(self, path, lazy=True):
+        """
+        Load the unexpired items of a snapshot file, as when warming up a cache after a restart.
+
+        :param path: The path of the snapshot file.
+        :param lazy: Decode every value on its first read from the memory-mapped file rather than now.
+        :return: The number of items restored.
+        """
+        return self._restore(read_snapshot(path, limit=self.capacity, lazy=lazy))
+
+    def _restore(self, entries):
+        """
+        Insert restored entries as the most recently used items. Keys already present were written after the
+        snapshot was taken and keep their current value.
+
+        :param entries: List of CacheEntry, from least to most recently used.
+        :return: The number of entries inserted.
+        """
+        restored = 0
+        for entry in entries:
+            if entry.key in self.cache:
+                continue
+            if self.prepare:
+                entry = self.entry_class(entry.key, self._prepare(entry.key, entry.value), entry.expires_at,
+                                         entry.version)
+            self.cache[entry.key] = entry
+            self.timers.schedule(entry)
+            if self.digest is not None:
+                self.digest.add(entry.key, entry.version)
+            if self.notify_policy:
+                self.policy.on_insert(entry.key)
+            if len(self.cache) > self.capacity:
+                self._evict()
+            if self.sizes is not None and self.bytes > self.max_bytes:
+                self._evict_bytes()
+            restored += 1
+        return restored
+
+    def _evict(self):
+        """
+        Remove the element chosen by the eviction policy.
+        """
+        evicted = self.cache.pop(self.policy.evict())
+        self.timers.cancel(evicted)
+        if self.digest is not None:
+            self.digest.discard(evicted.key)
+        if self.sizes is not None:
+            self._forget(evicted.key)
+        if self.on_remove is not None:
+            self.on_remove(evicted.key)
+        self.evictions += 1
+
+    def purge_expired(self):
+        """
+        Remove every expired item whose timer has fired.
+
+        :return: The number of items removed.
+        """
+        return self._purge_expired(time.time())
+
+    def _purge_expired(self, now):
+        """
+        Advance the timer wheel and drop the items it reports as expired. The work done is proportional to the
+        number of expired items, so it is cheap enough to run on every operation.
+
+        :param now: Current time.
+        :return: The number of items removed.
+        """
+        expired = self.timers.advance(now)
+        for entry in expired:
+            del self.cache[entry.key]
+            if self.notify_policy:
+                self.policy.on_remove(entry.key)
+            if self.digest is not None:
+                self.digest.discard(entry.key)
+            if self.sizes is not None:
+                self._forget(entry.key)
+            if self.on_remove is not None:
+                self.on_remove(entry.key)
+        self.expirations += len(expired)
+        return len(expired)
 
     def _is_expired(self, key: str):
         """
@@ -51,7 +427,7 @@ class LRUCache:
         :param key: Key of the item to check.
         :return: True if the item has expired, False otherwise.
         """
-        return time.time() - self.cache[key][CACHE_ELEMENT_TTL] > self.expiration_time
+        return time.time() > self.cache[key].expires_at
 
     def get_stale_data(self, key: str):
         """
@@ -60,10 +436,23 @@ class LRUCache:
         :param key: Key of the item to retrieve.
         :return: The value associated with the key, or -1 if not found.
         """
-        return self.cache.get(key, {}).get('value', -1)
+        entry = self.cache.get(key)
+        return -1 if entry is None else entry.value
 
     def _clear_cache(self):
         """
         Clear the cache
         """
+        if self.notify_policy:
+            for key in self.cache:
+                self.policy.on_remove(key)
+        if self.on_remove is not None:
+            for key in self.cache:
+                self.on_remove(key)
         self.cache.clear()
+        self.timers.clear()
+        if self.digest is not None:
+            self.digest.clear()
+        if self.sizes is not None:
+            self.sizes.clear()
+            self.bytes = 0
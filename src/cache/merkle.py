@@ -0,0 +1,111 @@
+import hashlib
+import struct
+from ..utils import ANTI_ENTROPY_DEPTH, hash_key
+
+"""
+This file contains the digests anti-entropy compares between regions. Keys are split into 2 ** depth ranges of the
+key hash space, every range summarised by one leaf hash, and a Merkle tree over the leaves tells in a few
+comparisons which ranges differ between two regions.
+"""
+
+_PAIR = struct.Struct('>QQ')
+
+
+def _entry_hash(key, version):
+    return hash_key(f"{key}\x00{version}")
+
+
+def _node_hash(left, right):
+    return int.from_bytes(hashlib.blake2b(_PAIR.pack(left, right), digest_size=8).digest(), 'big')
+
+
+class MerkleDigest:
+    def __init__(self, depth=ANTI_ENTROPY_DEPTH):
+        """
+        Initialize the digest of a cache, kept up to date by the cache as keys are written and removed.
+
+        Every leaf maps its keys to their version. Its hash, the XOR of the hashes of its (key, version) pairs, only
+        depends on the contents and not on the order of the writes, so two caches holding the same versions of the
+        same keys have the same leaves. Hashes are recomputed lazily, for the leaves written since the last time
+        they were asked for.
+
+        :param depth: The key hash space is split into 2 ** depth ranges.
+        """
+        self.depth = depth
+        self.shift = 64 - depth
+        self.leaves = [{} for _ in range(1 << depth)]
+        self.hashes = [0] * (1 << depth)
+        self.dirty = set()
+
+    def leaf(self, key):
+        """
+        :return: The index of the range holding a key.
+        """
+        return hash_key(key) >> self.shift
+
+    def add(self, key, version):
+        """
+        Record the version of a key written to the cache.
+        """
+        leaf = hash_key(key) >> self.shift
+        self.leaves[leaf][key] = version
+        self.dirty.add(leaf)
+
+    def discard(self, key):
+        """
+        Forget a key removed from the cache.
+        """
+        leaf = hash_key(key) >> self.shift
+        if self.leaves[leaf].pop(key, None) is not None:
+            self.dirty.add(leaf)
+
+    def clear(self):
+        for leaf in self.leaves:
+            leaf.clear()
+        self.hashes = [0] * len(self.leaves)
+        self.dirty.clear()
+
+    def leaf_hashes(self):
+        """
+        :return: The list of the leaf hashes.
+        """
+        for leaf in self.dirty:
+            digest = 0
+            for key, version in self.leaves[leaf].items():
+                digest ^= _entry_hash(key, version)
+            self.hashes[leaf] = digest
+        self.dirty.clear()
+        return list(self.hashes)
+
+
+class MerkleTree:
+    def __init__(self, leaf_hashes):
+        """
+        Build a Merkle tree over leaf hashes.
+
+        :param leaf_hashes: List of 2 ** depth leaf hashes, e.g. from MerkleDigest.leaf_hashes.
+        """
+        self.levels = [leaf_hashes]  # From the leaves up to the root
+        level = leaf_hashes
+        while len(level) > 1:
+            level = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+            self.levels.append(level)
+
+    @property
+    def root(self):
+        return self.levels[-1][0]
+
+    def diff(self, other):
+        """
+        Find the leaves that differ from another tree of the same depth, descending only into differing subtrees.
+
+        :param other: The MerkleTree to compare with.
+        :return: The sorted list of the indexes of the differing leaves.
+        """
+        if len(self.levels) != len(other.levels):
+            raise ValueError("Cannot compare Merkle trees of different depths")
+        nodes = [0] if self.root != other.root else []
+        for depth in range(len(self.levels) - 2, -1, -1):
+            mine, theirs = self.levels[depth], other.levels[depth]
+            nodes = [child for node in nodes for child in (2 * node, 2 * node + 1) if mine[child] != theirs[child]]
+        return nodes
@@ -0,0 +1,162 @@
+import argparse
+import heapq
+from bisect import bisect_right
+from .trace import TRACE_DELETE, TRACE_GET, TRACE_PUT, read_trace
+
+"""
+Miss-ratio curves of LRU region caches computed offline from an access trace, see trace.py, to pick the capacity and
+expiration time of the regions from real traffic.
+
+A single pass over the trace computes the reuse distance of every read, the number of distinct keys accessed since
+the previous access of its key, with a Fenwick tree over the access positions. An LRU cache of capacity c hits
+exactly the reads at a distance below c, so one histogram of the distances gives the miss ratio of every capacity.
+The trace only holds the keys of a hash-based sample of rate R (SHARDS): distances between sampled keys are scaled
+by 1 / R, which estimates the distances in the full stream. A sample holding more or fewer reads than R times the
+reads of the period, e.g. because a very hot key is in it or not, skews the curve, so the misses are divided by the
+expected number of sampled reads rather than the actual one (SHARDS-adj).
+
+Expiration is replayed too: a write sets the expiration time of its key, which leaves the cache at that time and
+misses whatever the capacity. Reads of a key not in the cache load nothing, the write of the value loaded, recorded
+as a put, brings it back.
+
+Run with: python -m src.cache.mrc trace.bin
+"""
+
+_READS_MODULO = 1 << 32  # The read counts of the records wrap around
+
+
+class _Positions:
+    """ Fenwick tree counting the keys whose latest access is at each position of the trace """
+
+    def __init__(self, size):
+        self.tree = [0] * (size + 1)
+
+    def add(self, position, delta):
+        tree, size = self.tree, len(self.tree)
+        position += 1
+        while position < size:
+            tree[position] += delta
+            position += position & -position
+
+    def count(self, position):
+        """
+        :return: The number of marked positions below position.
+        """
+        tree, total = self.tree, 0
+        while position > 0:
+            total += tree[position]
+            position -= position & -position
+        return total
+
+
+def miss_ratio_curve(records, capacities, sample_rate=1.0, ttl=None):
+    """
+    Replay the accesses of one region cache and compute its miss ratio at several capacities.
+
+    :param records: The (key hash, timestamp, ttl, region id, op, reads) records of the region, from the oldest.
+    :param capacities: The capacities, in items of the whole key space, to compute the miss ratio of.
+    :param sample_rate: Share of the keys the records were sampled from.
+    :param ttl: Time in seconds after which every written entry expires, replacing the ttl of the records, e.g. to
+    evaluate another expiration time. 0 keeps entries forever.
+    :return: Dictionary of the number of 'reads', the reads of keys never written or deleted ('cold') and of expired
+    keys ('expired'), which miss at any capacity, and the 'curve' mapping every capacity to its miss ratio.
+    """
+    capacities = sorted(capacities)
+    positions = _Positions(len(records))
+    latest = {}  # key hash -> position of its latest access, for the keys in the cache
+    expires = {}  # key hash -> expiration time of the keys in the cache
+    expirations = []  # Heap of (expiration time, key hash), possibly outdated by later writes
+    expired = set()  # Keys that expired and were not written since
+    hits = [0] * (len(capacities) + 1)  # Reads by the smallest capacity they hit at, the last one for none
+    reads = cold = expired_reads = 0
+    first = last = None  # Read counts of the first and last sampled reads
+    for position, (key, timestamp, record_ttl, _, op, counted) in enumerate(records):
+        while expirations and expirations[0][0] < timestamp:
+            expires_at, expiring = heapq.heappop(expirations)
+            if expires.get(expiring) == expires_at:
+                positions.add(latest.pop(expiring), -1)
+                del expires[expiring]
+                expired.add(expiring)
+        previous = latest.get(key)
+        if op == TRACE_GET:
+            reads += 1
+            if first is None:
+                first = counted
+            last = counted
+            if previous is None:
+                if key in expired:
+                    expired_reads += 1
+                else:
+                    cold += 1
+                continue
+            distance = (positions.count(position) - positions.count(previous + 1)) / sample_rate
+            hits[bisect_right(capacities, distance)] += 1
+        elif op == TRACE_DELETE:
+            if previous is not None:
+                positions.add(previous, -1)
+                del latest[key]
+                expires.pop(key, None)
+            continue
+        if previous is not None:
+            positions.add(previous, -1)
+        positions.add(position, 1)
+        latest[key] = position
+        if op == TRACE_PUT:
+            expired.discard(key)
+            lifetime = record_ttl if ttl is None else ttl
+            if lifetime > 0:
+                expires[key] = timestamp + lifetime
+                heapq.heappush(expirations, (timestamp + lifetime, key))
+            else:
+                expires.pop(key, None)
+    expected = ((last - first) % _READS_MODULO + 1) * sample_rate if reads else 0
+    curve, hit = {}, 0
+    for index, capacity in enumerate(capacities):
+        hit += hits[index]
+        curve[capacity] = min(1.0, (reads - hit) / expected) if reads else 0.0
+    return {'reads': reads, 'cold': cold, 'expired': expired_reads, 'curve': curve}
+
+
+def miss_ratio_curves(path, capacities=None, ttl=None):
+    """
+    Compute the miss-ratio curve of every region of a trace file.
+
+    :param path: The path of the trace file, see TraceRecorder.
+    :param capacities: The capacities to compute the miss ratio of, by default powers of two up to the estimated
+    number of distinct keys of the region.
+    :param ttl: Time in seconds after which every written entry expires, replacing the ttl recorded.
+    :return: Dictionary of region name to its miss_ratio_curve result, with the estimated number of distinct
+    'keys' of the region.
+    """
+    trace = read_trace(path)
+    sample_rate = trace['sample_rate']
+    by_region = {}
+    for record in trace['records']:
+        by_region.setdefault(record[3], []).append(record)
+    curves = {}
+    for region_id, records in sorted(by_region.items()):
+        keys = round(len({record[0] for record in records}) / sample_rate)
+        region_capacities = capacities or [1 << i for i in range(max(1, keys).bit_length() + 1)]
+        curve = miss_ratio_curve(records, region_capacities, sample_rate, ttl)
+        curve['keys'] = keys
+        curves[trace['regions'][region_id]] = curve
+    return curves
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Miss-ratio curves of the LRU region caches from an access trace')
+    parser.add_argument('trace', help='Trace file written by a TraceRecorder')
+    parser.add_argument('--capacities', type=int, nargs='+', help='Capacities to evaluate, powers of two by default')
+    parser.add_argument('--ttl', type=float, help='Expiration time replacing the recorded one, 0 for none')
+    args = parser.parse_args()
+    for region, result in miss_ratio_curves(args.trace, args.capacities, args.ttl).items():
+        print(f"{region}: {result['reads']} sampled reads, ~{result['keys']} keys, "
+              f"{result['cold'] / max(1, result['reads']):.1%} cold, "
+              f"{result['expired'] / max(1, result['reads']):.1%} expired")
+        print(f"{'capacity':>12} {'miss ratio':>11}")
+        for capacity, ratio in result['curve'].items():
+            print(f"{capacity:>12} {ratio:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+from collections import OrderedDict
+from ..utils import CACHE_EVICTION_POLICY
+
+"""
+This file contains the eviction policies an LRUCache can use. A policy is told about insertions, accesses and
+removals of keys and picks the victim when the cache is over capacity.
+"""
+
+
+class EvictionPolicy:
+    """
+    Base class of the eviction policies.
+
+    The cache calls on_insert for a new key, on_access when a key is read or rewritten, and on_remove when a key
+    leaves the cache for another reason than eviction (expiration, deletion). When the cache holds more keys than
+    its capacity it calls evict, which returns the key to drop. That key may be the one just inserted, which is how
+    an admission policy rejects a newcomer.
+    """
+    # A passive policy relies only on the cache's own recency order, so the cache can skip the hook calls
+    passive = False
+
+    def __init__(self, capacity):
+        """
+        :param capacity: The capacity of the cache the policy manages.
+        """
+        self.capacity = capacity
+
+    def bind(self, entries):
+        """
+        Attach the policy to the entries of a cache.
+
+        :param entries: The cache's OrderedDict, ordered from least to most recently used.
+        """
+        self.entries = entries
+
+    def on_insert(self, key):
+        pass
+
+    def on_access(self, key):
+        pass
+
+    def on_remove(self, key):
+        pass
+
+    def evict(self):
+        raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+    """ Least Recently Used: evicts the head of the cache's own recency order """
+    passive = True
+
+    def evict(self):
+        return next(iter(self.entries))
+
+
+class SegmentedLRUPolicy(EvictionPolicy):
+    """
+    Segmented LRU: new keys enter a probation segment and are promoted to a protected segment on their second
+    access. Victims come from probation first, so a scan of one-time keys cannot flush the protected working set.
+    """
+
+    def __init__(self, capacity, protected_ratio=0.8):
+        """
+        :param capacity: The capacity of the cache the policy manages.
+        :param protected_ratio: Share of the capacity reserved to the protected segment.
+        """
+        super().__init__(capacity)
+        self.protected_capacity = max(1, int(capacity * protected_ratio))
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+
+    def __len__(self):
+        return len(self.probation) + len(self.protected)
+
+    def on_insert(self, key):
+        self.probation[key] = None
+
+    def on_access(self, key):
+        if key in self.protected:
+            self.protected.move_to_end(key)
+        elif key in self.probation:
+            del self.probation[key]
+            self.protected[key] = None
+            if len(self.protected) > self.protected_capacity:  # Demote the coldest protected key
+                demoted, _ = self.protected.popitem(last=False)
+                self.probation[demoted] = None
+
+    def on_remove(self, key):
+        self.probation.pop(key, None)
+        self.protected.pop(key, None)
+
+    def victim(self):
+        """
+        :return: The key evict would pick, without removing it.
+        """
+        return next(iter(self.probation or self.protected))
+
+    def evict(self):
+        segment = self.probation or self.protected
+        key, _ = segment.popitem(last=False)
+        return key
+
+
+class TwoQueuePolicy(EvictionPolicy):
+    """
+    2Q (Johnson and Shasha): new keys go through a FIFO (A1in). Keys evicted from it are remembered in a ghost
+    queue (A1out), and only a key seen again while in A1out enters the main LRU (Am).
+    """
+
+    def __init__(self, capacity, in_ratio=0.25, out_ratio=0.5):
+        """
+        :param capacity: The capacity of the cache the policy manages.
+        :param in_ratio: Share of the capacity given to the A1in FIFO.
+        :param out_ratio: Number of ghost keys remembered in A1out, relative to the capacity.
+        """
+        super().__init__(capacity)
+        self.in_capacity = max(1, int(capacity * in_ratio))
+        self.out_capacity = max(1, int(capacity * out_ratio))
+        self.a1in = OrderedDict()
+        self.a1out = OrderedDict()
+        self.am = OrderedDict()
+
+    def on_insert(self, key):
+        if key in self.a1out:
+            del self.a1out[key]
+            self.am[key] = None
+        else:
+            self.a1in[key] = None
+
+    def on_access(self, key):
+        if key in self.am:
+            self.am.move_to_end(key)
+
+    def on_remove(self, key):
+        self.a1in.pop(key, None)
+        self.am.pop(key, None)
+
+    def evict(self):
+        if len(self.a1in) > self.in_capacity or not self.am:
+            key, _ = self.a1in.popitem(last=False)
+            self.a1out[key] = None
+            if len(self.a1out) > self.out_capacity:
+                self.a1out.popitem(last=False)
+            return key
+        key, _ = self.am.popitem(last=False)
+        return key
+
+
+class ARCPolicy(EvictionPolicy):
+    """
+    Adaptive Replacement Cache (Megiddo and Modha): balances a recency list (T1) and a frequency list (T2), using
+    the ghost lists of their past victims (B1, B2) to move the target size of T1 towards what the workload rewards.
+    """
+
+    def __init__(self, capacity):
+        super().__init__(capacity)
+        self.p = 0  # Target size of T1
+        self.t1, self.t2 = OrderedDict(), OrderedDict()
+        self.b1, self.b2 = OrderedDict(), OrderedDict()
+        self.incoming = None
+        self.incoming_from_b2 = False
+
+    def on_insert(self, key):
+        self.incoming, self.incoming_from_b2 = key, False
+        if key in self.b1:
+            self.p = min(self.capacity, self.p + max(len(self.b2) // len(self.b1), 1))
+            del self.b1[key]
+            self.t2[key] = None
+        elif key in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) // len(self.b2), 1))
+            del self.b2[key]
+            self.incoming_from_b2 = True
+            self.t2[key] = None
+        else:
+            # Keep the directory bounded: |T1| + |B1| <= c and |T1| + |T2| + |B1| + |B2| <= 2c
+            if len(self.t1) + len(self.b1) >= self.capacity and self.b1:
+                self.b1.popitem(last=False)
+            elif len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2) >= 2 * self.capacity and self.b2:
+                self.b2.popitem(last=False)
+            self.t1[key] = None
+
+    def on_access(self, key):
+        if key in self.t1:
+            del self.t1[key]
+            self.t2[key] = None
+        elif key in self.t2:
+            self.t2.move_to_end(key)
+
+    def on_remove(self, key):
+        self.t1.pop(key, None)
+        self.t2.pop(key, None)
+
+    def evict(self):
+        t1_size = len(self.t1) - (self.incoming in self.t1)  # The incoming key is never its own victim
+        t2_size = len(self.t2) - (self.incoming in self.t2)
+        if t1_size > 0 and (t1_size > self.p or (self.incoming_from_b2 and t1_size == self.p) or t2_size == 0):
+            source, ghost = self.t1, self.b1
+        else:
+            source, ghost = self.t2, self.b2
+        key = next(iter(source))
+        del source[key]
+        ghost[key] = None
+        return key
+
+
+class CountMinSketch:
+    """
+    Approximate access frequencies in a fixed amount of memory. Counters saturate at 15 and are all halved once
+    sample_size increments have been recorded, so old popularity fades away. Increments are conservative: only the
+    counters holding the current estimate grow, which keeps collisions from inflating rare keys.
+    """
+    SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+
+    def __init__(self, capacity, sample_factor=10):
+        """
+        :param capacity: Number of keys the sketch should tell apart, it sizes the counter rows.
+        :param sample_factor: The counters are aged every capacity * sample_factor increments.
+        """
+        width = 16
+        while width < capacity * 4:  # Enough counters that collisions stay rare within one sample period
+            width <<= 1
+        self.mask = width - 1
+        self.rows = [bytearray(width) for _ in self.SEEDS]
+        self.sample_size = max(16, capacity * sample_factor)
+        self.additions = 0
+
+    def _indexes(self, key):
+        h = hash(key)
+        return [((h * seed) >> 24) & self.mask for seed in self.SEEDS]
+
+    def increment(self, key):
+        indexes = self._indexes(key)
+        low = min(row[index] for row, index in zip(self.rows, indexes))
+        if low < 15:
+            for row, index in zip(self.rows, indexes):
+                if row[index] == low:
+                    row[index] = low + 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.age()
+
+    def estimate(self, key):
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def age(self):
+        """
+        Halve every counter.
+        """
+        self.rows = [bytearray(count >> 1 for count in row) for row in self.rows]
+        self.additions //= 2
+
+
+class WTinyLFUPolicy(EvictionPolicy):
+    """
+    W-TinyLFU (Einziger, Friedman and Manes): new keys land in a small LRU window. A key leaving the window only
+    enters the main segmented LRU if the count-min sketch says it is accessed more often than the main victim it
+    would replace, so one-hit wonders never displace the frequent keys.
+    """
+
+    def __init__(self, capacity, window_ratio=0.01):
+        """
+        :param capacity: The capacity of the cache the policy manages.
+        :param window_ratio: Share of the capacity given to the admission window.
+        """
+        super().__init__(capacity)
+        self.window_capacity = max(1, int(capacity * window_ratio))
+        self.main_capacity = max(1, capacity - self.window_capacity)
+        self.window = OrderedDict()
+        self.main = SegmentedLRUPolicy(self.main_capacity)
+        self.sketch = CountMinSketch(capacity)
+
+    def on_insert(self, key):
+        self.sketch.increment(key)
+        self.window[key] = None
+
+    def on_access(self, key):
+        self.sketch.increment(key)
+        if key in self.window:
+            self.window.move_to_end(key)
+        else:
+            self.main.on_access(key)
+
+    def on_remove(self, key):
+        if key in self.window:
+            del self.window[key]
+        else:
+            self.main.on_remove(key)
+
+    def evict(self):
+        while len(self.window) > self.window_capacity and len(self.main) < self.main_capacity:
+            candidate, _ = self.window.popitem(last=False)
+            self.main.on_insert(candidate)
+        if len(self.window) > self.window_capacity:  # The main segment is full, the window victim has to compete
+            candidate, _ = self.window.popitem(last=False)
+            victim = self.main.victim()
+            if self.sketch.estimate(candidate) > self.sketch.estimate(victim):
+                self.main.evict()
+                self.main.on_insert(candidate)
+                return victim
+            return candidate
+        if len(self.main):
+            return self.main.evict()
+        key, _ = self.window.popitem(last=False)
+        return key
+
+
+POLICIES = {
+    'lru': LRUPolicy,
+    'slru': SegmentedLRUPolicy,
+    '2q': TwoQueuePolicy,
+    'arc': ARCPolicy,
+    'tinylfu': WTinyLFUPolicy,
+}
+
+
+def make_policy(policy=CACHE_EVICTION_POLICY, capacity=None):
+    """
+    Build an eviction policy.
+
+    :param policy: A policy name from POLICIES, an EvictionPolicy subclass, or an EvictionPolicy instance.
+    :param capacity: The capacity of the cache, used to size a policy built from a name or a class.
+    :return: An EvictionPolicy instance.
+    """
+    if isinstance(policy, EvictionPolicy):
+        return policy
+    if isinstance(policy, str):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        policy = POLICIES[policy]
+    return policy(capacity)
@@ -0,0 +1,305 @@
+from threading import Lock
+from .lrucache import LRUCache
+from .snapshot import read_snapshot, write_snapshot
+from ..utils import (CACHE_CAPACITY, CACHE_COMPRESSION_THRESHOLD, CACHE_EXPIRATION_TIME, CACHE_EVICTION_POLICY,
+                     CACHE_SHARD_COUNT)
+
+"""This file contains the ShardedLRUCache class, a lock-striped LRU cache made of independently locked LRUCache
+segments selected by key hash."""
+
+
+def _split(total, parts):
+    """
+    :return: List of parts integers adding up to total, the first total % parts of them one larger than the others.
+    """
+    size, extra = divmod(total, parts)
+    return [size + 1 if i < extra else size for i in range(parts)]
+
+
+class ShardedLRUCache:
+    def __init__(self, capacity=CACHE_CAPACITY, expiration_time=CACHE_EXPIRATION_TIME, shards=CACHE_SHARD_COUNT,
+                 policy=CACHE_EVICTION_POLICY, stale_grace=0, digest_depth=None, compression=None,
+                 compression_threshold=CACHE_COMPRESSION_THRESHOLD, max_bytes=None, on_remove=None):
+        """
+        Initialize a sharded LRU Cache.
+
+        Every shard holds a slice of the capacity, the slices differing by one item at most, and evicts on its own, so the eviction order is only an
+        approximation of a global LRU. In exchange, threads working on keys of different shards never wait on
+        each other.
+
+        :param capacity: The Maximum number of items the cache can hold across all shards.
+        :param expiration_time: Time in seconds after which an item expires.
+        :param shards: Number of segments. It is capped to the capacity so that no shard is empty.
+        :param policy: Eviction policy name or EvictionPolicy subclass, every shard gets its own instance.
+        :param stale_grace: Time in seconds expired items are kept for get_with_state, see LRUCache.
+        :param digest_depth: Keep a MerkleDigest per shard for anti-entropy, see LRUCache.
+        :param compression: Codec compressing large values, see LRUCache.
+        :param compression_threshold: Encoded size in bytes from which a value is compressed.
+        :param max_bytes: Byte capacity across all shards, split equally between them like the capacity, see
+        LRUCache.
+        :param on_remove: Callable receiving the key of every item removed from a shard, see LRUCache.
+        """
+        if shards < 1:
+            raise ValueError("A sharded cache needs at least one shard")
+        self.capacity = capacity
+        self.expiration_time = expiration_time
+        self.shard_count = max(1, min(shards, capacity))
+        shard_bytes = _split(max_bytes, self.shard_count) if max_bytes is not None else [None] * self.shard_count
+        self.max_bytes = max_bytes
+        self.shards = [LRUCache(shard_capacity, expiration_time, policy=policy, stale_grace=stale_grace,
+                                digest_depth=digest_depth, compression=compression,
+                                compression_threshold=compression_threshold, max_bytes=bytes_limit,
+                                on_remove=on_remove)
+                       for shard_capacity, bytes_limit in zip(_split(capacity, self.shard_count), shard_bytes)]
+        self.locks = [Lock() for _ in range(self.shard_count)]
+
+    def _index(self, key: str):
+        """
+        Select the shard owning a key.
+
+        :param key: The key to locate.
+        :return: The index of the shard holding the key.
+        """
+        return hash(key) % self.shard_count
+
+    def get(self, key: str):
+        """
+        Retrieve an item from the cache.
+
+        :param key: Key of the item to retrieve.
+        :return: The value associated with the key or -1 if the key is not present or expired.
+        """
+        index = self._index(key)
+        with self.locks[index]:
+            return self.shards[index].get(key)
+
+    def get_with_state(self, key: str, grace=None):
+        """
+        Retrieve an item and tell whether it is fresh or stale, see LRUCache.get_with_state.
+
+        :param key: Key of the item to retrieve.
+        :param grace: Time in seconds an expired item is still returned as stale.
+        :return: A CacheResult.
+        """
+        index = self._index(key)
+        with self.locks[index]:
+            return self.shards[index].get_with_state(key, grace)
+
+    def put(self, key: str, value: str, ttl=None, version=0):
+        """
+        Add a new item to the cache or update an existing one.
+
+        :param key: Key of the item to add or update.
+        :param value: Value of the item.
+        :param ttl: Time in seconds after which this item expires, defaults to the cache expiration time.
+        :param version: Version of the write, see HybridLogicalClock.
+        """
+        index = self._index(key)
+        with self.locks[index]:
+            self.shards[index].put(key, value, ttl, version)
+
+    def put_if_newer(self, key: str, value: str, version, ttl=None):
+        """
+        Write an item unless the cache holds a version of it at least as recent, see LRUCache.put_if_newer.
+
+        :return: True if the item was written.
+        """
+        index = self._index(key)
+        with self.locks[index]:
+            return self.shards[index].put_if_newer(key, value, version, ttl)
+
+    def get_many(self, keys):
+        """
+        Retrieve several items at once, taking each involved shard lock once.
+
+        :param keys: Keys of the items to retrieve.
+        :return: A dictionary of the keys found and their values. Missing and expired keys are left out.
+        """
+        found = {}
+        for index, shard_keys in self._group(keys).items():
+            with self.locks[index]:
+                found.update(self.shards[index].get_many(shard_keys))
+        return found
+
+    def put_many(self, mapping, ttl=None, version=0):
+        """
+        Add or update several items at once, taking each involved shard lock once.
+
+        :param mapping: Dictionary of the keys and values to write.
+        :param ttl: Time in seconds after which these items expire, defaults to the cache expiration time.
+        :param version: Version of the writes, see HybridLogicalClock.
+        """
+        for index, shard_keys in self._group(mapping).items():
+            with self.locks[index]:
+                self.shards[index].put_many({key: mapping[key] for key in shard_keys}, ttl, version)
+
+    def delete(self, key: str):
+        """
+        Remove an item from the cache.
+
+        :param key: Key of the item to remove.
+        :return: True if the item was present.
+        """
+        index = self._index(key)
+        with self.locks[index]:
+            return self.shards[index].delete(key)
+
+    def items(self):
+        """
+        List the unexpired items of every shard.
+
+        :return: List of (key, value, expires_at, version) tuples.
+        """
+        items = []
+        for index, shard in enumerate(self.shards):
+            with self.locks[index]:
+                items.extend(shard.items())
+        return items
+
+    def peek(self, key: str):
+        """
+        Look an item up without touching its recency or the lookup counters.
+
+        :param key: Key of the item.
+        :return: Its CacheEntry, expired or not, or None.
+        """
+        index = self._index(key)
+        with self.locks[index]:
+            return self.shards[index].peek(key)
+
+    def leaf_hashes(self):
+        """
+        :return: The leaf hashes of the region, combining the digests of the shards. Leaf hashes are XORs of entry
+        hashes, so the combination matches the digest a single LRUCache holding every item would have.
+        """
+        combined = None
+        for index, shard in enumerate(self.shards):
+            with self.locks[index]:
+                hashes = shard.leaf_hashes()
+            combined = hashes if combined is None else [mine ^ theirs for mine, theirs in zip(combined, hashes)]
+        return combined
+
+    def leaf_versions(self, leaf):
+        """
+        :param leaf: The index of a key range of the digest.
+        :return: Dictionary of the keys of the range to their version, over all shards.
+        """
+        versions = {}
+        for index, shard in enumerate(self.shards):
+            with self.locks[index]:
+                versions.update(shard.leaf_versions(leaf))
+        return versions
+
+    def entries(self):
+        """
+        List the entries of every shard, each shard from least to most recently used. Every shard lock is only held
+        while that shard is listed.
+
+        :return: List of CacheEntry.
+        """
+        entries = []
+        for index, shard in enumerate(self.shards):
+            with self.locks[index]:
+                entries.extend(shard.entries())
+        return entries
+
+    def snapshot(self, path):
+        """
+        Write the unexpired items of every shard to a snapshot file, see LRUCache.snapshot.
+
+        :param path: The path of the snapshot file.
+        :return: The number of items written.
+        """
+        return write_snapshot(path, self.entries())
+
+    def restore(self, path, lazy=True):
+        """
+        Load the unexpired items of a snapshot file into the shards owning them, see LRUCache.restore.
+
+        :param path: The path of the snapshot file.
+        :param lazy: Decode every value on its first read from the memory-mapped file rather than now.
+        :return: The number of items restored.
+        """
+        groups = {}
+        for entry in read_snapshot(path, lazy=lazy):
+            groups.setdefault(self._index(entry.key), []).append(entry)
+        restored = 0
+        for index, entries in groups.items():
+            with self.locks[index]:
+                restored += self.shards[index]._restore(entries)
+        return restored
+
+    def _group(self, keys):
+        """
+        Split keys by shard.
+
+        :param keys: The keys to split.
+        :return: Dictionary of shard index to the list of its keys.
+        """
+        groups = {}
+        for key in keys:
+            groups.setdefault(self._index(key), []).append(key)
+        return groups
+
+    def purge_expired(self):
+        """
+        Remove the expired items of every shard.
+
+        :return: The number of items removed.
+        """
+        removed = 0
+        for index, shard in enumerate(self.shards):
+            with self.locks[index]:
+                removed += shard.purge_expired()
+        return removed
+
+    @property
+    def expirations(self):
+        """ Number of expired items reclaimed over all shards """
+        return sum(shard.expirations for shard in self.shards)
+
+    @property
+    def evictions(self):
+        """ Number of items evicted over all shards """
+        return sum(shard.evictions for shard in self.shards)
+
+    @property
+    def bytes(self):
+        return sum(shard.bytes for shard in self.shards)
+
+    @property
+    def hits(self):
+        """ Number of lookups that found a fresh item over all shards """
+        return sum(shard.hits for shard in self.shards)
+
+    @property
+    def stale_hits(self):
+        """ Number of lookups answered with an expired item over all shards """
+        return sum(shard.stale_hits for shard in self.shards)
+
+    @property
+    def misses(self):
+        """ Number of lookups that found nothing over all shards """
+        return sum(shard.misses for shard in self.shards)
+
+    def get_stale_data(self, key: str):
+        """
+        Retrieve stale data from the cache if available.
+
+        :param key: Key of the item to retrieve.
+        :return: The value associated with the key, or -1 if not found.
+        """
+        index = self._index(key)
+        with self.locks[index]:
+            return self.shards[index].get_stale_data(key)
+
+    def __len__(self):
+        return sum(len(shard.cache) for shard in self.shards)
+
+    def _clear_cache(self):
+        """
+        Clear every shard
+        """
+        for index, shard in enumerate(self.shards):
+            with self.locks[index]:
+                shard._clear_cache()
@@ -0,0 +1,563 @@
+import fcntl
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from .entry import CacheEntry, CacheResult, FRESH, STALE, MISS
+from .snapshot import read_snapshot, write_snapshot
+from ..exceptions import CacheCapacityError
+from ..utils import (CACHE_CAPACITY, CACHE_EXPIRATION_TIME, SHARED_CACHE_SLOT_SIZE, decode_value, encode_value,
+                     hash_key)
+
+"""
+This file contains the SharedMemoryLRUCache class, a region cache stored in a multiprocessing.shared_memory block so
+that every worker process of a host reads and writes one copy of the region.
+
+The block holds a header, a table of fixed-size slots and an open-addressing index:
+
+    block  := header slot{capacity} bucket{buckets}
+    header := magic:8s capacity:u32 data_size:u32 buckets:u32 count:u32 hand:u32 sequence:u64
+              evictions:u64 expirations:u64 free:i32
+    slot   := used:u8 referenced:u8 key_size:u16 value_size:u32 key_hash:u64 expires_at:f64 version:u64
+              data:data_size
+    bucket := slot index:i32, -1 when empty
+
+Keys and values are stored with the wire codec's value encoding. The index is a linear-probing hash table over the
+stable key hash, cleared with backward-shift deletion so lookups never walk tombstones. Eviction is CLOCK, the usual
+approximation of LRU for fixed slots: reads set a referenced bit, and the hand sweeping the slots gives referenced
+slots a second chance and frees the first one that is expired or unreferenced. The hand only sweeps a full cache:
+free slots are chained into a list, headed by the free header field and linked through the key_hash field of the
+free slots, and writes take its first slot while there is one.
+
+Writers take a cross-process lock. Readers do not: the sequence number is odd while a write is in progress, and a
+read copying the value bytes out of the block is only kept if the sequence number did not change meanwhile
+(a seqlock). A read losing the race SEQLOCK_RETRIES times falls back to the lock.
+"""
+
+SHARED_CACHE_MAGIC = b'SHMLRU02'
+SEQLOCK_RETRIES = 8  # Lock-free read attempts before a read takes the lock
+
+_HEADER = struct.Struct('<8sIIIIIQQQi')
+_SLOT = struct.Struct('<BBHIQdQ')
+_BUCKET = struct.Struct('<i')
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_COUNT = 20  # Offsets of header fields
+_HAND = 24
+_SEQUENCE = 28
+_EVICTIONS = 36
+_EXPIRATIONS = 44
+_FREE = 52
+_REFERENCED = 1  # Offset of the referenced flag in a slot
+_NEXT_FREE = 8  # Offset of the next free slot in a free slot, over its key hash
+_EMPTY = -1
+_TRACK = sys.version_info >= (3, 13)  # SharedMemory can leave a block out of the resource tracker
+
+
+class FileLock:
+    """
+    A lock shared by every process opening the same lock file, and by the threads of each process.
+    flock only excludes other open files, so a thread lock serializes the threads of one process first.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+        self.local = threading.Lock()
+
+    def __enter__(self):
+        self.local.acquire()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.local.release()
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _encode_key(key):
+    """
+    :return: Tuple of (encoded key, hash of the encoded key).
+    """
+    encoded = encode_value(key)
+    return encoded, hash_key(encoded)
+
+
+def _attach(name):
+    """
+    Attach an existing block without registering it with the resource tracker, which would otherwise destroy it
+    when this process exits although other processes still use it.
+    """
+    if _TRACK:
+        return shared_memory.SharedMemory(name, track=False)
+    block = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+class SharedMemoryLRUCache:
+    def __init__(self, name, capacity=CACHE_CAPACITY, expiration_time=CACHE_EXPIRATION_TIME,
+                 slot_size=SHARED_CACHE_SLOT_SIZE, stale_grace=0, lock=None, create=None):
+        """
+        Initialize a cache in a named shared memory block, creating the block or attaching to an existing one.
+
+        The first process creates the block, the others attach to it by name and find the capacity and slot size
+        in its header. Writes take a cross-process lock, a FileLock next to the block by default, reads are
+        lock-free. Only the creator destroys the block, with unlink.
+
+        :param name: Name of the shared memory block, the same in every process.
+        :param capacity: The Maximum number of items the cache can hold.
+        :param expiration_time: Time in seconds after which an item expires.
+        :param slot_size: Bytes available for the encoded key and value of an item.
+        :param stale_grace: Time in seconds expired items are kept for get_with_state before their slot is reused.
+        :param lock: The lock guarding the block, e.g. a multiprocessing.Lock inherited by forked workers.
+        :param create: True to create the block, False to attach to it, None to attach or create.
+        """
+        self.name = name
+        self.expiration_time = expiration_time
+        self.stale_grace = stale_grace
+        self.lock = lock if lock is not None else FileLock(os.path.join(tempfile.gettempdir(), f"{name}.lock"))
+        self.hits = self.stale_hits = self.misses = 0  # Lookups of this process, unlike the shared evictions
+        self.owner = False
+        if create is not False:
+            buckets = 1 << max(3, (2 * capacity - 1).bit_length())  # At most half full
+            size = _HEADER.size + capacity * (_SLOT.size + slot_size) + buckets * _BUCKET.size
+            try:
+                self.block = shared_memory.SharedMemory(name, create=True, size=size)
+                self.owner = True
+            except FileExistsError:
+                if create:
+                    raise
+        if self.owner:
+            self._layout(capacity, slot_size, buckets)
+            self.buffer[self.slots_offset:self.index_offset] = bytes(self.index_offset - self.slots_offset)
+            self._clear_index()
+            self._chain_free_slots()
+            # The magic goes last, attaching processes wait for it
+            _HEADER.pack_into(self.buffer, 0, SHARED_CACHE_MAGIC, capacity, slot_size, buckets, 0, 0, 0, 0, 0, 0)
+        else:
+            self.block = _attach(name)
+            self.buffer = self.block.buf
+            deadline = time.monotonic() + 1
+            while bytes(self.buffer[:8]) != SHARED_CACHE_MAGIC:
+                if time.monotonic() > deadline:
+                    raise ValueError(f"Shared memory block {name} does not hold a cache")
+                time.sleep(0.001)
+            self._layout(*_HEADER.unpack_from(self.buffer, 0)[1:4])
+
+    def _layout(self, capacity, data_size, buckets):
+        self.buffer = self.block.buf
+        self.capacity = capacity
+        self.data_size = data_size
+        self.buckets = buckets
+        self.mask = buckets - 1
+        self.slot_size = _SLOT.size + data_size
+        self.slots_offset = _HEADER.size
+        self.index_offset = _HEADER.size + capacity * self.slot_size
+
+    def _clear_index(self):
+        size = self.buckets * _BUCKET.size
+        self.buffer[self.index_offset:self.index_offset + size] = b'\xff' * size
+
+    def _chain_free_slots(self):
+        """
+        Chain every slot into the free list, in slot order. The slots must all be free.
+        """
+        for slot in range(self.capacity - 1):
+            _BUCKET.pack_into(self.buffer, self._slot(slot) + _NEXT_FREE, slot + 1)
+        _BUCKET.pack_into(self.buffer, self._slot(self.capacity - 1) + _NEXT_FREE, _EMPTY)
+        _BUCKET.pack_into(self.buffer, _FREE, 0)
+
+    def __len__(self):
+        return _U32.unpack_from(self.buffer, _COUNT)[0]
+
+    @property
+    def evictions(self):
+        return _U64.unpack_from(self.buffer, _EVICTIONS)[0]
+
+    @property
+    def expirations(self):
+        return _U64.unpack_from(self.buffer, _EXPIRATIONS)[0]
+
+    def _add(self, offset, amount=1):
+        _U64.pack_into(self.buffer, offset, _U64.unpack_from(self.buffer, offset)[0] + amount)
+
+    @contextmanager
+    def _writing(self):
+        """
+        Hold the lock and keep the sequence number odd while modifying the block.
+        """
+        with self.lock:
+            sequence = _U64.unpack_from(self.buffer, _SEQUENCE)[0]
+            _U64.pack_into(self.buffer, _SEQUENCE, sequence + 1)
+            try:
+                yield
+            finally:
+                _U64.pack_into(self.buffer, _SEQUENCE, sequence + 2)
+
+    def _slot(self, slot):
+        return self.slots_offset + slot * self.slot_size
+
+    def _bucket(self, bucket):
+        return _BUCKET.unpack_from(self.buffer, self.index_offset + bucket * _BUCKET.size)[0]
+
+    def _set_bucket(self, bucket, slot):
+        _BUCKET.pack_into(self.buffer, self.index_offset + bucket * _BUCKET.size, slot)
+
+    def _find(self, encoded_key, key_hash):
+        """
+        :return: Tuple of (slot index or -1, bucket holding it or the empty bucket ending the probe).
+        """
+        buffer, mask, size = self.buffer, self.mask, len(encoded_key)
+        bucket = key_hash & mask
+        while True:
+            slot = _BUCKET.unpack_from(buffer, self.index_offset + bucket * _BUCKET.size)[0]
+            if slot == _EMPTY:
+                return _EMPTY, bucket
+            offset = self.slots_offset + slot * self.slot_size
+            _, _, key_size, _, slot_hash, _, _ = _SLOT.unpack_from(buffer, offset)
+            if slot_hash == key_hash and key_size == size:
+                data = offset + _SLOT.size
+                if buffer[data:data + size] == encoded_key:
+                    return slot, bucket
+            bucket = (bucket + 1) & mask
+
+    def _unlink_bucket(self, bucket):
+        """
+        Empty a bucket of the index, moving the following entries of its probe run back so that lookups stop at the
+        first empty bucket.
+        """
+        hole, bucket = bucket, (bucket + 1) & self.mask
+        while True:
+            slot = self._bucket(bucket)
+            if slot == _EMPTY:
+                break
+            home = _SLOT.unpack_from(self.buffer, self._slot(slot))[4] & self.mask
+            # The entry may fill the hole unless its home bucket lies cyclically in (hole, bucket]
+            if (bucket - home) & self.mask >= (bucket - hole) & self.mask:
+                self._set_bucket(hole, slot)
+                hole = bucket
+            bucket = (bucket + 1) & self.mask
+        self._set_bucket(hole, _EMPTY)
+
+    def _remove(self, slot):
+        """
+        Free a used slot and drop it from the index. The caller is writing.
+        """
+        offset = self._slot(slot)
+        _, _, key_size, _, key_hash, _, _ = _SLOT.unpack_from(self.buffer, offset)
+        data = offset + _SLOT.size
+        found, bucket = self._find(bytes(self.buffer[data:data + key_size]), key_hash)
+        if found == slot:
+            self._unlink_bucket(bucket)
+        self.buffer[offset] = 0
+        _BUCKET.pack_into(self.buffer, offset + _NEXT_FREE, _BUCKET.unpack_from(self.buffer, _FREE)[0])
+        _BUCKET.pack_into(self.buffer, _FREE, slot)
+        _U32.pack_into(self.buffer, _COUNT, len(self) - 1)
+
+    def _read(self, slot):
+        """
+        :return: Tuple of (key, value, expires_at, version) of a used slot.
+        """
+        offset = self._slot(slot)
+        _, _, key_size, value_size, _, expires_at, version = _SLOT.unpack_from(self.buffer, offset)
+        data = offset + _SLOT.size
+        key = decode_value(self.buffer, data)[0]
+        value = decode_value(self.buffer, data + key_size)[0]
+        return key, value, expires_at, version
+
+    def _probe(self, encoded_key, key_hash):
+        """
+        :return: Tuple of (slot offset, expiration time, copy of the encoded value), or None if the key is absent.
+        """
+        slot, _ = self._find(encoded_key, key_hash)
+        if slot == _EMPTY:
+            return None
+        offset = self._slot(slot)
+        _, _, key_size, value_size, _, expires_at, _ = _SLOT.unpack_from(self.buffer, offset)
+        data = offset + _SLOT.size + key_size
+        return offset, expires_at, bytes(self.buffer[data:data + value_size])
+
+    def _lookup(self, key, now, grace):
+        """
+        Find a key without the lock unless writers keep changing the block, and mark it referenced.
+
+        :return: A CacheResult.
+        """
+        (encoded, key_hash), buffer = _encode_key(key), self.buffer
+        for _ in range(SEQLOCK_RETRIES):
+            sequence = _U64.unpack_from(buffer, _SEQUENCE)[0]
+            if sequence & 1:
+                continue
+            found = self._probe(encoded, key_hash)
+            if _U64.unpack_from(buffer, _SEQUENCE)[0] == sequence:
+                break
+        else:
+            with self.lock:
+                found = self._probe(encoded, key_hash)
+        if found is None:
+            self.misses += 1
+            return CacheResult(-1, MISS)
+        offset, expires_at, value = found
+        if now > expires_at:
+            if now > expires_at + grace:
+                self.misses += 1
+                return CacheResult(-1, MISS)
+            self.stale_hits += 1
+            state = STALE
+        else:
+            self.hits += 1
+            state = FRESH
+        if not buffer[offset + _REFERENCED]:
+            buffer[offset + _REFERENCED] = 1  # A lost race only gives a reused slot an undeserved second chance
+        return CacheResult(decode_value(value)[0], state)
+
+    def get(self, key: str):
+        """
+        Retrieve an item from the cache.
+
+        :param key: Key of the item to retrieve.
+        :return: The value associated with the key or -1 if the key is not present or expired.
+        """
+        return self._lookup(key, time.time(), 0).value
+
+    def get_with_state(self, key: str, grace=None):
+        """
+        Retrieve an item and tell whether it is fresh, or expired for less than a grace period, see LRUCache.
+
+        :return: A CacheResult, whose value is -1 on a miss.
+        """
+        return self._lookup(key, time.time(), self.stale_grace if grace is None else grace)
+
+    def get_many(self, keys):
+        """
+        Retrieve several items.
+
+        :return: A dictionary of the keys found and their values. Missing and expired keys are left out.
+        """
+        now, found = time.time(), {}
+        for key in keys:
+            result = self._lookup(key, now, 0)
+            if result.state == FRESH:
+                found[key] = result.value
+        return found
+
+    def _write(self, key, value, expires_at, version, if_newer=False):
+        """
+        Insert or update an item. The caller is writing.
+
+        :return: True if the item was written.
+        """
+        (encoded_key, key_hash), encoded_value = _encode_key(key), encode_value(value)
+        if len(encoded_key) + len(encoded_value) > self.data_size:
+            raise CacheCapacityError(f"Item {key!r} needs {len(encoded_key) + len(encoded_value)} bytes, slots hold "
+                                     f"{self.data_size}")
+        slot, bucket = self._find(encoded_key, key_hash)
+        if slot != _EMPTY:
+            if if_newer and _SLOT.unpack_from(self.buffer, self._slot(slot))[6] >= version:
+                return False
+        else:
+            slot = self._allocate()
+            _, bucket = self._find(encoded_key, key_hash)  # The eviction may have moved the probe run
+            self._set_bucket(bucket, slot)
+            _U32.pack_into(self.buffer, _COUNT, len(self) + 1)
+        offset = self._slot(slot)
+        _SLOT.pack_into(self.buffer, offset, 1, 1, len(encoded_key), len(encoded_value), key_hash, expires_at,
+                        version)
+        data = offset + _SLOT.size
+        self.buffer[data:data + len(encoded_key)] = encoded_key
+        self.buffer[data + len(encoded_key):data + len(encoded_key) + len(encoded_value)] = encoded_value
+        return True
+
+    def _allocate(self):
+        """
+        Take the first slot of the free list. When the cache is full, sweep the CLOCK hand to an expired or
+        unreferenced slot and free it first. The caller is writing.
+
+        :return: The index of a free slot, out of the free list.
+        """
+        if _BUCKET.unpack_from(self.buffer, _FREE)[0] == _EMPTY:
+            self._sweep()
+        slot = _BUCKET.unpack_from(self.buffer, _FREE)[0]
+        _BUCKET.pack_into(self.buffer, _FREE, _BUCKET.unpack_from(self.buffer, self._slot(slot) + _NEXT_FREE)[0])
+        return slot
+
+    def _sweep(self):
+        """
+        Sweep the CLOCK hand over the slots of a full cache, giving referenced slots a second chance, and free the
+        first expired or unreferenced one. The caller is writing.
+        """
+        now = time.time()
+        hand = _U32.unpack_from(self.buffer, _HAND)[0]
+        while True:
+            offset = self._slot(hand)
+            _, referenced, _, _, _, expires_at, _ = _SLOT.unpack_from(self.buffer, offset)
+            slot, hand = hand, (hand + 1) % self.capacity
+            if now > expires_at + self.stale_grace:
+                self._remove(slot)
+                self._add(_EXPIRATIONS)
+                break
+            if referenced:
+                self.buffer[offset + _REFERENCED] = 0
+                continue
+            self._remove(slot)
+            self._add(_EVICTIONS)
+            break
+        _U32.pack_into(self.buffer, _HAND, hand)
+
+    def put(self, key: str, value: str, ttl=None, version=0):
+        """
+        Add a new item to the cache or update an existing one.
+
+        :param key: Key of the item to add or update.
+        :param value: Value of the item.
+        :param ttl: Time in seconds after which this item expires, defaults to the cache expiration time.
+        :param version: Version of the write, see HybridLogicalClock.
+        :raises CacheCapacityError: If the encoded key and value do not fit in a slot.
+        """
+        with self._writing():
+            self._write(key, value, time.time() + (self.expiration_time if ttl is None else ttl), version)
+
+    def put_if_newer(self, key: str, value: str, version, ttl=None):
+        """
+        Write an item unless the cache holds a version of it at least as recent, see LRUCache.put_if_newer.
+
+        :return: True if the item was written.
+        """
+        with self._writing():
+            return self._write(key, value, time.time() + (self.expiration_time if ttl is None else ttl), version,
+                               if_newer=True)
+
+    def put_many(self, mapping, ttl=None, version=0):
+        """
+        Add or update several items under one acquisition of the lock.
+        """
+        expires_at = time.time() + (self.expiration_time if ttl is None else ttl)
+        with self._writing():
+            for key, value in mapping.items():
+                self._write(key, value, expires_at, version)
+
+    def delete(self, key: str):
+        """
+        Remove an item from the cache.
+
+        :return: True if the item was present.
+        """
+        with self._writing():
+            slot, _ = self._find(*_encode_key(key))
+            if slot == _EMPTY:
+                return False
+            self._remove(slot)
+            return True
+
+    def peek(self, key: str):
+        """
+        Look an item up without marking it referenced or counting the lookup.
+
+        :return: A CacheEntry copied out of the block, or None.
+        """
+        with self.lock:
+            slot, _ = self._find(*_encode_key(key))
+            if slot == _EMPTY:
+                return None
+            return CacheEntry(*self._read(slot))
+
+    def get_stale_data(self, key: str):
+        """
+        Retrieve stale data from the cache if available.
+
+        :return: The value associated with the key, or -1 if not found.
+        """
+        entry = self.peek(key)
+        return -1 if entry is None else entry.value
+
+    def _used_slots(self):
+        return [slot for slot in range(self.capacity) if self.buffer[self._slot(slot)]]
+
+    def entries(self):
+        """
+        List the items in slot order, which is all the order CLOCK keeps, as CacheEntry copies.
+        """
+        with self.lock:
+            return [CacheEntry(*self._read(slot)) for slot in self._used_slots()]
+
+    def items(self):
+        """
+        List the unexpired items.
+
+        :return: List of (key, value, expires_at, version) tuples.
+        """
+        now = time.time()
+        return [(entry.key, entry.value, entry.expires_at, entry.version) for entry in self.entries()
+                if now <= entry.expires_at]
+
+    def snapshot(self, path):
+        """
+        Write the unexpired items to a snapshot file, see LRUCache.snapshot.
+        """
+        return write_snapshot(path, self.entries())
+
+    def restore(self, path, lazy=True):
+        """
+        Load the unexpired items of a snapshot file. Values are copied into the block, so they are decoded now
+        whatever lazy says. Keys already present keep their current value.
+
+        :return: The number of items restored.
+        """
+        restored = 0
+        entries = read_snapshot(path, limit=self.capacity, lazy=False)
+        with self._writing():
+            for entry in entries:
+                if self._find(*_encode_key(entry.key))[0] == _EMPTY:
+                    self._write(entry.key, entry.value, entry.expires_at, entry.version)
+                    restored += 1
+        return restored
+
+    def purge_expired(self):
+        """
+        Free every expired slot.
+
+        :return: The number of items removed.
+        """
+        now, removed = time.time(), 0
+        with self._writing():
+            for slot in self._used_slots():
+                if now > _SLOT.unpack_from(self.buffer, self._slot(slot))[5] + self.stale_grace:
+                    self._remove(slot)
+                    removed += 1
+            self._add(_EXPIRATIONS, removed)
+        return removed
+
+    def _clear_cache(self):
+        """
+        Clear the cache
+        """
+        with self._writing():
+            for slot in self._used_slots():
+                self.buffer[self._slot(slot)] = 0
+            struct.pack_into('<II', self.buffer, _COUNT, 0, 0)
+            self._clear_index()
+            self._chain_free_slots()
+
+    def close(self):
+        """
+        Detach from the block. It stays available to the other processes.
+        """
+        self.buffer = None
+        self.block.close()
+
+    def unlink(self):
+        """
+        Destroy the block once every process closed it.
+        """
+        if not _TRACK:
+            # Before Python 3.13 unlink always unregisters the block, which an attached block no longer is
+            resource_tracker.register(self.block._name, 'shared_memory')
+        self.block.unlink()
@@ -0,0 +1,171 @@
+import gc
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+from .entry import CacheEntry
+from ..exceptions import SerializationError, SnapshotError
+from ..utils import encode_value, decode_value
+
+"""
+Snapshot files of a cache, used to warm a cache up after a restart. A snapshot is a header, the encoded keys and
+values, then a fixed-size index with one record per entry from least to most recently used:
+
+    file   := header data index
+    header := magic:8s version:u16 count:u32 created:f64 index_offset:u64
+    index  := (expires_at:f64 version:u64 offset:u64 key_size:u32 value_size:u32)*
+
+Keys and values use the wire codec's value encoding, the value following its key at offset + key_size. The index is
+written last, so entries are streamed to disk without being held in memory, and reading it never touches the data.
+On restore the file is memory-mapped and values are only decoded the first time they are read.
+"""
+
+SNAPSHOT_MAGIC = b'LRUSNAP\x00'
+SNAPSHOT_VERSION = 2  # Version 2 added the write version of the entries
+
+_HEADER = struct.Struct('<8sHIdQ')
+_INDEX = struct.Struct('<dQQII')
+_TAG_STR8 = encode_value('')[0]
+
+_value_slot = CacheEntry.value  # The slot descriptor of CacheEntry, wrapped by SnapshotEntry
+
+
+class SnapshotEntry(CacheEntry):
+    """
+    A CacheEntry restored from a snapshot, whose value is decoded from the mapped file on first access. Reading the
+    value of an ordinary CacheEntry goes through its slot at no extra cost, only restored entries pay the property.
+    """
+    __slots__ = ('source',)
+
+    def __init__(self, key, source, expires_at, version=0):
+        """
+        :param key: Key of the item.
+        :param source: Tuple of (buffer, offset) locating the encoded value.
+        :param expires_at: Time after which the item is expired.
+        :param version: Version of the write that stored the value.
+        """
+        self.key = key  # The value slot stays unset until the first read
+        self.expires_at = expires_at
+        self.bucket = None
+        self.version = version
+        self.source = source
+
+    @property
+    def value(self):
+        source = self.source
+        if source is not None:
+            _value_slot.__set__(self, decode_value(*source)[0])
+            self.source = None  # Drop the reference so the mapping is released once every value was read
+        return _value_slot.__get__(self)
+
+    @value.setter
+    def value(self, value):
+        self.source = None
+        _value_slot.__set__(self, value)
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Pause the cyclic garbage collector while allocating many objects at once. None of them form cycles, but every
+    allocation burst would otherwise trigger collections scanning the whole growing heap.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def write_snapshot(path, entries, now=None):
+    """
+    Write entries to a snapshot file. The file is written next to its destination and renamed over it, so a reader
+    never sees a partial snapshot.
+
+    :param path: The path of the snapshot file.
+    :param entries: Iterable of CacheEntry, from least to most recently used. Expired entries are left out.
+    :param now: Current time, defaults to time.time().
+    :return: The number of entries written.
+    """
+    now = time.time() if now is None else now
+    temporary = f"{path}.tmp"
+    index = []
+    try:
+        with open(temporary, 'wb') as f:
+            f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, now, 0))
+            offset = _HEADER.size
+            for entry in entries:
+                if entry.expires_at <= now:
+                    continue
+                key, value = encode_value(entry.key), encode_value(entry.value)
+                f.write(key)
+                f.write(value)
+                index.append(_INDEX.pack(entry.expires_at, entry.version, offset, len(key), len(value)))
+                offset += len(key) + len(value)
+            f.write(b''.join(index))
+            f.seek(0)
+            f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(index), now, offset))
+        os.replace(temporary, path)
+    except (OSError, SerializationError) as e:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise SnapshotError(f"Failed to write snapshot {path}: {e}") from e
+    return len(index)
+
+
+def read_snapshot(path, now=None, limit=None, lazy=True):
+    """
+    Read the unexpired entries of a snapshot file.
+
+    :param path: The path of the snapshot file.
+    :param now: Current time, entries expired by then are skipped. Defaults to time.time().
+    :param limit: Keep only the limit most recently used entries, e.g. the capacity of the cache restored.
+    :param lazy: Leave the values in the mapped file until they are read. Otherwise decode them now and close the
+    file.
+    :return: List of CacheEntry, from least to most recently used.
+    """
+    now = time.time() if now is None else now
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise SnapshotError(f"Snapshot {path} is truncated")
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError as e:
+        raise SnapshotError(f"Failed to read snapshot {path}: {e}") from e
+    buffer = memoryview(mapping)
+    entries = []
+    try:
+        magic, version, count, _, index_offset = _HEADER.unpack_from(buffer, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot version {version} in {path}")
+        if index_offset + count * _INDEX.size != len(buffer):
+            raise SnapshotError(f"Snapshot {path} is truncated")
+        with _gc_paused():
+            with buffer[index_offset:] as index:
+                live = [record for record in _INDEX.iter_unpack(index) if record[0] > now]
+            if limit is not None and len(live) > limit:
+                live = live[len(live) - limit:]
+            for expires_at, version, offset, key_size, _ in live:
+                if key_size == buffer[offset + 1] + 2 and buffer[offset] == _TAG_STR8:  # Short string keys, inlined
+                    key = str(buffer[offset + 2:offset + key_size], 'utf-8')
+                else:
+                    key = decode_value(buffer, offset)[0]
+                if lazy:
+                    entries.append(SnapshotEntry(key, (buffer, offset + key_size), expires_at, version))
+                else:
+                    entries.append(CacheEntry(key, decode_value(buffer, offset + key_size)[0], expires_at, version))
+    except (struct.error, IndexError, SerializationError, SnapshotError) as e:
+        buffer.release()
+        mapping.close()
+        if isinstance(e, SnapshotError):
+            raise
+        raise SnapshotError(f"Snapshot {path} is corrupt: {e}") from e
+    if not lazy or not entries:
+        buffer.release()
+        mapping.close()
+    return entries
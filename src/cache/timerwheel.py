@@ -0,0 +1,213 @@
+import time
+
+"""This file contains the TimerWheel class, a hierarchical timing wheel used to find expired cache entries without
+scanning the whole cache."""
+
+
+class TimerWheel:
+    def __init__(self, resolution=1.0, slots=64, levels=4, now=None, delay=0.0):
+        """
+        Initialize a hierarchical Timer Wheel.
+
+        Level 0 has one bucket per tick, and every level above covers `slots` times the span of the level below.
+        Timers far in the future sit in a coarse bucket and cascade down as time advances, so scheduling, cancelling
+        and firing a timer are all O(1). Advancing jumps from one occupied bucket to the next, so an idle gap costs a
+        look at each level's buckets rather than a step per tick.
+
+        Timers are the scheduled objects themselves (e.g. CacheEntry): they expose their deadline as `expires_at`
+        and a writable `bucket` attribute, None while the object is not scheduled. Keeping that state on the object
+        saves a lookup table entry per timer. A deadline that moves later does not need rescheduling: the timer is
+        re-placed when its old bucket comes up.
+
+        :param resolution: Duration of a tick in seconds. A timer fires at most one tick after its deadline.
+        :param slots: Number of buckets per level.
+        :param levels: Number of levels. Deadlines beyond slots ** levels ticks wait in an overflow bucket.
+        :param now: Start time, defaults to the current time.
+        :param delay: Time in seconds timers fire after their expires_at, e.g. to keep expired entries around.
+        """
+        self.resolution = resolution
+        self.delay = delay
+        self.slots = slots
+        self.levels = levels
+        self.spans = [slots ** level for level in range(levels + 1)]
+        self.wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self.overflow = set()
+        self.count = 0
+        self.tick = int((time.time() if now is None else now) / resolution)
+        self.horizon = (self.tick + 1) * resolution  # Nothing can fire before this time
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, timer):
+        """
+        Schedule a timer at its expires_at, or move it if it is already scheduled.
+
+        :param timer: The object to schedule.
+        """
+        if timer.bucket is None:
+            self.count += 1
+        else:
+            timer.bucket.discard(timer)
+        self._place(timer, self.tick)
+
+    def cancel(self, timer):
+        """
+        Cancel a timer, if it is scheduled.
+
+        :param timer: The scheduled object.
+        """
+        if timer.bucket is not None:
+            timer.bucket.discard(timer)
+            timer.bucket = None
+            self.count -= 1
+
+    def advance(self, now=None):
+        """
+        Move the wheel up to the current time and collect the timers that fired.
+
+        :param now: Current time, defaults to time.time().
+        :return: List of objects whose deadline has passed. They are no longer scheduled.
+        """
+        target = int((time.time() if now is None else now) / self.resolution)
+        if target <= self.tick:
+            return []
+        self.horizon = (target + 1) * self.resolution
+        if not self.count:
+            self.tick = target
+            return []
+        if target - self.tick >= self.spans[self.levels]:
+            return self._advance_all(target)
+        expired = []
+        while self.count and self.tick < target:
+            # A single tick, the usual step when the wheel is advanced on every operation, is not worth a search
+            tick = self.tick + 1 if target - self.tick == 1 else self._next_tick(target)
+            if tick is None:
+                break
+            for level in range(self.levels - 1, 0, -1):
+                span = self.spans[level]
+                if tick % span == 0:
+                    self._cascade(self.wheels[level][(tick // span) % self.slots], tick - 1)
+            if self.overflow and tick % self.spans[self.levels] == 0:
+                self._cascade(self.overflow, tick - 1)
+            bucket = self.wheels[0][tick % self.slots]
+            if bucket:
+                timers = list(bucket)
+                bucket.clear()
+                for timer in timers:
+                    if self._fire_tick(timer) > tick:  # The deadline was pushed back since it was placed
+                        self._place(timer, tick)
+                    else:
+                        timer.bucket = None
+                        self.count -= 1
+                        expired.append(timer)
+            self.tick = tick
+        self.tick = target
+        return expired
+
+    def _next_tick(self, target):
+        """
+        Find the next tick with work: a level 0 bucket to fire, or a coarser bucket or the overflow to cascade. The
+        ticks before it would only visit empty buckets and can be skipped.
+
+        :param target: The last tick to consider.
+        :return: The tick, or None when nothing happens up to target.
+        """
+        tick, slots = self.tick, self.slots
+        wheel = self.wheels[0]
+        best = None
+        for candidate in range(tick + 1, min(tick + slots, target) + 1):
+            if wheel[candidate % slots]:
+                best = candidate
+                break
+        limit = target if best is None else best - 1  # Only an earlier tick can still win
+        for level in range(1, self.levels):
+            span = self.spans[level]
+            first = tick // span + 1  # Blocks of a coarser level start on multiples of a finer level's span
+            if first * span > limit:
+                break
+            wheel = self.wheels[level]
+            for block in range(first, min(first + slots - 1, limit // span) + 1):
+                if wheel[block % slots]:
+                    best = block * span
+                    limit = best - 1
+                    break
+        if self.overflow:
+            span = self.spans[self.levels]
+            candidate = (tick // span + 1) * span
+            if candidate <= limit:
+                best = candidate
+        return best
+
+    def clear(self):
+        """
+        Cancel every timer.
+        """
+        for timer in self._timers():
+            timer.bucket = None
+        for wheel in self.wheels:
+            for bucket in wheel:
+                bucket.clear()
+        self.overflow.clear()
+        self.count = 0
+
+    def _timers(self):
+        for wheel in self.wheels:
+            for bucket in wheel:
+                yield from bucket
+        yield from self.overflow
+
+    def _fire_tick(self, timer):
+        return int((timer.expires_at + self.delay) / self.resolution) + 1
+
+    def _place(self, timer, current_tick):
+        """
+        Put a timer in the bucket matching its distance to the current tick.
+
+        :param timer: The object to place.
+        :param current_tick: The last tick already processed.
+        """
+        fire_tick = int((timer.expires_at + self.delay) / self.resolution) + 1
+        if fire_tick <= current_tick:
+            fire_tick = current_tick + 1
+        slots = self.slots
+        if fire_tick - current_tick <= slots:
+            bucket = self.wheels[0][fire_tick % slots]
+        else:
+            for level in range(1, self.levels):
+                span = self.spans[level]
+                # The bucket is visited at the start of the fire tick's block, which must come within one turn
+                if fire_tick // span - current_tick // span <= slots:
+                    bucket = self.wheels[level][(fire_tick // span) % slots]
+                    break
+            else:
+                bucket = self.overflow
+        bucket.add(timer)
+        timer.bucket = bucket
+
+    def _cascade(self, bucket, current_tick):
+        """
+        Move the timers of a coarse bucket to the finer buckets they now belong to.
+        """
+        if not bucket:
+            return
+        timers = list(bucket)
+        bucket.clear()
+        for timer in timers:
+            self._place(timer, current_tick)
+
+    def _advance_all(self, target):
+        """
+        Advance past a gap longer than the whole wheel by re-placing every timer instead of walking each tick.
+        """
+        timers = list(self._timers())
+        self.clear()
+        self.tick = target
+        expired = []
+        for timer in timers:
+            if self._fire_tick(timer) <= target:
+                expired.append(timer)
+            else:
+                self.count += 1
+                self._place(timer, target)
+        return expired
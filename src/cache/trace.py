@@ -0,0 +1,179 @@
+import itertools
+import mmap
+import struct
+import time
+from threading import Lock
+from ..exceptions import TraceError
+from ..utils import TRACE_CAPACITY, TRACE_SAMPLE_RATE
+
+"""
+Access traces of a cache, replayed offline by mrc.py to size the regions from real traffic. A trace file is a fixed
+header, a table of region names, then a ring of fixed-size records overwritten from the oldest once it is full:
+
+    file    := header regions records
+    header  := magic:8s version:u16 record_size:u16 sample_rate:f64 capacity:u64 written:u64 region_count:u16
+    regions := (name:48s)*64
+    records := (key_hash:u64 timestamp:f64 ttl:f32 region:u16 op:u8 pad:u8 reads:u32)*capacity
+
+Keys are sampled by hash rather than by access: a sampled key has all its accesses recorded, an unsampled one none,
+which is what SHARDS needs to estimate reuse distances from a fraction of the keys. The reads of every region are
+counted whether sampled or not, each record carries the count of its region, modulo 2 ** 32, so that the reads of
+the period a trace covers correct the estimate when the sample misses or catches a very hot key.
+
+The key hash is the built-in hash(), mixed so that integer keys are sampled evenly. It is cached on string keys, so
+an unsampled access costs next to nothing, but it is salted per process: the records of two processes do not share
+key hashes. Records are written into a memory-mapped file without a lock or a system call, the position of the next
+one is drawn from an atomic counter.
+"""
+
+TRACE_MAGIC = b'LRUTRACE'
+TRACE_VERSION = 1
+
+TRACE_GET = 0  # A lookup
+TRACE_PUT = 1  # A write, local or replicated, with the ttl of the written entry
+TRACE_DELETE = 2  # A removal, e.g. an invalidation dropping the copy of a region
+
+_HEADER = struct.Struct('<8sHHdQQH')
+_WRITTEN = struct.Struct('<Q')
+_WRITTEN_OFFSET = 28  # Offset of the written field in the header
+_REGION = struct.Struct('<48s')
+_REGION_SLOTS = 64
+_REGIONS_OFFSET = 64
+_RECORDS_OFFSET = _REGIONS_OFFSET + _REGION.size * _REGION_SLOTS
+_RECORD = struct.Struct('<QdfHBxI')
+_SAMPLE_BITS = 24  # The high bits of the key hash compared to the sampling threshold
+_SAMPLE_MASK = ((1 << _SAMPLE_BITS) - 1) << 64 - _SAMPLE_BITS
+_MIX = 0x9E3779B97F4A7C15  # Odd multiplier spreading the built-in hash over the 64 bits, Fibonacci hashing
+_MASK = (1 << 64) - 1
+_READS_MASK = (1 << 32) - 1
+
+
+class TraceRecorder:
+    def __init__(self, path, sample_rate=TRACE_SAMPLE_RATE, capacity=TRACE_CAPACITY):
+        """
+        Create a trace file, replacing any file at path, and record accesses into it.
+
+        Recording a key outside the sample costs a few integer operations, recording a sampled one a struct pack
+        into the mapped file. Concurrent writers never share a record, readers order the records by their timestamp.
+
+        :param path: The path of the trace file.
+        :param sample_rate: Share of the keys whose accesses are recorded, between 0 and 1.
+        :param capacity: Number of records the file holds, the oldest are overwritten once it is full.
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("The sample rate must be in (0, 1]")
+        if capacity < 1:
+            raise ValueError("A trace holds at least one record")
+        self.path = path
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.threshold = round(sample_rate * (1 << _SAMPLE_BITS)) << 64 - _SAMPLE_BITS
+        self.region_ids = {}
+        self.reads = []  # Reads of every region, by region id, sampled or not
+        self.regions_lock = Lock()
+        self.counter = itertools.count()
+        try:
+            with open(path, 'w+b') as f:
+                f.truncate(_RECORDS_OFFSET + capacity * _RECORD.size)
+                f.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, _RECORD.size, sample_rate, capacity, 0, 0))
+                self.map = mmap.mmap(f.fileno(), 0)
+        except OSError as e:
+            raise TraceError(f"Failed to create trace {path}: {e}") from e
+
+    def record(self, key, op, region='', ttl=0.0):
+        """
+        Record an access if its key is sampled.
+
+        :param key: The key accessed.
+        :param op: TRACE_GET, TRACE_PUT or TRACE_DELETE.
+        :param region: The region of the cache accessed.
+        :param ttl: With TRACE_PUT, time in seconds after which the written entry expires.
+        """
+        region_id = self.region_ids.get(region)
+        if region_id is None:
+            region_id = self._add_region(region)
+        if op == TRACE_GET:
+            self.reads[region_id] += 1
+        mixed = hash(key) * _MIX
+        if mixed & _SAMPLE_MASK >= self.threshold:
+            return
+        index = next(self.counter)
+        try:
+            _RECORD.pack_into(self.map, _RECORDS_OFFSET + index % self.capacity * _RECORD.size, mixed & _MASK,
+                              time.time(), ttl, region_id, op, self.reads[region_id] & _READS_MASK)
+            _WRITTEN.pack_into(self.map, _WRITTEN_OFFSET, index + 1)
+        except (ValueError, TypeError):  # Closed meanwhile, the access is not recorded
+            pass
+
+    def _add_region(self, region):
+        """
+        :return: The id of a region, written to the region table on first use.
+        """
+        with self.regions_lock:
+            region_id = self.region_ids.get(region)
+            if region_id is not None:
+                return region_id
+            name = str(region).encode('utf-8')
+            if len(name) > _REGION.size:
+                raise TraceError(f"Region name {region} is longer than {_REGION.size} bytes")
+            region_id = len(self.region_ids)
+            if region_id >= _REGION_SLOTS:
+                raise TraceError(f"A trace records at most {_REGION_SLOTS} regions")
+            _REGION.pack_into(self.map, _REGIONS_OFFSET + region_id * _REGION.size, name)
+            struct.pack_into('<H', self.map, _HEADER.size - 2, region_id + 1)
+            self.reads.append(0)
+            self.region_ids[region] = region_id
+            return region_id
+
+    def __len__(self):
+        """
+        :return: The number of records written, including those overwritten since.
+        """
+        return _WRITTEN.unpack_from(self.map, _WRITTEN_OFFSET)[0]
+
+    def flush(self):
+        """
+        Write the recorded accesses to disk.
+        """
+        self.map.flush()
+
+    def close(self):
+        """
+        Flush the trace and close the file. Accesses recorded afterwards are dropped.
+        """
+        if self.map.closed:
+            return
+        self.map.flush()
+        self.map.close()
+
+
+def read_trace(path):
+    """
+    Read a trace file.
+
+    :param path: The path of the trace file.
+    :return: Dictionary of the 'sample_rate', the 'regions' in the order of their ids, the number of records
+    'written', including those overwritten since, and the 'records' still in the file, from the oldest to the
+    newest, as (key hash, timestamp, ttl, region id, op, reads) tuples, reads counting the reads of the region,
+    sampled or not, modulo 2 ** 32.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        raise TraceError(f"Failed to read trace {path}: {e}") from e
+    if len(data) < _RECORDS_OFFSET:
+        raise TraceError(f"Trace {path} is truncated")
+    magic, version, record_size, sample_rate, capacity, written, region_count = _HEADER.unpack_from(data, 0)
+    if magic != TRACE_MAGIC:
+        raise TraceError(f"{path} is not a trace")
+    if version != TRACE_VERSION or record_size != _RECORD.size:
+        raise TraceError(f"Unsupported trace version {version} in {path}")
+    if len(data) != _RECORDS_OFFSET + capacity * _RECORD.size:
+        raise TraceError(f"Trace {path} is truncated")
+    regions = [_REGION.unpack_from(data, _REGIONS_OFFSET + i * _REGION.size)[0].rstrip(b'\x00').decode('utf-8')
+               for i in range(region_count)]
+    with memoryview(data)[_RECORDS_OFFSET:] as view:
+        records = [record for record in _RECORD.iter_unpack(view) if record[1] > 0]
+    records.sort(key=lambda record: record[1])  # Orders the ring and the records of concurrent writers alike
+    return {'sample_rate': sample_rate, 'regions': regions, 'written': written, 'records': records}
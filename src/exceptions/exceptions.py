@@ -36,3 +36,23 @@ class CacheCapacityError(CacheError):
 class CacheExpirationError(CacheError):
     """ Raised when there is an error related to cache expiration logic """
     pass
+
+
+class SerializationError(CacheError):
+    """ Raised when a value cannot be encoded or a message cannot be decoded """
+    pass
+
+
+class CacheLoadError(CacheError):
+    """ Raised when the loader of a read-through cache fails to load a key """
+    pass
+
+
+class SnapshotError(CacheError):
+    """ Raised when a snapshot file cannot be read or written """
+    pass
+
+
+class TraceError(CacheError):
+    """ Raised when an access trace file cannot be read or written """
+    pass
@@ -1,3 +1,7 @@
 from .messaging import Messaging
 from .circuitbreaker import CircuitBreaker
+from .batcher import ReplicationBatcher
+from .outbox import Outbox
+from .transport import Transport, RabbitMQTransport, InMemoryBroker, InMemoryTransport
+from .asynctransport import AsyncTransport, AsyncInMemoryTransport, AsyncRabbitMQTransport
 # from pika import exceptions
@@ -0,0 +1,248 @@
+import asyncio
+import inspect
+import logging
+import threading
+from .transport import Transport
+from ..exceptions import MessagePublishError
+from ..utils.config import (ASYNC_PUBLISH_CAPACITY, RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USERNAME,
+                            RABBITMQ_PASSWORD, RABBITMQ_EXCHANGE, RABBITMQ_CONFIRM_DELIVERY)
+
+"""
+This file contains the transports driven by an asyncio event loop, used by AsyncGeoDistributedLRUCache: publishing
+only queues the message and each queue is consumed by a task of the loop, so no call waits for the broker and no
+thread is started. AsyncRabbitMQTransport talks to RabbitMQ through aio-pika, AsyncInMemoryTransport is its
+in-process stand-in.
+"""
+
+
+class AsyncTransport(Transport):
+    def __init__(self, capacity=ASYNC_PUBLISH_CAPACITY):
+        """
+        Initialize the transport on the running event loop, so it must be created from a coroutine.
+
+        publish hands the message over without waiting and may be called from any thread, calls from other threads
+        are passed to the loop. Messages published and not yet delivered are pending: wait_writable lets writers
+        wait while capacity of them are, which bounds the memory held by a slow broker or consumer.
+
+        :param capacity: Number of pending messages from which wait_writable waits.
+        """
+        self.capacity = capacity
+        self.loop = asyncio.get_running_loop()
+        self.thread = threading.get_ident()  # The thread running the loop
+        self.pending = 0
+        self.writable = asyncio.Event()  # Set while fewer than capacity messages are pending
+        self.writable.set()
+        self.drained = asyncio.Event()  # Set while no message is pending
+        self.drained.set()
+        self.tasks = []
+        self.closed = False
+
+    def publish(self, name, body):
+        if self.closed:
+            raise MessagePublishError(f"Failed to publish to {name}: the transport is closed")
+        if threading.get_ident() == self.thread:
+            self._publish(name, body)
+        else:
+            self.loop.call_soon_threadsafe(self._publish, name, body)
+
+    def _publish(self, name, body):
+        """
+        Queue a message, on the loop thread.
+        """
+        self.pending += 1
+        self.drained.clear()
+        if self.pending >= self.capacity:
+            self.writable.clear()
+        self._send(name, body)
+
+    def _send(self, name, body):
+        """
+        Hand a queued message to the broker, calling _delivered once it is. Runs on the loop thread.
+        """
+        raise NotImplementedError
+
+    def _delivered(self):
+        self.pending -= 1
+        if self.pending < self.capacity:
+            self.writable.set()
+        if not self.pending:
+            self.drained.set()
+
+    def consume(self, name, callback):
+        """
+        Start a task of the loop consuming a queue. The callback may be a coroutine function.
+        """
+        self.tasks.append(self.loop.create_task(self._consume(name, callback)))
+
+    async def _consume(self, name, callback):
+        raise NotImplementedError
+
+    @staticmethod
+    async def _apply(callback, body, name):
+        try:
+            result = callback(body, name)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logging.error("Failed to apply a message from %s: %s", name, e)
+
+    async def wait_writable(self):
+        """
+        Wait until fewer than capacity messages are pending.
+        """
+        while not self.writable.is_set():
+            await self.writable.wait()
+
+    async def join(self):
+        """
+        Wait until every message published so far was delivered.
+        """
+        while not self.drained.is_set():
+            await self.drained.wait()
+
+    def close(self):
+        """
+        Refuse new messages and cancel the tasks. See wait_closed to wait for them.
+        """
+        self.closed = True
+        for task in self.tasks:
+            task.cancel()
+
+    async def wait_closed(self):
+        """
+        Wait until the cancelled tasks finished.
+        """
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+class AsyncInMemoryTransport(AsyncTransport):
+    def __init__(self, capacity=ASYNC_PUBLISH_CAPACITY):
+        """
+        Initialize an in-process transport of asyncio queues, one per name. A message is delivered once its
+        consumer applied it.
+
+        :param capacity: Number of pending messages from which wait_writable waits.
+        """
+        super().__init__(capacity)
+        self.queues = {}
+
+    def queue(self, name):
+        queue = self.queues.get(name)
+        if queue is None:
+            queue = self.queues[name] = asyncio.Queue()
+        return queue
+
+    def declare_queue(self, name):
+        self.queue(name)
+
+    def _send(self, name, body):
+        self.queue(name).put_nowait(body)
+
+    async def _consume(self, name, callback):
+        queue = self.queue(name)
+        while True:
+            body = await queue.get()
+            try:
+                await self._apply(callback, body, name)
+            finally:
+                self._delivered()
+
+
+class AsyncRabbitMQTransport(AsyncTransport):
+    def __init__(self, host=RABBITMQ_HOST, port=RABBITMQ_PORT, username=RABBITMQ_USERNAME,
+                 password=RABBITMQ_PASSWORD, exchange=RABBITMQ_EXCHANGE, confirm_delivery=RABBITMQ_CONFIRM_DELIVERY,
+                 capacity=ASYNC_PUBLISH_CAPACITY):
+        """
+        Initialize the asyncio RabbitMQ transport, which needs the aio-pika package.
+
+        A single robust connection carries a publishing channel and the consumers. Queued messages are published in
+        order by a task of the loop, and a message is delivered once the broker took it, confirmed with
+        confirm_delivery. Nothing connects until a task needs the broker. A message the broker refused is logged and
+        dropped, like a failed publish of RabbitMQTransport.
+
+        :param host: The host of the RabbitMQ server.
+        :param port: The port of the RabbitMQ server.
+        :param username: The RabbitMQ user.
+        :param password: The password of the RabbitMQ user.
+        :param exchange: The exchange messages are published to. The default exchange ('') routes by queue name.
+        :param confirm_delivery: Wait for the broker to confirm each publish.
+        :param capacity: Number of pending messages from which wait_writable waits.
+        """
+        try:
+            import aio_pika
+        except ImportError as e:
+            raise ImportError("AsyncRabbitMQTransport needs the aio-pika package: pip install aio-pika") from e
+        super().__init__(capacity)
+        self.aio_pika = aio_pika
+        self.url = f"amqp://{username}:{password}@{host}:{port}/"
+        self.exchange_name = exchange
+        self.confirm_delivery = confirm_delivery
+        self.outgoing = asyncio.Queue()
+        self.connection = None
+        self.publishing = None  # Channel of the publisher
+        self.exchange = None
+        self.connecting = asyncio.Lock()
+        self.publisher = None
+
+    async def channel(self):
+        """
+        :return: The publishing channel, connecting if needed.
+        """
+        async with self.connecting:
+            if self.connection is None:
+                self.connection = await self.aio_pika.connect_robust(self.url)
+                self.publishing = await self.connection.channel(publisher_confirms=self.confirm_delivery)
+                self.exchange = (self.publishing.default_exchange if not self.exchange_name
+                                 else await self.publishing.get_exchange(self.exchange_name))
+        return self.publishing
+
+    def declare_queue(self, name):
+        self.tasks.append(self.loop.create_task(self._declare(name)))
+
+    async def _declare(self, name):
+        try:
+            await (await self.channel()).declare_queue(name)
+        except Exception as e:
+            logging.error("Failed to declare queue for region %s: %s", name, e)
+
+    def _send(self, name, body):
+        self.outgoing.put_nowait((name, body))
+        if self.publisher is None:
+            self.publisher = self.loop.create_task(self._publish_loop())
+            self.tasks.append(self.publisher)
+
+    async def _publish_loop(self):
+        while True:
+            name, body = await self.outgoing.get()
+            try:
+                await self.channel()
+                body = body.encode('utf-8') if isinstance(body, str) else bytes(body)
+                await self.exchange.publish(self.aio_pika.Message(body=body), routing_key=name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("Failed to publish message to %s: %s", name, e)
+            finally:
+                self._delivered()
+
+    async def _consume(self, name, callback):
+        try:
+            await self.channel()
+            channel = await self.connection.channel()  # Consumers get their own channel
+            queue = await channel.declare_queue(name)
+            async with queue.iterator() as messages:
+                async for message in messages:
+                    async with message.process():
+                        await self._apply(callback, message.body, name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not self.closed:
+                logging.error("Connection error for region %s: %s", name, e)
+
+    async def wait_closed(self):
+        await super().wait_closed()
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from ..utils.config import REPLICATION_BATCH_SIZE, REPLICATION_FLUSH_INTERVAL
+
+"""
+This file contains the ReplicationBatcher, which buffers replication updates per destination region, coalesces
+repeated writes to the same key and hands them over as one batch once a size or time threshold is reached.
+"""
+
+
+class ReplicationBatcher:
+    def __init__(self, send, batch_size=REPLICATION_BATCH_SIZE, flush_interval=REPLICATION_FLUSH_INTERVAL):
+        """
+        Initialize the Replication Batcher.
+
+        :param send: Callable receiving (records, destination) for every flushed batch, where records is a list of
+        update dictionaries such as {'key': ..., 'value': ...}.
+        :param batch_size: Number of distinct keys buffered for a destination before it is flushed.
+        :param flush_interval: Maximum time in seconds an update waits in the buffer.
+        """
+        self.send = send
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffers = {}
+        self.deadlines = {}
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+
+    def add(self, record, destination):
+        """
+        Buffer an update for a destination region. A pending update for the same key is replaced (last write wins).
+
+        :param record: The update to replicate, a dictionary holding at least its 'key'.
+        :param destination: The region the update is sent to.
+        """
+        with self.condition:
+            buffer = self.buffers.setdefault(destination, {})
+            buffer[record['key']] = record
+            if destination not in self.deadlines:
+                self.deadlines[destination] = time.monotonic() + self.flush_interval
+                self.condition.notify()
+            if len(buffer) < self.batch_size:
+                return
+            records = self._take(destination)
+        self._send(records, destination)
+
+    def flush(self):
+        """
+        Send every pending batch right away.
+        """
+        with self.condition:
+            batches = [(self._take(destination), destination) for destination in list(self.buffers)]
+        for records, destination in batches:
+            self._send(records, destination)
+
+    def close(self):
+        """
+        Flush the pending batches and stop the background flusher.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
+
+    def _take(self, destination):
+        """
+        Remove the buffer of a destination. Must be called with the condition held.
+
+        :param destination: The destination region.
+        :return: The buffered updates as a list of records.
+        """
+        buffer = self.buffers.pop(destination, {})
+        self.deadlines.pop(destination, None)
+        return list(buffer.values())
+
+    def _send(self, records, destination):
+        if not records:
+            return
+        try:
+            self.send(records, destination)
+        except Exception as e:
+            logging.error("Failed to send a batch of %d updates to region %s: %s", len(records), destination, e)
+
+    def _flush_loop(self):
+        """
+        Flush the buffers whose oldest update has waited for flush_interval.
+        """
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+                now = time.monotonic()
+                due = [destination for destination, deadline in self.deadlines.items() if deadline <= now]
+                batches = [(self._take(destination), destination) for destination in due]
+                if not batches:
+                    timeout = min(self.deadlines.values()) - now if self.deadlines else None
+                    self.condition.wait(timeout)
+                    continue
+            for records, destination in batches:
+                self._send(records, destination)
@@ -1,3 +1,4 @@
+import threading
 import time
 from ..utils.config import CIRCUIT_BREAKER_MAX_FAILURES, CIRCUIT_BREAKER_RESET_TIME
 
@@ -6,12 +7,19 @@ This file contains the CircuitBreaker, which goal is to prevent the system from
 likely to fail.
 """
 
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
 
 class CircuitBreaker:
     def __init__(self, max_failures=CIRCUIT_BREAKER_MAX_FAILURES, reset_time=CIRCUIT_BREAKER_RESET_TIME):
         """
         Initialize the Circuit Breaker.
 
+        The breaker is closed until max_failures failures are recorded, then open: allow_request refuses every
+        call for reset_time seconds. After that it lets a single probe call through (half-open). A success of the
+        probe closes the breaker, a failure opens it for another reset_time. A probe whose outcome was never recorded
+        is given up after reset_time, and the next call probes again. The breaker is safe to share between threads.
+
         :param max_failures: The maximum number of failures before the breaker opens.
         :param reset_time: The time in seconds to wait before resetting the breaker state.
         """
@@ -19,37 +27,81 @@ class CircuitBreaker:
         self.reset_time = reset_time
         self.failures = 0
         self.last_failure_time = None
+        self.state = CLOSED
+        self.lock = threading.Lock()
 
     def record_failure(self):
         """
-        Record a failure. Open the circuit breaker if the failure threshold is reached.
+        Record a failure. Open the circuit breaker if the failure threshold is reached, or if the failed call was
+        the probe of a half-open breaker.
         """
-        self.failures += 1
-        self.last_failure_time = time.time()
+        with self.lock:
+            self.failures += 1
+            self.last_failure_time = time.time()
+            if self.failures >= self.max_failures or self.state == HALF_OPEN:
+                self._open()
+
+    def record_success(self):
+        """
+        Record a success, which closes the breaker.
+        """
+        if self.state == CLOSED and not self.failures:  # Nothing to reset, skip the lock on the common path
+            return
+        self.reset()
+
+    def allow_request(self):
+        """
+        Check whether a call may go through, and turn an open breaker whose reset time elapsed half-open. Only the
+        call that turned it half-open is allowed until its outcome is recorded.
 
-        if self.failures >= self.max_failures:
-            self.open()
+        :return: True if the call may be made.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if time.time() - self.last_failure_time >= self.reset_time:
+                self.state = HALF_OPEN
+                self.last_failure_time = time.time()  # Start of the probe
+                return True
+            return False
 
     def reset(self):
         """
         Reset the circuit breaker to the closed state.
         """
-        self.failures = 0
-        self.last_failure_time = None
+        with self.lock:
+            self.failures = 0
+            self.last_failure_time = None
+            self.state = CLOSED
 
     def is_open(self):
         """
         Check if the circuit breaker is open.
 
-        :return: True if the circuit breaker is open, False otherwise.
+        :return: True if the circuit breaker is open or probing, False otherwise.
         """
-        if self.failures < self.max_failures:
+        state = self.state
+        if state == CLOSED:
             return False
-        return (time.time() - self.last_failure_time) < self.reset_time
+        if state == HALF_OPEN:
+            return True
+        last_failure_time = self.last_failure_time
+        return last_failure_time is not None and (time.time() - last_failure_time) < self.reset_time
+
+    def snapshot(self):
+        """
+        :return: Dictionary of whether the breaker is 'open', its 'state' and its number of 'failures'.
+        """
+        return {'open': self.is_open(), 'state': self.state, 'failures': self.failures}
 
     def open(self):
         """
         Open the circuit breaker.
         """
-        self.failures = self.max_failures
+        with self.lock:
+            self._open()
+
+    def _open(self):
+        self.failures = max(self.failures, self.max_failures)
         self.last_failure_time = time.time()
+        self.state = OPEN
@@ -1,130 +1,230 @@
 import logging
-import threading
-import pika
-from pika import exceptions
+from time import perf_counter
+from .batcher import ReplicationBatcher
+from .circuitbreaker import CircuitBreaker
+from .outbox import Outbox
+from .transport import RabbitMQTransport
+from ..exceptions import CacheConnectionError, MessagePublishError
+from ..utils.config import (OUTBOX_CAPACITY, OUTBOX_SPILL_PATH, RABBITMQ_HOST, REPLICATION_BATCHING,
+                            REPLICATION_BATCH_SIZE, REPLICATION_FLUSH_INTERVAL, REPLICATION_OUTBOX)
 
 """
-This class is responsible for handling the messaging and replication logic across different cache regions using RabbitMQ
+This class is responsible for handling the messaging and replication logic across different cache regions. Messages
+travel over a Transport, RabbitMQ by default.
 """
 
 
 class Messaging:
-    def __init__(self, cache_instance, host='localhost'):
+    def __init__(self, cache_instance, host=RABBITMQ_HOST, batching=REPLICATION_BATCHING,
+                 batch_size=REPLICATION_BATCH_SIZE, flush_interval=REPLICATION_FLUSH_INTERVAL, transport=None,
+                 consume=True, outbox=REPLICATION_OUTBOX, outbox_capacity=OUTBOX_CAPACITY,
+                 outbox_spill=OUTBOX_SPILL_PATH, debounce_interval=None):
         """
         Initialize the Messaging system for the cache.
 
         :param cache_instance: The instance of the GeoDistributedLRUCache.
-        :param host: The host of the RabbitMQ server.
+        :param host: The host of the RabbitMQ server, used when no transport is given.
+        :param batching: Buffer updates per destination region and publish them as batches.
+        :param batch_size: Number of distinct keys that triggers a batch flush.
+        :param flush_interval: Time in seconds after which a non-empty batch is flushed.
+        :param transport: The Transport carrying the messages, a RabbitMQTransport to `host` by default.
+        :param consume: Consume the region queues. Processes sharing their region caches leave it to one of them and
+        only publish.
+        :param outbox: Hand the messages to an Outbox, sent by a background thread, instead of publishing them from
+        the calling thread. The sends are guarded by the publishing circuit breaker.
+        :param outbox_capacity: Number of messages the outbox keeps in memory.
+        :param outbox_spill: Path of the append-only file receiving the messages overflowing the outbox, None to drop
+        the oldest ones.
+        :param debounce_interval: When set, time in seconds during which debounce_update sends each key at most once
+        to each region.
         """
         self.host = host
-        self.connection_params = pika.ConnectionParameters(self.host)
-        self.connection = pika.BlockingConnection(self.connection_params)
-        self.channel = self.connection.channel()
+        self.consume = consume
+        self.transport = transport if transport is not None else RabbitMQTransport(host)
         self.cache_instance = cache_instance
+        self.stats = getattr(cache_instance, 'stats_data', None)  # CacheStats of the cache, None when disabled
+        # Failures of the broker, apart from the circuit breaker of the cache, which follows its loader
+        self.circuit_breaker = CircuitBreaker()
+        self.batcher = ReplicationBatcher(self.publish_batch, batch_size, flush_interval) if batching else None
+        # Never flushed by size, so that a key is sent once per interval whatever the number of keys debounced
+        self.debouncer = ReplicationBatcher(self.publish_batch, float('inf'),
+                                            debounce_interval) if debounce_interval else None
+        self.outbox = Outbox(self.deliver, outbox_capacity, outbox_spill, self.circuit_breaker) if outbox else None
         self.setup_queues()
         self.setup_messaging()
 
-    """ 
-    Encountered a common issue where pika throws a pika.exceptions.ReentrancyError where pika's BlockingConnection does 
-    not allow to start_consuming() from within the same thread that's handling another BlockingConnection or 
-    BlockingChannel callback.
-    """
-
     def setup_queues(self):
         """
         Declares the queues without starting to consume messages
         """
         for region in self.cache_instance.regions:
-            self.channel.queue_declare(queue=region)
+            try:
+                self.transport.declare_queue(region)
+            except CacheConnectionError as e:
+                logging.error("Failed to declare queue for region %s: %s", region, e)
 
-    def start_consumer_thread(self):
+    def setup_messaging(self):
         """
-        Initializes a separate thread for each region to consume messages, with Each thread creating its own channel to
-        avoid reentrancy issues
+        Start consuming the queue of every region.
         """
+        if not self.consume:
+            return
         for region in self.cache_instance.regions:
-            thread = threading.Thread(target=self.consume_messages, args=(region,))
-            thread.daemon = True
-            thread.start()
-
-    def consume_messages(self, region):
-        channel = self.connection.channel()  # Create a new channel for this thread
-        channel.basic_consume(queue=region, on_message_callback=self.on_message, auto_ack=True)
-        try:
-            channel.start_consuming()
-        except exceptions as e:
-            print(e)
-        finally:
-            channel.close()
-            self.connection.close()
+            self.setup_region_queue(region)
 
-    def setup_messaging(self):
+    def add_region(self, region):
         """
-        Setup the messaging system with RabbitMQ.
+        Declare and start consuming the queue of a region that joined after the messaging was set up.
+
+        :param region: The name of the region.
         """
         try:
-            self.connection_params = pika.ConnectionParameters(self.host)
-            self.connection = pika.BlockingConnection(self.connection_params)
-            self.channel = self.connection.channel()
-
-            for region in self.cache_instance.regions:
-                self.setup_region_queue(region)
-        except pika.exceptions.AMQPConnectionError as e:
-            logging.error("Failed to connect to RabbitMQ: %s", e)
-            # Handle connection error here, possibly retry
+            self.transport.declare_queue(region)
+        except CacheConnectionError as e:
+            logging.error("Failed to declare queue for region %s: %s", region, e)
+        if self.consume:
+            self.setup_region_queue(region)
 
     def setup_region_queue(self, region):
         """
-        Set up a queue for a specific region.
+        Start consuming the queue of a specific region. The transport runs the consumer in its own thread.
 
         :param region: The name of the region.
         """
-        try:
-            self.channel.queue_declare(queue=region)
-            self.channel.basic_consume(queue=region, on_message_callback=self.on_message, auto_ack=True)
+        self.transport.consume(region, self.handle_message)
 
-            thread = threading.Thread(target=self.start_consuming, args=(region,))
-            thread.daemon = True
-            thread.start()
-        except pika.exceptions.ChannelError as e:
-            logging.error("Failed to declare queue or start consumer for region %s: %s", region, e)
-            # Handle channel error here
-
-    def start_consuming(self, region):
+    def on_message(self, ch, method, properties, body):
         """
-        Start consuming messages from the queue.
+        Callback function for handling incoming messages, with the signature of a pika consumer callback.
 
-        :param region: The name of the region.
+        :param method: The method frame.
+        :param body: The message body.
         """
-        try:
-            self.channel.start_consuming()
-        except pika.exceptions.ConnectionClosedByBroker:
-            logging.error("Connection closed by broker for region: %s", region)
-        except pika.exceptions.AMQPChannelError as e:
-            logging.error("Channel error for region %s: %s", region, e)
-        except pika.exceptions.AMQPConnectionError as e:
-            logging.error("Connection error for region %s: %s", region, e)
+        self.handle_message(body, method.routing_key)
 
-    def on_message(self, ch, method, properties, body):
+    def handle_message(self, body, region):
         """
-        Callback function for handling incoming messages.
+        Apply an incoming message to the cache of its region.
 
-        :param method: The method frame.
         :param body: The message body.
+        :param region: The region whose queue delivered the message.
         """
-        self.cache_instance.update_cache(body, method.routing_key)
+        self.cache_instance.update_cache(body, region)
 
-    def publish_update(self, message, region):
+    def publish_update(self, message, region, targets=None):
         """
         Publish an update to all region queues except the originating region.
 
         :param message: The message to be published.
         :param region: The originating region.
+        :param targets: The regions to publish to, every region by default. The originating region is skipped.
         """
+        for reg in self.cache_instance.regions if targets is None else targets:
+            if reg != region:
+                self.publish_to(message, reg)
+
+    def publish_to(self, message, region):
+        """
+        Publish a message to the queue of a single region, or queue it in the outbox.
+
+        :param message: The message to be published.
+        :param region: The destination region.
+        """
+        if self.outbox is not None:
+            self.outbox.put(region, message)
+            return
         try:
-            for reg in self.cache_instance.regions:
-                if reg != region:
-                    self.channel.basic_publish(exchange='test', routing_key=reg, body=message)
-        except pika.exceptions.AMQPConnectionError as e:
+            self.deliver(region, message)
+        except MessagePublishError as e:
             logging.error("Failed to publish message: %s", e)
-            # Handle publishing error here, possibly retry
+            self.circuit_breaker.record_failure()
+            return
+        self.circuit_breaker.record_success()
+
+    def deliver(self, region, message):
+        """
+        Publish a message to the queue of a region from the calling thread, counting it in the statistics.
+
+        :param region: The destination region.
+        :param message: The message to be published.
+        :raises MessagePublishError: If the transport failed to publish it.
+        """
+        stats = self.stats
+        region_stats = start = None
+        if stats is not None:
+            region_stats = stats.region(region)
+            if stats.sample():
+                start = perf_counter()
+        try:
+            self.transport.publish(region, message)
+        except MessagePublishError:
+            if region_stats is not None:
+                region_stats.publish_errors += 1
+            raise
+        if region_stats is not None:
+            region_stats.published += 1
+            if start is not None:
+                region_stats.publish.record(perf_counter() - start)
+
+    def buffer_update(self, record, region, targets=None):
+        """
+        Buffer an update for every region except the originating one. Repeated writes to a key are coalesced and
+        each region receives one batch message per flush.
+
+        :param record: The update to replicate, e.g. {'key': ..., 'value': ...}.
+        :param region: The originating region.
+        :param targets: The regions to buffer the update for, every region by default.
+        """
+        for reg in self.cache_instance.regions if targets is None else targets:
+            if reg != region:
+                self.batcher.add(record, reg)
+
+    def debounce_update(self, record, region, targets=None):
+        """
+        Hold an update of a frequently written key for every region except the originating one. Each region receives
+        the latest update of the key, in one batch message per debounce interval with the other keys held.
+
+        :param record: The update to replicate, e.g. {'key': ..., 'value': ...}.
+        :param region: The originating region.
+        :param targets: The regions to send the update to, every region by default.
+        """
+        for reg in self.cache_instance.regions if targets is None else targets:
+            if reg != region:
+                self.debouncer.add(record, reg)
+
+    def publish_batch(self, records, region):
+        """
+        Encode a batch of updates and publish it to a single region.
+
+        :param records: List of updates.
+        :param region: The destination region.
+        """
+        self.publish_to(self.cache_instance.encode_updates(records), region)
+
+    def flush(self, timeout=None):
+        """
+        Publish every buffered update right away, and wait until the outbox sent them.
+
+        :param timeout: Maximum time in seconds to wait for the outbox, None to wait for as long as it takes.
+        :return: False if the outbox still holds messages after the timeout, True otherwise.
+        """
+        if self.batcher is not None:
+            self.batcher.flush()
+        if self.debouncer is not None:
+            self.debouncer.flush()
+        if self.outbox is not None:
+            return self.outbox.join(timeout)
+        return True
+
+    def close(self):
+        """
+        Publish the buffered updates, then stop the consumers and release the transport. Messages the outbox could
+        not send in time stay in its spill file.
+        """
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.debouncer is not None:
+            self.debouncer.close()
+        if self.outbox is not None:
+            self.outbox.close()
+        self.transport.close()
@@ -0,0 +1,244 @@
+import logging
+import os
+import struct
+import threading
+from collections import deque
+from .circuitbreaker import CircuitBreaker
+from ..utils.config import OUTBOX_CAPACITY, OUTBOX_CLOSE_TIMEOUT, OUTBOX_RETRY_DELAY
+
+"""
+This file contains the Outbox, a bounded queue of outgoing messages drained by a background sender, so that
+publishing never waits for the broker. Messages that do not fit in memory are spilled to an append-only file and
+sent from it in order once the broker is back.
+"""
+
+_SPILL_HEADER = struct.Struct('<BHI')  # Body is text (1) or bytes (0), destination length, body length
+
+
+class Outbox:
+    def __init__(self, send, capacity=OUTBOX_CAPACITY, spill_path=None, circuit_breaker=None,
+                 retry_delay=OUTBOX_RETRY_DELAY):
+        """
+        Initialize the Outbox and start its sender thread.
+
+        The sender publishes the messages one at a time in the order they were added, retrying a message until it
+        is sent. Failures feed the circuit breaker: while it is open nothing is sent, and once its reset time
+        elapsed the message at the head of the outbox is the half-open probe.
+
+        Once capacity messages wait in memory, the next ones are appended to the spill file, and keep going there
+        until the sender caught up with the file, which preserves their order. Without a spill file the oldest
+        message is dropped instead. A spill file left over by a previous process is replayed first.
+
+        :param send: Callable receiving (destination, message), raising an exception when the message was not sent.
+        :param capacity: Number of messages kept in memory.
+        :param spill_path: Path of the spill file, None to drop the overflow.
+        :param circuit_breaker: The CircuitBreaker guarding the sends, a private one by default.
+        :param retry_delay: Time in seconds between two attempts while sends fail or the breaker is open.
+        """
+        self.send = send
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.retry_delay = retry_delay
+        self.messages = deque()
+        self.condition = threading.Condition()
+        self.spill = None
+        self.spill_offset = 0  # Position of the next message to send from the spill file
+        self.spilling = False  # New messages go to the spill file until the sender reaches its end
+        if spill_path is not None:
+            self.spill = open(spill_path, 'a+b')
+            self.spilling = self.spill.seek(0, os.SEEK_END) > 0
+        self.sent = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.closed = False
+        self.stopped = False
+        self.idle = False  # The sender waits for messages
+        self.stopping = threading.Event()  # Interrupts the pauses between attempts
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, destination, message):
+        """
+        Queue a message. Never blocks on the broker.
+
+        :param destination: The queue the message is published to.
+        :param message: The message body, bytes or text.
+        """
+        with self.condition:
+            if self.spilling:
+                self._append(destination, message)
+            elif len(self.messages) < self.capacity:
+                self.messages.append((destination, message))
+            elif self.spill is not None:
+                self.spilling = True
+                self._append(destination, message)
+            else:
+                self.messages.popleft()
+                self.messages.append((destination, message))
+                self.dropped += 1
+                logging.error("Outbox full, dropped the oldest message")
+            if self.idle:
+                self.condition.notify_all()
+
+    def _append(self, destination, message):
+        """
+        Append a message to the spill file. Must be called with the condition held.
+        """
+        text = isinstance(message, str)
+        body = message.encode('utf-8') if text else bytes(message)
+        name = destination.encode('utf-8')
+        self.spill.write(_SPILL_HEADER.pack(text, len(name), len(body)) + name + body)
+        self.spill.flush()
+        self.spilled += 1
+
+    def _head(self):
+        """
+        Read the next message to send, from memory first, then from the spill file. Must be called with the
+        condition held.
+
+        :return: Tuple of (destination, message, spill file offset after the message or None), or None when the
+        outbox is empty.
+        """
+        if self.messages:
+            return self.messages[0] + (None,)
+        if not self.spilling:
+            return None
+        head = self._read_spill()
+        if head is None:  # Sent the whole file, new messages can stay in memory again
+            self.spill.truncate(0)
+            self.spill_offset = 0
+            self.spilling = False
+            self.condition.notify_all()
+        return head
+
+    def _read_spill(self):
+        """
+        Read the message at the current offset of the spill file. Must be called with the condition held.
+
+        :return: Tuple of (destination, message, offset after the message), or None at the end of the file.
+        """
+        self.spill.seek(self.spill_offset)
+        header = self.spill.read(_SPILL_HEADER.size)
+        if len(header) < _SPILL_HEADER.size:
+            return None
+        text, name_length, body_length = _SPILL_HEADER.unpack(header)
+        name, body = self.spill.read(name_length), self.spill.read(body_length)
+        if len(body) < body_length:  # Written by a process that died mid-append
+            logging.error("Discarding a truncated message at the end of the outbox spill file")
+            return None
+        return name.decode('utf-8'), body.decode('utf-8') if text else body, self.spill.tell()
+
+    def _run(self):
+        """
+        Send the messages in order until the outbox is closed and empty, or stopped.
+        """
+        while True:
+            with self.condition:
+                head = None if self.stopped else self._head()
+                while head is None and not self.closed and not self.stopped:
+                    self.idle = True
+                    self.condition.wait()
+                    self.idle = False
+                    head = None if self.stopped else self._head()
+                if head is None:
+                    return
+            destination, message, offset = head
+            if not self.circuit_breaker.allow_request():
+                self._pause()
+                continue
+            try:
+                self.send(destination, message)
+            except Exception as e:
+                logging.error("Failed to send an outbox message to %s: %s", destination, e)
+                self.circuit_breaker.record_failure()
+                self._pause()
+                continue
+            self.circuit_breaker.record_success()
+            with self.condition:
+                if self.stopped:  # close already saved the queued messages, this one included
+                    return
+                if offset is None:
+                    self.messages.popleft()
+                else:
+                    self.spill_offset = offset
+                self.sent += 1
+                self.condition.notify_all()
+
+    def _pause(self):
+        self.stopping.wait(self.retry_delay)
+
+    def __len__(self):
+        """
+        :return: The number of messages waiting in memory and in the spill file.
+        """
+        with self.condition:
+            if not self.spilling:
+                return len(self.messages)
+            offset = self.spill_offset
+            pending = self._pending_spilled()
+            self.spill_offset = offset
+            return len(self.messages) + len(pending)
+
+    def join(self, timeout=None):
+        """
+        Wait until every queued message was sent.
+
+        :param timeout: Maximum time in seconds to wait, None to wait for as long as it takes.
+        :return: True if the outbox is empty.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.messages and not self.spilling or self.stopped,
+                                           timeout) and not self.messages and not self.spilling
+
+    def close(self, timeout=OUTBOX_CLOSE_TIMEOUT):
+        """
+        Send the queued messages, for at most timeout seconds, then stop the sender. The messages left are kept in
+        the spill file, so that the next Outbox on the same file replays them, or lost without a spill file. A
+        message being sent when the timeout expired may be both sent and kept, replication applies it only once
+        since updates are versioned.
+
+        :param timeout: Maximum time in seconds to wait for the queued messages to be sent.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.stopping.set()
+        self.thread.join(self.retry_delay)
+        with self.condition:
+            if self.spill is None:
+                if self.messages:
+                    logging.error("Closing the outbox with %d unsent messages", len(self.messages))
+            else:  # Keep only the unsent messages, in order
+                pending = list(self.messages) + (self._pending_spilled() if self.spilling else [])
+                self.spill.truncate(0)
+                self.spill_offset = 0
+                for destination, message in pending:
+                    self._append(destination, message)
+                self.spill.close()
+            self.messages.clear()
+
+    def _pending_spilled(self):
+        """
+        Read the messages waiting in the spill file, moving the offset to its end. Must be called with the
+        condition held.
+
+        :return: The list of (destination, message) tuples.
+        """
+        pending = []
+        head = self._read_spill()
+        while head is not None:
+            pending.append(head[:2])
+            self.spill_offset = head[2]
+            head = self._read_spill()
+        return pending
+
+    def snapshot(self):
+        """
+        :return: Dictionary of the outbox counters: pending messages, sent, spilled and dropped ones.
+        """
+        return {'pending': len(self), 'sent': self.sent, 'spilled': self.spilled, 'dropped': self.dropped}
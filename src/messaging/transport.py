@@ -0,0 +1,246 @@
+import logging
+import queue
+import threading
+import pika
+from pika import exceptions
+from ..exceptions import CacheConnectionError, MessagePublishError
+from ..utils.config import (RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USERNAME, RABBITMQ_PASSWORD, RABBITMQ_EXCHANGE,
+                            RABBITMQ_CONFIRM_DELIVERY)
+
+"""
+This file contains the transports Messaging uses to move replication messages between regions: RabbitMQ for real
+deployments and an in-process broker stand-in for tests, benchmarks and single-box runs.
+"""
+
+
+class Transport:
+    """
+    Base class of the transports. A transport delivers message bodies to named queues, one queue per region.
+    Implementations must be safe to call from any thread.
+    """
+
+    def declare_queue(self, name):
+        """
+        Make sure a queue exists.
+
+        :param name: The name of the queue.
+        """
+        raise NotImplementedError
+
+    def publish(self, name, body):
+        """
+        Deliver a message to a queue.
+
+        :param name: The name of the queue.
+        :param body: The message body.
+        :raises MessagePublishError: If the message could not be delivered.
+        """
+        raise NotImplementedError
+
+    def consume(self, name, callback):
+        """
+        Start consuming a queue in the background.
+
+        :param name: The name of the queue.
+        :param callback: Callable receiving (body, queue name) for every message.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Stop the consumers and release the connections.
+        """
+        pass
+
+
+class RabbitMQTransport(Transport):
+    def __init__(self, host=RABBITMQ_HOST, port=RABBITMQ_PORT, username=RABBITMQ_USERNAME,
+                 password=RABBITMQ_PASSWORD, exchange=RABBITMQ_EXCHANGE, confirm_delivery=RABBITMQ_CONFIRM_DELIVERY):
+        """
+        Initialize the RabbitMQ transport.
+
+        pika connections and channels are not thread-safe, so every thread lazily opens its own connection and
+        channel, kept in a thread-local slot and registered in connections for close() to tear down. Channels are
+        not shared or pooled between threads. Nothing connects until the first call that needs the broker.
+
+        :param host: The host of the RabbitMQ server.
+        :param port: The port of the RabbitMQ server.
+        :param username: The RabbitMQ user.
+        :param password: The password of the RabbitMQ user.
+        :param exchange: The exchange messages are published to. The default exchange ('') routes by queue name.
+        :param confirm_delivery: Wait for the broker to confirm each publish, so lost messages raise an error. pika's
+        BlockingChannel waits for every confirm before returning: each publish costs a broker round trip, which
+        batching (REPLICATION_BATCHING) pays once per batch rather than once per update.
+        """
+        self.connection_params = pika.ConnectionParameters(
+            host, port, credentials=pika.PlainCredentials(username, password))
+        self.exchange = exchange
+        self.confirm_delivery = confirm_delivery
+        self.local = threading.local()
+        self.connections = []  # Open connection of every thread, closed by close()
+        self.connections_lock = threading.Lock()
+        self.closed = threading.Event()
+
+    def channel(self):
+        """
+        Return the channel of the calling thread, connecting if needed.
+
+        :return: A pika BlockingChannel owned by the calling thread.
+        """
+        channel = getattr(self.local, 'channel', None)
+        if channel is not None and channel.is_open:
+            return channel
+        self._disconnect()
+        try:
+            connection = pika.BlockingConnection(self.connection_params)
+            channel = connection.channel()
+            if self.confirm_delivery:
+                channel.confirm_delivery()
+        except exceptions.AMQPError as e:
+            raise CacheConnectionError(f"Failed to connect to RabbitMQ: {e}") from e
+        self.local.connection, self.local.channel = connection, channel
+        with self.connections_lock:
+            self.connections.append(connection)
+        return channel
+
+    def _disconnect(self):
+        """
+        Close the connection of the calling thread, if any, and forget it, so that the next call reconnects.
+        """
+        connection = getattr(self.local, 'connection', None)
+        self.local.connection = self.local.channel = None
+        if connection is None:
+            return
+        with self.connections_lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+        try:
+            if connection.is_open:
+                connection.close()
+        except exceptions.AMQPError as e:
+            logging.error("Failed to close a RabbitMQ connection: %s", e)
+
+    def declare_queue(self, name):
+        self.channel().queue_declare(queue=name)
+
+    def publish(self, name, body):
+        try:
+            self.channel().basic_publish(exchange=self.exchange, routing_key=name, body=body)
+        except (exceptions.AMQPError, CacheConnectionError) as e:
+            self._disconnect()  # Reconnect on the next publish
+            raise MessagePublishError(f"Failed to publish to {name}: {e}") from e
+
+    def consume(self, name, callback):
+        thread = threading.Thread(target=self._consume, args=(name, callback), daemon=True)
+        thread.start()
+
+    def _consume(self, name, callback):
+        """
+        Consume a queue on a channel owned by the calling thread.
+        """
+        def on_message(channel, method, properties, body):
+            try:
+                callback(body, method.routing_key)
+            except Exception as e:
+                logging.error("Failed to apply a message from %s: %s", name, e)
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+
+        try:
+            channel = self.channel()
+            channel.basic_consume(queue=name, on_message_callback=on_message)
+            channel.start_consuming()
+        except exceptions.ConnectionClosedByBroker:
+            logging.error("Connection closed by broker for region: %s", name)
+        except exceptions.AMQPChannelError as e:
+            logging.error("Channel error for region %s: %s", name, e)
+        except (exceptions.AMQPConnectionError, CacheConnectionError) as e:
+            if not self.closed.is_set():
+                logging.error("Connection error for region %s: %s", name, e)
+
+    def close(self):
+        self.closed.set()
+        with self.connections_lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            try:
+                if connection.is_open:
+                    connection.add_callback_threadsafe(connection.close)
+            except exceptions.AMQPError as e:
+                logging.error("Failed to close a RabbitMQ connection: %s", e)
+
+
+class InMemoryBroker:
+    def __init__(self, queue_factory=queue.Queue):
+        """
+        Initialize an in-process broker holding one queue per name.
+
+        :param queue_factory: Callable creating a queue. queue.Queue serves threads of one process, and a
+        multiprocessing JoinableQueue serves processes forked after the queues are declared.
+        """
+        self.queue_factory = queue_factory
+        self.queues = {}
+        self.lock = threading.Lock()
+
+    def queue(self, name):
+        """
+        Return a queue, creating it if needed.
+
+        :param name: The name of the queue.
+        """
+        with self.lock:
+            if name not in self.queues:
+                self.queues[name] = self.queue_factory()
+            return self.queues[name]
+
+
+class InMemoryTransport(Transport):
+    def __init__(self, broker=None, poll_interval=0.05):
+        """
+        Initialize an in-process transport. Caches sharing a broker replicate to each other without RabbitMQ.
+
+        :param broker: The InMemoryBroker to use, a private one by default.
+        :param poll_interval: How often in seconds idle consumers check whether the transport was closed.
+        """
+        self.broker = broker if broker is not None else InMemoryBroker()
+        self.poll_interval = poll_interval
+        self.closed = threading.Event()
+        self.threads = []
+
+    def declare_queue(self, name):
+        self.broker.queue(name)
+
+    def publish(self, name, body):
+        if self.closed.is_set():
+            raise MessagePublishError(f"Failed to publish to {name}: the transport is closed")
+        self.broker.queue(name).put(body)
+
+    def consume(self, name, callback):
+        thread = threading.Thread(target=self._consume, args=(self.broker.queue(name), name, callback), daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def _consume(self, messages, name, callback):
+        while not self.closed.is_set():
+            try:
+                body = messages.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            try:
+                callback(body, name)
+            except Exception as e:
+                logging.error("Failed to apply a message from %s: %s", name, e)
+            finally:
+                if hasattr(messages, 'task_done'):
+                    messages.task_done()
+
+    def join(self):
+        """
+        Block until every message published so far has been consumed.
+        """
+        for messages in list(self.broker.queues.values()):
+            messages.join()
+
+    def close(self):
+        self.closed.set()
+        for thread in self.threads:
+            thread.join()
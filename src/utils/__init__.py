@@ -1,2 +1,7 @@
-from .utils import serialize_data, deserialize_data, select_region
+from .utils import (serialize_data, deserialize_data, encode_value, decode_value, is_serialized, hash_key,
+                    select_region, ConsistentHashRing, CompressedValue, check_connectivity, measure_latency, log_info)
+from .compression import check_codec, compress_value, decompress_value
+from .clock import HybridLogicalClock, version_time
+from .latency import LatencyTracker
+from .stats import LatencyHistogram, RegionStats, CacheStats, StatsExporter, PrometheusExporter, LogExporter
 from .config import *
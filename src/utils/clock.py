@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+import time
+from .config import HLC_MAX_DRIFT, HLC_NODE_ID
+
+"""
+This file contains the HybridLogicalClock, which stamps every write with a version that orders writes across
+regions even when their physical clocks disagree.
+"""
+
+LOGICAL_BITS = 12  # Writes ordered within the same millisecond before the physical part is borrowed
+NODE_BITS = 10  # Node identifier breaking ties between clocks
+
+
+class HybridLogicalClock:
+    def __init__(self, node_id=HLC_NODE_ID, max_drift=HLC_MAX_DRIFT):
+        """
+        Initialize a Hybrid Logical Clock.
+
+        A version packs the physical time in milliseconds, a logical counter and a node identifier into one
+        integer: versions compare as integers, fit the 64-bit encoding of the wire codec, and two clocks never issue
+        the same version unless they share a node identifier. Every version a clock issues is greater than the
+        previous one and than every version it received, so a write is always ordered after the writes its region
+        had seen, whatever the clock skew between regions.
+
+        Two clocks sharing a node identifier may issue the same version for different writes, which regions then
+        resolve differently and never converge on, so every writing process needs its own. A random one collides
+        with good odds among a few dozen writers: configure distinct ones. A received version carrying the node
+        identifier of the clock but ahead of every version it issued comes from another clock with the same one:
+        it is logged as an error and counted in duplicates.
+
+        :param node_id: Identifier of the clock, below 2 ** NODE_BITS, distinct for every writer. Random when None.
+        :param max_drift: Time in seconds a received version may be ahead of the local clock before a warning is
+        logged. The clock still follows it, refusing it would break the ordering.
+        """
+        self.node_id = int.from_bytes(os.urandom(2), 'big') % (1 << NODE_BITS) if node_id is None else node_id
+        if not 0 <= self.node_id < 1 << NODE_BITS:
+            raise ValueError(f"The node id must be below {1 << NODE_BITS}")
+        self.max_drift = max_drift
+        self.duplicates = 0  # Received versions issued by another clock with the same node identifier
+        self.last = 0  # Physical and logical parts of the last version, without the node identifier
+        self.lock = threading.Lock()
+
+    def now(self):
+        """
+        Issue a version for a local write.
+
+        :return: A version greater than every version issued or received so far.
+        """
+        physical = int(time.time() * 1000) << LOGICAL_BITS
+        with self.lock:
+            self.last = max(self.last + 1, physical)
+            return (self.last << NODE_BITS) | self.node_id
+
+    def update(self, version):
+        """
+        Merge a version received from another region, so that the next local versions are ordered after it.
+
+        :param version: The received version.
+        """
+        received = version >> NODE_BITS
+        if received > self.last and version & ((1 << NODE_BITS) - 1) == self.node_id:
+            self.duplicates += 1
+            logging.error("Received version %d from another clock with node id %d, give every writer its own node id",
+                          version, self.node_id)
+        if received > self.last:
+            drift = ((received >> LOGICAL_BITS) - time.time() * 1000) / 1000
+            if drift > self.max_drift:
+                logging.warning("Received a version %.1f seconds ahead of the local clock", drift)
+            with self.lock:
+                if received > self.last:
+                    self.last = received
+
+
+def version_time(version):
+    """
+    :param version: A version issued by a HybridLogicalClock.
+    :return: The physical time of the version, in seconds since the epoch.
+    """
+    return (version >> (NODE_BITS + LOGICAL_BITS)) / 1000
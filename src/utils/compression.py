@@ -0,0 +1,55 @@
+import lzma
+import zlib
+from .config import CACHE_COMPRESSION_THRESHOLD, COMPRESSION_LZMA_PRESET, COMPRESSION_ZLIB_LEVEL
+from .utils import COMPRESSION_CODEC_IDS, CompressedValue, decode_value, encode_value
+
+"""
+This file contains the compression of cache values. A value at least as large as a threshold once encoded is
+compressed into a CompressedValue, which the caches store and the replication messages carry as is. zlib is the
+cheap default, lzma trades a lot more CPU for smaller values and suits regions holding cold data.
+"""
+
+_COMPRESSORS = {
+    'zlib': (lambda data: zlib.compress(data, COMPRESSION_ZLIB_LEVEL), zlib.decompress),
+    'lzma': (lambda data: lzma.compress(data, preset=COMPRESSION_LZMA_PRESET), lzma.decompress),
+}
+
+
+def check_codec(codec):
+    """
+    :param codec: A compression codec name, or None.
+    :raises ValueError: If the codec is not supported.
+    """
+    if codec is not None and codec not in COMPRESSION_CODEC_IDS:
+        raise ValueError(f"Unknown compression codec: {codec}")
+
+
+def compress_value(value, codec, threshold=CACHE_COMPRESSION_THRESHOLD):
+    """
+    Compress a value if it is large enough and compression makes it smaller.
+
+    :param value: The value, of a type serialize_data supports, or a CompressedValue.
+    :param codec: The compression codec, 'zlib' or 'lzma'.
+    :param threshold: Encoded size in bytes from which the value is compressed.
+    :return: Tuple of (the CompressedValue or the value itself, encoded size in bytes of what is returned).
+    """
+    if value.__class__ is CompressedValue:
+        if value.codec == codec:
+            return value, len(value.data)
+        value = decompress_value(value)
+    encoded = encode_value(value)
+    if len(encoded) >= threshold:
+        data = _COMPRESSORS[codec][0](encoded)
+        if len(data) < len(encoded):
+            return CompressedValue(codec, data), len(data)
+    return value, len(encoded)
+
+
+def decompress_value(value):
+    """
+    :param value: A CompressedValue, or any other value which is returned as is.
+    :return: The original value.
+    """
+    if value.__class__ is not CompressedValue:
+        return value
+    return decode_value(_COMPRESSORS[value.codec][1](value.data))[0]
@@ -4,12 +4,58 @@
 CACHE_CAPACITY = 100  # Default capacity of the LRU Cache
 CACHE_EXPIRATION_TIME = 300  # Time in seconds after which a cache item expires
 CACHE_ELEMENT_TTL = 'ttl'  # Cache element expiration time
+CACHE_EVICTION_POLICY = 'lru'  # Eviction policy of each region cache ('lru', 'slru', '2q', 'arc' or 'tinylfu')
+CACHE_TIMER_RESOLUTION = 1.0  # Granularity in seconds of the timer wheel purging expired items
+CACHE_SHARD_COUNT = 16  # Number of independently locked segments in a ShardedLRUCache
+CACHE_STALE_GRACE = 0  # Time in seconds expired items may still be served as stale while they are refreshed, 0 disables
+CACHE_STALE_GRACE_OPEN_FACTOR = 10  # Multiplier of the stale grace window while the circuit breaker is open
+NEGATIVE_CACHE_TTL = 5  # Time in seconds a failed load is remembered before the loader is tried again
+CACHE_SNAPSHOT_DIRECTORY = 'snapshots'  # Directory where GeoDistributedLRUCache.snapshot writes one file per region
+CACHE_COMPRESSION = None  # Codec compressing large values in the region caches and messages ('zlib', 'lzma' or None)
+CACHE_COMPRESSION_THRESHOLD = 1024  # Encoded size in bytes from which a value is compressed
+COMPRESSION_ZLIB_LEVEL = 6  # zlib compression level, 1 (fastest) to 9 (smallest)
+COMPRESSION_LZMA_PRESET = 6  # lzma compression preset, 0 (fastest) to 9 (smallest), for cold data
+SHARED_CACHE_SLOT_SIZE = 256  # Bytes of encoded key and value each slot of a SharedMemoryLRUCache holds
+HOT_KEYS = False  # Detect the hot keys of every region, serve them from a near cache and debounce their replication
+HOT_KEY_CAPACITY = 128  # Keys counted per region by the Space-Saving summary, above 1 / HOT_KEY_SHARE
+HOT_KEY_SHARE = 0.01  # Share of the counted accesses of a region from which a key is hot
+HOT_KEY_SAMPLE_RATE = 16  # One access in this many is counted by the hot key detection
+HOT_KEY_WINDOW = 1024  # Counted accesses between two evaluations of the hot keys, after which the counts are halved
+HOT_KEY_REPLICATION_INTERVAL = 0.05  # Time in seconds during which the writes of a hot key are replicated once
+TRACE_SAMPLE_RATE = 0.01  # Share of the keys whose accesses a TraceRecorder writes, sampled by key hash
+TRACE_CAPACITY = 1000000  # Number of records of a trace file, the oldest are overwritten once it is full
 
 # RabbitMQ Settings
 RABBITMQ_HOST = 'localhost'  # Hostname of the RabbitMQ server
 RABBITMQ_PORT = 5672  # Port number for RabbitMQ
 RABBITMQ_USERNAME = 'guest'  # Username for RabbitMQ
 RABBITMQ_PASSWORD = 'guest'  # Password for RabbitMQ
+RABBITMQ_EXCHANGE = ''  # Exchange replication messages are published to, '' routes by queue name
+RABBITMQ_CONFIRM_DELIVERY = True  # Wait for the broker to confirm every publish, one round trip per message published
+
+# Replication Settings
+REPLICATION_BATCHING = False  # Buffer replication updates per destination region and publish them as batches
+REPLICATION_BATCH_SIZE = 100  # Number of distinct keys buffered for a region before its batch is flushed
+REPLICATION_FLUSH_INTERVAL = 0.05  # Time in seconds after which a non-empty batch is flushed
+REPLICATION_OUTBOX = False  # Publish replication messages from a background sender instead of the writing thread
+OUTBOX_CAPACITY = 10000  # Number of outgoing messages kept in memory before the outbox spills to its file
+OUTBOX_SPILL_PATH = None  # Append-only file of the messages overflowing the outbox, None drops the oldest ones
+OUTBOX_RETRY_DELAY = 0.1  # Time in seconds between two attempts of the outbox sender while the broker fails
+OUTBOX_CLOSE_TIMEOUT = 5  # Time in seconds close waits for the outbox to be sent before spilling what is left
+ASYNC_PUBLISH_CAPACITY = 10000  # Messages an asyncio transport holds undelivered before writers wait for it
+REPLICATION_CODEC = 'binary'  # Wire format of replication messages ('binary' or 'json')
+INVALIDATION_PREFIXES = ()  # Key prefixes replicated as (key, version) invalidations, values are then fetched lazily
+REPLICATION_FACTOR = 2  # Number of regions owning each key in partitioned mode
+CONSISTENT_HASH_VNODES = 160  # Points per region on the consistent-hashing ring
+ANTI_ENTROPY_DEPTH = 10  # Depth of the Merkle trees compared by anti-entropy, splitting keys in 2 ** depth ranges
+ANTI_ENTROPY_INTERVAL = 0  # Time in seconds between background anti-entropy rounds, 0 disables them
+LATENCY_EWMA_ALPHA = 0.2  # Weight of a new observation in the smoothed latency of a region
+LATENCY_PROBE_INTERVAL = 0  # Time in seconds between background latency probes of the region hosts, 0 disables them
+LATENCY_PROBE_TIMEOUT = 1.0  # Time in seconds a latency probe waits for a connection, counted as its latency on failure
+HEDGE_PERCENTILE = 95  # Percentile of a region's read latency after which a hedged read is sent to the next region
+HEDGE_MIN_DELAY = 0.002  # Minimum time in seconds before a hedged read is sent
+HLC_NODE_ID = None  # Node id of the clock versioning writes, below 1024 and distinct per writer, None draws one
+HLC_MAX_DRIFT = 60  # Time in seconds a received version may be ahead of the local clock before a warning is logged
 
 # Circuit Breaker Settings
 CIRCUIT_BREAKER_MAX_FAILURES = 3  # Number of failures before the circuit opens
@@ -18,5 +64,10 @@ CIRCUIT_BREAKER_RESET_TIME = 60  # Time in seconds to reset the circuit breaker
 # Regions Configuration
 REGIONS = ['us-east', 'eu-central', 'asia-south']  # List of regions in the distributed cache system
 
+# Statistics Settings
+STATS_ENABLED = False  # Count hits, misses and replication traffic and record latency histograms per region
+STATS_SAMPLE_RATE = 64  # One operation in this many is timed into the latency histograms
+STATS_EXPORT_PREFIX = 'geocache'  # Prefix of the metric names written by the exporters
+
 # Logging Settings
 LOG_LEVEL = 'ERROR'  # Logging level (e.g., DEBUG, INFO, WARNING, ERROR)
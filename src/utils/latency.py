@@ -0,0 +1,110 @@
+import threading
+from .config import HEDGE_MIN_DELAY, HEDGE_PERCENTILE, LATENCY_EWMA_ALPHA, LATENCY_PROBE_TIMEOUT, RABBITMQ_PORT
+from .stats import LatencyHistogram
+from .utils import measure_latency
+
+"""
+This file contains the LatencyTracker, which keeps a smoothed latency of every region, from the reads served by the
+region and from periodic connection probes, to route reads to the fastest region and to time hedged requests.
+"""
+
+
+class LatencyTracker:
+    def __init__(self, alpha=LATENCY_EWMA_ALPHA, hedge_percentile=HEDGE_PERCENTILE, hedge_min_delay=HEDGE_MIN_DELAY):
+        """
+        Initialize the latency tracker.
+
+        The latency of a region is an exponentially weighted moving average: every observation moves it by alpha
+        of the difference, so it follows a degrading region within a few observations without jumping on a single
+        slow one. The raw observations also go to a histogram per region, whose percentiles time the hedged reads.
+
+        :param alpha: Weight of a new observation, between 0 and 1.
+        :param hedge_percentile: Percentile of the latency of a region after which a hedged read is sent elsewhere.
+        :param hedge_min_delay: Time in seconds a hedged read waits at least, so that fast regions are not doubled.
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError("The smoothing factor must be in (0, 1]")
+        self.alpha = alpha
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.averages = {}  # region -> smoothed latency in seconds
+        self.histograms = {}  # region -> LatencyHistogram of the observations
+        self.lock = threading.Lock()
+        self.fallbacks = 0  # Routed reads served by another region than the local one
+        self.hedges = 0  # Hedged reads sent
+        self.hedge_wins = 0  # Hedged reads answering before the read they doubled
+
+    def observe(self, region, seconds):
+        """
+        Record a latency observed for a region.
+
+        :param region: The name of the region.
+        :param seconds: The observed latency in seconds.
+        """
+        with self.lock:
+            average = self.averages.get(region)
+            self.averages[region] = seconds if average is None else average + self.alpha * (seconds - average)
+            histogram = self.histograms.get(region)
+            if histogram is None:
+                histogram = self.histograms[region] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def latency(self, region):
+        """
+        :return: The smoothed latency of a region in seconds, None before the first observation.
+        """
+        return self.averages.get(region)
+
+    def rank(self, regions, distances=None, origin=None):
+        """
+        Order regions from the fastest. Regions never observed come last, ordered by their distance from the origin.
+
+        :param regions: The candidate regions.
+        :param distances: Mapping of (from region, to region) to a network cost, see GeoDistributedLRUCache.
+        :param origin: The region the distances are taken from.
+        :return: The sorted list of the regions.
+        """
+        return sorted(regions, key=self._cost(distances, origin))
+
+    def nearest(self, regions, distances=None, origin=None):
+        """
+        :return: The first region rank would return.
+        """
+        return min(regions, key=self._cost(distances, origin))
+
+    def _cost(self, distances, origin):
+        averages, distances = self.averages, distances or {}
+        return lambda region: (region not in averages, averages.get(region, 0.0),
+                               distances.get((origin, region), float('inf')))
+
+    def hedge_delay(self, region):
+        """
+        :return: Time in seconds to wait for a read from a region before sending a hedged read elsewhere.
+        """
+        histogram = self.histograms.get(region)
+        if histogram is None:
+            return self.hedge_min_delay
+        return max(histogram.percentile(self.hedge_percentile), self.hedge_min_delay)
+
+    def probe(self, hosts, timeout=LATENCY_PROBE_TIMEOUT):
+        """
+        Measure the connection latency to the host of every region. An unreachable host counts as the timeout.
+
+        :param hosts: Mapping of region to a host name, or to a (host, port) tuple.
+        :param timeout: Time in seconds to wait for each connection.
+        :return: Dictionary of the measured latencies, None for unreachable regions.
+        """
+        measured = {}
+        for region, host in hosts.items():
+            host, port = host if isinstance(host, tuple) else (host, RABBITMQ_PORT)
+            latency = measured[region] = measure_latency(host, port, timeout)
+            self.observe(region, timeout if latency is None else latency)
+        return measured
+
+    def snapshot(self):
+        """
+        :return: Dictionary of the smoothed latency of every region in seconds and of the routing counters.
+        """
+        with self.lock:
+            return {'regions': dict(self.averages), 'fallbacks': self.fallbacks, 'hedges': self.hedges,
+                    'hedge_wins': self.hedge_wins}
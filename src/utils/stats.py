@@ -0,0 +1,230 @@
+from .config import STATS_EXPORT_PREFIX, STATS_SAMPLE_RATE
+from .utils import log_info
+
+"""
+This file contains the statistics of the cache: per-region counters and log-linear latency histograms, kept cheap
+enough to stay enabled on the hot path, and exporters turning a stats() snapshot into something a monitoring system
+reads.
+
+Recording does not take a lock. Two threads updating the same counter at the same instant may lose one increment,
+which is an acceptable error for monitoring and much cheaper than a lock on every cache operation.
+"""
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of durations. Values are recorded in nanoseconds into buckets that are linear within each
+    power of two, 2 ** sub_bits buckets per power, so every percentile is reported within 1 / 2 ** sub_bits of the
+    true value whatever its magnitude, in a fixed amount of memory.
+    """
+
+    def __init__(self, sub_bits=5, max_bits=40):
+        """
+        :param sub_bits: Number of bits of precision kept, 5 bounds the relative error to about 3%.
+        :param max_bits: Durations above 2 ** max_bits nanoseconds (about 18 minutes) land in the last bucket.
+        """
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.counts = [0] * ((max_bits - sub_bits + 1) * self.sub_count)
+        self.last = len(self.counts) - 1
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """
+        Record a duration.
+
+        :param seconds: The duration in seconds.
+        """
+        value = int(seconds * 1e9)
+        if value < self.sub_count << 1:
+            index = value if value > 0 else 0
+        else:
+            shift = value.bit_length() - self.sub_bits - 1
+            index = ((shift + 1) << self.sub_bits) + (value >> shift) - self.sub_count
+            if index > self.last:
+                index = self.last
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def _bucket_value(self, index):
+        """
+        :return: The midpoint of a bucket, in seconds.
+        """
+        shift = (index >> self.sub_bits) - 1
+        if shift <= 0:
+            return index / 1e9
+        low = ((index & (self.sub_count - 1)) + self.sub_count) << shift
+        return (low + (1 << shift) / 2) / 1e9
+
+    def percentile(self, percent):
+        """
+        :param percent: The percentile wanted, between 0 and 100.
+        :return: The duration in seconds below which that share of the recorded durations fall, 0 when empty.
+        """
+        if not self.count:
+            return 0.0
+        target = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.max if index == self.last else min(self._bucket_value(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        """
+        Add the recordings of another histogram with the same precision to this one.
+        """
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def snapshot(self):
+        """
+        :return: Dictionary of the count, sum, mean, max and the 50th, 90th, 99th and 99.9th percentiles, in seconds.
+        """
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'max': self.max,
+        }
+
+
+class RegionStats:
+    """
+    Replication counters and latency histograms of one region. Lookup counters (hits, misses) are kept by the
+    region cache itself, which already holds the entry at hand and counts at almost no cost.
+    """
+    COUNTERS = ('puts', 'published', 'publish_errors', 'applied', 'rejected', 'messages', 'invalidations', 'fetches')
+    HISTOGRAMS = ('get', 'put', 'publish', 'apply', 'lock_wait', 'replication_lag')
+    __slots__ = COUNTERS + HISTOGRAMS
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        for name in self.HISTOGRAMS:
+            setattr(self, name, LatencyHistogram())
+
+    def snapshot(self):
+        """
+        :return: Dictionary of the counters and a 'latency' dictionary of histogram snapshots.
+        """
+        snapshot = {name: getattr(self, name) for name in self.COUNTERS}
+        snapshot['latency'] = {name: getattr(self, name).snapshot() for name in self.HISTOGRAMS}
+        return snapshot
+
+
+class CacheStats:
+    def __init__(self, regions=(), sample_rate=STATS_SAMPLE_RATE):
+        """
+        Initialize the statistics of a cache.
+
+        Counters see every operation, but only one operation in sample_rate is timed into the histograms, which
+        keeps the clock reads and the histogram update off most calls. The callers draw the sampled operations with
+        sample(), a countdown shared by all regions.
+
+        :param regions: The regions to track, more are added on first use.
+        :param sample_rate: One operation in sample_rate is timed.
+        """
+        self.sample_rate = max(1, sample_rate)
+        self.countdown = self.sample_rate
+        self.regions = {region: RegionStats() for region in regions}
+
+    def sample(self):
+        """
+        :return: True for one call in sample_rate, when the operation should be timed.
+        """
+        self.countdown -= 1
+        if self.countdown > 0:
+            return False
+        self.countdown = self.sample_rate
+        return True
+
+    def region(self, region):
+        """
+        :param region: The name of the region.
+        :return: The RegionStats of the region, created if needed.
+        """
+        stats = self.regions.get(region)
+        if stats is None:
+            stats = self.regions.setdefault(region, RegionStats())
+        return stats
+
+    def snapshot(self):
+        """
+        :return: Dictionary of region name to its RegionStats snapshot.
+        """
+        return {region: stats.snapshot() for region, stats in list(self.regions.items())}
+
+
+class StatsExporter:
+    """
+    Base class of the exporters. An exporter receives the snapshot returned by GeoDistributedLRUCache.stats().
+    """
+
+    def export(self, snapshot):
+        raise NotImplementedError
+
+
+class PrometheusExporter(StatsExporter):
+    def __init__(self, prefix=STATS_EXPORT_PREFIX):
+        """
+        Render snapshots in the Prometheus text exposition format: counters and gauges labelled by region, and one
+        summary with quantiles per latency histogram. The _count and _sum of a summary cover the sampled operations.
+
+        :param prefix: Prefix of every metric name.
+        """
+        self.prefix = prefix
+
+    def export(self, snapshot):
+        """
+        :param snapshot: A GeoDistributedLRUCache.stats() snapshot.
+        :return: The metrics as text, ready to be served on a /metrics endpoint.
+        """
+        regions = snapshot.get('regions', {})
+        lines = []
+        for metric, kind in (('lookups', 'counter'), ('hits', 'counter'), ('misses', 'counter'),
+                             ('stale_hits', 'counter'), ('puts', 'counter'), ('published', 'counter'),
+                             ('publish_errors', 'counter'), ('applied', 'counter'), ('rejected', 'counter'),
+                             ('invalidations', 'counter'),
+                             ('fetches', 'counter'), ('evictions', 'counter'), ('expirations', 'counter'),
+                             ('near_hits', 'counter'), ('hot_keys', 'gauge'), ('size', 'gauge'),
+                             ('hit_ratio', 'gauge')):
+            name = f"{self.prefix}_{metric}_total" if kind == 'counter' else f"{self.prefix}_{metric}"
+            lines.append(f"# TYPE {name} {kind}")
+            for region, stats in regions.items():
+                if metric in stats:
+                    lines.append(f'{name}{{region="{region}"}} {stats[metric]}')
+        histograms = sorted({name for stats in regions.values() for name in stats.get('latency', {})})
+        for histogram in histograms:
+            name = f"{self.prefix}_{histogram}_seconds"
+            lines.append(f"# TYPE {name} summary")
+            for region, stats in regions.items():
+                latency = stats['latency'][histogram]
+                for quantile, key in (('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99'), ('0.999', 'p999')):
+                    lines.append(f'{name}{{region="{region}",quantile="{quantile}"}} {latency[key]:.9f}')
+                lines.append(f'{name}_sum{{region="{region}"}} {latency["sum"]:.9f}')
+                lines.append(f'{name}_count{{region="{region}"}} {latency["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class LogExporter(StatsExporter):
+    """ Write one info log line of counters and tail latencies per region """
+
+    def export(self, snapshot):
+        for region, stats in snapshot.get('regions', {}).items():
+            log_info("cache stats", region=region, hits=stats['hits'], misses=stats['misses'],
+                     hit_ratio=round(stats['hit_ratio'], 3), get_p99=stats['latency']['get']['p99'],
+                     replication_lag_p99=stats['latency']['replication_lag']['p99'])
@@ -1,33 +1,418 @@
+import bisect
+import functools
+import hashlib
+import logging
+import socket
+import struct
+import time
+from ..exceptions import SerializationError
+from .config import CONSISTENT_HASH_VNODES, RABBITMQ_PORT
+
+"""
+Binary wire codec (version 1). A frame is a header followed by records, every record being one tagged value:
+
+    frame  := magic:u8 version:u8 count:u32 record*
+    value  := tag:u8 payload
+
+Lengths and counts are little-endian and sized by the tag (u8 for short strings and bytes, u32 otherwise), so the
+decoder walks the buffer with struct.unpack_from and never slices it into intermediate copies. A CompressedValue is
+carried as is, flagged by its own tag: codec:u8 size:u32 data.
+"""
+
+CODEC_MAGIC = 0xCA
+CODEC_VERSION = 1
+
+_TAG_NONE, _TAG_FALSE, _TAG_TRUE = 0, 1, 2
+_TAG_INT8, _TAG_INT64, _TAG_BIGINT, _TAG_FLOAT = 3, 4, 5, 6
+_TAG_STR8, _TAG_STR32, _TAG_BYTES8, _TAG_BYTES32 = 7, 8, 9, 10
+_TAG_LIST, _TAG_DICT = 11, 12
+_TAG_COMPRESSED = 13
+
+COMPRESSION_CODEC_IDS = {'zlib': 1, 'lzma': 2}
+_COMPRESSION_CODECS = {codec_id: codec for codec, codec_id in COMPRESSION_CODEC_IDS.items()}
+
+_HEADER = struct.Struct('<BBI')
+_TAG = struct.Struct('<B')
+_TAG_U8 = struct.Struct('<BB')
+_TAG_U32 = struct.Struct('<BI')
+_TAG_I8 = struct.Struct('<Bb')
+_TAG_I64 = struct.Struct('<Bq')
+_TAG_F64 = struct.Struct('<Bd')
+_TAG_COMPRESSED_HEADER = struct.Struct('<BBI')
+_U8 = struct.Struct('<B')
+_U32 = struct.Struct('<I')
+_I8 = struct.Struct('<b')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+
+_CONSTANTS = {None: _TAG.pack(_TAG_NONE), False: _TAG.pack(_TAG_FALSE), True: _TAG.pack(_TAG_TRUE)}
+
+
+class CompressedValue:
+    """
+    A value encoded with encode_value then compressed, see compression.py. Caches store it and replication messages
+    carry it without decompressing it, it is only decompressed when read.
+    """
+    __slots__ = ('codec', 'data')
+
+    def __init__(self, codec, data):
+        """
+        :param codec: Name of the compression codec, a key of COMPRESSION_CODEC_IDS.
+        :param data: The compressed bytes.
+        """
+        self.codec = codec
+        self.data = data
+
+    def __eq__(self, other):
+        return isinstance(other, CompressedValue) and (self.codec, self.data) == (other.codec, other.data)
+
+    def __repr__(self):
+        return f"CompressedValue(codec={self.codec!r}, size={len(self.data)})"
+
+
+def _encode_sized(data, short_tag, long_tag, out):
+    size = len(data)
+    out.append(_TAG_U8.pack(short_tag, size) if size < 256 else _TAG_U32.pack(long_tag, size))
+    out.append(data)
+
+
+def _encode_value(value, out):
+    kind = type(value)
+    if kind is str:
+        _encode_sized(value.encode('utf-8'), _TAG_STR8, _TAG_STR32, out)
+    elif value is None or kind is bool:
+        out.append(_CONSTANTS[value])
+    elif kind is int:
+        if -128 <= value < 128:
+            out.append(_TAG_I8.pack(_TAG_INT8, value))
+        elif -2 ** 63 <= value < 2 ** 63:
+            out.append(_TAG_I64.pack(_TAG_INT64, value))
+        else:
+            digits = str(value).encode('ascii')
+            out.append(_TAG_U32.pack(_TAG_BIGINT, len(digits)))
+            out.append(digits)
+    elif kind is float:
+        out.append(_TAG_F64.pack(_TAG_FLOAT, value))
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _encode_sized(bytes(value), _TAG_BYTES8, _TAG_BYTES32, out)
+    elif isinstance(value, dict):
+        out.append(_TAG_U32.pack(_TAG_DICT, len(value)))
+        for item_key, item_value in value.items():
+            if type(item_key) is str and len(item_key) < 64:  # Short ASCII-sized keys skip the generic path
+                data = item_key.encode('utf-8')
+                out.append(_TAG_U8.pack(_TAG_STR8, len(data)))
+                out.append(data)
+            else:
+                _encode_value(item_key, out)
+            _encode_value(item_value, out)
+    elif isinstance(value, (list, tuple)):
+        out.append(_TAG_U32.pack(_TAG_LIST, len(value)))
+        for item in value:
+            _encode_value(item, out)
+    elif isinstance(value, str):
+        _encode_sized(value.encode('utf-8'), _TAG_STR8, _TAG_STR32, out)
+    elif isinstance(value, int):
+        _encode_value(int(value), out)
+    elif isinstance(value, float):
+        out.append(_TAG_F64.pack(_TAG_FLOAT, value))
+    elif kind is CompressedValue:
+        out.append(_TAG_COMPRESSED_HEADER.pack(_TAG_COMPRESSED, COMPRESSION_CODEC_IDS[value.codec], len(value.data)))
+        out.append(value.data)
+    else:
+        raise SerializationError(f"Unsupported type for serialization: {kind.__name__}")
+
+
+def _decode_value(buffer, offset):
+    tag = buffer[offset]
+    offset += 1
+    if tag == _TAG_STR8:
+        end = offset + 1 + buffer[offset]
+        return str(buffer[offset + 1:end], 'utf-8'), end
+    if tag == _TAG_INT8:
+        return _I8.unpack_from(buffer, offset)[0], offset + 1
+    if tag == _TAG_DICT:
+        count = _U32.unpack_from(buffer, offset)[0]
+        offset += 4
+        result = {}
+        for _ in range(count):
+            if buffer[offset] == _TAG_STR8:
+                end = offset + 2 + buffer[offset + 1]
+                item_key = str(buffer[offset + 2:end], 'utf-8')
+                offset = end
+            else:
+                item_key, offset = _decode_value(buffer, offset)
+            result[item_key], offset = _decode_value(buffer, offset)
+        return result, offset
+    if tag == _TAG_LIST:
+        count = _U32.unpack_from(buffer, offset)[0]
+        offset += 4
+        result = []
+        for _ in range(count):
+            item, offset = _decode_value(buffer, offset)
+            result.append(item)
+        return result, offset
+    if tag == _TAG_STR32:
+        start = offset + 4
+        end = start + _U32.unpack_from(buffer, offset)[0]
+        return str(buffer[start:end], 'utf-8'), end
+    if tag == _TAG_BYTES8:
+        end = offset + 1 + buffer[offset]
+        return bytes(buffer[offset + 1:end]), end
+    if tag == _TAG_BYTES32:
+        start = offset + 4
+        end = start + _U32.unpack_from(buffer, offset)[0]
+        return bytes(buffer[start:end]), end
+    if tag == _TAG_INT64:
+        return _I64.unpack_from(buffer, offset)[0], offset + 8
+    if tag == _TAG_FLOAT:
+        return _F64.unpack_from(buffer, offset)[0], offset + 8
+    if tag == _TAG_NONE:
+        return None, offset
+    if tag == _TAG_FALSE:
+        return False, offset
+    if tag == _TAG_TRUE:
+        return True, offset
+    if tag == _TAG_BIGINT:
+        start = offset + 4
+        end = start + _U32.unpack_from(buffer, offset)[0]
+        return int(str(buffer[start:end], 'ascii')), end
+    if tag == _TAG_COMPRESSED:
+        codec = _COMPRESSION_CODECS.get(buffer[offset])
+        if codec is None:
+            raise SerializationError(f"Unknown compression codec {buffer[offset]} at offset {offset}")
+        start = offset + 5
+        end = start + _U32.unpack_from(buffer, offset + 1)[0]
+        if end > len(buffer):
+            raise SerializationError(f"Compressed value truncated at offset {offset - 1}")
+        return CompressedValue(codec, bytes(buffer[start:end])), end
+    raise SerializationError(f"Unknown type tag {tag} at offset {offset - 1}")
+
+
 def serialize_data(data):
-    # Custom serialization logic
-    pass
+    """
+    Encode a list of records into a binary frame.
+
+    Supported values are str, bytes, int, float, bool, None, and dicts and lists of those.
+
+    :param data: The records to encode, e.g. a list of {'key': ..., 'value': ...} updates.
+    :return: The encoded frame as bytes.
+    """
+    out = [_HEADER.pack(CODEC_MAGIC, CODEC_VERSION, len(data))]
+    for record in data:
+        _encode_value(record, out)
+    return b''.join(out)
 
 
 def deserialize_data(serialized_data):
-    # Custom deserialization logic
-    pass
+    """
+    Decode a binary frame produced by serialize_data.
+
+    :param serialized_data: The frame, as any bytes-like object (e.g. the body delivered by pika).
+    :return: The list of records carried by the frame.
+    """
+    buffer = memoryview(serialized_data)
+    try:
+        magic, version, count = _HEADER.unpack_from(buffer, 0)
+        if magic != CODEC_MAGIC:
+            raise SerializationError("Not a binary frame")
+        if version != CODEC_VERSION:
+            raise SerializationError(f"Unsupported frame version {version}")
+        offset = _HEADER.size
+        records = []
+        for _ in range(count):
+            record, offset = _decode_value(buffer, offset)
+            records.append(record)
+        if offset != len(buffer):
+            raise SerializationError(f"Frame length mismatch: expected {len(buffer)} bytes, decoded {offset}")
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+        raise SerializationError(f"Malformed frame: {e}") from e
+    return records
+
+
+def encode_value(value):
+    """
+    Encode a single value without a frame header, e.g. to store it in a file with its own layout.
+
+    :param value: The value to encode, of a type serialize_data supports.
+    :return: The encoded value as bytes.
+    """
+    out = []
+    _encode_value(value, out)
+    return b''.join(out)
+
+
+def decode_value(buffer, offset=0):
+    """
+    Decode a single value produced by encode_value.
+
+    :param buffer: A bytes-like object holding the value, e.g. a memoryview over a memory-mapped file.
+    :param offset: Position of the value in the buffer.
+    :return: Tuple of (value, offset just past the value).
+    """
+    try:
+        return _decode_value(buffer, offset)
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+        raise SerializationError(f"Malformed value: {e}") from e
+
+
+def is_serialized(data):
+    """
+    Check whether a message body is a binary frame rather than JSON.
+
+    :param data: The message body.
+    :return: True if the body starts with the binary frame magic byte.
+    """
+    return len(data) > 0 and data[0] == CODEC_MAGIC
 
 
 def hash_key(key):
-    # Implement a hashing function for cache keys
-    pass
+    """
+    Hash a cache key to a 64-bit integer that is the same in every process, unlike the salted built-in hash().
+
+    :param key: The key to hash, bytes are hashed as is and anything else through its str().
+    :return: An integer in [0, 2 ** 64).
+    """
+    data = key if isinstance(key, (bytes, bytearray, memoryview)) else str(key).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+class ConsistentHashRing:
+    def __init__(self, nodes=(), vnodes=CONSISTENT_HASH_VNODES):
+        """
+        Initialize a consistent-hashing ring.
+
+        Every node is placed at `vnodes` points of a 64-bit ring and a key belongs to the first node found walking
+        clockwise from the key's hash. Adding or removing one node among N only moves the keys of the arcs it gains
+        or loses, about 1/N of them, and the virtual nodes keep the arcs evenly sized.
+
+        :param nodes: The initial nodes, e.g. region names.
+        :param vnodes: Number of points per node on the ring.
+        """
+        self.vnodes = vnodes
+        self.nodes = []
+        self.points = []
+        self.owners_at = []
+        for node in nodes:
+            self.add_node(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.nodes
+
+    def add_node(self, node):
+        """
+        Add a node to the ring.
+
+        :param node: The node to add.
+        """
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        self._rebuild()
+
+    def remove_node(self, node):
+        """
+        Remove a node from the ring.
+
+        :param node: The node to remove.
+        """
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        self._rebuild()
+
+    def _rebuild(self):
+        ring = sorted((hash_key(f"{node}#{i}"), node) for node in self.nodes for i in range(self.vnodes))
+        self.points = [point for point, _ in ring]
+        self.owners_at = [node for _, node in ring]
+
+    def node_for(self, key):
+        """
+        :param key: The key to locate.
+        :return: The node owning the key, or None if the ring is empty.
+        """
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, hash_key(key))
+        return self.owners_at[index % len(self.points)]
+
+    def owners(self, key, count):
+        """
+        Select the distinct nodes responsible for a key, its owner first and then the next nodes clockwise.
+
+        :param key: The key to locate.
+        :param count: Number of nodes wanted, capped to the number of nodes.
+        :return: List of nodes.
+        """
+        count = min(count, len(self.nodes))
+        owners = []
+        if not count:
+            return owners
+        start = bisect.bisect(self.points, hash_key(key))
+        size = len(self.points)
+        for step in range(size):
+            node = self.owners_at[(start + step) % size]
+            if node not in owners:
+                owners.append(node)
+                if len(owners) == count:
+                    break
+        return owners
+
+
+@functools.lru_cache(maxsize=32)
+def _ring(regions):
+    return ConsistentHashRing(regions)
 
 
 def select_region(key, regions):
-    # Logic to select the appropriate region for a given key
-    pass
+    """
+    Select the region owning a key on a consistent-hashing ring of the given regions.
+
+    :param key: The key to locate.
+    :param regions: The candidate regions.
+    :return: The owning region, or None if there are none.
+    """
+    return _ring(tuple(regions)).node_for(key)
 
 
-def check_connectivity(host):
-    # Code to check network connectivity to a host
-    pass
+def check_connectivity(host, port=RABBITMQ_PORT, timeout=1.0):
+    """
+    Check whether a TCP connection to a host can be opened.
 
+    :param host: The host name or address.
+    :param port: The TCP port, the RabbitMQ port by default.
+    :param timeout: Time in seconds to wait for the connection.
+    :return: True if the host accepted the connection.
+    """
+    return measure_latency(host, port, timeout) is not None
 
-def measure_latency(host):
-    # Code to measure network latency to a host
-    pass
+
+def measure_latency(host, port=RABBITMQ_PORT, timeout=1.0):
+    """
+    Measure the network latency to a host as the time taken to open a TCP connection, about one round trip.
+
+    :param host: The host name or address.
+    :param port: The TCP port, the RabbitMQ port by default.
+    :param timeout: Time in seconds to wait for the connection.
+    :return: The latency in seconds, or None if the host could not be reached.
+    """
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return time.perf_counter() - start
+    except OSError:
+        return None
 
 
 def log_info(message, **kwargs):
-    # Enhanced logging functionality
-    pass
+    """
+    Log a message at the info level, followed by its context as key=value pairs.
+
+    :param message: The message.
+    :param kwargs: Context values, e.g. region='us-east'.
+    """
+    if kwargs:
+        message = f"{message} " + ' '.join(f"{key}={value}" for key, value in kwargs.items())
+    logging.info(message)
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from src.cache.asyncgeocache import AsyncGeoDistributedLRUCache
+from src.cache.entry import FRESH, STALE
+from src.messaging import AsyncInMemoryTransport, InMemoryTransport
+
+
+class TestAsyncGeoDistributedLRUCache(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.regions = ['us-east', 'eu-central', 'asia-south']
+        self.transport = AsyncInMemoryTransport()
+        self.threads = threading.active_count()
+        self.cache = AsyncGeoDistributedLRUCache(self.regions, capacity=100, transport=self.transport)
+
+    async def asyncTearDown(self):
+        await self.cache.close()
+
+    async def test_put_replicates_to_other_regions(self):
+        await self.cache.put('key1', 'value1', 'us-east')
+        self.assertEqual(await self.cache.get('key1', 'us-east'), 'value1')
+        await self.cache.flush()
+        for region in self.regions:
+            self.assertEqual(await self.cache.get('key1', region), 'value1')
+        self.assertEqual(threading.active_count(), self.threads)  # Consumers are tasks, not threads
+
+    async def test_bulk_operations(self):
+        await self.cache.put_many({f'key{i}': i for i in range(20)}, 'eu-central')
+        await self.cache.flush()
+        self.assertEqual(await self.cache.get_many([f'key{i}' for i in range(25)], 'asia-south'),
+                         {f'key{i}': i for i in range(20)})
+
+    async def test_concurrent_writers(self):
+        await asyncio.gather(*(self.cache.put(f'key{i}', i, self.regions[i % 3]) for i in range(60)))
+        await self.cache.flush()
+        for region in self.regions:
+            self.assertEqual(len(await self.cache.get_many([f'key{i}' for i in range(60)], region)), 60)
+
+    async def test_writers_wait_while_the_transport_is_full(self):
+        transport = AsyncInMemoryTransport(capacity=4)
+        cache = AsyncGeoDistributedLRUCache(self.regions, transport=transport, consume=False)
+        await cache.put('key1', 'value1', 'us-east')  # Two messages, one per other region
+        await cache.put('key2', 'value2', 'us-east')
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(cache.put('key3', 'value3', 'us-east'), 0.05)
+        self.assertEqual(transport.pending, 4)
+        self.assertEqual(await cache.get('key2', 'us-east'), 'value2')  # Reads do not wait
+        for region in self.regions:  # Start consuming, which makes room
+            transport.consume(region, cache.cache.messaging.handle_message)
+        await asyncio.wait_for(cache.put('key3', 'value3', 'us-east'), 1)
+        await cache.flush()
+        self.assertEqual(await cache.get('key3', 'asia-south'), 'value3')
+        await cache.close()
+
+    async def test_loader_runs_outside_the_loop(self):
+        loaded = []
+
+        def loader(key):
+            time.sleep(0.2)
+            loaded.append(time.perf_counter())
+            return f'loaded {key}'
+
+        cache = AsyncGeoDistributedLRUCache(self.regions, transport=AsyncInMemoryTransport(), loader=loader)
+
+        async def tick():
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+            return time.perf_counter()
+
+        value, ticked = await asyncio.gather(cache.get_or_load('key1', 'us-east'), tick())
+        self.assertEqual(value, 'loaded key1')
+        self.assertLess(ticked, loaded[0])  # The loop kept running during the load
+        await cache.flush()
+        self.assertEqual(await cache.get('key1', 'eu-central'), 'loaded key1')
+        await cache.close()
+
+    async def test_stale_values_are_served(self):
+        cache = AsyncGeoDistributedLRUCache(self.regions, transport=AsyncInMemoryTransport(), stale_grace=10,
+                                            loader=lambda key: 'refreshed')
+        await cache.put('key1', 'value1', 'us-east', ttl=0.01)
+        await asyncio.sleep(0.05)
+        result = await cache.get_with_state('key1', 'us-east')
+        self.assertEqual((result.value, result.state), ('value1', STALE))
+        for _ in range(100):
+            result = await cache.get_with_state('key1', 'us-east')
+            if result.state == FRESH:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(result.value, 'refreshed')
+        await cache.close()
+
+    async def test_stale_refresh_is_a_task_of_the_loop(self):
+        cache = AsyncGeoDistributedLRUCache(self.regions, transport=AsyncInMemoryTransport(), stale_grace=10,
+                                            loader=lambda key: 'refreshed')
+        await cache.put('key1', 'value1', 'us-east', ttl=0.01)
+        await asyncio.sleep(0.05)
+        self.assertEqual(await cache.get('key2', 'us-east'), -1)  # A miss is not loaded
+        with patch('src.cache.geocache.Thread') as thread:
+            self.assertEqual(await cache.get('key1', 'us-east'), 'value1')
+            self.assertEqual(len(cache.refreshes), 1)
+            await asyncio.gather(*cache.refreshes)
+        thread.assert_not_called()
+        self.assertEqual(await cache.get('key1', 'us-east'), 'refreshed')
+        await cache.close()
+
+    async def test_publish_from_another_thread(self):
+        message = self.cache.cache.encode_updates([{'key': 'key1', 'value': 'value1'}])
+        thread = threading.Thread(target=self.transport.publish, args=('eu-central', message))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+        await self.cache.flush()
+        self.assertEqual(await self.cache.get('key1', 'eu-central'), 'value1')
+
+    async def test_needs_an_async_transport(self):
+        with self.assertRaises(ValueError):
+            AsyncGeoDistributedLRUCache(self.regions, transport=InMemoryTransport())
+        with self.assertRaises(ValueError):
+            AsyncGeoDistributedLRUCache(self.regions, transport=self.transport, batching=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+from src.messaging.batcher import ReplicationBatcher
+
+
+class TestReplicationBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.sent_event = threading.Event()
+
+    def send(self, records, destination):
+        self.sent.append((destination, records))
+        self.sent_event.set()
+
+    def test_flush_on_batch_size(self):
+        batcher = ReplicationBatcher(self.send, batch_size=3, flush_interval=60)
+        for i in range(3):
+            batcher.add({'key': f"key{i}", 'value': f"value{i}"}, 'eu-central')
+        self.assertEqual(len(self.sent), 1, "A full batch should be sent right away")
+        destination, records = self.sent[0]
+        self.assertEqual(destination, 'eu-central')
+        self.assertEqual([record['key'] for record in records], ['key0', 'key1', 'key2'])
+        batcher.close()
+
+    def test_repeated_writes_are_coalesced(self):
+        batcher = ReplicationBatcher(self.send, batch_size=10, flush_interval=60)
+        batcher.add({'key': "key1", 'value': "value1"}, 'eu-central')
+        batcher.add({'key': "key1", 'value': "value2"}, 'eu-central')
+        batcher.add({'key': "key2", 'value': "value3"}, 'eu-central')
+        batcher.flush()
+        self.assertEqual(self.sent, [('eu-central', [{'key': 'key1', 'value': 'value2'},
+                                                     {'key': 'key2', 'value': 'value3'}])])
+        batcher.close()
+
+    def test_flush_on_interval(self):
+        batcher = ReplicationBatcher(self.send, batch_size=100, flush_interval=0.05)
+        start = time.monotonic()
+        batcher.add({'key': "key1", 'value': "value1"}, 'eu-central')
+        self.assertTrue(self.sent_event.wait(1), "The batch was not flushed after the interval")
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        self.assertEqual(self.sent, [('eu-central', [{'key': 'key1', 'value': 'value1'}])])
+        batcher.close()
+
+    def test_buffers_are_per_destination(self):
+        batcher = ReplicationBatcher(self.send, batch_size=10, flush_interval=60)
+        batcher.add({'key': "key1", 'value': "value1"}, 'eu-central')
+        batcher.add({'key': "key1", 'value': "value1"}, 'asia-south')
+        batcher.close()
+        self.assertEqual(sorted(destination for destination, _ in self.sent), ['asia-south', 'eu-central'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import os
+import unittest
+from benchmarks.suite import SECTIONS, compare, contention, metric, micro, replication, workloads
+
+
+def run_of(**metrics):
+    return {'meta': {}, 'metrics': metrics}
+
+
+class TestCompare(unittest.TestCase):
+
+    def test_throughput_regresses_when_lower(self):
+        baseline = run_of(ops=metric(1000, 'ops/s'))
+        self.assertEqual(compare(run_of(ops=metric(800, 'ops/s')), baseline, 0.25), [])
+        self.assertEqual(compare(run_of(ops=metric(2000, 'ops/s')), baseline, 0.25), [])
+        self.assertEqual(compare(run_of(ops=metric(500, 'ops/s')), baseline, 0.25), [('ops', 1000, 500, -0.5)])
+
+    def test_latency_regresses_when_higher(self):
+        baseline = run_of(lag=metric(0.01, 's', 'lower'))
+        self.assertEqual(compare(run_of(lag=metric(0.012, 's', 'lower')), baseline, 0.25), [])
+        self.assertEqual(compare(run_of(lag=metric(0.001, 's', 'lower')), baseline, 0.25), [])
+        regressions = compare(run_of(lag=metric(0.02, 's', 'lower')), baseline, 0.25)
+        self.assertEqual([name for name, *_ in regressions], ['lag'])
+        self.assertAlmostEqual(regressions[0][3], 1.0)
+
+    def test_missing_and_zero_metrics_are_ignored(self):
+        baseline = run_of(ops=metric(0, 'ops/s'), old=metric(1000, 'ops/s'))
+        current = run_of(ops=metric(10, 'ops/s'), new=metric(1, 'ops/s'))
+        self.assertEqual(compare(current, baseline, 0.25), [])
+
+    def test_stored_baseline_covers_every_section(self):
+        with open(os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'baseline.json')) as f:
+            baseline = json.load(f)
+        self.assertTrue(baseline['meta']['quick'])
+        self.assertEqual({name.split('/')[0] for name in baseline['metrics']}, set(SECTIONS))
+
+
+class TestSections(unittest.TestCase):
+
+    def test_sections_run(self):
+        results = {}
+        results.update(micro(capacities=(10,), operations=100, rounds=1))
+        results.update(workloads(keys=100, capacity=10, operations=500, rounds=1))
+        results.update(contention(thread_counts=(2,), operations=100, keys=100))
+        results.update(replication(region_counts=(2,), writes=50))
+        self.assertEqual({name.split('/')[0] for name in results}, set(SECTIONS))
+        for name, result in results.items():
+            self.assertGreaterEqual(result['value'], 0, name)
+        self.assertEqual(results['workloads/scan/lru/hit_ratio']['value'], 0)  # A scan larger than the cache
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,15 @@
 import json
+import threading
+import time
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
+from src.cache.entry import FRESH, STALE, MISS
 from src.cache.geocache import GeoDistributedLRUCache
+from src.cache.policies import ARCPolicy, SegmentedLRUPolicy
+from src.cache.shardedcache import ShardedLRUCache
+from src.exceptions import CacheLoadError
+from src.messaging import InMemoryTransport
+from src.utils import CACHE_STALE_GRACE_OPEN_FACTOR, CompressedValue
 
 
 class TestGeoDistributedLRUCacheReplication(unittest.TestCase):
@@ -70,5 +78,648 @@ class TestGeoDistributedLRUCacheReplication(unittest.TestCase):
     #     self.mock_messaging.publish_update.assert_called_once()
 
 
+class TestGeoDistributedLRUCacheShards(unittest.TestCase):
+
+    def setUp(self):
+        self.regions = ['us-east', 'eu-central']
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=8, shards=4)
+
+    def test_regions_use_sharded_cache(self):
+        for region in self.regions:
+            self.assertIsInstance(self.geo_cache.regions[region], ShardedLRUCache)
+
+    def test_update_cache_and_get(self):
+        message = json.dumps({'key': 'key1', 'value': 'value1'})
+        self.geo_cache.update_cache(message, 'eu-central')
+        self.assertEqual(self.geo_cache.get('key1', 'eu-central'), 'value1')
+        self.assertEqual(self.geo_cache.get('key1', 'us-east'), -1)
+
+
+class TestGeoDistributedLRUCacheBatching(unittest.TestCase):
+
+    def setUp(self):
+        self.regions = ['us-east', 'eu-central']
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(self.regions, batching=True)
+
+    def test_put_buffers_update(self):
+        self.geo_cache.put('key1', 'value1', 'us-east')
+        self.geo_cache.messaging.buffer_update.assert_called_once_with(
+            {'key': 'key1', 'value': 'value1', 'version': ANY}, 'us-east')
+        self.geo_cache.messaging.publish_update.assert_not_called()
+
+    def test_batch_applied_under_one_lock_acquisition(self):
+        records = [{'key': f'key{i}', 'value': f'value{i}'} for i in range(3)]
+        message = self.geo_cache.encode_updates(records)
+        lock = MagicMock()
+        self.geo_cache.locks['eu-central'] = lock
+        self.geo_cache.update_cache(message, 'eu-central')
+        lock.__enter__.assert_called_once()
+        for i in range(3):
+            self.assertEqual(self.geo_cache.get(f'key{i}', 'eu-central'), f'value{i}')
+
+
+class TestGeoDistributedLRUCacheCodec(unittest.TestCase):
+
+    def setUp(self):
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(['us-east', 'eu-central'])
+
+    def test_put_publishes_binary_frame(self):
+        self.geo_cache.put('key1', {'id': 1}, 'us-east')
+        message, region = self.geo_cache.messaging.publish_update.call_args[0]
+        self.assertEqual(region, 'us-east')
+        self.assertEqual(self.geo_cache.decode_updates(message), [{'key': 'key1', 'value': {'id': 1}, 'version': ANY}])
+        self.assertIsInstance(message, bytes)
+
+    def test_json_messages_still_applied(self):
+        self.geo_cache.update_cache(json.dumps({'key': 'key1', 'value': 'value1'}).encode('utf-8'), 'eu-central')
+        self.geo_cache.update_cache(self.geo_cache.encode_updates([{'key': 'key2', 'value': b'raw'}]), 'eu-central')
+        self.assertEqual(self.geo_cache.get('key1', 'eu-central'), 'value1')
+        self.assertEqual(self.geo_cache.get('key2', 'eu-central'), b'raw')
+
+    def test_ttl_is_replicated(self):
+        self.geo_cache.put('key1', 'value1', 'us-east', ttl=30)
+        message, _ = self.geo_cache.messaging.publish_update.call_args[0]
+        self.geo_cache.update_cache(message, 'eu-central')
+        entry = self.geo_cache.regions['eu-central'].cache['key1']
+        self.assertAlmostEqual(entry.expires_at - time.time(), 30, places=1)
+
+    def test_unknown_codec(self):
+        with patch('src.cache.geocache.Messaging'), self.assertRaises(ValueError):
+            GeoDistributedLRUCache(['us-east'], codec='xml')
+
+
+class TestGeoDistributedLRUCacheBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.regions = ['us-east', 'eu-central', 'asia-south']
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=50)
+
+    def test_put_many_replicates_one_message(self):
+        mapping = {f'key{i}': f'value{i}' for i in range(20)}
+        self.geo_cache.put_many(mapping, 'us-east')
+        self.geo_cache.messaging.publish_update.assert_called_once()
+        message, region = self.geo_cache.messaging.publish_update.call_args[0]
+        self.assertEqual(region, 'us-east')
+        self.geo_cache.update_cache(message, 'eu-central')
+        self.assertEqual(self.geo_cache.get_many(list(mapping), 'eu-central'), mapping)
+
+    def test_put_many_writes_originating_region(self):
+        self.geo_cache.put_many({'key1': 'value1'}, 'us-east')
+        self.assertEqual(self.geo_cache.get('key1', 'us-east'), 'value1')
+
+    def test_get_many_leaves_out_missing_keys(self):
+        self.geo_cache.put_many({'key1': 'value1'}, 'us-east')
+        self.assertEqual(self.geo_cache.get_many(['key1', 'key2'], 'us-east'), {'key1': 'value1'})
+        self.assertEqual(self.geo_cache.get_many(['key1'], 'asia-south'), {})
+
+    def test_get_many_takes_region_lock_once(self):
+        lock = MagicMock()
+        self.geo_cache.locks['us-east'] = lock
+        self.geo_cache.get_many([f'key{i}' for i in range(100)], 'us-east')
+        lock.__enter__.assert_called_once()
+
+
+class TestGeoDistributedLRUCachePolicy(unittest.TestCase):
+
+    def test_each_region_gets_its_own_policy(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(['us-east', 'eu-central'], policy='arc')
+        us_policy, eu_policy = (geo_cache.regions[region].policy for region in ('us-east', 'eu-central'))
+        self.assertIsInstance(us_policy, ARCPolicy)
+        self.assertIsNot(us_policy, eu_policy)
+
+    def test_sharded_regions_use_policy(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(['us-east'], capacity=8, shards=2, policy='slru')
+        for shard in geo_cache.regions['us-east'].shards:
+            self.assertIsInstance(shard.policy, SegmentedLRUPolicy)
+
+
+
+class TestGeoDistributedLRUCachePartitioned(unittest.TestCase):
+
+    def setUp(self):
+        self.regions = ['us-east', 'eu-central', 'asia-south', 'sa-east']
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=1000, partitioned=True,
+                                                    replication_factor=2)
+
+    def key_not_owned_by(self, region):
+        return next(f'key{i}' for i in range(100) if region not in self.geo_cache.owners(f'key{i}'))
+
+    def test_put_publishes_to_owners_only(self):
+        key = self.key_not_owned_by('us-east')
+        self.geo_cache.put(key, 'value1', 'us-east')
+        message, region, targets = self.geo_cache.messaging.publish_update.call_args[0]
+        self.assertEqual(region, 'us-east')
+        self.assertEqual(targets, self.geo_cache.owners(key))
+        self.assertEqual(len(targets), 2)
+
+    def test_owner_writes_locally(self):
+        key = 'key1'
+        owner = self.geo_cache.owners(key)[0]
+        self.geo_cache.put(key, 'value1', owner)
+        self.assertEqual(self.geo_cache.regions[owner].get(key), 'value1')
+
+    def test_get_routes_to_nearest_owner(self):
+        key = self.key_not_owned_by('us-east')
+        first, second = self.geo_cache.owners(key)
+        self.geo_cache.regions[first].put(key, 'from-first')
+        self.geo_cache.regions[second].put(key, 'from-second')
+        self.assertEqual(self.geo_cache.get(key, 'us-east'), 'from-first')
+        self.geo_cache.distances = {('us-east', first): 120, ('us-east', second): 15}
+        self.assertEqual(self.geo_cache.get(key, 'us-east'), 'from-second')
+        self.assertEqual(self.geo_cache.get_many([key], 'us-east'), {key: 'from-second'})
+        self.assertEqual(self.geo_cache.regions['us-east'].get(key), -1)
+
+    def test_put_many_sends_one_message_per_owner(self):
+        mapping = {f'key{i}': i for i in range(100)}
+        self.geo_cache.put_many(mapping, 'us-east')
+        calls = self.geo_cache.messaging.publish_update.call_args_list
+        self.assertEqual(sorted(call[0][2][0] for call in calls), ['asia-south', 'eu-central', 'sa-east'])
+        for message, _, (target,) in (call[0] for call in calls):
+            self.geo_cache.update_cache(message, target)
+        for key, value in mapping.items():
+            for owner in self.geo_cache.owners(key):
+                self.assertEqual(self.geo_cache.regions[owner].get(key), value)
+        self.assertEqual(sum(len(cache.cache) for cache in self.geo_cache.regions.values()), 200)
+
+    def fill(self, count):
+        for i in range(count):
+            for owner in self.geo_cache.owners(f'key{i}'):
+                self.geo_cache.regions[owner].put(f'key{i}', i)
+
+    def test_add_region_moves_a_fraction_of_keys(self):
+        self.fill(800)
+        moved = self.geo_cache.add_region('ap-east')
+        self.geo_cache.messaging.add_region.assert_called_once_with('ap-east')
+        self.assertLess(moved, 800 * 2 * 0.35)
+        self.assertGreater(moved, 0)
+        for i in range(800):
+            for owner in self.geo_cache.owners(f'key{i}'):
+                self.assertEqual(self.geo_cache.regions[owner].get(f'key{i}'), i)
+        self.assertEqual(sum(len(cache.cache) for cache in self.geo_cache.regions.values()), 1600)
+
+    def test_remove_region_hands_keys_over(self):
+        self.fill(800)
+        self.geo_cache.remove_region('asia-south')
+        self.assertNotIn('asia-south', self.geo_cache.regions)
+        for i in range(800):
+            owners = self.geo_cache.owners(f'key{i}')
+            self.assertNotIn('asia-south', owners)
+            for owner in owners:
+                self.assertEqual(self.geo_cache.regions[owner].get(f'key{i}'), i)
+
+    def test_full_replication_targets_every_region(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(self.regions)
+        self.assertFalse(geo_cache.partitioned)
+        self.assertEqual(geo_cache.owners('key1'), self.regions)
+        self.assertEqual(geo_cache.route('key1', 'sa-east'), 'sa-east')
+
+
+
+class TestGeoDistributedLRUCacheLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.loaded = []
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(['us-east', 'eu-central'], loader=self.load)
+
+    def load(self, key):
+        self.loaded.append(key)
+        time.sleep(0.05)
+        return f'db-{key}'
+
+    def test_miss_loads_and_replicates(self):
+        self.assertEqual(self.geo_cache.get_or_load('key1', 'us-east'), 'db-key1')
+        self.assertEqual(self.geo_cache.get('key1', 'us-east'), 'db-key1')
+        self.geo_cache.messaging.publish_update.assert_called_once()
+        self.assertEqual(self.geo_cache.get_or_load('key1', 'us-east'), 'db-key1')
+        self.assertEqual(self.loaded, ['key1'])
+
+    def test_hit_skips_loader(self):
+        self.geo_cache.regions['us-east'].put('key1', 'cached')
+        self.assertEqual(self.geo_cache.get_or_load('key1', 'us-east'), 'cached')
+        self.assertEqual(self.loaded, [])
+
+    def test_stampede_calls_loader_once(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.geo_cache.get_or_load('hot', 'us-east')))
+                   for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['db-hot'] * 20)
+        self.assertEqual(self.loaded, ['hot'])
+        stats = self.geo_cache.loader_stats.snapshot()
+        self.assertEqual(stats['loads'], 1)
+        self.assertGreater(stats['coalesced'], 0)  # Threads starting after the load completed simply hit
+        self.assertGreaterEqual(stats['mean_load_time'], 0.05)
+
+    def test_errors_are_negative_cached(self):
+        calls = []
+
+        def failing(key):
+            calls.append(key)
+            raise IOError("database down")
+
+        self.geo_cache.negative_ttl = 0.1
+        with self.assertRaises(CacheLoadError) as raised:
+            self.geo_cache.get_or_load('key1', 'us-east', loader=failing)
+        self.assertIsInstance(raised.exception.__cause__, IOError)
+        with self.assertRaises(CacheLoadError):
+            self.geo_cache.get_or_load('key1', 'us-east', loader=failing)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.geo_cache.loader_stats.negative_hits, 1)
+        time.sleep(0.15)
+        self.assertEqual(self.geo_cache.get_or_load('key1', 'us-east'), 'db-key1')
+
+    def test_no_loader(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(['us-east'])
+        with self.assertRaises(ValueError):
+            geo_cache.get_or_load('key1', 'us-east')
+
+
+class TestGeoDistributedLRUCacheStaleWhileRevalidate(unittest.TestCase):
+
+    def setUp(self):
+        self.version = 0
+        self.release = threading.Event()
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(['us-east', 'eu-central'], expiration_time=0.1, stale_grace=1,
+                                                    loader=self.load)
+
+    def load(self, key):
+        self.release.wait(1)
+        self.version += 1
+        return f'{key}-v{self.version}'
+
+    def expire(self):
+        self.release.set()
+        self.assertEqual(self.geo_cache.get_with_state('key1', 'us-east'), ('key1-v1', FRESH))
+        self.release.clear()
+        time.sleep(0.15)
+
+    def test_stale_value_served_while_refreshing(self):
+        self.expire()
+        start = time.perf_counter()
+        result = self.geo_cache.get_with_state('key1', 'us-east')
+        self.assertLess(time.perf_counter() - start, 0.1, "A stale read waited for the loader")
+        self.assertEqual(result, ('key1-v1', STALE))
+        self.assertEqual(self.geo_cache.get('key1', 'us-east'), 'key1-v1')
+        self.assertEqual(self.geo_cache.refreshing, {'key1'})
+        self.release.set()
+        for _ in range(100):
+            if not self.geo_cache.refreshing:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.geo_cache.get_with_state('key1', 'us-east'), ('key1-v2', FRESH))
+        self.assertEqual(self.version, 2)
+
+    def test_open_breaker_stretches_grace_and_skips_refresh(self):
+        self.geo_cache.stale_grace = 0.01
+        self.expire()
+        self.assertEqual(self.geo_cache.regions['us-east'].get_with_state('key1', self.geo_cache.grace()), (-1, MISS))
+        self.geo_cache.circuit_breaker.open()
+        self.assertEqual(self.geo_cache.grace(), 0.01 * CACHE_STALE_GRACE_OPEN_FACTOR)
+        self.assertEqual(self.geo_cache.get_with_state('key1', 'us-east'), ('key1-v1', STALE))
+        self.assertEqual(self.geo_cache.refreshing, set())
+
+    def test_get_does_not_load_misses(self):
+        self.assertEqual(self.geo_cache.get('key1', 'us-east'), -1)
+        self.assertEqual(self.version, 0)
+        self.expire()
+        self.assertEqual(self.geo_cache.get('key1', 'us-east'), 'key1-v1')  # Stale, refreshed in the background
+        self.release.set()
+        for _ in range(100):
+            if not self.geo_cache.refreshing:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.geo_cache.get('key1', 'us-east'), 'key1-v2')
+
+    def test_breaker_half_opens_and_closes_on_a_refresh(self):
+        breaker = self.geo_cache.circuit_breaker
+        breaker.reset_time = 0.05
+        self.expire()
+        breaker.open()
+        self.assertEqual(self.geo_cache.get_with_state('key1', 'us-east'), ('key1-v1', STALE))
+        self.assertEqual(self.geo_cache.refreshing, set())  # Open, no refresh
+        time.sleep(0.06)
+        self.assertEqual(self.geo_cache.get_with_state('key1', 'us-east'), ('key1-v1', STALE))
+        self.assertEqual(breaker.state, 'half-open')  # The refresh is the probe
+        self.release.set()
+        for _ in range(100):
+            if not self.geo_cache.refreshing:
+                break
+            time.sleep(0.01)
+        self.assertEqual((breaker.state, breaker.failures), ('closed', 0))
+
+    def test_successful_loads_reset_the_failure_count(self):
+        self.geo_cache.negative_ttl = 0
+        self.release.set()
+        for i in range(2 * self.geo_cache.circuit_breaker.max_failures):
+            with self.assertRaises(CacheLoadError):
+                self.geo_cache.get_or_load(f'bad{i}', 'us-east', loader=lambda key: 1 / 0)
+            if i % 2:
+                self.geo_cache.get_or_load(f'key{i}', 'us-east')
+            self.assertEqual(self.geo_cache.circuit_breaker.state, 'closed')
+
+    def test_loader_failures_open_the_breaker(self):
+        self.geo_cache.negative_ttl = 0
+        for i in range(self.geo_cache.circuit_breaker.max_failures):
+            with self.assertRaises(CacheLoadError):
+                self.geo_cache.get_or_load(f'key{i}', 'us-east', loader=lambda key: 1 / 0)
+        self.assertTrue(self.geo_cache.circuit_breaker.is_open())
+
+    def test_disabled_by_default(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(['us-east'], expiration_time=0.05)
+        geo_cache.put_many({'key1': 'value1'}, 'us-east')
+        time.sleep(0.1)
+        self.assertEqual(geo_cache.get_with_state('key1', 'us-east'), (-1, MISS))
+        self.assertEqual(geo_cache.get('key1', 'us-east'), -1)
+
+
+
+class TestGeoDistributedLRUCacheVersioning(unittest.TestCase):
+
+    def setUp(self):
+        self.regions = ['us-east', 'eu-central', 'asia-south']
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=500, anti_entropy=True)
+
+    def published(self):
+        return self.geo_cache.messaging.publish_update.call_args[0][0]
+
+    def test_reordered_and_duplicated_deliveries(self):
+        self.geo_cache.put('key1', 'value1', 'us-east')
+        first = self.published()
+        self.geo_cache.put('key1', 'value2', 'us-east')
+        second = self.published()
+        for message in (second, first, second):
+            self.geo_cache.update_cache(message, 'eu-central')
+        self.assertEqual(self.geo_cache.get('key1', 'eu-central'), 'value2')
+
+    def test_received_versions_advance_the_clock(self):
+        with patch('src.cache.geocache.Messaging'):
+            remote = GeoDistributedLRUCache(self.regions)
+        with patch('src.utils.clock.time.time', return_value=time.time() + 5):
+            remote.put('key1', 'remote', 'asia-south')
+        self.geo_cache.update_cache(remote.messaging.publish_update.call_args[0][0], 'eu-central')
+        self.geo_cache.put('key1', 'local', 'us-east')  # Issued after the remote write was seen, so it wins
+        self.geo_cache.update_cache(self.published(), 'eu-central')
+        self.assertEqual(self.geo_cache.get('key1', 'eu-central'), 'local')
+
+    def test_writers_sharing_a_node_id_are_reported(self):
+        with patch('src.cache.geocache.Messaging'):
+            local, remote = (GeoDistributedLRUCache(self.regions, node_id=5) for _ in range(2))
+        with patch('src.utils.clock.time.time', return_value=time.time() + 5):
+            remote.put('key1', 'remote', 'asia-south')
+        with self.assertLogs(level='ERROR'):
+            local.update_cache(remote.messaging.publish_update.call_args[0][0], 'eu-central')
+        self.assertEqual(local.stats()['clock'], {'node_id': 5, 'duplicates': 1})
+
+    def test_resync_copies_only_the_divergence(self):
+        for i in range(200):
+            self.geo_cache.put(f'key{i}', i, 'us-east')
+            self.geo_cache.update_cache(self.published(), 'us-east')
+            if i < 190:  # eu-central misses the last ten messages
+                self.geo_cache.update_cache(self.published(), 'eu-central')
+        self.geo_cache.put('key0', 'newer', 'eu-central')
+        self.geo_cache.update_cache(self.published(), 'eu-central')
+        tree = self.geo_cache.merkle_tree('eu-central')
+        self.assertLessEqual(len(tree.diff(self.geo_cache.merkle_tree('us-east'))), 11)
+        self.assertEqual(self.geo_cache.resync('eu-central', 'us-east'), 11)
+        self.assertEqual(self.geo_cache.get('key195', 'eu-central'), 195)
+        self.assertEqual(self.geo_cache.get('key0', 'us-east'), 'newer')
+        self.assertEqual(self.geo_cache.merkle_tree('eu-central').root, self.geo_cache.merkle_tree('us-east').root)
+        self.assertEqual(self.geo_cache.resync('eu-central', 'us-east'), 0)
+
+    def test_anti_entropy_round(self):
+        self.geo_cache.put_many({'key1': 'value1'}, 'asia-south')
+        self.assertEqual(self.geo_cache.anti_entropy_round(), 2)
+        for region in self.regions:
+            self.assertEqual(self.geo_cache.get('key1', region), 'value1')
+
+    def test_background_rounds(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(self.regions, anti_entropy=True, anti_entropy_interval=0.05)
+        geo_cache.put_many({'key1': 'value1'}, 'us-east')
+        deadline = time.time() + 2
+        while geo_cache.get('key1', 'asia-south') == -1 and time.time() < deadline:
+            time.sleep(0.05)
+        geo_cache.close()
+        self.assertEqual(geo_cache.get('key1', 'asia-south'), 'value1')
+        geo_cache.messaging.close.assert_called_once()
+
+    def test_resync_needs_digests(self):
+        with patch('src.cache.geocache.Messaging'):
+            plain = GeoDistributedLRUCache(self.regions)
+            partitioned = GeoDistributedLRUCache(self.regions, partitioned=True, anti_entropy=True)
+        with self.assertRaises(ValueError):
+            plain.resync('us-east', 'eu-central')
+        with self.assertRaises(ValueError):
+            partitioned.resync('us-east', 'eu-central')
+
+
+
+class TestGeoDistributedLRUCacheRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.regions = ['us-east', 'eu-central', 'asia-south']
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=10,
+                                                    distances={('us-east', 'eu-central'): 80,
+                                                               ('us-east', 'asia-south'): 200})
+
+    def tearDown(self):
+        self.geo_cache.close()
+
+    def test_falls_back_to_regions_holding_the_key(self):
+        self.geo_cache.regions['asia-south'].put('key1', 'value1')
+        self.assertEqual(self.geo_cache.get('key1', 'us-east'), -1)
+        self.assertEqual(self.geo_cache.get_routed('key1', 'us-east'), 'value1')
+        self.assertEqual(self.geo_cache.get_routed('key2', 'us-east'), -1)
+        routing = self.geo_cache.stats()['routing']
+        self.assertEqual(routing['fallbacks'], 1)
+        self.assertEqual(set(routing['regions']), {'eu-central', 'asia-south'})
+
+    def test_local_hit_is_not_routed(self):
+        self.geo_cache.regions['us-east'].put('key1', 'local')
+        self.geo_cache.regions['eu-central'].put('key1', 'remote')
+        self.assertEqual(self.geo_cache.get_routed('key1', 'us-east'), 'local')
+        self.assertEqual(self.geo_cache.latency.snapshot()['regions'], {})
+
+    def test_fastest_region_first(self):
+        self.geo_cache.regions['eu-central'].put('key1', 'from eu-central')
+        self.geo_cache.regions['asia-south'].put('key1', 'from asia-south')
+        self.assertEqual(self.geo_cache.get_routed('key1', 'us-east'), 'from eu-central')  # Nearest by distance
+        self.geo_cache.latency.observe('eu-central', 0.5)
+        self.geo_cache.latency.observe('asia-south', 0.01)
+        self.assertEqual(self.geo_cache.get_routed('key1', 'us-east'), 'from asia-south')
+
+    def test_hedged_read_bypasses_a_degraded_region(self):
+        self.geo_cache.regions['eu-central'].put('key1', 'from eu-central')
+        self.geo_cache.regions['asia-south'].put('key1', 'from asia-south')
+        self.geo_cache.latency.hedge_min_delay = 0.01
+        with self.geo_cache.locks['eu-central']:  # eu-central, the nearest, hangs until the lock is released
+            start = time.perf_counter()
+            value = self.geo_cache.get_routed('key1', 'us-east', hedge=True)
+            elapsed = time.perf_counter() - start
+        self.assertEqual(value, 'from asia-south')
+        self.assertLess(elapsed, 1)
+        routing = self.geo_cache.stats()['routing']
+        self.assertEqual((routing['hedges'], routing['hedge_wins']), (1, 1))
+
+    def test_hedged_read_misses_everywhere(self):
+        self.assertEqual(self.geo_cache.get_routed('key1', 'us-east', hedge=True), -1)
+
+    def test_partitioned_route_follows_latency(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(self.regions, partitioned=True, replication_factor=2)
+        key = next(f'key{i}' for i in range(100) if 'us-east' not in geo_cache.owners(f'key{i}'))
+        first, second = geo_cache.owners(key)
+        geo_cache.latency.observe(first, 0.5)
+        geo_cache.latency.observe(second, 0.01)
+        self.assertEqual(geo_cache.route(key, 'us-east'), second)
+
+
+
+class TestGeoDistributedLRUCacheCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.regions = ['us-east', 'eu-central', 'asia-south']
+        self.value = {'rows': [{'id': i, 'status': 'active'} for i in range(300)]}
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=10,
+                                                    compression={'us-east': 'zlib', 'asia-south': 'lzma'})
+
+    def test_values_are_replicated_compressed(self):
+        self.geo_cache.put('key1', self.value, 'us-east')
+        message, _ = self.geo_cache.messaging.publish_update.call_args[0]
+        self.assertIsInstance(self.geo_cache.decode_updates(message)[0]['value'], CompressedValue)
+        for region in ('eu-central', 'asia-south'):
+            self.geo_cache.update_cache(message, region)
+            self.assertEqual(self.geo_cache.get('key1', region), self.value)
+        self.assertEqual(self.geo_cache.regions['asia-south'].peek('key1').stored.codec, 'lzma')
+        self.assertFalse(self.geo_cache.regions['eu-central'].peek('key1').compressed)
+
+    def test_uncompressed_regions_send_plain_values(self):
+        self.geo_cache.put_many({'key1': self.value}, 'eu-central')
+        message, _ = self.geo_cache.messaging.publish_update.call_args[0]
+        self.assertEqual(self.geo_cache.decode_updates(message)[0]['value'], self.value)
+        self.geo_cache.update_cache(message, 'us-east')
+        self.assertTrue(self.geo_cache.regions['us-east'].peek('key1').compressed)
+
+    def test_json_codec_sends_plain_values(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(self.regions, codec='json', compression='zlib')
+        geo_cache.put('key1', self.value, 'us-east')
+        message, _ = geo_cache.messaging.publish_update.call_args[0]
+        self.assertEqual(json.loads(message)['value'], self.value)
+
+    def test_byte_capacity_in_stats(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(self.regions, capacity=100, compression='zlib', max_bytes=10000,
+                                               shards=2)
+        geo_cache.put_many({f'key{i}': self.value for i in range(5)}, 'us-east')
+        message, _ = geo_cache.messaging.publish_update.call_args[0]
+        geo_cache.update_cache(message, 'eu-central')
+        stats = geo_cache.stats()['regions']['eu-central']
+        self.assertEqual(stats['size'], 5)
+        self.assertLessEqual(stats['bytes'], 10000)
+        self.assertEqual(stats['max_bytes'], 10000)
+
+    def test_invalid_codec(self):
+        with patch('src.cache.geocache.Messaging'), self.assertRaises(ValueError):
+            GeoDistributedLRUCache(self.regions, compression={'us-east': 'gzip'})
+
+
+
+class TestGeoDistributedLRUCacheInvalidation(unittest.TestCase):
+
+    def setUp(self):
+        self.regions = ['us-east', 'eu-central', 'asia-south']
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=10, invalidation_prefixes=('blob:',),
+                                                    stats=True)
+
+    def replicate(self, region):
+        message = self.geo_cache.messaging.publish_update.call_args[0][0]
+        self.geo_cache.update_cache(message, region)
+        return message
+
+    def test_prefixed_keys_replicate_invalidations(self):
+        self.geo_cache.put('blob:1', 'x' * 10000, 'us-east')
+        message = self.replicate('eu-central')
+        self.assertLess(len(message), 100)
+        self.assertEqual(self.geo_cache.regions['us-east'].get('blob:1'), 'x' * 10000)
+        self.assertEqual(len(self.geo_cache.regions['eu-central']), 0)
+        self.assertEqual(self.geo_cache.get('blob:1', 'eu-central'), 'x' * 10000)  # Fetched from us-east
+        self.assertEqual(self.geo_cache.regions['eu-central'].peek('blob:1').version,
+                         self.geo_cache.regions['us-east'].peek('blob:1').version)
+        self.assertEqual(self.geo_cache.get('blob:1', 'asia-south'), -1)  # Its invalidation was not delivered
+        stats = self.geo_cache.stats()['regions']['eu-central']
+        self.assertEqual((stats['invalidations'], stats['fetches']), (1, 1))
+
+    def test_other_keys_stay_fully_replicated(self):
+        self.geo_cache.put('small:1', 'value1', 'us-east')
+        self.replicate('eu-central')
+        self.assertEqual(self.geo_cache.regions['eu-central'].get('small:1'), 'value1')
+
+    def test_invalidation_drops_older_copies_only(self):
+        self.geo_cache.put('blob:1', 'old', 'eu-central')
+        self.geo_cache.put('blob:1', 'new', 'us-east')
+        self.replicate('eu-central')
+        self.assertIsNone(self.geo_cache.regions['eu-central'].peek('blob:1'))
+        self.assertEqual(self.geo_cache.get_many(['blob:1'], 'eu-central'), {'blob:1': 'new'})
+        self.geo_cache.put('blob:1', 'newest', 'eu-central')
+        stale = self.geo_cache.encode_updates([{'key': 'blob:1', 'version': 1, 'invalidate': 'us-east'}])
+        self.geo_cache.update_cache(stale, 'eu-central')
+        self.assertEqual(self.geo_cache.get('blob:1', 'eu-central'), 'newest')
+
+    def test_put_many_and_json_codec(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(self.regions, codec='json', invalidation_prefixes=['blob:'])
+        geo_cache.put_many({'blob:1': 'large', 'small:1': 'value1'}, 'us-east')
+        message = geo_cache.messaging.publish_update.call_args[0][0]
+        records = {record['key']: record for record in json.loads(message)['batch']}
+        self.assertNotIn('value', records['blob:1'])
+        self.assertEqual(records['small:1']['value'], 'value1')
+        geo_cache.update_cache(message, 'asia-south')
+        self.assertEqual(geo_cache.get_many(['blob:1', 'small:1'], 'asia-south'),
+                         {'blob:1': 'large', 'small:1': 'value1'})
+
+    def test_invalidated_keys_are_bounded(self):
+        for i in range(15):
+            self.geo_cache.put(f'blob:{i}', i, 'us-east')
+            self.replicate('eu-central')
+        self.assertEqual(len(self.geo_cache.invalidated['eu-central']), 10)
+        self.assertEqual(self.geo_cache.get('blob:0', 'eu-central'), -1)
+        self.assertEqual(self.geo_cache.get('blob:14', 'eu-central'), 14)
+
+    def test_end_to_end(self):
+        transport = InMemoryTransport()
+        geo_cache = GeoDistributedLRUCache(self.regions, transport=transport, invalidation_prefixes=('blob:',))
+        try:
+            geo_cache.put('blob:1', {'rows': list(range(100))}, 'asia-south')
+            transport.join()
+            for region in self.regions:
+                self.assertEqual(geo_cache.get('blob:1', region), {'rows': list(range(100))})
+        finally:
+            geo_cache.close()
+
+    def test_partitioned_mode_is_rejected(self):
+        with patch('src.cache.geocache.Messaging'), self.assertRaises(ValueError):
+            GeoDistributedLRUCache(self.regions, partitioned=True, invalidation_prefixes=('blob:',))
+
+
 if __name__ == '__main__':
     unittest.main()
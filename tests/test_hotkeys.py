@@ -0,0 +1,187 @@
+import time
+import unittest
+from src.cache.geocache import GeoDistributedLRUCache
+from src.cache.hotkeys import HotKeys, SpaceSaving
+from src.messaging import InMemoryTransport
+
+
+class CountingTransport(InMemoryTransport):
+    """ An InMemoryTransport counting the messages it publishes """
+
+    def __init__(self):
+        super().__init__()
+        self.published = 0
+
+    def publish(self, name, body):
+        self.published += 1
+        super().publish(name, body)
+
+
+class TestSpaceSaving(unittest.TestCase):
+
+    def test_heavy_hitters(self):
+        summary = SpaceSaving(4)
+        for i in range(1000):
+            summary.offer('hot' if i % 2 else f'key{i}')
+        self.assertEqual(len(summary.counts), 4)
+        self.assertEqual(list(summary.heavy_hitters(0.1)), ['hot'])
+        self.assertGreaterEqual(summary.counts['hot'], 500)
+
+    def test_decay_halves_and_forgets_single_counts(self):
+        summary = SpaceSaving(4)
+        for key in ['a'] * 6 + ['b']:
+            summary.offer(key)
+        summary.decay()
+        self.assertEqual((summary.counts, summary.total), ({'a': 3}, 3))
+        summary.offer('c')
+        self.assertEqual(summary.minimum, 1)
+
+
+class TestHotKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = HotKeys(capacity=8, share=0.2, sample_rate=1, window=10)
+
+    def test_hot_keys_follow_the_traffic(self):
+        for i in range(10):
+            self.tracker.offer('hot' if i % 2 else f'key{i}')
+        self.assertEqual(self.tracker.hot, {'hot'})
+        self.assertEqual(self.tracker.snapshot(), [('hot', 5)])
+        self.tracker.update('hot', 'value', time.time() + 60, 1)
+        for i in range(40):
+            self.tracker.offer(f'key{i}')
+        self.assertEqual(self.tracker.hot, frozenset())
+        self.assertEqual(self.tracker.near, {})
+
+    def test_older_fills_and_writes_are_dropped(self):
+        for _ in range(10):
+            self.tracker.offer('hot')
+        self.tracker.update('hot', 'new', time.time() + 60, 5)
+        self.tracker.update('hot', 'old', time.time() + 60, 4)
+        self.assertEqual(self.tracker.get('hot'), 'new')
+        self.tracker.remove('hot', 6)
+        self.assertEqual(self.tracker.get('hot'), -1)
+        self.tracker.update('cold', 'value', time.time() + 60, 1)
+        self.assertNotIn('cold', self.tracker.near)
+
+    def test_fill_from_an_older_epoch_is_dropped(self):
+        for _ in range(10):
+            self.tracker.offer('hot')
+        epoch = self.tracker.epoch
+        self.tracker.clear()
+        entry = type('Entry', (), {'value': 'value', 'expires_at': time.time() + 60, 'version': 1})()
+        self.tracker.fill('hot', entry, epoch)
+        self.assertEqual(self.tracker.near, {})
+        self.tracker.fill('hot', entry, self.tracker.epoch)
+        self.assertEqual(self.tracker.get('hot'), 'value')
+
+    def test_countdown_reached_by_several_threads_counts_once(self):
+        tracker = HotKeys(capacity=8, share=0.2, sample_rate=4, window=10)
+        tracker.countdown = -3  # Four threads decremented it before any of them sampled
+        for _ in range(4):
+            tracker._sample('hot')
+        self.assertEqual(tracker.counted, 1)
+        self.assertGreater(tracker.countdown, 0)
+
+
+class TestGeoDistributedLRUCacheHotKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = CountingTransport()
+        self.cache = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=100, transport=self.transport,
+                                            consume=False, hot_keys=True, hot_key_interval=5, stats=True)
+        for region in self.cache.regions:
+            self.cache.trackers[region] = HotKeys(capacity=8, share=0.2, sample_rate=1, window=10)
+        self.cache.put('hot', 'value1', 'us-east')
+
+    def tearDown(self):
+        self.cache.close()
+
+    def _heat(self, region='us-east'):
+        for _ in range(20):
+            self.cache.get('hot', region)
+
+    def test_hot_key_served_from_the_near_cache(self):
+        self._heat()
+        tracker = self.cache.trackers['us-east']
+        self.assertIn('hot', tracker.near)
+        hits = self.cache.regions['us-east'].hits
+        self.assertEqual(self.cache.get('hot', 'us-east'), 'value1')
+        self.assertEqual(self.cache.regions['us-east'].hits, hits)  # The region cache is not touched
+        self.assertEqual(self.cache.hot_keys()['us-east'][0][0], 'hot')
+        stats = self.cache.stats()['regions']['us-east']
+        self.assertGreater(stats['near_hits'], 0)
+        self.assertEqual(stats['hot_keys'], 1)
+
+    def test_writes_are_seen_at_once(self):
+        self._heat()
+        self.cache.put('hot', 'value2', 'us-east')
+        self.assertEqual(self.cache.get('hot', 'us-east'), 'value2')
+        version = self.cache.clock.now()
+        self.cache.update_cache(self.cache.encode_updates([{'key': 'hot', 'value': 'value3', 'version': version}]),
+                                'us-east')
+        self.assertEqual(self.cache.get('hot', 'us-east'), 'value3')
+        stale = {'key': 'hot', 'value': 'value0', 'version': version - 1}
+        self.cache.update_cache(self.cache.encode_updates([stale]), 'us-east')
+        self.assertEqual(self.cache.get('hot', 'us-east'), 'value3')
+
+    def test_invalidations_reach_the_near_cache(self):
+        self._heat()
+        invalidation = {'key': 'hot', 'version': self.cache.clock.now(), 'invalidate': 'eu-central'}
+        self.cache.update_cache(self.cache.encode_updates([invalidation]), 'us-east')
+        self.assertEqual(self.cache.get('hot', 'us-east'), -1)
+
+    def test_local_deletes_reach_the_near_cache(self):
+        self._heat()
+        self.cache.regions['us-east'].delete('hot')
+        self.assertNotIn('hot', self.cache.trackers['us-east'].near)
+        self.assertEqual(self.cache.get('hot', 'us-east'), -1)
+
+    def test_evictions_reach_the_near_cache(self):
+        cache = GeoDistributedLRUCache(['us-east'], capacity=2, transport=InMemoryTransport(), consume=False,
+                                       hot_keys=True)
+        cache.trackers['us-east'] = HotKeys(capacity=8, share=0.2, sample_rate=1, window=10)
+        cache.put('hot', 'value1', 'us-east')
+        for _ in range(20):
+            cache.get('hot', 'us-east')
+        self.assertIn('hot', cache.trackers['us-east'].near)
+        cache.put('a', 1, 'us-east')
+        cache.put('b', 2, 'us-east')
+        self.assertEqual(cache.regions['us-east'].peek('hot'), None)
+        self.assertNotIn('hot', cache.trackers['us-east'].near)
+        self.assertEqual(cache.get('hot', 'us-east'), -1)
+        cache.close()
+
+    def test_bulk_copies_clear_the_near_cache(self):
+        self._heat()
+        self.cache._store('us-east', [('other', 'value', time.time() + 60, self.cache.clock.now())])
+        self.assertEqual(self.cache.trackers['us-east'].near, {})
+        self.assertEqual(self.cache.get('hot', 'us-east'), 'value1')
+
+    def test_rewrites_of_a_hot_key_are_debounced(self):
+        self._heat()
+        self.cache.messaging.flush()
+        published = self.transport.published
+        for i in range(100):
+            self.cache.put('hot', f'value{i}', 'us-east')
+        self.cache.messaging.flush()
+        self.assertEqual(self.transport.published, published + 1)
+        messages = self.transport.broker.queue('eu-central')
+        while not messages.empty():
+            self.cache.update_cache(messages.get_nowait(), 'eu-central')
+        self.assertEqual(self.cache.regions['eu-central'].get('hot'), 'value99')
+
+    def test_shared_memory_is_rejected(self):
+        with self.assertRaises(ValueError):
+            GeoDistributedLRUCache(['us-east'], transport=InMemoryTransport(), shared_memory=True, hot_keys=True)
+
+    def test_disabled_by_default(self):
+        cache = GeoDistributedLRUCache(['us-east'], transport=InMemoryTransport(), consume=False)
+        self.assertIsNone(cache.trackers)
+        with self.assertRaises(ValueError):
+            cache.hot_keys()
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
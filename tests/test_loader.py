@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+from src.cache.loader import LoaderStats, SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_run(self):
+        flights = SingleFlight()
+        calls, results = [], []
+        started = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return 'value'
+
+        def call():
+            results.append(flights.do('key1', slow))
+
+        threads = [threading.Thread(target=call) for _ in range(10)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results, key=lambda result: not result[1]),
+                         [('value', True)] + [('value', False)] * 9)
+        self.assertEqual(len(flights), 0)
+
+    def test_error_reaches_every_caller(self):
+        flights = SingleFlight()
+        with self.assertRaises(KeyError):
+            flights.do('key1', lambda: {}['missing'])
+        self.assertEqual(flights.do('key1', lambda: 'value'), ('value', True))
+
+    def test_stats_snapshot(self):
+        stats = LoaderStats()
+        stats.record_load(0.2)
+        stats.record_load(0.4, failed=True)
+        stats.record_coalesced()
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot['loads'], snapshot['errors'], snapshot['coalesced']), (2, 1, 1))
+        self.assertAlmostEqual(snapshot['mean_load_time'], 0.3)
+        self.assertAlmostEqual(snapshot['max_load_time'], 0.4)
+
+
+if __name__ == '__main__':
+    unittest.main()
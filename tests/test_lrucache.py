@@ -1,5 +1,6 @@
 import unittest
 import time
+from src.cache.entry import FRESH, STALE, MISS
 from src.cache.lrucache import LRUCache
 
 
@@ -80,5 +81,139 @@ class TestLRUCache(unittest.TestCase):
         self.assertEqual(result, "value1", "Failed to retrieve stale data for 'key1'")
 
 
+    def test_per_entry_ttl(self):
+        cache = LRUCache(capacity=2, expiration_time=10)
+        cache.put("key1", "value1", ttl=0.5)
+        cache.put("key2", "value2")
+        time.sleep(0.6)
+        self.assertEqual(cache.get("key1"), -1, "Per-entry TTL was not applied")
+        self.assertEqual(cache.get("key2"), "value2", "Default expiration time should still apply")
+
+    def test_expired_items_are_purged(self):
+        cache = LRUCache(capacity=100, expiration_time=0.2, timer_resolution=0.1)
+        for i in range(50):
+            cache.put(f"key{i}", i)
+        cache.put("long", "lived", ttl=10)
+        time.sleep(0.4)
+        self.assertEqual(cache.purge_expired(), 50, "Expired items were not reclaimed")
+        self.assertEqual(cache.expirations, 50)
+        self.assertEqual(list(cache.cache), ["long"])
+
+    def test_expired_items_free_capacity(self):
+        cache = LRUCache(capacity=2, expiration_time=10, timer_resolution=0.1)
+        cache.put("key1", "value1", ttl=0.1)
+        cache.put("key2", "value2")
+        time.sleep(0.3)
+        cache.put("key3", "value3")  # The expired key1 is purged instead of evicting key2
+        self.assertEqual(cache.get("key2"), "value2", "A live item was evicted while an expired one was kept")
+        self.assertEqual(cache.expirations, 1)
+
+
+    def test_get_many(self):
+        cache = LRUCache(capacity=3, expiration_time=10)
+        cache.put("key1", "value1")
+        cache.put("key2", "value2", ttl=0)
+        cache.put("key3", "value3")
+        result = cache.get_many(["key1", "key2", "key3", "nonexistent"])
+        self.assertEqual(result, {"key1": "value1", "key3": "value3"}, "Missing or expired keys should be left out")
+        cache.put("key4", "value4")  # key2 is the least recently used, key1 and key3 were just read
+        self.assertNotIn("key2", cache.cache)
+
+    def test_put_many(self):
+        cache = LRUCache(capacity=3, expiration_time=10)
+        cache.put_many({"key1": "value1", "key2": "value2"})
+        cache.put_many({"key2": "updated", "key3": "value3", "key4": "value4"}, ttl=5)
+        self.assertEqual(cache.get_many(["key1", "key2", "key3", "key4"]),
+                         {"key2": "updated", "key3": "value3", "key4": "value4"})
+        self.assertEqual(cache.evictions, 1)
+
+    def test_get_with_state(self):
+        cache = LRUCache(capacity=3, expiration_time=0.1, stale_grace=0.5, timer_resolution=0.05)
+        cache.put("key1", "value1")
+        self.assertEqual(cache.get_with_state("key1"), ("value1", FRESH))
+        time.sleep(0.2)
+        self.assertEqual(cache.get("key1"), -1)
+        self.assertEqual(cache.get_with_state("key1"), ("value1", STALE))
+        self.assertTrue(cache.get_with_state("key1").stale)
+        self.assertEqual(cache.get_with_state("key1", grace=0.05), (-1, MISS))
+        time.sleep(0.5)
+        self.assertEqual(cache.get_with_state("key1"), (-1, MISS))
+        self.assertEqual(len(cache.cache), 0)
+
+    def test_put_if_newer(self):
+        cache = LRUCache(capacity=2, expiration_time=10)
+        self.assertTrue(cache.put_if_newer("key1", "value2", version=2))
+        self.assertFalse(cache.put_if_newer("key1", "value1", version=1))  # Delivered out of order
+        self.assertFalse(cache.put_if_newer("key1", "value2", version=2))  # Delivered twice
+        self.assertEqual(cache.get("key1"), "value2")
+        self.assertTrue(cache.put_if_newer("key1", "value3", version=3))
+        self.assertEqual(cache.peek("key1").version, 3)
+        self.assertEqual(cache.items()[0][::3], ("key1", 3))
+
+    def test_digest_follows_writes_and_removals(self):
+        cache = LRUCache(capacity=2, expiration_time=10, digest_depth=4)
+        other = LRUCache(capacity=2, expiration_time=10, digest_depth=4)
+        cache.put("key1", "value1", version=1)
+        cache.put("key2", "value2", version=2)
+        cache.put("key3", "value3", version=3)  # Evicts key1
+        other.put("key3", "value3", version=3)
+        other.put("key2", "value2", version=2)
+        self.assertEqual(cache.leaf_hashes(), other.leaf_hashes())
+        cache.delete("key2")
+        self.assertNotEqual(cache.leaf_hashes(), other.leaf_hashes())
+        leaf = cache.digest.leaf("key3")
+        self.assertEqual(cache.leaf_versions(leaf), {"key3": 3})
+
+
+class TestLRUCacheCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.value = 'payload ' * 1000
+
+    def test_compressed_storage(self):
+        cache = LRUCache(capacity=3, expiration_time=10, compression='zlib', compression_threshold=1024)
+        cache.put('large', self.value)
+        cache.put('small', 'value')
+        self.assertTrue(cache.peek('large').compressed)
+        self.assertLess(len(cache.peek('large').stored.data), 100)
+        self.assertFalse(cache.peek('small').compressed)
+        self.assertEqual(cache.get('large'), self.value)
+        self.assertEqual(cache.get_many(['large', 'small']), {'large': self.value, 'small': 'value'})
+        cache.put('large', 'now small')
+        self.assertEqual(cache.get('large'), 'now small')
+        self.assertEqual(cache.items()[-1][1], 'now small')
+        with self.assertRaises(ValueError):
+            LRUCache(compression='snappy')
+
+    def test_byte_capacity(self):
+        cache = LRUCache(capacity=100, expiration_time=10, max_bytes=2500)
+        cache.put('key1', 'x' * 1000)
+        cache.put('key2', 'x' * 1000)
+        self.assertEqual(cache.bytes, 2 * 1005)  # Encoded with a 5 byte header
+        cache.put('key3', 'x' * 1000)  # Evicts key1, the least recently used
+        self.assertEqual(list(cache.cache), ['key2', 'key3'])
+        self.assertEqual(cache.evictions, 1)
+        cache.put('key2', 'small')
+        self.assertEqual(cache.bytes, 1005 + 7)
+        cache.delete('key3')
+        self.assertEqual(cache.bytes, 7)
+
+    def test_compressed_entries_count_by_real_size(self):
+        plain = LRUCache(capacity=100, expiration_time=10, max_bytes=20000)
+        compressed = LRUCache(capacity=100, expiration_time=10, max_bytes=20000, compression='zlib')
+        for cache in (plain, compressed):
+            cache.put_many({f'key{i}': self.value + str(i) for i in range(50)})
+        self.assertEqual(len(plain), 2)
+        self.assertEqual(len(compressed), 50)
+        self.assertLessEqual(compressed.bytes, 20000)
+
+    def test_expired_items_release_bytes(self):
+        cache = LRUCache(capacity=10, expiration_time=10, timer_resolution=0.1, max_bytes=10000)
+        cache.put('key1', 'x' * 100, ttl=0.1)
+        time.sleep(0.3)
+        cache.purge_expired()
+        self.assertEqual(cache.bytes, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
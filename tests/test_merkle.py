@@ -0,0 +1,53 @@
+import unittest
+from src.cache.merkle import MerkleDigest, MerkleTree
+from src.cache.shardedcache import ShardedLRUCache
+from src.cache.lrucache import LRUCache
+
+
+class TestMerkleDigest(unittest.TestCase):
+
+    def test_independent_of_write_order(self):
+        first, second = MerkleDigest(depth=4), MerkleDigest(depth=4)
+        for i in range(100):
+            first.add(f'key{i}', i)
+        for i in reversed(range(100)):
+            second.add(f'key{i}', i)
+        second.add('key100', 100)
+        second.discard('key100')
+        self.assertEqual(first.leaf_hashes(), second.leaf_hashes())
+
+    def test_versions_matter(self):
+        first, second = MerkleDigest(depth=4), MerkleDigest(depth=4)
+        first.add('key1', 1)
+        second.add('key1', 2)
+        self.assertNotEqual(first.leaf_hashes(), second.leaf_hashes())
+
+    def test_sharded_digest_matches_single_cache(self):
+        single = LRUCache(capacity=100, expiration_time=10, digest_depth=4)
+        sharded = ShardedLRUCache(capacity=100, expiration_time=10, shards=4, digest_depth=4)
+        for i in range(50):
+            single.put(f'key{i}', i, version=i)
+            sharded.put(f'key{i}', i, version=i)
+        self.assertEqual(single.leaf_hashes(), sharded.leaf_hashes())
+        leaf = single.digest.leaf('key7')
+        self.assertEqual(single.leaf_versions(leaf), sharded.leaf_versions(leaf))
+
+
+class TestMerkleTree(unittest.TestCase):
+
+    def test_diff_finds_differing_leaves(self):
+        leaves = list(range(1, 17))
+        changed = list(leaves)
+        changed[3] ^= 1
+        changed[12] ^= 1
+        self.assertEqual(MerkleTree(leaves).diff(MerkleTree(changed)), [3, 12])
+        self.assertEqual(MerkleTree(leaves).diff(MerkleTree(list(leaves))), [])
+        self.assertEqual(MerkleTree([5]).diff(MerkleTree([6])), [0])
+
+    def test_different_depths(self):
+        with self.assertRaises(ValueError):
+            MerkleTree([1, 2]).diff(MerkleTree([1, 2, 3, 4]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from pika import exceptions
+from src.cache.geocache import GeoDistributedLRUCache
+from src.exceptions import CacheLoadError, MessagePublishError
+from src.messaging import InMemoryBroker, InMemoryTransport, RabbitMQTransport
+
+
+class FlakyTransport(InMemoryTransport):
+    """ An InMemoryTransport failing to publish while down """
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+
+    def publish(self, name, body):
+        if self.down:
+            raise MessagePublishError(f"Failed to publish to {name}: the broker is down")
+        super().publish(name, body)
+
+
+class TestInMemoryReplication(unittest.TestCase):
+
+    def setUp(self):
+        self.regions = ['us-east', 'eu-central', 'asia-south']
+        self.transport = InMemoryTransport()
+
+    def tearDown(self):
+        self.geo_cache.messaging.close()
+
+    def test_put_replicates_to_other_regions(self):
+        self.geo_cache = GeoDistributedLRUCache(self.regions, transport=self.transport)
+        self.geo_cache.put('key1', 'value1', 'us-east')
+        self.transport.join()
+        self.assertEqual(self.geo_cache.get('key1', 'eu-central'), 'value1')
+        self.assertEqual(self.geo_cache.get('key1', 'asia-south'), 'value1')
+
+    def test_batched_replication(self):
+        self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=100, transport=self.transport, batching=True)
+        for i in range(30):
+            self.geo_cache.put(f'key{i}', i, 'us-east')
+        self.geo_cache.messaging.flush()
+        self.transport.join()
+        self.assertEqual(self.geo_cache.get_many([f'key{i}' for i in range(30)], 'asia-south'),
+                         {f'key{i}': i for i in range(30)})
+
+    def test_partitioned_replication(self):
+        self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=100, transport=self.transport,
+                                                partitioned=True, replication_factor=2)
+        for i in range(30):
+            self.geo_cache.put(f'key{i}', i, 'us-east')
+        self.transport.join()
+        for i in range(30):
+            owners = self.geo_cache.owners(f'key{i}')
+            for region in self.regions:
+                expected = i if region in owners else -1
+                self.assertEqual(self.geo_cache.regions[region].get(f'key{i}'), expected)
+            self.assertEqual(self.geo_cache.get(f'key{i}', 'asia-south'), i)
+
+    def test_publish_failures_feed_circuit_breaker(self):
+        self.geo_cache = GeoDistributedLRUCache(self.regions, transport=self.transport)
+        self.transport.closed.set()
+        self.geo_cache.put('key1', 'value1', 'us-east')
+        breaker = self.geo_cache.messaging.circuit_breaker
+        self.assertEqual(breaker.failures, 2)
+        self.assertFalse(breaker.is_open())
+        self.geo_cache.put('key1', 'value1', 'us-east')
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(self.geo_cache.circuit_breaker.is_open())  # The loader's breaker is left alone
+
+    def test_put_writes_the_local_region(self):
+        self.geo_cache = GeoDistributedLRUCache(self.regions, transport=self.transport)
+        self.transport.closed.set()
+        self.geo_cache.put('key1', 'value1', 'us-east')
+        self.assertEqual(self.geo_cache.get('key1', 'us-east'), 'value1')
+
+    def test_outbox_holds_updates_while_the_broker_is_down(self):
+        transport = FlakyTransport()
+        self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=100, transport=transport, outbox=True)
+        breaker = self.geo_cache.messaging.circuit_breaker
+        breaker.reset_time = 0.05
+        transport.down = True
+        start = time.perf_counter()
+        for i in range(20):
+            self.geo_cache.put(f'key{i}', i, 'us-east')
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(self.geo_cache.get('key19', 'us-east'), 19)
+        deadline = time.monotonic() + 2
+        while breaker.failures < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(breaker.failures, 3)
+        transport.down = False
+        self.assertTrue(self.geo_cache.messaging.flush(timeout=5))
+        transport.join()
+        for region in ('eu-central', 'asia-south'):
+            self.assertEqual(self.geo_cache.get_many([f'key{i}' for i in range(20)], region),
+                             {f'key{i}': i for i in range(20)})
+        stats = self.geo_cache.stats()
+        self.assertEqual(stats['outbox']['sent'], 40)
+        self.assertEqual(stats['publish_circuit_breaker']['state'], 'closed')
+
+    def test_outbox_and_loader_have_separate_breakers(self):
+        self.geo_cache = GeoDistributedLRUCache(self.regions, capacity=100, transport=self.transport, outbox=True,
+                                                negative_ttl=0)
+        loader_breaker = self.geo_cache.circuit_breaker
+        for i in range(loader_breaker.max_failures):  # The origin fails
+            with self.assertRaises(CacheLoadError):
+                self.geo_cache.get_or_load(f'missing{i}', 'us-east', loader=lambda key: 1 / 0)
+        self.assertTrue(loader_breaker.is_open())
+        for i in range(10):
+            self.geo_cache.put(f'key{i}', i, 'us-east')
+        self.assertTrue(self.geo_cache.messaging.flush(timeout=2), "Loader failures paused the outbox")
+        self.assertEqual(self.geo_cache.stats()['outbox']['sent'], 20)
+        self.assertTrue(loader_breaker.is_open(), "Outbox sends closed the loader's breaker")
+
+    def test_pika_callback_signature(self):
+        self.geo_cache = GeoDistributedLRUCache(self.regions, transport=self.transport)
+        method = MagicMock(routing_key='eu-central')
+        self.geo_cache.messaging.on_message(None, method, None, self.geo_cache.encode_updates(
+            [{'key': 'key1', 'value': 'value1'}]))
+        self.assertEqual(self.geo_cache.get('key1', 'eu-central'), 'value1')
+
+
+class TestInMemoryTransport(unittest.TestCase):
+
+    def test_shared_broker(self):
+        broker = InMemoryBroker()
+        publisher, consumer = InMemoryTransport(broker), InMemoryTransport(broker)
+        received = []
+        consumer.consume('eu-central', lambda body, name: received.append((body, name)))
+        publisher.publish('eu-central', b'message')
+        consumer.join()
+        self.assertEqual(received, [(b'message', 'eu-central')])
+        consumer.close()
+
+    def test_publish_after_close(self):
+        transport = InMemoryTransport()
+        transport.close()
+        with self.assertRaises(MessagePublishError):
+            transport.publish('eu-central', b'message')
+
+
+class TestRabbitMQTransport(unittest.TestCase):
+
+    @patch('src.messaging.transport.pika.BlockingConnection')
+    def test_one_channel_per_thread(self, mock_connection):
+        mock_connection.side_effect = lambda params: MagicMock()
+        transport = RabbitMQTransport()
+        mock_connection.assert_not_called()  # Connections are opened lazily
+        channels = []
+        threads = [threading.Thread(target=lambda: channels.append(transport.channel())) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.assertEqual(len({id(channel) for channel in channels}), 3, "Threads should not share a channel")
+        self.assertIs(transport.channel(), transport.channel(), "A thread should reuse its channel")
+        self.assertEqual(len(transport.connections), 4)
+
+    @patch('src.messaging.transport.pika.BlockingConnection')
+    def test_failed_publish_closes_its_connection(self, mock_connection):
+        mock_connection.side_effect = lambda params: MagicMock()
+        transport = RabbitMQTransport()
+        channel = transport.channel()
+        channel.basic_publish.side_effect = exceptions.AMQPConnectionError('connection lost')
+        connection = transport.connections[0]
+        with self.assertRaises(MessagePublishError):
+            transport.publish('eu-central', b'message')
+        connection.close.assert_called_once()
+        self.assertEqual(transport.connections, [])
+        transport.publish('eu-central', b'message')  # Reconnects
+        self.assertEqual(len(transport.connections), 1)
+        self.assertIsNot(transport.connections[0], connection)
+
+    @patch('src.messaging.transport.pika.BlockingConnection')
+    def test_publish_uses_default_exchange_and_confirms(self, mock_connection):
+        transport = RabbitMQTransport()
+        transport.publish('eu-central', b'message')
+        channel = mock_connection.return_value.channel.return_value
+        channel.confirm_delivery.assert_called_once()
+        channel.basic_publish.assert_called_once_with(exchange='', routing_key='eu-central', body=b'message')
+
+
+if __name__ == '__main__':
+    unittest.main()
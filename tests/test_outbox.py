@@ -0,0 +1,143 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from src.exceptions import MessagePublishError
+from src.messaging import CircuitBreaker, Outbox
+
+
+class Broker:
+    """ Records the messages sent while up, fails while down """
+
+    def __init__(self, up=True):
+        self.up = threading.Event()
+        if up:
+            self.up.set()
+        self.received = []
+        self.attempts = 0
+
+    def send(self, destination, message):
+        self.attempts += 1
+        if not self.up.is_set():
+            raise MessagePublishError("broker down")
+        self.received.append((destination, message))
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.directory.name, 'outbox.spill')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_sends_in_order(self):
+        broker = Broker()
+        outbox = Outbox(broker.send)
+        for i in range(100):
+            outbox.put('eu-central', f'message{i}'.encode())
+        self.assertTrue(outbox.join(timeout=5))
+        self.assertEqual(broker.received, [('eu-central', f'message{i}'.encode()) for i in range(100)])
+        self.assertEqual(outbox.snapshot(), {'pending': 0, 'sent': 100, 'spilled': 0, 'dropped': 0})
+        outbox.close()
+
+    def test_circuit_breaker_paces_retries(self):
+        broker = Broker(up=False)
+        breaker = CircuitBreaker(max_failures=2, reset_time=0.3)
+        outbox = Outbox(broker.send, circuit_breaker=breaker, retry_delay=0.01)
+        outbox.put('eu-central', b'message1')
+        outbox.put('eu-central', b'message2')
+        time.sleep(0.15)
+        self.assertTrue(breaker.is_open())
+        self.assertEqual(broker.attempts, 2)  # No attempt while open
+        time.sleep(0.3)
+        self.assertEqual(broker.attempts, 3)  # One half-open probe, which failed
+        broker.up.set()
+        self.assertTrue(outbox.join(timeout=2))
+        self.assertEqual([message for _, message in broker.received], [b'message1', b'message2'])
+        self.assertEqual(breaker.state, 'closed')
+        outbox.close()
+
+    def test_overflow_spills_in_order(self):
+        broker = Broker(up=False)
+        outbox = Outbox(broker.send, capacity=3, spill_path=self.spill_path, retry_delay=0.01,
+                        circuit_breaker=CircuitBreaker(max_failures=100))
+        for i in range(10):
+            outbox.put('eu-central' if i % 2 else 'asia-south', f'message{i}' if i % 3 else f'message{i}'.encode())
+        self.assertEqual(len(outbox), 10)
+        self.assertEqual(outbox.spilled, 7)
+        broker.up.set()
+        self.assertTrue(outbox.join(timeout=5))
+        self.assertEqual(broker.received, [('eu-central' if i % 2 else 'asia-south',
+                                            f'message{i}' if i % 3 else f'message{i}'.encode()) for i in range(10)])
+        self.assertEqual(os.path.getsize(self.spill_path), 0)
+        outbox.put('eu-central', b'message10')  # Back to memory
+        self.assertTrue(outbox.join(timeout=5))
+        self.assertEqual(os.path.getsize(self.spill_path), 0)
+        outbox.close()
+
+    def test_unsent_messages_survive_a_restart(self):
+        broker = Broker(up=False)
+        outbox = Outbox(broker.send, capacity=2, spill_path=self.spill_path, retry_delay=0.01)
+        for i in range(5):
+            outbox.put('eu-central', f'message{i}'.encode())
+        outbox.close(timeout=0.05)
+        broker = Broker()
+        outbox = Outbox(broker.send, spill_path=self.spill_path)
+        outbox.put('eu-central', b'message5')
+        self.assertTrue(outbox.join(timeout=5))
+        self.assertEqual([message for _, message in broker.received], [f'message{i}'.encode() for i in range(6)])
+        outbox.close()
+        self.assertEqual(os.path.getsize(self.spill_path), 0)
+
+    def test_overflow_without_spill_file_drops_the_oldest(self):
+        broker = Broker(up=False)
+        outbox = Outbox(broker.send, capacity=2, retry_delay=0.01)
+        for i in range(4):
+            outbox.put('eu-central', f'message{i}'.encode())
+        self.assertEqual((len(outbox), outbox.dropped), (2, 2))
+        broker.up.set()
+        self.assertTrue(outbox.join(timeout=5))
+        self.assertEqual([message for _, message in broker.received][-2:], [b'message2', b'message3'])
+        outbox.close()
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(max_failures=2, reset_time=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(breaker.allow_request())
+        time.sleep(0.06)
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.allow_request())  # The probe
+        self.assertFalse(breaker.allow_request())
+        self.assertTrue(breaker.is_open())
+        breaker.record_failure()  # A failed probe opens the breaker again
+        self.assertEqual(breaker.state, 'open')
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual((breaker.state, breaker.failures), ('closed', 0))
+        self.assertTrue(breaker.allow_request())
+
+    def test_single_probe_across_threads(self):
+        breaker = CircuitBreaker(max_failures=1, reset_time=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        allowed = []
+        threads = [threading.Thread(target=lambda: allowed.append(breaker.allow_request())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import bisect
+import itertools
+import random
+import time
+import unittest
+from src.cache.lrucache import LRUCache
+from src.cache.policies import POLICIES, CountMinSketch, EvictionPolicy, LRUPolicy, make_policy
+
+
+def zipf_trace(keys, alpha, length, seed=1):
+    rng = random.Random(seed)
+    weights = list(itertools.accumulate(1 / (rank ** alpha) for rank in range(1, keys + 1)))
+    return [f"key{bisect.bisect(weights, rng.random() * weights[-1])}" for _ in range(length)]
+
+
+def scan_trace(hot_keys, rounds, scan_length, seed=2):
+    """ A hot working set interrupted by long scans of keys that are never read again """
+    rng = random.Random(seed)
+    trace = []
+    for round_index in range(rounds):
+        trace.extend(f"hot{rng.randrange(hot_keys)}" for _ in range(hot_keys * 3))
+        trace.extend(f"scan{round_index}-{i}" for i in range(scan_length))
+    return trace
+
+
+def loop_trace(keys, rounds):
+    """ A cyclic walk over more keys than the cache holds, the worst case of LRU """
+    return [f"key{i}" for _ in range(rounds) for i in range(keys)]
+
+
+def resident_keys(policy):
+    if hasattr(policy, 'window'):
+        return set(policy.window) | resident_keys(policy.main)
+    segments = {'probation', 'protected', 'a1in', 'am', 't1', 't2'}
+    return set().union(*(getattr(policy, segment) for segment in segments if hasattr(policy, segment)))
+
+
+def hit_ratio(policy, trace, capacity):
+    cache = LRUCache(capacity, expiration_time=10 ** 6, policy=policy)
+    hits = 0
+    for key in trace:
+        if cache.get(key) == -1:
+            cache.put(key, key)
+        else:
+            hits += 1
+    return hits / len(trace)
+
+
+class TestEvictionPolicies(unittest.TestCase):
+
+    def test_capacity_respected_and_policy_in_sync(self):
+        trace = zipf_trace(2000, 0.8, 20000) + scan_trace(50, 5, 300)
+        for name in POLICIES:
+            cache = LRUCache(capacity=100, expiration_time=10 ** 6, policy=name)
+            puts = 0
+            for key in trace:
+                if cache.get(key) == -1:
+                    cache.put(key, key)
+                    puts += 1
+                self.assertLessEqual(len(cache.cache), 100, f"{name} exceeded the capacity")
+            self.assertEqual(cache.evictions, puts - len(cache.cache), name)
+            if name != 'lru':
+                self.assertEqual(resident_keys(cache.policy), set(cache.cache), f"{name} lost track of the keys")
+
+    def test_default_policy_is_lru(self):
+        cache = LRUCache(capacity=2, expiration_time=10)
+        self.assertIsInstance(cache.policy, LRUPolicy)
+        self.assertFalse(cache.notify_policy, "The LRU policy should not need hook calls")
+
+    def test_make_policy(self):
+        self.assertIsInstance(make_policy('arc', 10), POLICIES['arc'])
+        self.assertIsInstance(make_policy(POLICIES['2q'], 10), POLICIES['2q'])
+        policy = POLICIES['slru'](10)
+        self.assertIs(make_policy(policy), policy)
+        with self.assertRaises(ValueError):
+            make_policy('mru', 10)
+
+    def test_expired_keys_leave_the_policy(self):
+        cache = LRUCache(capacity=10, expiration_time=10, timer_resolution=0.01, policy='slru')
+        cache.put("key1", "value1", ttl=0)
+        cache.put("key2", "value2")
+        time.sleep(0.05)
+        cache.purge_expired()
+        self.assertEqual(set(cache.policy.probation) | set(cache.policy.protected), {"key2"})
+
+    def test_tinylfu_removes_window_keys_from_the_window_only(self):
+        policy = POLICIES['tinylfu'](100)
+        removed = []
+        policy.main.on_remove = removed.append
+        policy.on_insert("key1")
+        policy.on_remove("key1")
+        self.assertEqual((list(policy.window), removed), ([], []))
+        policy.on_remove("key2")
+        self.assertEqual(removed, ["key2"])
+
+    def test_admission_rejects_one_hit_wonders(self):
+        cache = LRUCache(capacity=100, expiration_time=10 ** 6, policy='tinylfu')
+        for _ in range(5):
+            for i in range(99):
+                if cache.get(f"hot{i}") == -1:
+                    cache.put(f"hot{i}", i)
+        for i in range(1000):
+            cache.put(f"once{i}", i)
+        survivors = sum(1 for i in range(99) if f"hot{i}" in cache.cache)
+        self.assertGreaterEqual(survivors, 95, "Frequent keys were displaced by keys seen once")
+
+    def test_zipf_workload(self):
+        """ Skewed popularity: every frequency-aware policy keeps more of the head than LRU """
+        trace = zipf_trace(10000, 0.9, 60000)
+        ratios = {name: hit_ratio(name, trace, 200) for name in POLICIES}
+        for name in ('slru', '2q', 'arc', 'tinylfu'):
+            self.assertGreater(ratios[name], ratios['lru'] + 0.05, f"{name} should beat LRU on Zipf: {ratios}")
+
+    def test_scan_workload(self):
+        """ Scans of one-time keys: SLRU, ARC and W-TinyLFU shield the hot set, LRU and 2Q lose it """
+        trace = scan_trace(100, 20, 500)
+        ratios = {name: hit_ratio(name, trace, 200) for name in POLICIES}
+        for name in ('slru', 'arc', 'tinylfu'):
+            self.assertGreater(ratios[name], ratios['lru'] + 0.05, f"{name} should beat LRU on scans: {ratios}")
+
+    def test_loop_workload(self):
+        """ A loop larger than the cache: LRU never hits, 2Q and W-TinyLFU keep part of the loop resident """
+        trace = loop_trace(300, 20)
+        ratios = {name: hit_ratio(name, trace, 200) for name in POLICIES}
+        self.assertEqual(ratios['lru'], 0.0)
+        for name in ('2q', 'tinylfu'):
+            self.assertGreater(ratios[name], 0.3, f"{name} should survive a loop: {ratios}")
+
+
+class TestCountMinSketch(unittest.TestCase):
+
+    def test_estimates_and_aging(self):
+        sketch = CountMinSketch(64)
+        for _ in range(10):
+            sketch.increment("hot")
+        sketch.increment("cold")
+        self.assertGreaterEqual(sketch.estimate("hot"), 10)
+        self.assertLess(sketch.estimate("cold"), sketch.estimate("hot"))
+        hot = sketch.estimate("hot")
+        sketch.age()
+        self.assertEqual(sketch.estimate("hot"), hot // 2)
+
+    def test_counters_saturate(self):
+        sketch = CountMinSketch(64, sample_factor=1000)
+        for _ in range(100):
+            sketch.increment("key")
+        self.assertEqual(sketch.estimate("key"), 15)
+
+
+class TestCustomPolicy(unittest.TestCase):
+
+    def test_custom_policy_instance(self):
+        class NewestFirst(EvictionPolicy):
+            def evict(self):
+                return next(reversed(self.entries))
+
+        cache = LRUCache(capacity=2, expiration_time=10, policy=NewestFirst(2))
+        cache.put("key1", "value1")
+        cache.put("key2", "value2")
+        cache.put("key3", "value3")  # Evicts the newest key, i.e. key3 itself
+        self.assertEqual(sorted(cache.cache), ["key1", "key2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
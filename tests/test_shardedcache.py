@@ -0,0 +1,76 @@
+import threading
+import unittest
+from src.cache.shardedcache import ShardedLRUCache
+
+
+class TestShardedLRUCache(unittest.TestCase):
+
+    def test_cache_initialization(self):
+        cache = ShardedLRUCache(capacity=64, expiration_time=10, shards=8)
+        self.assertEqual(cache.shard_count, 8, "Cache should be split in 8 shards")
+        self.assertTrue(all(shard.capacity == 8 for shard in cache.shards), "Capacity should be split evenly")
+
+    def test_shard_count_capped_to_capacity(self):
+        cache = ShardedLRUCache(capacity=2, expiration_time=10, shards=16)
+        self.assertEqual(cache.shard_count, 2, "Shard count should not exceed the capacity")
+
+    def test_basic_put_and_get(self):
+        cache = ShardedLRUCache(capacity=16, expiration_time=10, shards=4)
+        cache.put("key1", "value1")
+        self.assertEqual(cache.get("key1"), "value1", "Failed to get the correct value for 'key1'")
+        self.assertEqual(cache.get("nonexistent"), -1, "Retrieving a non-existent key should return -1")
+
+    def test_capacity_limits(self):
+        cache = ShardedLRUCache(capacity=8, expiration_time=10, shards=4)
+        for i in range(100):
+            cache.put(f"key{i}", i)
+        self.assertLessEqual(len(cache), 8, "Cache exceeded its capacity limit")
+
+    def test_uneven_capacity_split_exactly(self):
+        cache = ShardedLRUCache(capacity=10, expiration_time=10, shards=4)
+        self.assertEqual([shard.capacity for shard in cache.shards], [3, 3, 2, 2])
+        for i in range(1000):
+            cache.put(f"key{i}", i)
+            self.assertLessEqual(len(cache), 10, "Cache exceeded its capacity limit")
+        self.assertEqual(len(cache), 10)
+
+    def test_lru_eviction_within_shard(self):
+        cache = ShardedLRUCache(capacity=4, expiration_time=10, shards=2)
+        keys = [f"key{i}" for i in range(50)]
+        same_shard = [key for key in keys if cache._index(key) == 0][:3]
+        cache.put(same_shard[0], "value0")
+        cache.put(same_shard[1], "value1")
+        cache.get(same_shard[0])  # Access the first key to make it recently used
+        cache.put(same_shard[2], "value2")  # This should evict the second key
+        self.assertEqual(cache.get(same_shard[1]), -1, "LRU eviction policy failed inside the shard")
+        self.assertEqual(cache.get(same_shard[0]), "value0")
+
+    def test_get_many_and_put_many(self):
+        cache = ShardedLRUCache(capacity=64, expiration_time=10, shards=4)
+        cache.put_many({f"key{i}": i for i in range(20)})
+        result = cache.get_many([f"key{i}" for i in range(25)])
+        self.assertEqual(result, {f"key{i}": i for i in range(20)})
+
+    def test_concurrent_access(self):
+        cache = ShardedLRUCache(capacity=1000, expiration_time=10, shards=8)
+        errors = []
+
+        def worker(offset):
+            try:
+                for i in range(500):
+                    cache.put(f"key{offset}-{i}", i)
+                    cache.get(f"key{offset}-{i // 2}")
+            except Exception as e:  # pragma: no cover - only reached on a race
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [], "Concurrent access raised an error")
+        self.assertLessEqual(len(cache), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
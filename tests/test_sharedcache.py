@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import time
+import unittest
+from src.cache.entry import FRESH, STALE, MISS
+from src.cache.geocache import GeoDistributedLRUCache
+from src.cache.sharedcache import SharedMemoryLRUCache
+from src.exceptions import CacheCapacityError
+from src.messaging import InMemoryBroker, InMemoryTransport
+
+
+def _write_from_child(name):
+    cache = SharedMemoryLRUCache(name, create=False)
+    cache.put('child', {'pid': os.getpid()})
+    cache.close()
+
+
+def _rewrite_from_child(name, rounds):
+    cache = SharedMemoryLRUCache(name, create=False)
+    for i in range(rounds):
+        cache.put(f'key{i % 2}', str(i % 10) * (i % 50 + 1))  # Values of varying size, a single repeated digit
+        cache.put(f'other{i}', i)  # Evicts and moves probe runs around
+    cache.close()
+
+
+class TestSharedMemoryLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.name = f"test-shm-{os.getpid()}-{self.id().rsplit('.', 1)[-1]}"
+        self.cache = SharedMemoryLRUCache(self.name, capacity=3, expiration_time=10)
+
+    def tearDown(self):
+        self.cache.close()
+        self.cache.unlink()
+        os.remove(self.cache.lock.path)
+
+    def test_put_and_get(self):
+        self.cache.put('key1', 'value1')
+        self.cache.put('key2', {'id': 2, 'tags': ['a']})
+        self.assertEqual(self.cache.get('key1'), 'value1')
+        self.assertEqual(self.cache.get('key2'), {'id': 2, 'tags': ['a']})
+        self.assertEqual(self.cache.get('key3'), -1)
+        self.cache.put('key1', 'value2')
+        self.assertEqual(self.cache.get('key1'), 'value2')
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (3, 1))
+
+    def test_clock_eviction_spares_referenced_items(self):
+        self.cache.put_many({'key1': 1, 'key2': 2, 'key3': 3})
+        self.cache.put('key4', 4)  # Every item was referenced when written, the hand clears them and evicts key1
+        self.assertEqual(self.cache.get_many(['key1', 'key2', 'key3', 'key4']), {'key2': 2, 'key3': 3, 'key4': 4})
+        self.cache.put('key5', 5)  # key2, key3 and key4 were read, the hand gives them a second chance
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(self.cache.evictions, 2)
+
+    def test_free_slots_are_taken_before_evicting(self):
+        self.cache.put_many({'key1': 1, 'key2': 2, 'key3': 3})
+        self.cache.put('key4', 4)  # Evicts key1
+        self.cache.delete('key4')
+        self.cache.put('key5', 5)  # Takes the slot key4 freed
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(self.cache.get_many(['key2', 'key3', 'key5']), {'key2': 2, 'key3': 3, 'key5': 5})
+        self.cache._clear_cache()
+        self.cache.put_many({'key1': 1, 'key2': 2, 'key3': 3})
+        self.assertEqual((len(self.cache), self.cache.evictions), (3, 1))
+
+    def test_expiration_and_stale_reads(self):
+        cache = SharedMemoryLRUCache(self.name + '-stale', capacity=3, expiration_time=10, stale_grace=5)
+        try:
+            cache.put('key1', 'value1', ttl=0.1)
+            time.sleep(0.2)
+            self.assertEqual(cache.get('key1'), -1)
+            self.assertEqual(cache.get_with_state('key1').state, STALE)
+            self.assertEqual(cache.get_with_state('key1', grace=0).state, MISS)
+            cache.put('key1', 'value2')
+            self.assertEqual(cache.get_with_state('key1'), ('value2', FRESH))
+        finally:
+            cache.close()
+            cache.unlink()
+            os.remove(cache.lock.path)
+        self.cache.put('key1', 'value1', ttl=0.1)
+        time.sleep(0.2)
+        self.assertEqual(self.cache.purge_expired(), 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_delete_keeps_probe_runs_reachable(self):
+        cache = SharedMemoryLRUCache(self.name + '-many', capacity=200, expiration_time=10)
+        try:
+            cache.put_many({f'key{i}': i for i in range(200)})
+            for i in range(0, 200, 3):
+                self.assertTrue(cache.delete(f'key{i}'))
+            self.assertFalse(cache.delete('key0'))
+            self.assertEqual(cache.get_many([f'key{i}' for i in range(200)]),
+                             {f'key{i}': i for i in range(200) if i % 3})
+        finally:
+            cache.close()
+            cache.unlink()
+            os.remove(cache.lock.path)
+
+    def test_versions(self):
+        self.assertTrue(self.cache.put_if_newer('key1', 'value1', 2))
+        self.assertFalse(self.cache.put_if_newer('key1', 'older', 1))
+        self.assertEqual(self.cache.peek('key1').version, 2)
+        self.assertEqual(self.cache.items()[0][:2], ('key1', 'value1'))
+
+    def test_oversized_item(self):
+        with self.assertRaises(CacheCapacityError):
+            self.cache.put('key1', 'x' * 1000)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_attach_reads_layout(self):
+        self.cache.put('key1', 'value1')
+        attached = SharedMemoryLRUCache(self.name)
+        try:
+            self.assertFalse(attached.owner)
+            self.assertEqual(attached.capacity, 3)
+            self.assertEqual(attached.get('key1'), 'value1')
+        finally:
+            attached.close()
+        with self.assertRaises(FileExistsError):
+            SharedMemoryLRUCache(self.name, create=True)
+
+    def test_other_process_writes(self):
+        process = multiprocessing.get_context('spawn').Process(target=_write_from_child, args=(self.name,))
+        process.start()
+        process.join(30)
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(self.cache.get('child'), {'pid': process.pid})
+
+    def test_reads_never_see_partial_writes(self):
+        process = multiprocessing.get_context('spawn').Process(target=_rewrite_from_child, args=(self.name, 5000))
+        process.start()
+        while process.is_alive():
+            for key in ('key0', 'key1'):
+                value = self.cache.get(key)
+                if value != -1:
+                    self.assertEqual(value, value[0] * len(value))
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+
+class TestGeoDistributedLRUCacheSharedMemory(unittest.TestCase):
+
+    def test_one_consumer_applies_updates_for_every_process(self):
+        prefix = f"test-geo-{os.getpid()}"
+        broker = InMemoryBroker()
+        consumer_transport, worker_transport = InMemoryTransport(broker), InMemoryTransport(broker)
+        consumer = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=10, shared_memory=prefix,
+                                          transport=consumer_transport)
+        worker = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=10, shared_memory=prefix,
+                                        transport=worker_transport, consume=False)
+        shared = list(consumer.regions.values())
+        try:
+            self.assertEqual(worker_transport.threads, [])
+            worker.put('key1', 'value1', 'us-east')
+            consumer_transport.join()
+            self.assertEqual(worker.get('key1', 'eu-central'), 'value1')
+            self.assertEqual(consumer.get('key1', 'eu-central'), 'value1')
+        finally:
+            worker.close()
+            consumer.close()
+            for cache in shared:
+                cache.unlink()
+                os.remove(cache.lock.path)
+
+    def test_oversized_update_does_not_drop_the_batch(self):
+        cache = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=10, shared_memory=f"test-geo-{os.getpid()}",
+                                       transport=InMemoryTransport(), consume=False, stats=True)
+        shared = list(cache.regions.values())
+        try:
+            version = cache.clock.now()
+            cache.put('key3', 'value3', 'us-east')
+            records = [{'key': 'key1', 'value': 'value1', 'version': version},
+                       {'key': 'big', 'value': 'x' * 1000, 'version': version},
+                       {'key': 'key2', 'value': 'value2', 'version': version},
+                       {'key': 'key3', 'version': cache.clock.now(), 'invalidate': 'eu-central'}]
+            with self.assertLogs(level='ERROR'):
+                cache.update_cache(cache.encode_updates(records), 'us-east')
+            self.assertEqual(cache.regions['us-east'].get_many(['key1', 'big', 'key2', 'key3']),
+                             {'key1': 'value1', 'key2': 'value2'})
+            stats = cache.stats()['regions']['us-east']
+            self.assertEqual((stats['applied'], stats['rejected'], stats['invalidations']), (2, 1, 1))
+        finally:
+            cache.close()
+            for region_cache in shared:
+                region_cache.unlink()
+                os.remove(region_cache.lock.path)
+
+    def test_incompatible_options(self):
+        with self.assertRaises(ValueError):
+            GeoDistributedLRUCache(['us-east'], shared_memory='test-geo', shards=4, transport=InMemoryTransport())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from src.cache.entry import CacheEntry
+from src.cache.geocache import GeoDistributedLRUCache
+from src.cache.lrucache import LRUCache
+from src.cache.shardedcache import ShardedLRUCache
+from src.cache.snapshot import SnapshotEntry, read_snapshot, write_snapshot
+from src.exceptions import SnapshotError
+
+
+class TestSnapshotFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'region.snapshot')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip_keeps_order_and_expiration(self):
+        now = time.time()
+        entries = [CacheEntry('key1', 'value1', now + 10), CacheEntry('key2', {'id': 2, 'tags': ['a']}, now + 20),
+                   CacheEntry('key3', b'\x00\x01', now + 30)]
+        self.assertEqual(write_snapshot(self.path, entries), 3)
+        restored = read_snapshot(self.path)
+        self.assertEqual([(entry.key, entry.value, entry.expires_at) for entry in restored],
+                         [(entry.key, entry.value, entry.expires_at) for entry in entries])
+
+    def test_expired_entries_are_skipped(self):
+        now = time.time()
+        write_snapshot(self.path, [CacheEntry('key1', 'value1', now + 5), CacheEntry('key2', 'value2', now + 50)])
+        self.assertEqual([entry.key for entry in read_snapshot(self.path, now=now + 10)], ['key2'])
+
+    def test_limit_keeps_most_recent(self):
+        now = time.time()
+        write_snapshot(self.path, [CacheEntry(f'key{i}', i, now + 10) for i in range(5)])
+        self.assertEqual([entry.key for entry in read_snapshot(self.path, limit=2)], ['key3', 'key4'])
+
+    def test_lazy_values_decoded_on_first_read(self):
+        write_snapshot(self.path, [CacheEntry('key1', 'value1', time.time() + 10)])
+        entry = read_snapshot(self.path)[0]
+        self.assertIsInstance(entry, SnapshotEntry)
+        self.assertIsNotNone(entry.source)
+        self.assertEqual(entry.value, 'value1')
+        self.assertIsNone(entry.source)
+        entry.value = 'value2'
+        self.assertEqual(entry.value, 'value2')
+        eager = read_snapshot(self.path, lazy=False)[0]
+        self.assertNotIsInstance(eager, SnapshotEntry)
+        self.assertEqual(eager.value, 'value1')
+
+    def test_corrupt_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot at all, just some bytes')
+        with self.assertRaises(SnapshotError):
+            read_snapshot(self.path)
+        write_snapshot(self.path, [CacheEntry('key1', 'value1', time.time() + 10)])
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        with self.assertRaises(SnapshotError):
+            read_snapshot(self.path)
+        with self.assertRaises(SnapshotError):
+            read_snapshot(os.path.join(self.directory.name, 'missing.snapshot'))
+
+    def test_unsupported_values_leave_no_file(self):
+        with self.assertRaises(SnapshotError):
+            write_snapshot(self.path, [CacheEntry('key1', object(), time.time() + 10)])
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+class TestCacheSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'region.snapshot')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lru_cache_warm_restart(self):
+        cache = LRUCache(capacity=3, expiration_time=10)
+        cache.put('key1', 'value1')
+        cache.put('key2', 'value2', ttl=100)
+        cache.put('key3', 'value3')
+        cache.get('key1')  # key2 becomes the least recently used
+        self.assertEqual(cache.snapshot(self.path), 3)
+
+        restarted = LRUCache(capacity=3, expiration_time=10)
+        self.assertEqual(restarted.restore(self.path), 3)
+        self.assertEqual(list(restarted.cache), ['key2', 'key3', 'key1'])
+        self.assertEqual(restarted.cache['key2'].expires_at, cache.cache['key2'].expires_at)
+        restarted.put('key4', 'value4')  # Evicts key2, the least recently used before the restart
+        self.assertEqual(restarted.get('key2'), -1)
+        self.assertEqual(restarted.get('key1'), 'value1')
+
+    def test_restore_keeps_newer_items(self):
+        cache = LRUCache(capacity=3, expiration_time=10)
+        cache.put('key1', 'old')
+        cache.snapshot(self.path)
+        restarted = LRUCache(capacity=3, expiration_time=10)
+        restarted.put('key1', 'new')
+        self.assertEqual(restarted.restore(self.path), 0)
+        self.assertEqual(restarted.get('key1'), 'new')
+
+    def test_restored_items_expire(self):
+        cache = LRUCache(capacity=3, expiration_time=10, timer_resolution=0.1)
+        cache.put('key1', 'value1', ttl=0.2)
+        cache.snapshot(self.path)
+        restarted = LRUCache(capacity=3, expiration_time=10, timer_resolution=0.1)
+        restarted.restore(self.path)
+        time.sleep(0.4)
+        self.assertEqual(restarted.purge_expired(), 1)
+        self.assertEqual(len(restarted), 0)
+
+    def test_sharded_cache(self):
+        cache = ShardedLRUCache(capacity=100, expiration_time=10, shards=4)
+        cache.put_many({f'key{i}': i for i in range(50)})
+        self.assertEqual(cache.snapshot(self.path), 50)
+        restarted = ShardedLRUCache(capacity=100, expiration_time=10, shards=4)
+        self.assertEqual(restarted.restore(self.path), 50)
+        self.assertEqual(restarted.get_many([f'key{i}' for i in range(50)]), {f'key{i}': i for i in range(50)})
+
+    def test_geo_cache(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=10)
+            restarted = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=10)
+        geo_cache.put_many({'key1': 'value1', 'key2': 'value2'}, 'us-east')
+        self.assertEqual(geo_cache.snapshot(self.directory.name), {'us-east': 2, 'eu-central': 0})
+        self.assertEqual(restarted.restore(self.directory.name), {'us-east': 2, 'eu-central': 0})
+        self.assertEqual(restarted.get('key2', 'us-east'), 'value2')
+
+    def test_geo_cache_background_snapshot(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(['us-east'], capacity=10, shards=2)
+        geo_cache.put_many({'key1': 'value1'}, 'us-east')
+        thread = geo_cache.snapshot(self.directory.name, background=True)
+        thread.join()
+        self.assertEqual([entry.key for entry in read_snapshot(os.path.join(self.directory.name,
+                                                                            'us-east.snapshot'))], ['key1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
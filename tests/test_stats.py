@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import patch
+from src.cache.geocache import GeoDistributedLRUCache
+from src.utils import LatencyHistogram, CacheStats, PrometheusExporter, LogExporter, log_info
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles_within_precision(self):
+        histogram = LatencyHistogram()
+        for micros in range(1, 10001):
+            histogram.record(micros / 1e6)
+        self.assertEqual(histogram.count, 10000)
+        for percent in (50, 90, 99, 99.9):
+            expected = percent / 100 * 0.01
+            self.assertAlmostEqual(histogram.percentile(percent), expected, delta=expected * 0.04)
+        self.assertAlmostEqual(histogram.snapshot()['mean'], 0.0050005, places=6)
+        self.assertEqual(histogram.percentile(100), 0.01)
+
+    def test_extreme_values(self):
+        histogram = LatencyHistogram()
+        histogram.record(0)
+        histogram.record(1e-9)
+        histogram.record(10 ** 4)  # Beyond the last bucket
+        self.assertEqual(histogram.percentile(0), 0)
+        self.assertEqual(histogram.percentile(100), 10 ** 4)
+        self.assertEqual(LatencyHistogram().percentile(99), 0.0)
+
+    def test_merge(self):
+        first, second = LatencyHistogram(), LatencyHistogram()
+        first.record(0.001)
+        second.record(0.002)
+        first.merge(second)
+        self.assertEqual(first.count, 2)
+        self.assertEqual(first.max, 0.002)
+
+
+class TestCacheStats(unittest.TestCase):
+
+    def setUp(self):
+        with patch('src.cache.geocache.Messaging'):
+            self.geo_cache = GeoDistributedLRUCache(['us-east', 'eu-central'], capacity=10, stats=True)
+        self.geo_cache.stats_data.sample_rate = self.geo_cache.stats_data.countdown = 1  # Time every operation
+
+    def test_hits_misses_and_latency(self):
+        self.geo_cache.put_many({'key1': 'value1'}, 'us-east')
+        self.geo_cache.get('key1', 'us-east')
+        self.geo_cache.get('key2', 'us-east')
+        self.geo_cache.get_many(['key1', 'key3'], 'us-east')
+        region = self.geo_cache.stats()['regions']['us-east']
+        self.assertEqual((region['lookups'], region['hits'], region['misses']), (4, 2, 2))
+        self.assertEqual(region['hit_ratio'], 0.5)
+        self.assertEqual(region['latency']['get']['count'], 2)
+        self.assertEqual(region['latency']['lock_wait']['count'], 2)
+        self.assertEqual((region['size'], region['capacity'], region['puts']), (1, 10, 1))
+
+    def test_replication_lag_from_message_timestamps(self):
+        self.geo_cache.put('key1', 'value1', 'us-east')
+        message = self.geo_cache.messaging.publish_update.call_args[0][0]
+        self.assertIn('ts', self.geo_cache.decode_updates(message)[0])
+        self.geo_cache.update_cache(message, 'eu-central')
+        region = self.geo_cache.stats()['regions']['eu-central']
+        self.assertEqual(region['applied'], 1)
+        self.assertEqual(region['latency']['replication_lag']['count'], 1)
+        self.assertLess(region['latency']['replication_lag']['max'], 1)
+        self.assertEqual(self.geo_cache.stats()['regions']['us-east']['latency']['put']['count'], 1)
+
+    def test_sampling(self):
+        stats = CacheStats(['us-east'], sample_rate=10)
+        self.assertEqual(sum(stats.sample() for _ in range(100)), 10)
+        self.geo_cache.stats_data.sample_rate = self.geo_cache.stats_data.countdown = 16
+        for _ in range(64):
+            self.geo_cache.get('key1', 'us-east')
+        region = self.geo_cache.stats()['regions']['us-east']
+        self.assertEqual(region['latency']['get']['count'], 4)
+        self.assertEqual(region['misses'], 64)
+
+    def test_disabled(self):
+        with patch('src.cache.geocache.Messaging'):
+            geo_cache = GeoDistributedLRUCache(['us-east', 'eu-central'], stats=False)
+        geo_cache.put('key1', 'value1', 'us-east')
+        message = geo_cache.messaging.publish_update.call_args[0][0]
+        self.assertNotIn('ts', geo_cache.decode_updates(message)[0])
+        geo_cache.get('key1', 'us-east')
+        region = geo_cache.stats()['regions']['us-east']
+        self.assertEqual((region['lookups'], region['hits']), (1, 1))
+        self.assertNotIn('latency', region)
+
+    def test_prometheus_export(self):
+        self.geo_cache.get('key1', 'us-east')
+        text = PrometheusExporter(prefix='cache').export(self.geo_cache.stats())
+        self.assertIn('# TYPE cache_misses_total counter', text)
+        self.assertIn('cache_misses_total{region="us-east"} 1', text)
+        self.assertIn('cache_get_seconds_count{region="us-east"} 1', text)
+        self.assertIn('cache_get_seconds{region="us-east",quantile="0.99"}', text)
+
+    def test_log_export(self):
+        with self.assertLogs(level='INFO') as logs:
+            LogExporter().export(self.geo_cache.stats())
+        self.assertIn('region=us-east', logs.output[0])
+
+
+class TestInstrumentationHelpers(unittest.TestCase):
+
+    def test_log_info(self):
+        with self.assertLogs(level='INFO') as logs:
+            log_info("replicated", region='eu-central', keys=3)
+        self.assertEqual(logs.output, ['INFO:root:replicated region=eu-central keys=3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
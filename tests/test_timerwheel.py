@@ -0,0 +1,103 @@
+import random
+import unittest
+from unittest.mock import patch
+from src.cache.entry import CacheEntry
+from src.cache.timerwheel import TimerWheel
+
+
+def timer(key, expires_at=0):
+    return CacheEntry(key, None, expires_at)
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_timer_fires_after_deadline(self):
+        wheel = TimerWheel(resolution=1.0, now=1000)
+        key1 = timer("key1")
+        key1.expires_at = 1005.5
+        wheel.schedule(key1)
+        self.assertEqual(wheel.advance(1005), [], "Timer fired before its deadline")
+        self.assertEqual(wheel.advance(1006), [key1])
+        self.assertEqual(len(wheel), 0)
+        self.assertIsNone(key1.bucket)
+
+    def test_far_timers_cascade(self):
+        wheel = TimerWheel(resolution=1.0, slots=8, levels=3, now=0)
+        deadlines = {f"key{i}": i * 7.5 for i in range(1, 80)}  # Up to 592 ticks, beyond 8 ** 3
+        for key, deadline in deadlines.items():
+            wheel.schedule(timer(key, deadline))
+        fired = {}
+        for now in range(0, 700):
+            for entry in wheel.advance(now):
+                fired[entry.key] = now
+        self.assertEqual(set(fired), set(deadlines), "Some timers never fired")
+        for key, now in fired.items():
+            self.assertGreaterEqual(now, deadlines[key], f"{key} fired early")
+            self.assertLessEqual(now - deadlines[key], 1, f"{key} fired late")
+
+    def test_cancel_and_reschedule(self):
+        wheel = TimerWheel(resolution=1.0, now=0)
+        key1, key2 = timer("key1", 5), timer("key2", 5)
+        wheel.schedule(key1)
+        wheel.schedule(key2)
+        wheel.cancel(key1)
+        key2.expires_at = 50
+        wheel.schedule(key2)
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.advance(10), [])
+        self.assertEqual(wheel.advance(51), [key2])
+
+    def test_long_gap(self):
+        wheel = TimerWheel(resolution=1.0, slots=4, levels=2, now=0)
+        key1, key2 = timer("key1", 3), timer("key2", 10 ** 6)
+        wheel.schedule(key1)
+        wheel.schedule(key2)
+        self.assertEqual(wheel.advance(1000), [key1])
+        self.assertIsNotNone(key2.bucket)
+        self.assertEqual(wheel.advance(10 ** 6 + 1), [key2])
+
+    def test_idle_gap_skips_empty_ticks(self):
+        wheel = TimerWheel(resolution=1.0, now=0)
+        key1 = timer("key1", 10 ** 6)  # In the last level, below 64 ** 4 ticks
+        wheel.schedule(key1)
+        with patch.object(wheel, '_next_tick', wraps=wheel._next_tick) as steps:
+            self.assertEqual(wheel.advance(10 ** 6 - 1), [])
+            self.assertLessEqual(steps.call_count, 5, "Empty ticks were walked one by one")
+        self.assertEqual(wheel.tick, 10 ** 6 - 1)
+        self.assertEqual(wheel.advance(10 ** 6 + 1), [key1])
+
+    def test_random_advances_fire_on_time(self):
+        rng = random.Random(0)
+        wheel = TimerWheel(resolution=1.0, slots=8, levels=3, now=0)
+        deadlines = {f"key{i}": rng.uniform(0, 3000) for i in range(500)}
+        for key, deadline in deadlines.items():
+            wheel.schedule(timer(key, deadline))
+        fired, now = {}, 0
+        while now < 3100:
+            before, now = now, now + rng.choice([1, 3, 17, 150])
+            for entry in wheel.advance(now):
+                fired[entry.key] = (before, now)
+        self.assertEqual(set(fired), set(deadlines), "Some timers never fired")
+        for key, (before, now) in fired.items():
+            # Fired by the first advance reaching the tick after its deadline
+            self.assertTrue(before < int(deadlines[key]) + 1 <= now, f"{key} fired at {now}")
+
+    def test_postponed_deadline_is_rescheduled_lazily(self):
+        wheel = TimerWheel(resolution=1.0, now=0)
+        key1 = timer("key1", 5)
+        wheel.schedule(key1)
+        key1.expires_at = 20  # Moved later without telling the wheel
+        self.assertEqual(wheel.advance(10), [])
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.advance(21), [key1])
+
+    def test_delay(self):
+        wheel = TimerWheel(resolution=1.0, now=1000, delay=10)
+        key1 = timer("key1", 1005.5)
+        wheel.schedule(key1)
+        self.assertEqual(wheel.advance(1010), [])
+        self.assertEqual(wheel.advance(1016), [key1])
+
+
+if __name__ == '__main__':
+    unittest.main()
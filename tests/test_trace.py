@@ -0,0 +1,182 @@
+import os
+import random
+import tempfile
+import unittest
+from src.cache.geocache import GeoDistributedLRUCache
+from src.cache.lrucache import LRUCache
+from src.cache.mrc import miss_ratio_curve, miss_ratio_curves
+from src.cache.trace import TRACE_DELETE, TRACE_GET, TRACE_PUT, TraceRecorder, read_trace
+from src.exceptions import TraceError
+from src.messaging import InMemoryTransport
+from src.utils import hash_key
+
+
+def _replay(accesses, capacity):
+    """
+    :return: The miss ratio of an LRUCache of capacity serving the reads of accesses, loading every miss.
+    """
+    cache, misses = LRUCache(capacity), 0
+    for key in accesses:
+        if cache.get(key) == -1:
+            misses += 1
+            cache.put(key, key)
+    return misses / len(accesses)
+
+
+def _records(accesses):
+    """
+    :return: The trace records of accesses served by a cache loading every miss, one second apart.
+    """
+    records = []
+    for second, key in enumerate(accesses):
+        records.append((hash_key(key), float(second), 0.0, 0, TRACE_GET, second + 1))
+        # A hit at one capacity is a miss at a smaller one, the load is recorded whatever the capacity
+        records.append((hash_key(key), second + 0.5, 0.0, 0, TRACE_PUT, second + 1))
+    return records
+
+
+class TestTraceRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'trace.bin')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        recorder = TraceRecorder(self.path, sample_rate=1, capacity=10)
+        recorder.record('key1', TRACE_PUT, 'us-east', ttl=30)
+        recorder.record('key1', TRACE_GET, 'eu-central')
+        recorder.record('key1', TRACE_DELETE, 'us-east')
+        self.assertEqual(len(recorder), 3)
+        recorder.close()
+        trace = read_trace(self.path)
+        self.assertEqual((trace['sample_rate'], trace['regions'], trace['written']),
+                         (1, ['us-east', 'eu-central'], 3))
+        self.assertEqual(len({record[0] for record in trace['records']}), 1)
+        self.assertEqual([record[2:] for record in trace['records']],
+                         [(30, 0, TRACE_PUT, 0), (0, 1, TRACE_GET, 1), (0, 0, TRACE_DELETE, 0)])
+
+    def test_ring_keeps_the_newest_records(self):
+        recorder = TraceRecorder(self.path, sample_rate=1, capacity=4)
+        for i in range(10):
+            recorder.record(f'key{i}', TRACE_GET)
+        recorder.close()
+        trace = read_trace(self.path)
+        self.assertEqual(trace['written'], 10)
+        self.assertEqual([record[5] for record in trace['records']], [7, 8, 9, 10])
+
+    def test_keys_are_sampled_by_hash(self):
+        recorder = TraceRecorder(self.path, sample_rate=0.1, capacity=100000)
+        for _ in range(3):  # A sampled key has every access recorded
+            for i in range(10000):
+                recorder.record(f'key{i}', TRACE_GET)
+        recorder.close()
+        records = read_trace(self.path)['records']
+        keys = {record[0] for record in records}
+        self.assertEqual(len(records), 3 * len(keys))
+        self.assertAlmostEqual(len(keys) / 10000, 0.1, delta=0.02)
+
+    def test_invalid_files_are_rejected(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\x00' * 8192)
+        with self.assertRaises(TraceError):
+            read_trace(self.path)
+        with self.assertRaises(TraceError):
+            read_trace(os.path.join(self.directory.name, 'missing.bin'))
+        with self.assertRaises(ValueError):
+            TraceRecorder(self.path, sample_rate=0)
+
+    def test_lru_cache_records_its_accesses(self):
+        recorder = TraceRecorder(self.path, sample_rate=1, capacity=100)
+        cache = LRUCache(10, expiration_time=60, trace=recorder)
+        cache.put('key1', 'value1')
+        cache.put_many({'key2': 2, 'key3': 3}, ttl=5)
+        cache.get('key1')
+        cache.get_many(['key2', 'key4'])
+        cache.delete('key3')
+        recorder.close()
+        self.assertEqual([(record[2], record[4]) for record in read_trace(self.path)['records']],
+                         [(60, TRACE_PUT), (5, TRACE_PUT), (5, TRACE_PUT), (0, TRACE_GET), (0, TRACE_GET),
+                          (0, TRACE_GET), (0, TRACE_DELETE)])
+
+    def test_geo_cache_records_local_and_replicated_writes(self):
+        recorder = TraceRecorder(self.path, sample_rate=1, capacity=100)
+        cache = GeoDistributedLRUCache(['us-east', 'eu-central'], transport=InMemoryTransport(), trace=recorder)
+        cache.put('key1', 'value1', 'us-east')
+        cache.messaging.flush()
+        cache.get('key1', 'eu-central')
+        cache.close()
+        self.assertFalse(recorder.map.closed)  # The caller owns the recorder
+        recorder.close()
+        trace = read_trace(self.path)
+        self.assertEqual(sorted((trace['regions'][record[3]], record[4]) for record in trace['records']),
+                         [('eu-central', TRACE_GET), ('eu-central', TRACE_PUT), ('us-east', TRACE_PUT)])
+
+    def test_geo_cache_skips_rejected_replicated_writes(self):
+        recorder = TraceRecorder(self.path, sample_rate=1, capacity=100)
+        cache = GeoDistributedLRUCache(['us-east'], transport=InMemoryTransport(), consume=False, trace=recorder)
+        newer = {'key': 'key1', 'value': 'value2', 'version': cache.clock.now()}
+        older = {'key': 'key1', 'value': 'value1', 'version': newer['version'] - 1}
+        cache.update_cache(cache.encode_updates([newer]), 'us-east')
+        cache.update_cache(cache.encode_updates([older, newer]), 'us-east')  # A late and a duplicate delivery
+        cache.close()
+        recorder.close()
+        self.assertEqual([record[4] for record in read_trace(self.path)['records']], [TRACE_PUT])
+
+    def test_geo_cache_closes_the_trace_it_created(self):
+        cache = GeoDistributedLRUCache(['us-east'], transport=InMemoryTransport(), trace=self.path)
+        cache.close()
+        self.assertTrue(cache.trace.map.closed)
+        self.assertEqual(read_trace(self.path)['records'], [])
+
+
+class TestMissRatioCurve(unittest.TestCase):
+
+    def test_matches_an_lru_cache(self):
+        rng = random.Random(7)
+        accesses = [f'key{min(int(rng.paretovariate(1.0)), 300)}' for _ in range(5000)]
+        capacities = [1, 2, 5, 10, 20, 50, 100]
+        curve = miss_ratio_curve(_records(accesses), capacities)['curve']
+        for capacity in capacities:
+            self.assertAlmostEqual(curve[capacity], _replay(accesses, capacity), places=9)
+
+    def test_loop_larger_than_the_cache_always_misses(self):
+        accesses = [f'key{i % 10}' for i in range(100)]
+        result = miss_ratio_curve(_records(accesses), [9, 10])
+        self.assertEqual(result['cold'], 10)
+        self.assertEqual(result['curve'], {9: 1.0, 10: 0.1})
+
+    def test_expired_keys_miss_at_every_capacity(self):
+        key = hash_key('key1')
+        records = [(key, 0.0, 1.0, 0, TRACE_PUT, 0), (key, 0.5, 0, 0, TRACE_GET, 1), (key, 2.0, 0, 0, TRACE_GET, 2)]
+        result = miss_ratio_curve(records, [1, 100])
+        self.assertEqual((result['reads'], result['expired']), (2, 1))
+        self.assertEqual(result['curve'], {1: 0.5, 100: 0.5})
+        self.assertEqual(miss_ratio_curve(records, [1], ttl=0)['curve'], {1: 0.0})  # Another expiration time
+
+    def test_deleted_keys_miss(self):
+        key = hash_key('key1')
+        records = [(key, 0.0, 0, 0, TRACE_PUT, 0), (key, 1.0, 0, 0, TRACE_DELETE, 0), (key, 2.0, 0, 0, TRACE_GET, 1)]
+        self.assertEqual(miss_ratio_curve(records, [10])['curve'], {10: 1.0})
+
+    def test_sampled_trace_estimates_the_curve(self):
+        rng = random.Random(11)
+        # Integer keys hash alike in every process, so the same keys are sampled on every run
+        accesses = [int(rng.paretovariate(0.8)) for _ in range(100000)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.bin')
+            recorder = TraceRecorder(path, sample_rate=0.1, capacity=len(accesses))
+            cache = LRUCache(len(accesses), trace=recorder)
+            for key in accesses:
+                if cache.get(key) == -1:
+                    cache.put(key, key)
+            recorder.close()
+            curve = miss_ratio_curves(path, [100, 1000])['']['curve']
+        for capacity in (100, 1000):
+            self.assertAlmostEqual(curve[capacity], _replay(accesses, capacity), delta=0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
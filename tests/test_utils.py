@@ -0,0 +1,231 @@
+import json
+import os
+import time
+import unittest
+from src.exceptions import SerializationError
+from unittest.mock import patch
+from src.utils import (serialize_data, deserialize_data, is_serialized, hash_key, select_region, ConsistentHashRing,
+                       HybridLogicalClock, LatencyTracker, CompressedValue, check_codec, compress_value,
+                       decompress_value, measure_latency, version_time)
+
+
+class TestBinaryCodec(unittest.TestCase):
+
+    def test_round_trip_supported_types(self):
+        record = {
+            'str': 'value', 'unicode': 'é' * 300, 'bytes': b'\x00\x01' * 200, 'empty': b'',
+            'small': -5, 'int': 10 ** 12, 'bigint': -2 ** 100, 'float': 3.25,
+            'none': None, 'bool': [True, False], 'nested': {'list': [1, 'two', {'three': 3.0}]},
+        }
+        self.assertEqual(deserialize_data(serialize_data([record])), [record])
+
+    def test_multi_record_frame(self):
+        records = [{'key': f'key{i}', 'value': f'value{i}'} for i in range(500)]
+        frame = serialize_data(records)
+        self.assertEqual(deserialize_data(frame), records)
+
+    def test_decode_from_any_buffer(self):
+        frame = serialize_data([{'key': 'key1', 'value': 'value1'}])
+        for body in (frame, bytearray(frame), memoryview(frame)):
+            self.assertEqual(deserialize_data(body), [{'key': 'key1', 'value': 'value1'}])
+
+    def test_smaller_than_json(self):
+        records = [{'key': f'key{i}', 'value': {'id': i, 'score': i / 3, 'tags': ['a', 'b']}} for i in range(100)]
+        self.assertLess(len(serialize_data(records)), len(json.dumps({'batch': records}).encode('utf-8')))
+
+    def test_frame_detection(self):
+        self.assertTrue(is_serialized(serialize_data([])))
+        self.assertFalse(is_serialized(json.dumps({'key': 'key1'}).encode('utf-8')))
+        self.assertFalse(is_serialized(b''))
+
+    def test_unsupported_type(self):
+        with self.assertRaises(SerializationError):
+            serialize_data([object()])
+
+    def test_malformed_frames(self):
+        frame = serialize_data([{'key': 'key1', 'value': 'value1'}])
+        with self.assertRaises(SerializationError):
+            deserialize_data(frame[:-3])
+        with self.assertRaises(SerializationError):
+            deserialize_data(b'{"key": "key1"}')
+        with self.assertRaises(SerializationError):
+            deserialize_data(frame[:1] + b'\x63' + frame[2:])
+
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.value = {'items': [{'id': i, 'name': f'item {i}', 'tags': ['a', 'b']} for i in range(200)]}
+
+    def test_large_values_are_compressed(self):
+        for codec in ('zlib', 'lzma'):
+            compressed, size = compress_value(self.value, codec, threshold=1024)
+            self.assertIsInstance(compressed, CompressedValue)
+            self.assertEqual(size, len(compressed.data))
+            self.assertEqual(decompress_value(compressed), self.value)
+
+    def test_small_and_incompressible_values_are_kept(self):
+        self.assertEqual(compress_value('small', 'zlib', threshold=1024), ('small', 7))
+        noise = os.urandom(512)
+        self.assertIs(compress_value(noise, 'zlib', threshold=16)[0], noise)
+        self.assertEqual(decompress_value('plain'), 'plain')
+
+    def test_codec_conversion(self):
+        zlib_value = compress_value(self.value, 'zlib', threshold=0)[0]
+        self.assertIs(compress_value(zlib_value, 'zlib')[0], zlib_value)
+        lzma_value = compress_value(zlib_value, 'lzma', threshold=0)[0]
+        self.assertEqual(lzma_value.codec, 'lzma')
+        self.assertEqual(decompress_value(lzma_value), self.value)
+        with self.assertRaises(ValueError):
+            check_codec('brotli')
+
+    def test_compressed_values_travel_in_frames(self):
+        compressed = compress_value(self.value, 'zlib', threshold=0)[0]
+        frame = serialize_data([{'key': 'key1', 'value': compressed}])
+        self.assertLess(len(frame), len(serialize_data([{'key': 'key1', 'value': self.value}])))
+        self.assertEqual(deserialize_data(frame), [{'key': 'key1', 'value': compressed}])
+        corrupt = bytearray(frame)
+        corrupt[frame.index(compressed.data) - 5] = 99  # Unknown codec id
+        with self.assertRaises(SerializationError):
+            deserialize_data(bytes(corrupt))
+
+
+class TestConsistentHashRing(unittest.TestCase):
+
+    def setUp(self):
+        self.keys = [f'key{i}' for i in range(5000)]
+
+    def test_hash_key_is_stable(self):
+        self.assertEqual(hash_key('key1'), hash_key('key1'))
+        self.assertEqual(hash_key(b'key1'), hash_key('key1'))
+        self.assertNotEqual(hash_key('key1'), hash_key('key2'))
+        self.assertLess(hash_key('key1'), 2 ** 64)
+
+    def test_owners_are_distinct(self):
+        ring = ConsistentHashRing(['a', 'b', 'c'])
+        for key in self.keys[:100]:
+            owners = ring.owners(key, 2)
+            self.assertEqual(len(set(owners)), 2)
+            self.assertEqual(owners[0], ring.node_for(key))
+        self.assertEqual(len(ring.owners('key1', 5)), 3)
+
+    def test_balanced(self):
+        ring = ConsistentHashRing([f'node{i}' for i in range(4)])
+        counts = {}
+        for key in self.keys:
+            counts[ring.node_for(key)] = counts.get(ring.node_for(key), 0) + 1
+        for count in counts.values():
+            self.assertAlmostEqual(count / len(self.keys), 0.25, delta=0.08)
+
+    def test_adding_a_node_moves_about_one_nth(self):
+        nodes = [f'node{i}' for i in range(4)]
+        ring = ConsistentHashRing(nodes)
+        before = {key: ring.node_for(key) for key in self.keys}
+        ring.add_node('node4')
+        moved = [key for key in self.keys if ring.node_for(key) != before[key]]
+        self.assertAlmostEqual(len(moved) / len(self.keys), 1 / 5, delta=0.07)
+        self.assertTrue(all(ring.node_for(key) == 'node4' for key in moved))
+        ring.remove_node('node4')
+        self.assertEqual({key: ring.node_for(key) for key in self.keys}, before)
+
+    def test_select_region(self):
+        regions = ['us-east', 'eu-central', 'asia-south']
+        self.assertIn(select_region('key1', regions), regions)
+        self.assertEqual(select_region('key1', regions), ConsistentHashRing(regions).node_for('key1'))
+        self.assertIsNone(select_region('key1', []))
+
+
+
+class TestHybridLogicalClock(unittest.TestCase):
+
+    def test_versions_increase(self):
+        clock = HybridLogicalClock(node_id=1)
+        versions = [clock.now() for _ in range(10000)]  # Many within the same millisecond
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertAlmostEqual(version_time(versions[0]), time.time(), delta=1)
+
+    def test_clock_going_backwards(self):
+        clock = HybridLogicalClock(node_id=1)
+        before = clock.now()
+        with patch('src.utils.clock.time.time', return_value=time.time() - 3600):
+            self.assertGreater(clock.now(), before)
+
+    def test_update_orders_after_received_versions(self):
+        behind, ahead = HybridLogicalClock(node_id=1), HybridLogicalClock(node_id=2)
+        with patch('src.utils.clock.time.time', return_value=time.time() + 5):
+            remote = ahead.now()
+        behind.update(remote)
+        self.assertGreater(behind.now(), remote)
+
+    def test_drift_warning(self):
+        clock = HybridLogicalClock(node_id=1, max_drift=1)
+        with patch('src.utils.clock.time.time', return_value=time.time() + 10):
+            remote = HybridLogicalClock(node_id=2).now()
+        with self.assertLogs(level='WARNING'):
+            clock.update(remote)
+
+    def test_node_ids_break_ties(self):
+        with patch('src.utils.clock.time.time', return_value=1700000000.0):
+            first, second = HybridLogicalClock(node_id=1).now(), HybridLogicalClock(node_id=2).now()
+        self.assertNotEqual(first, second)
+        with self.assertRaises(ValueError):
+            HybridLogicalClock(node_id=1 << 10)
+
+    def test_duplicate_node_ids_are_reported(self):
+        clock, twin = HybridLogicalClock(node_id=7), HybridLogicalClock(node_id=7)
+        clock.update(clock.now())  # Its own versions coming back are not duplicates
+        clock.update(HybridLogicalClock(node_id=8).now())
+        self.assertEqual(clock.duplicates, 0)
+        with patch('src.utils.clock.time.time', return_value=time.time() + 1):
+            remote = twin.now()
+        with self.assertLogs(level='ERROR'):
+            clock.update(remote)
+        self.assertEqual(clock.duplicates, 1)
+
+
+
+class TestLatencyTracker(unittest.TestCase):
+
+    def test_ewma_follows_observations(self):
+        tracker = LatencyTracker(alpha=0.5)
+        self.assertIsNone(tracker.latency('us-east'))
+        tracker.observe('us-east', 0.010)
+        self.assertAlmostEqual(tracker.latency('us-east'), 0.010)
+        tracker.observe('us-east', 0.030)
+        self.assertAlmostEqual(tracker.latency('us-east'), 0.020)
+        with self.assertRaises(ValueError):
+            LatencyTracker(alpha=0)
+
+    def test_rank_prefers_observed_latency_then_distance(self):
+        tracker = LatencyTracker()
+        distances = {('us-east', 'eu-central'): 80, ('us-east', 'asia-south'): 200, ('us-east', 'us-west'): 60}
+        regions = ['asia-south', 'eu-central', 'us-west']
+        self.assertEqual(tracker.rank(regions, distances, 'us-east'), ['us-west', 'eu-central', 'asia-south'])
+        tracker.observe('asia-south', 0.05)
+        tracker.observe('eu-central', 0.2)
+        self.assertEqual(tracker.rank(regions, distances, 'us-east'), ['asia-south', 'eu-central', 'us-west'])
+        self.assertEqual(tracker.nearest(regions, distances, 'us-east'), 'asia-south')
+
+    def test_hedge_delay(self):
+        tracker = LatencyTracker(hedge_percentile=90, hedge_min_delay=0.001)
+        self.assertEqual(tracker.hedge_delay('us-east'), 0.001)
+        for _ in range(9):
+            tracker.observe('us-east', 0.010)
+        tracker.observe('us-east', 1.0)
+        self.assertAlmostEqual(tracker.hedge_delay('us-east'), 0.010, delta=0.001)
+
+    @patch('src.utils.latency.measure_latency', side_effect=[0.02, None])
+    def test_probe(self, measure):
+        tracker = LatencyTracker()
+        self.assertEqual(tracker.probe({'us-east': 'us-east.example', 'eu-central': ('eu.example', 15672)},
+                                       timeout=0.5), {'us-east': 0.02, 'eu-central': None})
+        measure.assert_called_with('eu.example', 15672, 0.5)
+        self.assertEqual(tracker.latency('eu-central'), 0.5)
+
+    def test_measure_latency_unreachable(self):
+        self.assertIsNone(measure_latency('127.0.0.1', port=1, timeout=0.2))
+
+
+if __name__ == '__main__':
+    unittest.main()